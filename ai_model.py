@@ -1,34 +1,79 @@
+import copy
 import os
 import json
+import time
 import requests
 import chromadb
 from datetime import datetime
 import uuid
+import threading
+import ollama_client
+from log_utils import get_logger
+from metrics import (CHAT_REPLIES, CHROMA_QUERY_SECONDS, JSON_SERIALIZE_SECONDS, OLLAMA_ERRORS,
+                     OLLAMA_FIRST_TOKEN_SECONDS, OLLAMA_REQUEST_SECONDS, PROMPT_TOKENS, record_ollama_stats)
+from tracing import add_span, record_ollama_phases, span
+
+logger = get_logger("ai_model")
 
 # Import the custom embedding function
 try:
     from ollama_utils import OllamaEmbeddingFunction
 except ImportError:
-    print("Error: ollama_utils.py not found. Please ensure it's in the same directory.")
+    logger.error("Error: ollama_utils.py not found. Please ensure it's in the same directory.")
     class OllamaEmbeddingFunction: # type: ignore
-        def __init__(self, *args, **kwargs): print("Dummy OllamaEmbeddingFunction used due to import error.")
+        def __init__(self, *args, **kwargs): logger.warning("Dummy OllamaEmbeddingFunction used due to import error.")
         def __call__(self, texts): raise NotImplementedError("Dummy EF called")
 
+from json_stream import IncrementalJSONObjectParser
+from query_intent import answer_data_question
+from rag_ingestion import has_epoch_metadata, query_readings
+from model_router import MODEL_TIERS, ROUTING_ENABLED, route, run_with_fallback
+from prefetch import Prefetcher
+from prompt_builder import SUMMARY_MAX_TOKENS, build_chat_prompt, chat_prompt_prefix, observe_prompt_tokens, summary_update_prompt
+from semantic_cache import SemanticCache
+from sensor_handler import get_latest_timestamp
+
 # --- Configuration ---
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-OLLAMA_EMBED_API_URL = "http://localhost:11434/api/embeddings"
-OLLAMA_LLM_MODEL = "mushroom_gemma"
+OLLAMA_API_URL = ollama_client.url("generate") # Host from OLLAMA_HOST (see ollama_client.py)
+OLLAMA_EMBED_API_URL = ollama_client.url("embeddings")
+OLLAMA_LLM_MODEL = MODEL_TIERS["large"] # mushroom_gemma unless MUSHROOM_LARGE_MODEL is set; see model_router.py for the small tier
 OLLAMA_EMBED_MODEL = "nomic-embed-text"
 CHROMA_DB_PATH = "chroma_db_data"
 COLLECTION_NAME = "mushroom_zone_data"
 CONVERSATION_HISTORY_DIR = "conversation_history"
+FAST_PATH_ENABLED = True # Answer plain data lookups from sensor history without RAG/LLM
+FAST_PATH_LLM_PHRASING = False # Optionally pass the computed numbers to a short prompt for phrasing
+FAST_PATH_PHRASING_OPTIONS = {"temperature": 0.3, "num_predict": 120}
+PROMPT_VERSION = "2" # Bump when the chat prompt template changes; cached replies from older prompts are dropped
+SEMANTIC_CACHE_ENABLED = os.environ.get("MUSHROOM_SEMANTIC_CACHE", "0") == "1" # Opt-in: reuse replies to near-identical questions (see semantic_cache.py)
+SEMANTIC_CACHE_WATERMARK_SECONDS = 300 # Readings less than this much newer than a cached reply's data do not invalidate it
+RAG_CANDIDATES = 6 # Documents retrieved per chat message; prompt_builder deduplicates and trims them to the token budget
+SUMMARY_MIN_NEW_MESSAGES = 6 # Fold turns into the running summary once at least this many have left the prompt (batched: one short generation per ~3 exchanges)
+SUMMARY_OPTIONS = {"temperature": 0.2, "num_predict": SUMMARY_MAX_TOKENS}
+PREFETCH_KEEP_ALIVE = os.environ.get("MUSHROOM_PREFETCH_KEEP_ALIVE", "30m") # How long Ollama keeps a prefetched model loaded
 
 os.makedirs(CONVERSATION_HISTORY_DIR, exist_ok=True)
 
+CHAT_CACHE = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
+
 # --- ChromaDB and Embedding Function Initialization ---
 rag_collection = None
 ollama_embed_ef = None
 chroma_client = None
+RAG_TIME_FILTER = True # Cleared for an index built before epoch metadata existed (see _check_time_filter)
+
+def _check_time_filter(collection):
+    """Falls back to zone-only retrieval, with a warning, when the index has no epoch metadata to filter on."""
+    global RAG_TIME_FILTER
+    try:
+        RAG_TIME_FILTER = has_epoch_metadata(collection)
+    except Exception as e:
+        logger.warning(f"Could not check '{COLLECTION_NAME}' for epoch metadata ({e}); keeping time filters on.")
+        return
+    if not RAG_TIME_FILTER:
+        logger.warning(f"Collection '{COLLECTION_NAME}' was indexed without epoch metadata, so periods named in chat "
+                       "messages (\"yesterday\", \"past 2 weeks\", ...) are ignored and retrieval filters on zone only. "
+                       "Run `python rag_ingestion.py --backfill-epochs` and restart to enable them.")
 
 try:
     chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
@@ -38,167 +83,554 @@ try:
             name=COLLECTION_NAME,
             embedding_function=ollama_embed_ef # This is important for ChromaDB to use our function
         )
-        print(f"Successfully connected to ChromaDB and retrieved collection '{COLLECTION_NAME}'.")
-        print(f"ChromaDB collection count: {rag_collection.count()}")
+        logger.info(f"Successfully connected to ChromaDB and retrieved collection '{COLLECTION_NAME}'.")
+        logger.info(f"ChromaDB collection count: {rag_collection.count()}")
+        _check_time_filter(rag_collection)
     except Exception as e: 
-        print(f"Info: Collection '{COLLECTION_NAME}' not found or EF incompatible ({e}). Will attempt to get/create later if needed by RAG.")
+        logger.info(f"Info: Collection '{COLLECTION_NAME}' not found or EF incompatible ({e}). Will attempt to get/create later if needed by RAG.")
 except Exception as e:
-    print(f"Error initializing ChromaDB or OllamaEmbeddingFunction: {e}. RAG capabilities will be affected.")
+    logger.error(f"Error initializing ChromaDB or OllamaEmbeddingFunction: {e}. RAG capabilities will be affected.")
 
 # --- Conversation History Management ---
+# Parsed conversation files keyed by path, checked against the file's mtime and size on every load
+# (another API worker may have written it). Filled by zone prefetch and by each load.
+_conversation_file_cache = {}
+
+def _load_conversation_file(path: str):
+    """The parsed JSON file (a fresh top-level copy), or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = _conversation_file_cache.get(path)
+    if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+        with open(path, 'r') as f:
+            cached = _conversation_file_cache[path] = ((stat.st_mtime_ns, stat.st_size), json.load(f))
+    return copy.copy(cached[1]) # Callers append to histories; the turns themselves are never modified
+
 def load_conversation_history(thread_id: str) -> list:
     history_file = os.path.join(CONVERSATION_HISTORY_DIR, f"{thread_id}.json")
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"Warning: Could not decode JSON from {history_file}. Starting with empty history.")
-            return []
-    return []
+    try:
+        with span("history_load"):
+            return _load_conversation_file(history_file) or []
+    except json.JSONDecodeError:
+        logger.warning(f"Warning: Could not decode JSON from {history_file}. Starting with empty history.")
+        return []
 
 def save_conversation_history(thread_id: str, history: list):
     history_file = os.path.join(CONVERSATION_HISTORY_DIR, f"{thread_id}.json")
     try:
-        with open(history_file, 'w') as f:
-            json.dump(history, f, indent=2)
+        with span("history_save"):
+            with JSON_SERIALIZE_SECONDS.labels("conversation").time():
+                serialized = json.dumps(history, indent=2)
+            with open(history_file, 'w') as f:
+                f.write(serialized)
+    except IOError as e:
+        logger.error(f"Error saving conversation history to {history_file}: {e}")
+
+def _summary_file(thread_id: str) -> str:
+    return os.path.join(CONVERSATION_HISTORY_DIR, f"{thread_id}.summary.json")
+
+def load_conversation_summary(thread_id: str) -> dict:
+    """{"summary": str, "covered": int}: running summary of the first `covered` history entries."""
+    try:
+        return _load_conversation_file(_summary_file(thread_id)) or {"summary": "", "covered": 0}
+    except (OSError, json.JSONDecodeError):
+        return {"summary": "", "covered": 0}
+
+def save_conversation_summary(thread_id: str, summary: str, covered: int):
+    try:
+        with open(_summary_file(thread_id), 'w') as f:
+            json.dump({"summary": summary, "covered": covered, "updated": datetime.now().isoformat(timespec="seconds")}, f)
     except IOError as e:
-        print(f"Error saving conversation history to {history_file}: {e}")
+        logger.error(f"Error saving conversation summary for {thread_id}: {e}")
+
+_summaries_running = set()
+_summaries_lock = threading.Lock()
+
+def update_conversation_summary(thread_id: str, covered: int):
+    """
+    Folds history entries from the stored summary's `covered` up to `covered` into the summary
+    with one short generation. Runs on a background thread so the reply is not delayed; if it
+    fails the summary stays as it was and the next turn retries.
+    """
+    with _summaries_lock:
+        if thread_id in _summaries_running:
+            return
+        _summaries_running.add(thread_id)
+    try:
+        stored = load_conversation_summary(thread_id)
+        turns = load_conversation_history(thread_id)[stored["covered"]:covered]
+        if not turns:
+            return
+        summary, _, _ = generate_text_routed(summary_update_prompt(stored["summary"], turns), "summary", options=SUMMARY_OPTIONS)
+        if summary.startswith(("Error", "An unexpected error")):
+            logger.warning(f"Conversation summary update failed for {thread_id}: {summary}")
+            return
+        save_conversation_summary(thread_id, summary, covered)
+        logger.info(f"Folded {len(turns)} messages into the summary of thread {thread_id}.")
+    finally:
+        with _summaries_lock:
+            _summaries_running.discard(thread_id)
 
 # --- Core AI Functions ---
 def start_conversation() -> str:
     thread_id = uuid.uuid4().hex
     save_conversation_history(thread_id, []) 
-    print(f"New conversation started with Thread ID: {thread_id}")
+    logger.info(f"New conversation started with Thread ID: {thread_id}")
     return thread_id
 
+def generate_text(prompt: str, options: dict = None, model: str = OLLAMA_LLM_MODEL, timeout: int = 60) -> str:
+    """
+    Run a single non-streaming Ollama generation and return the response text.
+    Errors are returned as "Error: ..." strings, matching what send_message replies with.
+    """
+    ai_response_text = "Error: Could not get a response from Ollama."
+    try:
+        logger.info(f"Sending prompt to Ollama model: {model}...")
+        ollama_payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": options or { 
+                "temperature": 0.7, 
+                "top_k": 50 
+            }
+        }
+        with span("ollama", OLLAMA_REQUEST_SECONDS.labels("generate")):
+            response = ollama_client.post("generate", ollama_payload, timeout=timeout) 
+        response.raise_for_status() 
+        
+        response_json = response.json()
+        observe_prompt_tokens(len(prompt), response_json.get("prompt_eval_count"))
+        record_ollama_stats(response_json)
+        record_ollama_phases(response_json)
+        ai_response_text = response_json.get("response", "Error: No 'response' key in Ollama output.").strip()
+        
+    except requests.exceptions.ConnectionError as e:
+        ai_response_text = f"Error: Could not connect to Ollama at {OLLAMA_API_URL}. Is Ollama running? ({e})"
+        logger.error(ai_response_text) 
+    except requests.exceptions.HTTPError as e:
+        error_detail = e.response.text
+        try:
+            error_json = e.response.json()
+            error_detail = error_json.get('error', error_detail) 
+            if "model not found" in error_detail.lower() or (e.response.status_code == 404 and "no such file" in error_detail.lower()): 
+                 ai_response_text = f"Error: Ollama LLM model '{model}' not found. Please ensure it is created/pulled. (Details: {error_detail})"
+            else:
+                ai_response_text = f"Error: HTTP error from Ollama: {e.response.status_code} (Details: {error_detail})"
+        except json.JSONDecodeError: 
+            ai_response_text = f"Error: HTTP error from Ollama: {e.response.status_code}. Could not decode error response. (Raw response: {error_detail})"
+        logger.error(ai_response_text) 
+    except requests.exceptions.Timeout:
+        ai_response_text = f"Error: Timeout connecting to Ollama at {OLLAMA_API_URL} for generation."
+        logger.error(ai_response_text) 
+    except Exception as e: 
+        ai_response_text = f"An unexpected error occurred while communicating with Ollama: {e}"
+        logger.error(ai_response_text) 
+    
+    if ai_response_text.startswith(("Error", "An unexpected error")):
+        OLLAMA_ERRORS.labels("generate").inc()
+    return ai_response_text
+
+def generate_text_streamed(prompt: str, on_token, options: dict = None, model: str = OLLAMA_LLM_MODEL,
+                           timeout: int = 60) -> str:
+    """
+    Streaming generate_text: calls on_token(text) for each token as Ollama produces it and
+    returns the full reply. A failure before the first token returns an "Error: ..." string
+    (nothing was shown); a failure mid-reply is logged and the partial reply is returned, since
+    that is what the caller already displayed.
+    """
+    ollama_payload = {"model": model, "prompt": prompt, "stream": True,
+                      "options": options or {"temperature": 0.7, "top_k": 50}}
+    chunks = []
+    error = None
+    request_start = time.perf_counter()
+    try:
+        logger.info(f"Streaming prompt to Ollama model: {model}...")
+        with ollama_client.post("generate", ollama_payload, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    error = f"Error: Ollama error during generation: {chunk['error']}"
+                    break
+                token = chunk.get("response", "")
+                if not chunks:
+                    token = token.lstrip() # generate_text strips the reply too
+                if token:
+                    if not chunks:
+                        OLLAMA_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - request_start)
+                    chunks.append(token)
+                    on_token(token)
+                if chunk.get("done"):
+                    observe_prompt_tokens(len(prompt), chunk.get("prompt_eval_count"))
+                    record_ollama_stats(chunk)
+                    record_ollama_phases(chunk)
+                    break
+    except requests.exceptions.ConnectionError as e:
+        error = f"Error: Could not connect to Ollama at {OLLAMA_API_URL}. Is Ollama running? ({e})"
+    except requests.exceptions.HTTPError as e:
+        error = f"Error: HTTP error from Ollama: {e.response.status_code} (Details: {e.response.text})"
+    except requests.exceptions.Timeout:
+        error = f"Error: Timeout connecting to Ollama at {OLLAMA_API_URL} for generation."
+    except json.JSONDecodeError as e:
+        error = f"Error: Could not decode streamed Ollama output: {e}"
+    except Exception as e:
+        error = f"An unexpected error occurred while communicating with Ollama: {e}"
+
+    request_seconds = time.perf_counter() - request_start
+    OLLAMA_REQUEST_SECONDS.labels("stream").observe(request_seconds)
+    add_span("ollama", request_seconds)
+    if error:
+        OLLAMA_ERRORS.labels("stream").inc()
+        logger.error(error)
+        if not chunks:
+            return error
+    return "".join(chunks).rstrip()
+
+def _is_valid_reply(text: str) -> bool:
+    return bool(text.strip()) and not text.startswith(("Error", "An unexpected error"))
+
+def generate_text_routed(prompt: str, kind: str, user_message: str = None, options: dict = None, timeout: int = 60,
+                         validate=_is_valid_reply, on_token=None):
+    """
+    generate_text on the model tier model_router picks for this request kind, regenerating on the
+    large model if a small-model reply fails `validate`. With `on_token` the reply is streamed
+    (generate_text_streamed); a failed small-model stream has shown nothing, so the fallback
+    starts clean. Returns (text, RouteDecision, tier used).
+    """
+    decision = route(kind, prompt, user_message)
+    if on_token is None:
+        generate = lambda model: generate_text(prompt, options=options, model=model, timeout=timeout)
+    else:
+        generate = lambda model: generate_text_streamed(prompt, on_token, options=options, model=model, timeout=timeout)
+    text, tier = run_with_fallback(decision, generate, validate)
+    return text, decision, tier
+
+def _answer_from_fast_path(user_message: str, zone_name: str):
+    """
+    Answers plain data lookups (e.g. "max temperature in Tent 2 this week") straight from
+    sensor history. Returns the reply text, or None if the message needs the full RAG + LLM path.
+    """
+    with span("fast_path"):
+        fast_result = answer_data_question(user_message, zone_name=zone_name)
+    if fast_result is None:
+        return None
+    logger.info(f"Fast path answered data question for zone {fast_result['query']['zone']} without RAG.")
+    if not FAST_PATH_LLM_PHRASING:
+        return fast_result["answer"]
+
+    phrasing_prompt = (
+        f"A mushroom farm caretaker asked: \"{user_message}\"\n"
+        f"Computed facts (exact, do not change any number): {json.dumps(fast_result['facts'])}\n"
+        f"Draft answer: {fast_result['answer']}\n"
+        "Rewrite the draft answer in at most three friendly sentences. Answer:"
+    )
+    phrased, _, _ = generate_text_routed(phrasing_prompt, "phrasing", options=FAST_PATH_PHRASING_OPTIONS, timeout=20)
+    # Never let a phrasing failure hide numbers we already have.
+    return fast_result["answer"] if phrased.startswith(("Error", "An unexpected error")) else phrased
+
+def _zone_data_watermark(zone_name: str) -> tuple:
+    """
+    What a chat reply for the zone was generated from: its newest reading (bucketed to
+    SEMANTIC_CACHE_WATERMARK_SECONDS) and the RAG document count. Moving either invalidates cached replies.
+    """
+    latest = get_latest_timestamp(zone_name)
+    bucket = None
+    if latest is not None:
+        seconds = datetime.strptime(latest, "%Y-%m-%d %H:%M:%S").timestamp()
+        bucket = int(seconds // SEMANTIC_CACHE_WATERMARK_SECONDS) if SEMANTIC_CACHE_WATERMARK_SECONDS else latest
+    return bucket, rag_collection.count() if rag_collection is not None else 0
+
+def _reply_version() -> str:
+    return f"{OLLAMA_LLM_MODEL}+{MODEL_TIERS['small'] if ROUTING_ENABLED else '-'}:{PROMPT_VERSION}"
+
+def _record_reply(thread_id: str, user_message: str, reply: str):
+    history = load_conversation_history(thread_id)
+    history.append({"role": "user", "content": user_message})
+    history.append({"role": "assistant", "content": reply})
+    save_conversation_history(thread_id, history)
+
+def get_chat_cache_stats() -> dict:
+    """Semantic cache hit rate and saved generation time ({"enabled": False} when the cache is off)."""
+    if CHAT_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **CHAT_CACHE.stats()}
+
+# --- Zone Prefetch ---
+def _prefetch_conversation(job):
+    """Reads the thread's history and summary into the conversation file cache."""
+    if job.thread_id:
+        load_conversation_history(job.thread_id)
+        load_conversation_summary(job.thread_id)
+
+def _prefetch_retrieval(job):
+    """Loads the embedding model and runs a zone query, so the first message finds both warm."""
+    if ollama_embed_ef is None or rag_collection is None:
+        return
+    probe = ollama_embed_ef([f"Recent conditions in Zone {job.zone_name}"])[0]
+    if not job.cancelled.is_set():
+        query_readings(rag_collection, probe, job.zone_name, "", RAG_CANDIDATES, include=())
+
+def _prefetch_model(job):
+    """
+    Loads the chat model(s) with PREFETCH_KEEP_ALIVE and evaluates the zone's prompt prefix, so
+    the first reply skips the load and Ollama reuses the cached prefix.
+    """
+    models = [MODEL_TIERS["large"]] + ([MODEL_TIERS["small"]] if ROUTING_ENABLED else [])
+    for model in models:
+        if job.cancelled.is_set():
+            return
+        response = ollama_client.post("generate", {"model": model, "prompt": chat_prompt_prefix(job.zone_name), "stream": False,
+                                                   "keep_alive": PREFETCH_KEEP_ALIVE, "options": {"num_predict": 1}})
+        response.raise_for_status()
+
+PREFETCHER = Prefetcher([("conversation", _prefetch_conversation), ("retrieval", _prefetch_retrieval),
+                         ("model", _prefetch_model)])
+
+def prefetch_zone(zone_name: str, client: str = None, thread_id: str = None) -> dict:
+    """
+    Starts warming what the first chat message in a zone needs (see prefetch.py). A client's
+    previous prefetch is cancelled. Returns the Prefetcher status dict.
+    """
+    return PREFETCHER.request(zone_name, client=client, thread_id=thread_id)
+
+def cancel_prefetch(client: str = None, zone_name: str = None) -> int:
+    return PREFETCHER.cancel(client=client, zone_name=zone_name)
+
+def get_prefetch_stats() -> dict:
+    return PREFETCHER.stats()
+
 def send_message(thread_id: str, user_message: str, zone_name: str) -> str:
+    return send_message_with_details(thread_id, user_message, zone_name)["reply"]
+
+def send_message_with_details(thread_id: str, user_message: str, zone_name: str, zone_summary: str = "",
+                              on_token=None) -> dict:
+    """
+    Same as send_message, but returns {"reply": str, "source": "fast_path"|"cache"|"llm"} so callers
+    can tell which path produced the reply; LLM replies also name the "model" that wrote them. Cached replies also carry a "cache" dict
+    (matched query, similarity, when it was generated).
+    `zone_summary` (analytics.summarize_recent_window) is added to the prompt as the zone's recent conditions.
+    With `on_token`, LLM replies are streamed to it token by token; fast-path and cached replies arrive as one call.
+    """
     global rag_collection 
     global ollama_embed_ef
     global chroma_client 
 
+    if FAST_PATH_ENABLED:
+        fast_reply = _answer_from_fast_path(user_message, zone_name)
+        if fast_reply is not None:
+            _record_reply(thread_id, user_message, fast_reply)
+            if on_token is not None:
+                on_token(fast_reply)
+            CHAT_REPLIES.labels("fast_path").inc()
+            return {"reply": fast_reply, "source": "fast_path"}
+
     context_str = "No RAG context available." 
 
     if ollama_embed_ef is None:
-        print("CRITICAL Error: Ollama Embedding Function not initialized. Cannot perform RAG.")
+        logger.critical("CRITICAL Error: Ollama Embedding Function not initialized. Cannot perform RAG.")
         try:
             ollama_embed_ef = OllamaEmbeddingFunction(model_name=OLLAMA_EMBED_MODEL, api_url=OLLAMA_EMBED_API_URL)
-            print("Re-initialized OllamaEmbeddingFunction in send_message.")
+            logger.info("Re-initialized OllamaEmbeddingFunction in send_message.")
         except Exception as e_ef:
-            print(f"Failed to re-initialize OllamaEmbeddingFunction in send_message: {e_ef}")
-            return "Error: AI system's embedding function is not working."
+            logger.error(f"Failed to re-initialize OllamaEmbeddingFunction in send_message: {e_ef}")
+            return {"reply": "Error: AI system's embedding function is not working.", "source": "llm"}
     
     if chroma_client is None:
-        print("CRITICAL Error: Chroma client not initialized. Cannot perform RAG.")
+        logger.critical("CRITICAL Error: Chroma client not initialized. Cannot perform RAG.")
         try:
             chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-            print("Re-initialized ChromaDB client in send_message.")
+            logger.info("Re-initialized ChromaDB client in send_message.")
         except Exception as e_chroma:
-            print(f"Failed to re-initialize ChromaDB client in send_message: {e_chroma}")
-            return "Error: AI system's database connection is not working."
+            logger.error(f"Failed to re-initialize ChromaDB client in send_message: {e_chroma}")
+            return {"reply": "Error: AI system's database connection is not working.", "source": "llm"}
 
     if rag_collection is None:
-        print(f"Warning: RAG collection '{COLLECTION_NAME}' not available at start of send_message. Attempting to get/re-initialize.")
+        logger.warning(f"Warning: RAG collection '{COLLECTION_NAME}' not available at start of send_message. Attempting to get/re-initialize.")
         if chroma_client and ollama_embed_ef:
             try:
                 rag_collection = chroma_client.get_collection(name=COLLECTION_NAME, embedding_function=ollama_embed_ef)
-                print(f"Successfully got collection '{COLLECTION_NAME}' within send_message. Count: {rag_collection.count()}")
+                logger.info(f"Successfully got collection '{COLLECTION_NAME}' within send_message. Count: {rag_collection.count()}")
+                _check_time_filter(rag_collection)
             except Exception as e_coll:
-                print(f"Error: Failed to get RAG collection '{COLLECTION_NAME}' within send_message: {e_coll}.")
+                logger.error(f"Error: Failed to get RAG collection '{COLLECTION_NAME}' within send_message: {e_coll}.")
                 context_str = "No RAG context available (collection access failed)."
         else:
-            print("Error: Chroma client or embedding function still not available. Cannot access RAG collection.")
+            logger.error("Error: Chroma client or embedding function still not available. Cannot access RAG collection.")
             context_str = "No RAG context available (Chroma client or EF not initialized)."
     
+    history = load_conversation_history(thread_id)
+    message_embedding = None
+    cache_watermark = None
+    # The cache key has no conversation in it, and a follow-up ("and yesterday?") means something
+    # different in each thread, so only a thread's opening question is looked up (and stored).
+    if CHAT_CACHE is not None and ollama_embed_ef is not None and not history:
+        try:
+            message_embedding = ollama_embed_ef([user_message])[0] # Reused for the RAG query on a miss
+            cache_watermark = _zone_data_watermark(zone_name)
+            with span("semantic_cache"):
+                cached = CHAT_CACHE.lookup(zone_name, message_embedding, cache_watermark, _reply_version())
+        except Exception as e_cache:
+            logger.warning(f"Semantic cache lookup failed, generating a fresh reply: {e_cache}")
+            cached = None
+        if cached is not None:
+            logger.info(f"Semantic cache hit for zone {zone_name} (similarity {cached['similarity']}, "
+                        f"saved ~{cached['generation_seconds']}s of generation).")
+            _record_reply(thread_id, user_message, cached["reply"])
+            if on_token is not None:
+                on_token(cached["reply"])
+            CHAT_REPLIES.labels("cache").inc()
+            return {"reply": cached["reply"], "source": "cache",
+                    "cache": {"query": cached["query"], "similarity": cached["similarity"],
+                              "cached_at": datetime.fromtimestamp(cached["cached_at"]).isoformat(timespec="seconds")}}
+
+    rag_context_ok = False
+    retrieved_docs_texts, retrieved_distances = [], None
     if rag_collection and ollama_embed_ef:
-        print(f"Retrieving RAG context for Zone: {zone_name} based on message: '{user_message[:50]}...'")
+        logger.info(f"Retrieving RAG context for Zone: {zone_name} based on message: '{user_message[:50]}...'")
         try:
-            message_embedding = ollama_embed_ef([user_message])[0]
-            results = rag_collection.query(
-                query_embeddings=[message_embedding],
-                n_results=3,
-                where={"zone": zone_name} 
-            )
-            retrieved_docs_texts = results.get('documents', [[]])[0]
+            if message_embedding is None:
+                message_embedding = ollama_embed_ef([user_message])[0]
+            with span("chroma_query", CHROMA_QUERY_SECONDS):
+                # Zone filter plus the period the message names ("yesterday", ...), applied before similarity ranking
+                retrieved = query_readings(rag_collection, message_embedding, zone_name, user_message, RAG_CANDIDATES,
+                                           time_filter=RAG_TIME_FILTER)
+            retrieved_docs_texts, retrieved_distances = retrieved["documents"], retrieved["distances"]
+            time_window = retrieved["window"]
+            rag_context_ok = True
+            context_str = None # prompt_builder picks the documents, or its own "nothing found" line
             if retrieved_docs_texts:
-                context_str = "\n--- Context --- \n".join(retrieved_docs_texts) 
-                print(f"Retrieved {len(retrieved_docs_texts)} documents from RAG.")
+                logger.info(f"Retrieved {len(retrieved_docs_texts)} documents from RAG.")
+            elif time_window is not None:
+                context_str = f"No stored readings for Zone {zone_name} {time_window[2]} ({time_window[0]:%Y-%m-%d %H:%M} to {time_window[1]:%Y-%m-%d %H:%M})."
+                logger.info(f"No documents found in RAG for zone {zone_name} {time_window[2]}.")
             else:
-                context_str = "No relevant historical data found for this query in the specified zone."
-                print("No documents found in RAG for the current query and zone.")
+                logger.info("No documents found in RAG for the current query and zone.")
         except Exception as e_rag:
-            print(f"Error during RAG retrieval: {e_rag}")
+            logger.error(f"Error during RAG retrieval: {e_rag}")
             context_str = "Error retrieving RAG context."
     
-    history = load_conversation_history(thread_id)
+    stored_summary = load_conversation_summary(thread_id)
+    covered = min(stored_summary["covered"], len(history))
+    with span("prompt_build"):
+        # Turns already folded into the summary are not repeated verbatim.
+        chat_prompt = build_chat_prompt(zone_name, user_message, history[covered:], retrieved_docs_texts,
+                                        retrieved_distances, stored_summary["summary"], context_note=context_str,
+                                        zone_summary=zone_summary)
+    for section, tokens in chat_prompt.sections.items():
+        PROMPT_TOKENS.labels(section).observe(tokens)
+    PROMPT_TOKENS.labels("total").observe(chat_prompt.tokens)
+
+    logger.info(f"\n--- Constructed Prompt for Ollama ({OLLAMA_LLM_MODEL}) ---")
+    logger.info(f"Prompt ~{chat_prompt.tokens} tokens {chat_prompt.sections}; left out "
+                f"{chat_prompt.dropped_documents} documents and {chat_prompt.first_turn} unsummarized turns.")
+    logger.info("--- End of Prompt ---")
+
+    generation_start = time.perf_counter()
+    ai_response_text, decision, tier = generate_text_routed(chat_prompt.text, "chat", user_message=user_message,
+                                                            on_token=on_token)
+    generation_seconds = time.perf_counter() - generation_start
+    logger.info(f"Chat routed to the {decision.tier} model ({decision.reason}); reply from the {tier} model.")
+    
+    logger.info(f"AI Raw Response (first 100 chars): {ai_response_text[:100]}...")
+
     history.append({"role": "user", "content": user_message})
+    history.append({"role": "assistant", "content": ai_response_text})
+    save_conversation_history(thread_id, history)
 
-    formatted_history = ""
-    for entry in history[-5:]: 
-        role = entry.get('role', 'Unknown')
-        content = entry.get('content', '')
-        formatted_history += f"{role.capitalize()}: {content}\n"
+    if chat_prompt.first_turn >= SUMMARY_MIN_NEW_MESSAGES:
+        # Turns that no longer fit verbatim are folded into the summary for the next message.
+        threading.Thread(target=update_conversation_summary, args=(thread_id, covered + chat_prompt.first_turn),
+                         name="conversation-summary", daemon=True).start()
 
-    prompt = f"""You are assisting with Zone: {zone_name}.
+    # Only replies generated with working retrieval are reused; errors and degraded answers are not.
+    if (cache_watermark is not None and rag_context_ok
+            and not ai_response_text.startswith(("Error", "An unexpected error"))):
+        CHAT_CACHE.store(zone_name, message_embedding, cache_watermark, _reply_version(),
+                         user_message, ai_response_text, generation_seconds)
 
-Retrieved context from historical data for Zone {zone_name}:
-{context_str}
+    CHAT_REPLIES.labels("llm").inc()
+    return {"reply": ai_response_text, "source": "llm", "model": MODEL_TIERS[tier]}
 
-Conversation History (last few messages):
-{formatted_history}
-User: {user_message}
-Assistant:"""
+def generate_structured(prompt: str, schema, options: dict = None, model: str = OLLAMA_LLM_MODEL, timeout: int = 60) -> dict:
+    """
+    Run a schema-constrained Ollama generation and return the first complete JSON object.
 
-    print(f"\n--- Constructed Prompt for Ollama ({OLLAMA_LLM_MODEL}) ---")
-    print(f"Prompt context length: ~{len(context_str)} chars, History length: ~{len(formatted_history)} chars.")
-    print("--- End of Prompt ---")
+    The request uses Ollama's `format` parameter (a JSON schema, or "json") so the model
+    can only emit JSON, and streams the response through an IncrementalJSONObjectParser.
+    As soon as the top-level object closes, the stream is closed, which stops generation
+    instead of waiting for trailing tokens.
 
-    ai_response_text = "Error: Could not get a response from Ollama."
+    Returns a dictionary with:
+      - "parsed": the decoded object, or None if the stream never produced a valid one
+      - "raw": the raw text received (useful for local repair)
+      - "early_stop": True if the stream was cut off once the object closed
+      - "error": an error message if the request itself failed, else None
+    """
+    parser = IncrementalJSONObjectParser()
+    raw_chunks = []
+    result = {"parsed": None, "raw": "", "early_stop": False, "error": None}
+    ollama_payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "format": schema,
+        "options": options or {"temperature": 0.7, "top_k": 50},
+    }
+    request_start = time.perf_counter()
+    first_token_at = None
     try:
-        print(f"Sending prompt to Ollama model: {OLLAMA_LLM_MODEL}...")
-        ollama_payload = {
-            "model": OLLAMA_LLM_MODEL,
-            "prompt": prompt,
-            "stream": False,
-            "options": { 
-                "temperature": 0.7, 
-                "top_k": 50 
-            }
-        }
-        response = requests.post(OLLAMA_API_URL, json=ollama_payload, timeout=60) 
-        response.raise_for_status() 
-        
-        response_json = response.json()
-        ai_response_text = response_json.get("response", "Error: No 'response' key in Ollama output.").strip()
-        
+        with ollama_client.post("generate", ollama_payload, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    result["error"] = f"Ollama error during generation: {chunk['error']}"
+                    break
+                token = chunk.get("response", "")
+                raw_chunks.append(token)
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                if parser.feed(token) and not chunk.get("done"):
+                    # Closing the stream means Ollama never sends its final stats chunk, so record
+                    # what the client saw instead: wall-clock total, and streamed tokens as eval.
+                    result["early_stop"] = True
+                    stopped_at = time.perf_counter()
+                    partial = {"total_duration": (stopped_at - request_start) * 1e9,
+                               "eval_duration": (stopped_at - first_token_at) * 1e9, "eval_count": len(raw_chunks)}
+                    record_ollama_stats(partial)
+                    record_ollama_phases(partial)
+                    break
+                if chunk.get("done"):
+                    record_ollama_stats(chunk)
+                    record_ollama_phases(chunk)
+                    break
     except requests.exceptions.ConnectionError as e:
-        ai_response_text = f"Error: Could not connect to Ollama at {OLLAMA_API_URL}. Is Ollama running? ({e})"
-        print(ai_response_text) 
+        result["error"] = f"Error: Could not connect to Ollama at {OLLAMA_API_URL}. Is Ollama running? ({e})"
     except requests.exceptions.HTTPError as e:
-        error_detail = e.response.text
-        try:
-            error_json = e.response.json()
-            error_detail = error_json.get('error', error_detail) 
-            if "model not found" in error_detail.lower() or (e.response.status_code == 404 and "no such file" in error_detail.lower()): 
-                 ai_response_text = f"Error: Ollama LLM model '{OLLAMA_LLM_MODEL}' not found. Please ensure it is created/pulled. (Details: {error_detail})"
-            else:
-                ai_response_text = f"Error: HTTP error from Ollama: {e.response.status_code} (Details: {error_detail})"
-        except json.JSONDecodeError: 
-            ai_response_text = f"Error: HTTP error from Ollama: {e.response.status_code}. Could not decode error response. (Raw response: {error_detail})"
-        print(ai_response_text) 
+        result["error"] = f"Error: HTTP error from Ollama: {e.response.status_code} (Details: {e.response.text})"
     except requests.exceptions.Timeout:
-        ai_response_text = f"Error: Timeout connecting to Ollama at {OLLAMA_API_URL} for generation."
-        print(ai_response_text) 
-    except Exception as e: 
-        ai_response_text = f"An unexpected error occurred while communicating with Ollama: {e}"
-        print(ai_response_text) 
-    
-    print(f"AI Raw Response (first 100 chars): {ai_response_text[:100]}...")
+        result["error"] = f"Error: Timeout connecting to Ollama at {OLLAMA_API_URL} for generation."
+    except json.JSONDecodeError as e:
+        result["error"] = f"Error: Could not decode streamed Ollama output: {e}"
+    except Exception as e:
+        result["error"] = f"An unexpected error occurred while communicating with Ollama: {e}"
 
-    history.append({"role": "assistant", "content": ai_response_text})
-    save_conversation_history(thread_id, history)
-
-    return ai_response_text
+    request_seconds = time.perf_counter() - request_start
+    OLLAMA_REQUEST_SECONDS.labels("structured").observe(request_seconds)
+    add_span("ollama", request_seconds)
+    result["raw"] = "".join(raw_chunks)
+    result["parsed"] = parser.result
+    if result["error"]:
+        OLLAMA_ERRORS.labels("structured").inc()
+        logger.error(result["error"])
+    return result
 
 if __name__ == "__main__":
     print("Starting AI Model script (Ollama & RAG integration)...")
@@ -0,0 +1,434 @@
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import numpy as np
+
+METRICS = ("temperature", "humidity", "CO2")
+METRIC_UNITS = {"temperature": "°F", "humidity": "%", "CO2": " ppm"}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# --- Analytics Configuration ---
+SLOPE_WINDOW_SECONDS = 3600          # Rolling slope over the most recent hour
+FORECAST_FIT_SECONDS = 6 * 3600      # Linear fit window used for short-horizon forecasts
+FORECAST_HORIZONS_SECONDS = (3600, 6 * 3600)
+EWMA_SPANS_SECONDS = {"ewma_1h": 3600, "ewma_24h": 24 * 3600}
+RECENT_SECONDS = 24 * 3600           # Window for counting recent outliers
+DEVIATION_FLAG_THRESHOLD = 3.5       # Robust z-score beyond which a reading is flagged
+CORRELATION_BUCKET_SECONDS = 3600    # Correlate hourly means, not raw samples
+BASELINE_MAX_SAMPLES = 2048          # Robust baselines use an evenly strided subsample of this size
+MAD_TO_SIGMA = 1.4826                # Scales the median absolute deviation to a std-dev estimate
+
+
+class _ZoneBuffer:
+    """One zone's most recent readings as a (metrics, samples) array plus epoch seconds, appended in place."""
+
+    def __init__(self):
+        self.values = np.empty((len(METRICS), 0))
+        self.seconds = np.empty(0)
+        self.end = 0 # Columns in use; the newest reading is at end - 1
+        self.count = 0 # History readings consumed so far
+        self.last_timestamp = None
+
+    def append(self, readings: list, max_samples: int = None):
+        if max_samples:
+            readings = readings[-max_samples:]
+        if not readings:
+            return
+        added = len(readings)
+        keep = self.end if not max_samples else min(self.end, max_samples - added)
+        if self.end + added > self.values.shape[1]:
+            # Reallocate with headroom (sliding the kept tail to the front), so appends stay amortized O(new readings).
+            capacity = 2 * (keep + added)
+            values, seconds = np.empty((len(METRICS), capacity)), np.empty(capacity)
+            values[:, :keep] = self.values[:, self.end - keep:self.end]
+            seconds[:keep] = self.seconds[self.end - keep:self.end]
+            self.values, self.seconds, self.end = values, seconds, keep
+        # None becomes NaN in the float conversion.
+        self.values[:, self.end:self.end + added] = np.array(
+            [[reading.get(metric) for metric in METRICS] for reading in readings], dtype=np.float64).T
+        self.seconds[self.end:self.end + added] = np.array(
+            [reading["timestamp"] for reading in readings], dtype="datetime64[s]").astype(np.float64)
+        self.end += added
+        self.last_timestamp = readings[-1]["timestamp"]
+
+
+class MetricTensorCache:
+    """
+    Keeps every zone's packed readings between calls, so building the (metrics, zones, samples)
+    tensor only converts the readings appended since the previous build. A zone whose history
+    was replaced or trimmed (its length shrank, or the reading at the last consumed position
+    changed) is repacked from scratch. Pass one to analyze_zones on a request path.
+    """
+
+    def __init__(self, max_samples: int = None):
+        self.max_samples = max_samples
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _update(self, zone: str, history) -> _ZoneBuffer:
+        buffer = self._buffers.get(zone)
+        length = len(history)
+        if buffer is None or length < buffer.count or \
+                (buffer.count and history[buffer.count - 1]["timestamp"] != buffer.last_timestamp):
+            buffer = self._buffers[zone] = _ZoneBuffer()
+        if length > buffer.count:
+            start = buffer.count if not self.max_samples else max(buffer.count, length - self.max_samples)
+            buffer.append(history[start:], self.max_samples)
+            buffer.count = length
+        return buffer
+
+    def build(self, histories: dict, zones=None):
+        """Same result as build_metric_tensor(histories, zones, self.max_samples)."""
+        zones = [zone for zone in (zones or list(histories)) if histories.get(zone)]
+        if not zones:
+            return [], np.empty((len(METRICS), 0, 0)), np.empty(0), []
+        with self._lock:
+            buffers = [self._update(zone, histories[zone]) for zone in zones]
+            samples = min(buffer.end for buffer in buffers)
+            if self.max_samples:
+                samples = min(samples, self.max_samples)
+            values = np.empty((len(METRICS), len(zones), samples))
+            interval_seconds = np.empty(len(zones))
+            for z, buffer in enumerate(buffers):
+                values[:, z] = buffer.values[:, buffer.end - samples:buffer.end]
+                span = buffer.seconds[buffer.end - 1] - buffer.seconds[buffer.end - samples]
+                interval_seconds[z] = span / (samples - 1) if samples > 1 else 0.0
+            last_timestamps = [buffer.last_timestamp for buffer in buffers]
+        return zones, values, interval_seconds, last_timestamps
+
+
+def build_metric_tensor(histories: dict, zones=None, max_samples: int = None):
+    """
+    Packs per-zone reading lists into one (metrics, zones, samples) float array.
+
+    Every zone is trimmed to its most recent T readings, where T is the shortest zone
+    history (capped at max_samples), so all zones share one time axis. Missing values
+    become NaN. Use a MetricTensorCache to repack only new readings on repeated calls.
+
+    Returns (zones, values, interval_seconds, last_timestamps):
+      - zones: list of zone names (axis 1 of values)
+      - values: float64 array of shape (len(METRICS), len(zones), T)
+      - interval_seconds: float64 array (len(zones),) with each zone's sampling interval
+      - last_timestamps: list of each zone's newest timestamp string
+    """
+    return MetricTensorCache(max_samples).build(histories, zones)
+
+
+def _samples_for(seconds: float, interval: float, total: int) -> int:
+    if interval <= 0:
+        return total
+    return int(max(2, min(total, round(seconds / interval))))
+
+
+def _linear_fit_tail(values: np.ndarray, window: int, has_nan: bool = True):
+    """Least-squares slope (per sample) and fitted end value over the last `window` samples, batched."""
+    tail = values[..., -window:]
+    x_centered = np.arange(window, dtype=np.float64) - (window - 1) / 2.0
+    if has_nan:
+        tail_mean = np.nanmean(tail, axis=-1)
+        slope = np.nan_to_num(tail - tail_mean[..., None]) @ x_centered / np.sum(x_centered ** 2)
+    else:
+        tail_mean = tail.mean(axis=-1)
+        slope = tail @ x_centered / np.sum(x_centered ** 2)  # sum(x_centered) == 0, so the mean drops out
+    end_value = tail_mean + slope * x_centered[-1]
+    return slope, end_value
+
+
+def _median(values: np.ndarray, has_nan: bool) -> np.ndarray:
+    """Median along the last axis; uses a single partition (upper median) when there are no NaNs."""
+    if has_nan:
+        return np.nanmedian(values, axis=-1)
+    middle = values.shape[-1] // 2
+    return np.partition(values, middle, axis=-1)[..., middle]
+
+
+def _ewma_last(values: np.ndarray, span: int) -> np.ndarray:
+    """Latest EWMA value (adjusted weights) for every series via a single weighted dot product."""
+    alpha = 2.0 / (span + 1.0)
+    window = min(values.shape[-1], span * 6)  # Weights beyond ~6 spans are negligible
+    weights = (1.0 - alpha) ** np.arange(window - 1, -1, -1, dtype=np.float64)
+    tail = values[..., -window:]
+    mask = ~np.isnan(tail)
+    return (np.where(mask, tail, 0.0) @ weights) / (mask @ weights)
+
+
+def _bucket_means(values: np.ndarray, bucket: int, has_nan: bool = True) -> np.ndarray:
+    usable = (values.shape[-1] // bucket) * bucket
+    if bucket <= 1 or usable == 0:
+        return values
+    trimmed = values[..., -usable:].reshape(*values.shape[:-1], usable // bucket, bucket)
+    return np.nanmean(trimmed, axis=-1) if has_nan else trimmed.mean(axis=-1)
+
+
+def _correlation_matrices(values: np.ndarray) -> np.ndarray:
+    """Per-metric zone x zone Pearson correlation, computed for all metrics at once."""
+    centered = np.nan_to_num(values - np.nanmean(values, axis=-1, keepdims=True))
+    covariance = centered @ centered.transpose(0, 2, 1)
+    norms = np.sqrt(np.diagonal(covariance, axis1=1, axis2=2)).copy()
+    norms[norms == 0] = np.nan
+    return covariance / (norms[:, :, None] * norms[:, None, :])
+
+
+def compute_analytics(values: np.ndarray, interval_seconds: np.ndarray) -> dict:
+    """
+    Runs every analytic over the (metrics, zones, samples) tensor in one batched pass.
+
+    All zones are assumed to share a sampling interval (the median of interval_seconds is
+    used to size windows). Returns a dict of arrays, each indexed [metric, zone] unless noted:
+      latest, ewma_1h, ewma_24h, slope_per_hour (rolling, last hour), trend_per_day (whole
+      window), forecast_<N>h, baseline_median, baseline_mad, deviation_z, recent_outliers,
+      and correlation [metric, zone, zone].
+    """
+    metrics_count, zone_count, total = values.shape
+    interval = float(np.median(interval_seconds)) if zone_count else 0.0
+    per_hour = 3600.0 / interval if interval > 0 else 0.0
+    has_nan = bool(np.isnan(values).any())
+
+    result = {"latest": values[..., -1], "interval_seconds": interval, "samples": total}
+    for name, seconds in EWMA_SPANS_SECONDS.items():
+        result[name] = _ewma_last(values, _samples_for(seconds, interval, total))
+
+    slope, _ = _linear_fit_tail(values, _samples_for(SLOPE_WINDOW_SECONDS, interval, total), has_nan)
+    result["slope_per_hour"] = slope * per_hour
+
+    fit_slope, fit_end = _linear_fit_tail(values, _samples_for(FORECAST_FIT_SECONDS, interval, total), has_nan)
+    for horizon in FORECAST_HORIZONS_SECONDS:
+        steps = horizon / interval if interval > 0 else 0.0
+        result[f"forecast_{horizon // 3600}h"] = fit_end + fit_slope * steps
+
+    # Whole-window trend and cross-zone correlation both work on hourly means.
+    bucket = _samples_for(CORRELATION_BUCKET_SECONDS, interval, total) if interval > 0 else 1
+    bucketed = _bucket_means(values, bucket, has_nan)
+    bucket_has_nan = has_nan and bool(np.isnan(bucketed).any())
+    trend, _ = _linear_fit_tail(bucketed, bucketed.shape[-1], bucket_has_nan)
+    result["trend_per_day"] = trend * (24.0 / (bucket / per_hour) if per_hour else 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result["correlation"] = _correlation_matrices(bucketed)
+
+    stride = max(1, -(-total // BASELINE_MAX_SAMPLES))
+    baseline_sample = values[..., ::-stride]  # Strided from the newest sample backwards
+    median = _median(baseline_sample, has_nan)
+    mad = _median(np.abs(baseline_sample - median[..., None]), has_nan)
+    scale = np.where(mad > 0, mad * MAD_TO_SIGMA, np.nan)
+    result["baseline_median"] = median
+    result["baseline_mad"] = mad
+    result["deviation_z"] = (values[..., -1] - median) / scale
+    recent = values[..., -_samples_for(RECENT_SECONDS, interval, total):]
+    with np.errstate(invalid="ignore"):
+        result["recent_outliers"] = np.sum(np.abs(recent - median[..., None]) / scale[..., None] > DEVIATION_FLAG_THRESHOLD, axis=-1)
+    return result
+
+
+def _round(metric: str, value):
+    if value is None or not np.isfinite(value):
+        return None
+    return int(round(float(value))) if metric == "CO2" else round(float(value), 2)
+
+
+def analyze_zones(histories: dict, zones=None, max_samples: int = None, top_correlations: int = 3,
+                  tensor_cache: MetricTensorCache = None) -> dict:
+    """
+    Batched trend/forecast/baseline/correlation analytics for every zone with history.
+    With a tensor_cache (whose max_samples then applies), only readings added since its last
+    build are packed.
+
+    Returns a compact, JSON-serializable summary:
+      {"zones": {zone: {"last_timestamp": str, metric: {...}, "flags": [str]}},
+       "correlations": {metric: [[zone_a, zone_b, r], ...]}, "compute_ms": float}
+    """
+    if tensor_cache is not None:
+        zones, values, interval_seconds, last_timestamps = tensor_cache.build(histories, zones=zones)
+    else:
+        zones, values, interval_seconds, last_timestamps = build_metric_tensor(histories, zones=zones, max_samples=max_samples)
+    if not zones:
+        return {"zones": {}, "correlations": {}, "compute_ms": 0.0}
+
+    start = time.perf_counter()
+    analytics = compute_analytics(values, interval_seconds)
+    compute_ms = (time.perf_counter() - start) * 1000
+
+    forecast_keys = [f"forecast_{horizon // 3600}h" for horizon in FORECAST_HORIZONS_SECONDS]
+    per_metric_keys = ["latest", *EWMA_SPANS_SECONDS, "slope_per_hour", "trend_per_day", *forecast_keys,
+                       "baseline_median", "deviation_z"]
+    summary = {"zones": {}, "correlations": {}, "compute_ms": round(compute_ms, 3)}
+    for z, zone in enumerate(zones):
+        zone_summary = {"last_timestamp": last_timestamps[z], "flags": []}
+        for m, metric in enumerate(METRICS):
+            metric_summary = {key: _round(metric, analytics[key][m, z]) for key in per_metric_keys}
+            metric_summary["deviation_z"] = _round("z", analytics["deviation_z"][m, z])
+            metric_summary["recent_outliers"] = int(analytics["recent_outliers"][m, z])
+            zone_summary[metric] = metric_summary
+
+            deviation = metric_summary["deviation_z"]
+            unit = METRIC_UNITS[metric]
+            if deviation is not None and abs(deviation) > DEVIATION_FLAG_THRESHOLD:
+                direction = "above" if deviation > 0 else "below"
+                zone_summary["flags"].append(
+                    f"{metric} now {metric_summary['latest']}{unit} is {abs(deviation):.1f} robust SDs {direction} "
+                    f"the zone baseline ({metric_summary['baseline_median']}{unit})")
+            if metric_summary["recent_outliers"]:
+                zone_summary["flags"].append(
+                    f"{metric_summary['recent_outliers']} {metric} outlier(s) in the last 24h")
+        summary["zones"][zone] = zone_summary
+
+    if len(zones) > 1:
+        upper = np.triu_indices(len(zones), k=1)
+        for m, metric in enumerate(METRICS):
+            pair_scores = analytics["correlation"][m][upper]
+            finite = np.isfinite(pair_scores)
+            order = np.argsort(-np.abs(np.where(finite, pair_scores, 0.0)))[:top_correlations]
+            summary["correlations"][metric] = [
+                [zones[upper[0][i]], zones[upper[1][i]], round(float(pair_scores[i]), 3)]
+                for i in order if finite[i]
+            ]
+    return summary
+
+
+def format_zone_analytics(summary: dict, zone_name: str) -> str:
+    """Renders one zone's computed analytics as compact text for an LLM prompt."""
+    zone_summary = summary["zones"].get(zone_name)
+    if not zone_summary:
+        return "No computed analytics available."
+    lines = []
+    for metric in METRICS:
+        stats = zone_summary[metric]
+        unit = METRIC_UNITS[metric]
+        lines.append(
+            f"{metric}: now {stats['latest']}{unit}, 1h EWMA {stats['ewma_1h']}{unit}, 24h EWMA {stats['ewma_24h']}{unit}, "
+            f"slope {stats['slope_per_hour']}{unit}/h, trend {stats['trend_per_day']}{unit}/day, "
+            f"forecast +1h {stats['forecast_1h']}{unit} / +6h {stats['forecast_6h']}{unit}, "
+            f"baseline median {stats['baseline_median']}{unit}, deviation {stats['deviation_z']} SD"
+        )
+    flags = zone_summary["flags"]
+    lines.append("Flags: " + ("; ".join(flags) if flags else "none"))
+    related = [f"{metric} tracks {a if b == zone_name else b} (r={r})"
+               for metric, pairs in summary["correlations"].items()
+               for a, b, r in pairs if zone_name in (a, b)]
+    if related:
+        lines.append("Cross-zone: " + "; ".join(related))
+    return "\n".join(lines)
+
+
+def compute_summary(history: list):
+    """Min/max/avg of each metric over a list of readings (None where a metric has no values)."""
+    temps = [entry["temperature"] for entry in history if "temperature" in entry and entry["temperature"] is not None]
+    hums  = [entry["humidity"] for entry in history if "humidity" in entry and entry["humidity"] is not None]
+    co2s  = [entry["CO2"] for entry in history if "CO2" in entry and entry["CO2"] is not None]
+    
+    summary = {
+        "temperature": {
+            "min": min(temps) if temps else None,
+            "max": max(temps) if temps else None,
+            "avg": round(sum(temps) / len(temps), 1) if temps else None, # Adjusted to 1 decimal
+        },
+        "humidity": {
+            "min": min(hums) if hums else None,
+            "max": max(hums) if hums else None,
+            "avg": round(sum(hums) / len(hums), 1) if hums else None, # Adjusted to 1 decimal
+        },
+        "CO2": {
+            "min": min(co2s) if co2s else None,
+            "max": max(co2s) if co2s else None,
+            "avg": round(sum(co2s) / len(co2s), 0) if co2s else None, # CO2 as whole number
+        }
+    }
+    return summary
+
+
+def summarize_recent_window(zone_name: str, history, window_seconds: float = RECENT_SECONDS) -> str:
+    """
+    Compact text summary of a zone for a chat prompt: the latest reading, min/avg/max over the
+    last `window_seconds`, trend and baseline per metric, and any flags. Meant to be computed
+    once (e.g. when a zone is opened) and reused for every message instead of raw history rows.
+    `history` is the zone's chronological readings (a list or a CompressedHistory).
+    """
+    if not len(history):
+        return f"No readings available for Zone {zone_name}."
+    latest = history[-1]
+    cutoff = (datetime.strptime(latest["timestamp"], TIMESTAMP_FORMAT) - timedelta(seconds=window_seconds)).strftime(TIMESTAMP_FORMAT)
+    window = history[bisect_left(history, cutoff, key=lambda reading: reading["timestamp"]):]
+    stats = compute_summary(window)
+    zone_analytics = analyze_zones({zone_name: history}, max_samples=BASELINE_MAX_SAMPLES)["zones"].get(zone_name, {})
+
+    hours = window_seconds / 3600
+    lines = [f"Latest reading ({latest['timestamp']}): " + ", ".join(
+        f"{metric} {latest.get(metric)}{METRIC_UNITS[metric]}" for metric in METRICS)]
+    for metric in METRICS:
+        unit = METRIC_UNITS[metric]
+        line = (f"{metric} last {hours:g}h: min {stats[metric]['min']}{unit}, avg {stats[metric]['avg']}{unit}, "
+                f"max {stats[metric]['max']}{unit}")
+        if metric in zone_analytics:
+            line += (f"; trend {zone_analytics[metric]['slope_per_hour']}{unit}/h, "
+                     f"baseline median {zone_analytics[metric]['baseline_median']}{unit}")
+        lines.append(line)
+    flags = zone_analytics.get("flags")
+    lines.append("Flags: " + ("; ".join(flags) if flags else "none"))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print("--- Analytics Engine Benchmark (100 zones x 30 days @ 5 min) ---")
+    rng = np.random.default_rng(42)
+    zone_count, samples = 100, 30 * 288
+    t = np.arange(samples)
+    daily = np.sin(2 * np.pi * t / 288)
+    values = np.empty((len(METRICS), zone_count, samples))
+    values[0] = 45 + 2 * daily + rng.normal(0, 1.0, (zone_count, samples))
+    values[1] = 97 - 1 * daily + rng.normal(0, 0.8, (zone_count, samples))
+    values[2] = 470 + 20 * daily + rng.normal(0, 10, (zone_count, samples))
+    values[:, :, -1] += np.array([15, -12, 250])[:, None]  # Inject a final-sample anomaly everywhere
+    interval_seconds = np.full(zone_count, 300.0)
+
+    compute_analytics(values, interval_seconds)  # Warm-up
+    runs = 10
+    start = time.perf_counter()
+    for _ in range(runs):
+        analytics = compute_analytics(values, interval_seconds)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / runs
+    print(f"Batched pass over {zone_count} zones x {samples} samples x {len(METRICS)} metrics: {elapsed_ms:.1f} ms")
+    print(f"Zone 0 CO2 deviation z-score: {analytics['deviation_z'][2, 0]:.1f}, "
+          f"1h forecast: {analytics['forecast_1h'][2, 0]:.0f} ppm")
+
+    print("\n--- End to end: analyze_zones over stored zone histories (what /insight runs) ---")
+    import sensor_handler
+    stamps = np.datetime64("2025-01-01T00:00:00") + np.arange(samples) * np.timedelta64(300, "s")
+    timestamps = [str(stamp).replace("T", " ") for stamp in stamps]
+    histories = {}
+    for z in range(zone_count):
+        rows = values[:, z].T.tolist()
+        histories[f"Zone{z}"] = sensor_handler.new_zone_history(
+            {"timestamp": timestamp, "temperature": temperature, "humidity": humidity, "CO2": co2}
+            for timestamp, (temperature, humidity, co2) in zip(timestamps, rows))
+
+    def append_reading(tick: int):
+        timestamp = str(stamps[-1] + (tick + 1) * np.timedelta64(300, "s")).replace("T", " ")
+        for history in histories.values():
+            history.append({"timestamp": timestamp, "temperature": 45.0, "humidity": 97.0, "CO2": 470.0})
+
+    runs = 3
+    start = time.perf_counter()
+    for _ in range(runs):
+        summary = analyze_zones(histories, max_samples=samples)
+    uncached_ms = (time.perf_counter() - start) * 1000 / runs
+    print(f"Repacking every history per call: {uncached_ms:.1f} ms (compute {summary['compute_ms']:.1f} ms)")
+
+    cache = MetricTensorCache(samples)
+    start = time.perf_counter()
+    analyze_zones(histories, tensor_cache=cache)
+    first_ms = (time.perf_counter() - start) * 1000
+    runs = 10
+    start = time.perf_counter()
+    for tick in range(runs):
+        append_reading(tick)
+        summary = analyze_zones(histories, tensor_cache=cache)
+    cached_ms = (time.perf_counter() - start) * 1000 / runs
+    print(f"With a MetricTensorCache: first call {first_ms:.1f} ms, then {cached_ms:.1f} ms per call "
+          f"with one new reading per zone (compute {summary['compute_ms']:.1f} ms)")
+
+    print("\n--- Analytics on sensor_handler history ---")
+    sensor_handler.initialize_history()
+    summary = analyze_zones(sensor_handler.SENSOR_HISTORY)
+    print(f"Computed in {summary['compute_ms']} ms")
+    print(format_zone_analytics(summary, sensor_handler.ZONE_NAMES[0]))
@@ -0,0 +1,147 @@
+import threading
+import time
+from datetime import datetime
+
+METRICS = ("temperature", "humidity", "CO2")
+
+# --- Detector Configuration ---
+DEFAULT_SPAN = 120            # EWMA span in readings for the per-zone/metric baseline
+DEFAULT_THRESHOLD = 4.0       # Robust z-score at which a reading raises an alert
+CRITICAL_THRESHOLD = 8.0      # Robust z-score at which an alert is marked critical
+DEFAULT_WARMUP = 30           # Readings per zone/metric before alerts are emitted
+MEAN_ABS_DEV_TO_SIGMA = 1.2533  # sqrt(pi/2): converts mean absolute deviation to a std-dev estimate
+
+
+class StreamingAnomalyDetector:
+    """
+    O(1)-per-reading streaming anomaly detector.
+
+    For every (zone, metric) pair it keeps an EWMA of the value and an EWMA of the absolute
+    deviation from it, which together give a robust z-score for each new reading. Readings
+    beyond the threshold raise an alert and are clipped to the band edge before updating
+    the baseline, so a burst of anomalies cannot drag the band along with it.
+    """
+
+    def __init__(self, span: int = DEFAULT_SPAN, threshold: float = DEFAULT_THRESHOLD,
+                 warmup: int = DEFAULT_WARMUP, metrics=METRICS):
+        self.alpha = 2.0 / (span + 1.0)
+        self.threshold = threshold
+        self.warmup = warmup
+        self.metrics = tuple(metrics)
+        self._state = {}  # (zone, metric) -> [count, mean, mean_abs_dev]
+        self._zones = set()
+        self._lock = threading.Lock()
+        self.readings_seen = 0
+        self.alerts_raised = 0
+
+    def update(self, reading: dict) -> list:
+        """
+        Feed one reading ({"zone", "timestamp", metric: value, ...}) and return a list of
+        alert events (possibly empty), one per metric outside its band.
+        """
+        zone = reading.get("zone")
+        alerts = []
+        with self._lock:
+            self.readings_seen += 1
+            self._zones.add(zone)
+            for metric in self.metrics:
+                value = reading.get(metric)
+                if value is None:
+                    continue
+                state = self._state.get((zone, metric))
+                if state is None:
+                    self._state[(zone, metric)] = [1, float(value), 0.0]
+                    continue
+
+                count, mean, mad = state
+                scale = mad * MEAN_ABS_DEV_TO_SIGMA
+                z = (value - mean) / scale if scale > 0 else 0.0
+                warmed_up = count >= self.warmup
+                if abs(z) >= self.threshold and warmed_up:
+                    alerts.append({
+                        "type": "alert",
+                        "zone": zone,
+                        "metric": metric,
+                        "value": value,
+                        "expected": round(mean, 2),
+                        "band": [round(mean - self.threshold * scale, 2), round(mean + self.threshold * scale, 2)],
+                        "z": round(z, 2),
+                        "severity": "critical" if abs(z) >= CRITICAL_THRESHOLD else "warning",
+                        "timestamp": reading.get("timestamp"),
+                    })
+                if warmed_up and abs(z) > self.threshold:
+                    # Clip to the band edge so outliers don't drag the baseline with them.
+                    value = mean + (self.threshold if z > 0 else -self.threshold) * scale
+                # Plain running averages until there are ~1/alpha readings, then EWMA.
+                alpha = max(self.alpha, 1.0 / (count + 1))
+                deviation = value - mean
+                state[0] = count + 1
+                state[1] = mean + alpha * deviation
+                state[2] = mad + alpha * (abs(deviation) - mad)
+            self.alerts_raised += len(alerts)
+        return alerts
+
+    def update_many(self, readings) -> list:
+        """Feed a batch of readings (e.g. one tick across all zones) and return all alerts raised."""
+        alerts = []
+        for reading in readings:
+            alerts.extend(self.update(reading))
+        return alerts
+
+    def prime(self, history) -> None:
+        """Warm the baselines from existing history without emitting alerts."""
+        for reading in history:
+            self.update(reading)
+        with self._lock:
+            self.alerts_raised = 0
+
+    def knows_zone(self, zone: str) -> bool:
+        """True once at least one reading for the zone has been seen (or primed)."""
+        return zone in self._zones
+
+    def snapshot(self) -> dict:
+        """Current baselines per zone and metric: {"zone": {"metric": {"mean", "scale", "count"}}}."""
+        with self._lock:
+            result = {}
+            for (zone, metric), (count, mean, mad) in self._state.items():
+                result.setdefault(zone, {})[metric] = {
+                    "mean": round(mean, 3), "scale": round(mad * MEAN_ABS_DEV_TO_SIGMA, 3), "count": count,
+                }
+            return result
+
+
+if __name__ == "__main__":
+    import random
+    from datetime import timedelta
+    from sensor_handler import ZONE_NAMES, generate_pseudo_sensor_data, get_zone_ranges
+
+    random.seed(7)
+    print("--- Streaming Anomaly Detector Benchmark ---")
+    readings_per_zone = 20000
+    start_time = datetime(2025, 1, 1)
+    stream = [
+        generate_pseudo_sensor_data(base_time=start_time + timedelta(minutes=5 * i), zone_name=zone)
+        for i in range(readings_per_zone) for zone in ZONE_NAMES
+    ]
+
+    detector = StreamingAnomalyDetector()
+    start = time.perf_counter()
+    flagged = set()
+    for index, reading in enumerate(stream):
+        if detector.update(reading):
+            flagged.add(index)
+    elapsed = time.perf_counter() - start
+    print(f"Processed {len(stream)} readings across {len(ZONE_NAMES)} zones in {elapsed:.2f}s "
+          f"({len(stream) / elapsed:,.0f} readings/s, {elapsed / len(stream) * 1e6:.2f} µs/reading)")
+
+    # The generator's injected anomalies are always warmer than the zone's normal maximum.
+    temperature_max = {zone: get_zone_ranges(zone)["temperature"][1] for zone in ZONE_NAMES}
+    warmup_readings = DEFAULT_WARMUP * len(ZONE_NAMES)
+    injected = {index for index, reading in enumerate(stream)
+                if index >= warmup_readings and reading["temperature"] > temperature_max[reading["zone"]]}
+    flagged = {index for index in flagged if index >= warmup_readings}
+    true_positives = len(injected & flagged)
+    precision = true_positives / len(flagged) if flagged else 0.0
+    recall = true_positives / len(injected) if injected else 0.0
+    print(f"Injected anomalies: {len(injected)}, flagged readings: {len(flagged)}")
+    print(f"Precision: {precision:.3f}, Recall: {recall:.3f}")
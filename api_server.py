@@ -1,25 +1,49 @@
 import asyncio
 import json
+import os
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 import uvicorn
 import websockets # For relaying
+from log_utils import get_logger
+from zone_registry import ZONE_REGISTRY
+
+logger = get_logger("api_server")
 
 # Attempt to import project-specific modules
 try:
+    import sensor_handler
     from sensor_handler import read_sensor_data, ZONE_NAMES
-    from ai_model import start_conversation as start_ai_conversation, send_message as send_ai_message
-    from insight_bot import get_insight
+    from ai_model import start_conversation as start_ai_conversation, send_message_with_details, get_chat_cache_stats
+    from ai_model import cancel_prefetch, get_prefetch_stats, prefetch_zone, CONVERSATION_HISTORY_DIR
+    from insight_bot import get_insight, get_insight_metrics
     MODULES_LOADED = True
 except ImportError as e:
-    print(f"Warning: Failed to import one or more project modules: {e}. API might not function fully.")
+    logger.warning(f"Warning: Failed to import one or more project modules: {e}. API might not function fully.")
     MODULES_LOADED = False
     # Define fallbacks if modules are not loaded, to allow server to start
     ZONE_NAMES = ["DefaultZoneOnError"] 
     def read_sensor_data(zone_name): return ({"error": "sensor_handler not loaded"}, [])
     def start_ai_conversation(): return "dummy_thread_id_error"
-    def send_ai_message(thread_id, msg, zone): return "AI model not loaded"
+    def send_message_with_details(thread_id, msg, zone): return {"reply": "AI model not loaded", "source": "error"}
+    def get_chat_cache_stats(): return {"enabled": False}
+    def prefetch_zone(zone_name, client=None, thread_id=None): return {"status": "disabled"}
+    def cancel_prefetch(client=None, zone_name=None): return 0
+    def get_prefetch_stats(): return {"enabled": False}
+    CONVERSATION_HISTORY_DIR = "conversation_history"
     def get_insight(zone): return {"error": "insight_bot not loaded"}
+    def get_insight_metrics(): return {"error": "insight_bot not loaded"}
+
+from anomaly_detector import StreamingAnomalyDetector
+from event_hub import EventHub, format_sse
+from shared_history import SHARED_HISTORY_ENV, SharedHistoryReader
+from metrics import (CACHE_REQUESTS, CONTENT_TYPE as METRICS_CONTENT_TYPE, EVENT_QUEUE_DEPTH, EVENT_SUBSCRIBERS,
+                     EVENTS_DROPPED, JSON_SERIALIZE_SECONDS, WS_CLIENTS, WS_MESSAGES, render_metrics)
+from model_router import get_routing_stats
+from bulk_import import SENSOR_IMPORT_ENV, import_exports, print_report as print_import_report
+from tracing import PROFILES, current_trace, end_trace, span, start_profiler, start_trace, store_profile
+import memory_debug
 
 
 app = FastAPI()
@@ -32,7 +56,106 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-PSEUDO_SERVER_URI = "ws://localhost:8765"
+PSEUDO_SERVER_URI = os.environ.get("MUSHROOM_SENSOR_FEED_URI", "ws://localhost:8765")
+SSE_KEEPALIVE_SECONDS = 15 # Comment frame sent on idle SSE streams so proxies keep them open
+TRACED_PATHS = ("/chat", "/run_insight", "/history") # Answered with a Server-Timing stage breakdown
+
+# --- Request Tracing ---
+# Traced requests get `Server-Timing` and `X-Trace-Id` headers. With MUSHROOM_PROFILING=1,
+# `?profile=sample|cprofile` (or an `X-Profile` header) also profiles that one request;
+# the report is kept in memory and served at GET /profiles/{trace_id}.
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if request.url.path not in TRACED_PATHS:
+        return await call_next(request)
+    trace, token = start_trace(f"{request.method} {request.url.path}")
+    profiler = start_profiler(trace, request.query_params.get("profile") or request.headers.get("x-profile"))
+    try:
+        response = await call_next(request)
+    finally:
+        end_trace(token)
+        if profiler is not None:
+            store_profile(trace, profiler.stop())
+    response.headers["Server-Timing"] = trace.server_timing()
+    response.headers["X-Trace-Id"] = trace.trace_id
+    return response
+
+# --- Server Push ---
+# Alerts and insight results are pushed to every connected /ws client and /events SSE stream
+# as typed events ({"type": "alerts"|"insight", ...}) the moment they are produced, so
+# dashboards never need to poll.
+EVENT_HUB = EventHub()
+memory_debug.start_from_env()
+MEMORY_TRACKER = memory_debug.MemoryTracker()
+ANOMALY_DETECTOR = StreamingAnomalyDetector()
+LATEST_INSIGHTS = {} # zone_name -> most recent successful insight, served by GET /insight
+INSIGHT_TASKS = {} # zone_name -> in-flight insight generation, shared by concurrent requests
+SHARED_HISTORY_POLL_SECONDS = 1.0 # How often a worker checks the shared segment for readings to run listeners on
+SHARED_HISTORY_WATCHER = [] # The watcher task (kept referenced so it is not garbage collected)
+
+# Fan-out gauges are read from the hub when /metrics is scraped, so they cost nothing per event.
+EVENT_SUBSCRIBERS.set_function(lambda: len(EVENT_HUB.subscribers))
+EVENT_QUEUE_DEPTH.set_function(lambda: EVENT_HUB.stats()["queued"])
+EVENTS_DROPPED.set_function(lambda: EVENT_HUB.dropped)
+
+def _on_new_reading(reading: dict):
+    zone_name = reading.get("zone")
+    if not ANOMALY_DETECTOR.knows_zone(zone_name):
+        # Warm the zone's baseline from its stored history (readings before this one; the
+        # shared segment may already hold it and newer ones).
+        history = sensor_handler.get_zone_history(zone_name)
+        ANOMALY_DETECTOR.prime(earlier for earlier in history if earlier["timestamp"] < reading["timestamp"])
+    alerts = ANOMALY_DETECTOR.update(reading)
+    if alerts:
+        logger.info(f"Anomaly detector raised {len(alerts)} alert(s) for zone {zone_name}.")
+        EVENT_HUB.publish({"type": "alerts", "alerts": alerts})
+
+async def _watch_shared_history(reader, seen: dict, interval: float = SHARED_HISTORY_POLL_SECONDS):
+    """
+    Multi-worker mode: readings are appended by the shared_history.py writer, so read_sensor_data
+    never sees them arrive. Each worker follows the segment's per-zone totals (`seen`, taken when
+    the worker starts) and runs the reading listeners (anomaly detection -> alerts on this
+    worker's /ws and /events) on what is new.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for zone_name in reader.zones:
+            readings, seen[zone_name] = reader.records_since(zone_name, seen[zone_name])
+            for reading in readings:
+                sensor_handler.notify_reading_listeners(reading)
+
+if MODULES_LOADED:
+    sensor_handler.add_reading_listener(_on_new_reading)
+    shared_history_name = os.environ.get(SHARED_HISTORY_ENV)
+    if shared_history_name:
+        # Multi-worker mode: a shared_history.py writer process owns ingestion.
+        sensor_handler.attach_shared_history(SharedHistoryReader(shared_history_name))
+        logger.info(f"Serving sensor history from shared memory segment '{shared_history_name}'; "
+                    f"anomaly alerts follow its new readings every {SHARED_HISTORY_POLL_SECONDS}s.")
+    elif os.environ.get(SENSOR_IMPORT_ENV):
+        # Serve real history: load exports (os.pathsep-separated) before the first request.
+        print_import_report(import_exports(os.environ[SENSOR_IMPORT_ENV].split(os.pathsep)))
+
+def _handle_ws_client_message(text: str, client_id: str):
+    """
+    Client-to-server /ws messages: {"type": "prefetch", "zone_name": ..., "thread_id": ...} when the
+    dashboard opens a zone, {"type": "prefetch_cancel"} to stop it. Returns the JSON reply or None.
+    """
+    try:
+        message = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(message, dict):
+        return None
+    if message.get("type") == "prefetch":
+        zone_name = message.get("zone_name")
+        if zone_name not in ZONE_REGISTRY:
+            return json.dumps({"type": "prefetch", "error": ZONE_REGISTRY.unknown_zone_message(str(zone_name))})
+        result = prefetch_zone(zone_name, client=client_id, thread_id=message.get("thread_id"))
+        return json.dumps({"type": "prefetch", "zone_name": zone_name, **result})
+    if message.get("type") == "prefetch_cancel":
+        return json.dumps({"type": "prefetch_cancel", "cancelled": cancel_prefetch(client=client_id)})
+    return None
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -40,85 +163,100 @@ async def websocket_endpoint(websocket: WebSocket):
     client_host = websocket.client.host if websocket.client else "Unknown"
     client_port = websocket.client.port if websocket.client else "N/A"
     client_id = f"{client_host}:{client_port}"
-    print(f"Client {client_id} connected to /ws relay.")
+    logger.info(f"Client {client_id} connected to /ws relay.")
+    WS_CLIENTS.inc()
+    event_queue = EVENT_HUB.subscribe()
     
     upstream_websocket = None # Define to ensure it's available in finally block
     try:
         async with websockets.connect(PSEUDO_SERVER_URI) as ws_upstream:
             upstream_websocket = ws_upstream # Assign to outer scope variable for finally block
-            print(f"Successfully connected to upstream pseudo_sensor_server at {PSEUDO_SERVER_URI} for client {client_id}")
+            logger.info(f"Successfully connected to upstream pseudo_sensor_server at {PSEUDO_SERVER_URI} for client {client_id}")
+            upstream_task = client_task = event_task = None
             try:
                 while True:
-                    # Listen to both websockets concurrently
-                    upstream_task = asyncio.create_task(upstream_websocket.recv())
-                    client_task = asyncio.create_task(websocket.receive_text()) # Check for client disconnects/messages
+                    # Listen to both websockets and the event hub concurrently. Only the receives that
+                    # finished are re-armed: cancelling a pending one could drop a message it already took.
+                    if upstream_task is None:
+                        upstream_task = asyncio.create_task(upstream_websocket.recv())
+                    if client_task is None:
+                        client_task = asyncio.create_task(websocket.receive_text()) # Check for client disconnects/messages
+                    if event_task is None:
+                        event_task = asyncio.create_task(event_queue.get()) # Alerts/insights pushed by this process
 
-                    done, pending = await asyncio.wait(
-                        [upstream_task, client_task],
+                    done, _ = await asyncio.wait(
+                        [upstream_task, client_task, event_task],
                         return_when=asyncio.FIRST_COMPLETED
                     )
 
+                    if event_task in done:
+                        finished, event_task = event_task, None
+                        await websocket.send_text(finished.result())
+                        WS_MESSAGES.labels("event").inc()
+
                     if client_task in done:
+                        finished, client_task = client_task, None
                         try:
-                            client_message = client_task.result()
-                            # Optional: Process client_message if your protocol defines client-to-server messages for /ws
-                            # print(f"Received from client {client_id}: {client_message}")
+                            reply = _handle_ws_client_message(finished.result(), client_id)
+                            if reply is not None:
+                                await websocket.send_text(reply)
                         except WebSocketDisconnect:
-                            print(f"Client {client_id} disconnected (handled by client_task).")
-                            for task in pending: task.cancel() # Cancel pending upstream recv
+                            logger.info(f"Client {client_id} disconnected (handled by client_task).")
                             break 
                         except Exception as e_client_recv:
-                            print(f"Error receiving from client {client_id}: {e_client_recv}")
-                            for task in pending: task.cancel()
+                            logger.error(f"Error receiving from client {client_id}: {e_client_recv}")
                             break
 
                     if upstream_task in done:
+                        finished, upstream_task = upstream_task, None
                         try:
-                            message = upstream_task.result()
+                            message = finished.result()
                             await websocket.send_text(message)
+                            WS_MESSAGES.labels("sensor").inc()
                         except websockets.exceptions.ConnectionClosed:
-                            print(f"Upstream pseudo_sensor_server connection closed for client {client_id}.")
+                            logger.info(f"Upstream pseudo_sensor_server connection closed for client {client_id}.")
                             await websocket.send_text(json.dumps({"error": "Live sensor data feed disconnected."}))
-                            for task in pending: task.cancel() # Cancel pending client recv
                             break 
                         except Exception as e_upstream_recv:
-                            print(f"Error from upstream or sending to client {client_id}: {e_upstream_recv}")
+                            logger.error(f"Error from upstream or sending to client {client_id}: {e_upstream_recv}")
                             await websocket.send_text(json.dumps({"error": f"Error in data relay: {str(e_upstream_recv)}"}))
-                            for task in pending: task.cancel()
                             break
-                    
-                    # Ensure all pending tasks are cancelled if one completed, to restart loop cleanly
-                    for task in pending:
-                        task.cancel()
 
             except WebSocketDisconnect: 
-                print(f"Client {client_id} disconnected (WebSocketDisconnect exception).")
+                logger.info(f"Client {client_id} disconnected (WebSocketDisconnect exception).")
             except websockets.exceptions.ConnectionClosed as e: 
-                print(f"Upstream pseudo_sensor_server connection closed unexpectedly for client {client_id}: {e}")
+                logger.warning(f"Upstream pseudo_sensor_server connection closed unexpectedly for client {client_id}: {e}")
                 try:
                     await websocket.send_text(json.dumps({"error": "Live sensor data feed connection lost."}))
                 except: pass 
             except Exception as e_loop:
-                print(f"Error in relay loop for client {client_id}: {e_loop}")
+                logger.error(f"Error in relay loop for client {client_id}: {e_loop}")
                 try:
                     await websocket.send_text(json.dumps({"error": f"Error in live data feed: {str(e_loop)}"}))
                 except: pass
+            finally:
+                for task in (upstream_task, client_task, event_task):
+                    if task is not None:
+                        task.cancel() # Only on disconnect/teardown: nothing is waiting for these any more
 
     except (websockets.exceptions.ConnectionClosedOSError, ConnectionRefusedError) as e: 
-        print(f"Could not connect to upstream pseudo_sensor_server at {PSEUDO_SERVER_URI} for client {client_id}: {e}. Is it running?")
+        logger.error(f"Could not connect to upstream pseudo_sensor_server at {PSEUDO_SERVER_URI} for client {client_id}: {e}. Is it running?")
         try:
             await websocket.send_text(json.dumps({"error": "Cannot connect to live sensor data feed. Upstream server offline."}))
         except: pass
     except Exception as e_connect:
-        print(f"Overall error in /ws endpoint for client {client_id} during connection phase: {e_connect}")
+        logger.error(f"Overall error in /ws endpoint for client {client_id} during connection phase: {e_connect}")
         try:
             await websocket.send_text(json.dumps({"error": f"A server error occurred in the live data feed setup: {str(e_connect)}"}))
         except: pass
     finally:
-        print(f"Client {client_id} session ended for /ws relay.")
+        cancel_prefetch(client=client_id) # The dashboard is gone; its zone warm-up is no longer useful
+        EVENT_HUB.unsubscribe(event_queue)
+        WS_CLIENTS.dec()
+        logger.info(f"Client {client_id} session ended for /ws relay.")
         if upstream_websocket and not upstream_websocket.closed:
             await upstream_websocket.close()
-            print(f"Closed connection to upstream for client {client_id}")
+            logger.info(f"Closed connection to upstream for client {client_id}")
         # FastAPI typically handles closing the `websocket` (client-facing) connection.
 
 
@@ -132,61 +270,201 @@ async def chat_endpoint(request: Request):
     user_message = payload.get("message")
     thread_id = payload.get("thread_id")
     zone_name = payload.get("zone_name") 
+    include_timing = bool(payload.get("timing")) # Adds the stage breakdown to the response body
 
     if not user_message:
         raise HTTPException(status_code=422, detail="Message ('message') is required in the JSON body.")
     if not zone_name:
         raise HTTPException(status_code=422, detail="Zone name ('zone_name') is required in the JSON body.")
-    if zone_name not in ZONE_NAMES: # Make sure ZONE_NAMES is available in this scope
-        raise HTTPException(status_code=422, detail=f"Invalid zone_name: '{zone_name}'. Must be one of {ZONE_NAMES}.")
+    if zone_name not in ZONE_REGISTRY: # O(1) lookup, however many zones zones.json defines
+        raise HTTPException(status_code=422, detail=ZONE_REGISTRY.unknown_zone_message(zone_name))
 
     if not thread_id:
         thread_id = start_ai_conversation() 
+    cancel_prefetch(zone_name=zone_name) # Remaining warm-up steps would only compete with this request
 
     try:
-        ai_reply = send_ai_message(thread_id, user_message, zone_name)
-        return {"thread_id": thread_id, "reply": ai_reply, "zone_name": zone_name}
+        with span("chat"):
+            ai_result = send_message_with_details(thread_id, user_message, zone_name)
+        result = {"thread_id": thread_id, "reply": ai_result["reply"], "zone_name": zone_name, "source": ai_result["source"]}
+        if "cache" in ai_result: # Served from the semantic cache: which earlier question it matched
+            result["cache"] = ai_result["cache"]
+        if "model" in ai_result: # Model tier that wrote an LLM reply (see model_router.py)
+            result["model"] = ai_result["model"]
+        if include_timing and current_trace() is not None:
+            result["timing"] = current_trace().summary()
+        return result
     except Exception as e:
-        print(f"Error in /chat calling send_ai_message: {e}")
+        logger.error(f"Error in /chat calling send_message_with_details: {e}")
         raise HTTPException(status_code=500, detail=f"AI interaction failed: {str(e)}")
 
 
 @app.get("/history")
 async def get_history(zone_name: str): 
-    if zone_name not in ZONE_NAMES:
-        raise HTTPException(status_code=404, detail=f"Invalid zone_name: '{zone_name}'. Must be one of {ZONE_NAMES}.")
+    if zone_name not in ZONE_REGISTRY:
+        raise HTTPException(status_code=404, detail=ZONE_REGISTRY.unknown_zone_message(zone_name))
     try:
-        latest_data, history_data = read_sensor_data(zone_name=zone_name)
-        return {"latest": latest_data, "history": history_data}
+        with span("sensor_read"):
+            latest_data, history_data = read_sensor_data(zone_name=zone_name)
+        with span("serialize", JSON_SERIALIZE_SECONDS.labels("history")):
+            body = json.dumps({"latest": latest_data, "history": list(history_data)})
+        return Response(content=body, media_type="application/json")
     except ValueError as e: 
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Unexpected error in /history for zone {zone_name}: {e}")
+        logger.error(f"Unexpected error in /history for zone {zone_name}: {e}")
         raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
 
+def _get_insight_traced(zone_name: str):
+    with span("insight"):
+        return get_insight(zone_name)
+
+async def _generate_and_publish_insight(zone_name: str) -> dict:
+    # The task (and the to_thread worker) inherit the starting request's trace context.
+    new_insight = await asyncio.to_thread(_get_insight_traced, zone_name)
+    if isinstance(new_insight, dict) and not new_insight.get("error"):
+        LATEST_INSIGHTS[zone_name] = new_insight
+        EVENT_HUB.publish({"type": "insight", "zone_name": zone_name, "insight": new_insight})
+    return new_insight
+
+@app.get("/insight")
+async def insight_endpoint(zone_name: str):
+    """Returns the most recent insight for a zone without generating a new one."""
+    if zone_name not in ZONE_REGISTRY:
+        raise HTTPException(status_code=404, detail=ZONE_REGISTRY.unknown_zone_message(zone_name))
+    insight = LATEST_INSIGHTS.get(zone_name)
+    CACHE_REQUESTS.labels("latest_insight", "hit" if insight is not None else "miss").inc()
+    return {"zone_name": zone_name, "insight": insight}
+
 @app.get("/run_insight")
-async def run_insight_endpoint(zone_name: str): 
-    if zone_name not in ZONE_NAMES:
-        raise HTTPException(status_code=404, detail=f"Invalid zone_name: '{zone_name}'. Must be one of {ZONE_NAMES}.")
+async def run_insight_endpoint(zone_name: str, timing: bool = False): 
+    if zone_name not in ZONE_REGISTRY:
+        raise HTTPException(status_code=404, detail=ZONE_REGISTRY.unknown_zone_message(zone_name))
     try:
-        new_insight = await asyncio.to_thread(get_insight, zone_name)
+        # Concurrent requests for the same zone share one generation instead of each calling the LLM.
+        task = INSIGHT_TASKS.get(zone_name)
+        if task is None or task.done():
+            CACHE_REQUESTS.labels("insight_inflight", "miss").inc()
+            task = asyncio.create_task(_generate_and_publish_insight(zone_name))
+            INSIGHT_TASKS[zone_name] = task
+        else:
+            CACHE_REQUESTS.labels("insight_inflight", "hit").inc()
+        new_insight = await asyncio.shield(task)
         if isinstance(new_insight, dict) and new_insight.get("error"): 
              raise HTTPException(status_code=500, detail=new_insight.get("error"))
-        return {"zone_name": zone_name, "insight": new_insight}
+        result = {"zone_name": zone_name, "insight": new_insight}
+        if timing and current_trace() is not None:
+            # Requests that joined an in-flight generation only see their own wait, not its stages.
+            result["timing"] = current_trace().summary()
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in /run_insight for zone {zone_name}: {e}")
+        logger.error(f"Error in /run_insight for zone {zone_name}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate insight: {str(e)}")
 
+@app.get("/events")
+async def events_endpoint(request: Request):
+    """Server-Sent Events stream of the same typed events pushed on /ws."""
+    event_queue = EVENT_HUB.subscribe()
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(event_queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                    yield format_sse(message)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            EVENT_HUB.unsubscribe(event_queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/zones")
+async def zones_endpoint():
+    """Configured zones (zones.json) with site, sensor intervals and baseline ranges."""
+    return {"zones": [zone.to_dict() for zone in ZONE_REGISTRY], "sites": ZONE_REGISTRY.sites()}
+
+@app.post("/prefetch")
+async def prefetch_endpoint(request: Request, zone_name: str, thread_id: str = None):
+    """
+    Hint that a zone was opened: loads the chat model, warms retrieval and the thread's
+    conversation state in the background. Rate-limited per zone; see prefetch.py.
+    """
+    if zone_name not in ZONE_REGISTRY:
+        raise HTTPException(status_code=404, detail=ZONE_REGISTRY.unknown_zone_message(zone_name))
+    client = thread_id or (request.client.host if request.client else None)
+    return {"zone_name": zone_name, **prefetch_zone(zone_name, client=client, thread_id=thread_id)}
+
+@app.delete("/prefetch")
+async def cancel_prefetch_endpoint(zone_name: str = None, thread_id: str = None):
+    return {"cancelled": cancel_prefetch(client=thread_id, zone_name=zone_name)}
+
+@app.get("/prefetch")
+async def prefetch_stats_endpoint():
+    """Prefetch requests by outcome plus running and recent jobs with per-step timings."""
+    return get_prefetch_stats()
+
+@app.get("/chat_cache")
+async def chat_cache_endpoint():
+    """Semantic chat cache hit rate, saved generation time and entries per zone (MUSHROOM_SEMANTIC_CACHE=1)."""
+    return get_chat_cache_stats()
+
+@app.get("/routing_metrics")
+async def routing_metrics_endpoint():
+    """Model routing: requests, mean latency and validation failures per kind and tier, plus fallbacks."""
+    return get_routing_stats()
+
+@app.get("/insight_metrics")
+async def insight_metrics_endpoint():
+    return get_insight_metrics()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition of latency histograms, counters and gauges (see metrics.py)."""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/profiles/{trace_id}")
+async def profile_endpoint(trace_id: str):
+    """Profile captured for a traced request started with ?profile=sample|cprofile (MUSHROOM_PROFILING=1)."""
+    profile = PROFILES.get(trace_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile stored for trace '{trace_id}'.")
+    return profile
+
+@app.get("/debug/memory")
+async def debug_memory_endpoint(top: int = memory_debug.DEFAULT_TOP, baseline: bool = False):
+    """
+    RSS, per-zone history sizes, connected clients, tasks and conversation files; with
+    MUSHROOM_TRACEMALLOC set also the top allocation sites and their growth since the last
+    ?baseline=true call (used by soak_test.py).
+    """
+    report = await asyncio.to_thread(MEMORY_TRACKER.report, top, baseline)
+    conversation_files = [entry.stat().st_size for entry in os.scandir(CONVERSATION_HISTORY_DIR)] \
+        if os.path.isdir(CONVERSATION_HISTORY_DIR) else []
+    return {**report,
+            "zone_readings": {zone_name: len(sensor_handler.get_zone_history(zone_name)) for zone_name in ZONE_NAMES}
+                             if MODULES_LOADED else {},
+            "ws_clients": WS_CLIENTS.get(), "event_subscribers": len(EVENT_HUB.subscribers),
+            "asyncio_tasks": len(asyncio.all_tasks()),
+            "conversation_files": len(conversation_files), "conversation_kb": round(sum(conversation_files) / 1024, 1)}
+
 @app.on_event("startup")
 async def startup_event():
-    print("FastAPI server startup complete.")
-    print("Note: Periodic insight update is currently disabled.")
-    print(f"Live sensor data will be relayed from: {PSEUDO_SERVER_URI}")
+    EVENT_HUB.bind_loop(asyncio.get_running_loop())
+    if MODULES_LOADED and sensor_handler.SHARED_HISTORY is not None:
+        reader = sensor_handler.SHARED_HISTORY
+        seen = {zone_name: reader.total(zone_name) for zone_name in reader.zones}
+        SHARED_HISTORY_WATCHER.append(asyncio.create_task(_watch_shared_history(reader, seen)))
+    logger.info("FastAPI server startup complete.")
+    logger.info("Note: Periodic insight update is currently disabled.")
+    logger.info(f"Live sensor data will be relayed from: {PSEUDO_SERVER_URI}")
     # Ensure ZONE_NAMES is loaded and available for validation if needed at startup
     if not MODULES_LOADED: # Check the flag set during initial imports
-        print("CRITICAL WARNING: Some project modules (sensor_handler, ai_model, insight_bot) may not have loaded correctly. API functionality will be severely limited.")
+        logger.critical("CRITICAL WARNING: Some project modules (sensor_handler, ai_model, insight_bot) may not have loaded correctly. API functionality will be severely limited.")
     elif not ZONE_NAMES or ZONE_NAMES == ["DefaultZoneOnError"]: # Check specific fallback for ZONE_NAMES
-        print("Warning: ZONE_NAMES could not be loaded correctly from sensor_handler. Zone validation might fail or use default.")
+        logger.warning("Warning: ZONE_NAMES could not be loaded correctly from sensor_handler. Zone validation might fail or use default.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+
+from analytics import analyze_zones, compute_summary, format_zone_analytics
+from sensor_handler import generate_pseudo_sensor_data
+from zone_registry import ZONE_NAMES, ZONE_REGISTRY
+
+# --- Configuration ---
+REPORTS_DIR = "reports"
+DEFAULT_PROCESSES = min(4, os.cpu_count() or 1) # Data generation + analytics, one report day per task
+DEFAULT_LLM_WORKERS = 2 # Concurrent insight generations; Ollama queues anything beyond OLLAMA_NUM_PARALLEL anyway
+LOOKBACK_DAYS = 7 # History loaded before each report day for trends and baselines (same week as initialize_history)
+RUN_LOG = "batch_runs.jsonl" # One line of timings per run, appended in the output directory
+
+
+def report_paths(output_dir: str, day: date, zone_name: str) -> tuple:
+    base = os.path.join(output_dir, day.isoformat(), zone_name.replace(" ", "_"))
+    return base + ".json", base + ".md"
+
+
+def is_complete(path: str, skip_llm: bool = False) -> bool:
+    """True if a report exists that a rerun should keep (failed generations are retried)."""
+    try:
+        with open(path) as f:
+            status = json.load(f).get("status")
+    except (OSError, json.JSONDecodeError):
+        return False
+    return status == "done" or (skip_llm and status == "analytics_only")
+
+
+def load_day(day: date, zones: list, lookback_days: int = LOOKBACK_DAYS) -> dict:
+    """
+    Process-pool task: generates the history every zone would have at the end of `day`
+    (seeded by the date, so reruns see the same readings), runs the batched analytics over all
+    zones and returns the report inputs for `zones`.
+    """
+    start = time.perf_counter()
+    random.seed(day.isoformat())
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    histories = {}
+    for zone in ZONE_REGISTRY:
+        interval = timedelta(seconds=zone.history_interval_seconds)
+        current_time = day_start - timedelta(days=lookback_days)
+        readings = []
+        while current_time < day_end:
+            readings.append(generate_pseudo_sensor_data(base_time=current_time, zone_name=zone.name))
+            current_time += interval
+        histories[zone.name] = readings
+
+    analytics_summary = analyze_zones(histories)
+    day_prefix = day.isoformat()
+    results = {}
+    for zone_name in zones:
+        history = histories[zone_name]
+        results[zone_name] = {
+            "summary": compute_summary([reading for reading in history if reading["timestamp"].startswith(day_prefix)]),
+            "latest": history[-1],
+            "analytics": analytics_summary["zones"].get(zone_name),
+            "analytics_text": format_zone_analytics(analytics_summary, zone_name),
+        }
+    return {"day": day, "zones": results, "readings": sum(len(history) for history in histories.values()),
+            "seconds": time.perf_counter() - start}
+
+
+def _write_atomic(path: str, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+def render_markdown(report: dict) -> str:
+    lines = [f"# {report['zone']} — {report['date']}", ""]
+    latest = report["latest"]
+    lines.append(f"Latest reading ({latest['timestamp']}): {latest['temperature']}°F, {latest['humidity']}%, {latest['CO2']} ppm")
+    lines += ["", "| Metric | Min | Max | Avg |", "| --- | --- | --- | --- |"]
+    for metric, stats in report["summary"].items():
+        lines.append(f"| {metric} | {stats.get('min')} | {stats.get('max')} | {stats.get('avg')} |")
+    flags = (report["analytics"] or {}).get("flags") or []
+    lines += ["", "## Flags", ""] + ([f"- ⚠️ {flag}" for flag in flags] or ["None."])
+    if report.get("insight"):
+        lines += ["", "## Summary", "", report["insight"]["historicalSummary"], "", "## Insight", "", report["insight"]["insight"]]
+    elif report.get("error"):
+        lines += ["", "## Insight", "", f"Generation failed: {report['error']}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_report(output_dir: str, day: date, zone_name: str, inputs: dict, insight: dict = None, llm_seconds: float = None):
+    report = {"zone": zone_name, "date": day.isoformat(), "generated_at": datetime.now().isoformat(timespec="seconds"),
+              "summary": inputs["summary"], "latest": inputs["latest"], "analytics": inputs["analytics"]}
+    if insight is None:
+        report["status"] = "analytics_only"
+    elif "error" in insight:
+        report.update(status="error", error=insight["error"])
+    else:
+        report.update(status="done", insight=insight, llm_seconds=round(llm_seconds, 2))
+    json_path, markdown_path = report_paths(output_dir, day, zone_name)
+    _write_atomic(markdown_path, render_markdown(report))
+    _write_atomic(json_path, json.dumps(report, indent=2, ensure_ascii=False)) # Last: its presence marks the report complete
+
+
+class StageTimer:
+    """Items, summed busy seconds and first-start/last-finish wall span of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.first_start = None
+        self.last_finish = None
+        self._lock = threading.Lock()
+
+    def record(self, started: float, seconds: float, busy_seconds: float = None):
+        """One item that spanned [started, started + seconds]; busy_seconds if the work ran elsewhere (a pool process)."""
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += seconds if busy_seconds is None else busy_seconds
+            self.first_start = started if self.first_start is None else min(self.first_start, started)
+            self.last_finish = max(self.last_finish or 0.0, started + seconds)
+
+    def to_dict(self) -> dict:
+        wall = (self.last_finish - self.first_start) if self.items else 0.0
+        return {"items": self.items, "busy_seconds": round(self.busy_seconds, 2), "wall_seconds": round(wall, 2),
+                "per_second": round(self.items / wall, 3) if wall else None}
+
+
+def run_batch(days: list, zones: list, output_dir: str = REPORTS_DIR, processes: int = DEFAULT_PROCESSES,
+              llm_workers: int = DEFAULT_LLM_WORKERS, lookback_days: int = LOOKBACK_DAYS, skip_llm: bool = False,
+              force: bool = False) -> dict:
+    """
+    Builds one report per (day, zone). Days are loaded and analyzed across a process pool; as
+    each day finishes, its insight generations go to a bounded thread pool. Every report is
+    written as soon as it is ready, and reports already complete on disk are skipped.
+    """
+    if not skip_llm:
+        from insight_bot import build_insight_prompt, generate_validated_insight # Imports ai_model (Chroma, Ollama)
+
+    pending = {}
+    for day in days:
+        zones_left = [zone for zone in zones if force or not is_complete(report_paths(output_dir, day, zone)[0], skip_llm)]
+        if zones_left:
+            pending[day] = zones_left
+    skipped = len(days) * len(zones) - sum(len(zones_left) for zones_left in pending.values())
+    print(f"{len(days)} day(s) x {len(zones)} zone(s): {skipped} report(s) already complete, "
+          f"{sum(len(z) for z in pending.values())} to build.")
+
+    load_stage, llm_stage, write_stage = StageTimer("load+analytics"), StageTimer("llm"), StageTimer("write")
+    outcomes = {"done": 0, "analytics_only": 0, "error": 0}
+    outcomes_lock = threading.Lock()
+    readings = 0
+
+    def finish(day, zone_name, inputs, insight=None, llm_seconds=None):
+        started = time.perf_counter()
+        write_report(output_dir, day, zone_name, inputs, insight, llm_seconds)
+        write_stage.record(started, time.perf_counter() - started)
+        status = "analytics_only" if insight is None else ("error" if "error" in insight else "done")
+        with outcomes_lock:
+            outcomes[status] += 1
+        print(f"  {day} {zone_name}: {status}")
+
+    def generate(day, zone_name, inputs):
+        prompt = build_insight_prompt(zone_name, inputs["summary"], inputs["latest"], inputs["analytics_text"])
+        started = time.perf_counter()
+        insight = generate_validated_insight(zone_name, prompt)
+        seconds = time.perf_counter() - started
+        llm_stage.record(started, seconds)
+        finish(day, zone_name, inputs, insight, seconds)
+
+    run_start = time.perf_counter()
+    # spawn: pool workers must not inherit the parent's Chroma client and HTTP connection pools
+    process_pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    llm_pool = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="batch-llm")
+    interrupted = False
+    try:
+        submitted = {}
+        for day, zones_left in pending.items():
+            submitted[process_pool.submit(load_day, day, zones_left, lookback_days)] = time.perf_counter()
+        llm_futures = []
+        waiting = set(submitted)
+        while waiting:
+            done, waiting = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                loaded = future.result()
+                load_stage.record(submitted[future], time.perf_counter() - submitted[future], loaded["seconds"])
+                readings += loaded["readings"]
+                for zone_name, inputs in loaded["zones"].items():
+                    if skip_llm:
+                        finish(loaded["day"], zone_name, inputs)
+                    else:
+                        llm_futures.append(llm_pool.submit(generate, loaded["day"], zone_name, inputs))
+        for future in llm_futures:
+            future.result()
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted: finished reports are on disk; rerun the same command to resume.")
+    finally:
+        process_pool.shutdown(wait=not interrupted, cancel_futures=interrupted)
+        llm_pool.shutdown(wait=True, cancel_futures=interrupted)
+
+    load = load_stage.to_dict()
+    load["readings_per_second"] = round(readings / load["busy_seconds"]) if load["busy_seconds"] else None
+    return {"started_at": datetime.now().isoformat(timespec="seconds"), "interrupted": interrupted,
+            "days": [days[0].isoformat(), days[-1].isoformat()] if days else [], "zones": zones,
+            "processes": processes, "llm_workers": 0 if skip_llm else llm_workers, "skipped": skipped,
+            "outcomes": outcomes, "wall_seconds": round(time.perf_counter() - run_start, 2),
+            "stages": {"load+analytics": load, "llm": llm_stage.to_dict(), "write": write_stage.to_dict()}}
+
+
+def print_run(run: dict):
+    print(f"\n--- Batch reports: {sum(run['outcomes'].values())} written ({run['outcomes']}), "
+          f"{run['skipped']} skipped, {run['wall_seconds']:.1f}s wall ---")
+    for name, stage in run["stages"].items():
+        if stage["items"]:
+            rate = f"{stage['per_second']:.2f}/s" if stage["per_second"] else "-"
+            print(f"{name:15s} {stage['items']:5d} items  busy {stage['busy_seconds']:8.1f}s  wall {stage['wall_seconds']:7.1f}s  {rate}")
+    readings_rate = run["stages"]["load+analytics"].get("readings_per_second")
+    if readings_rate:
+        print(f"readings generated per worker-second: {readings_rate:,}")
+
+
+def _parse_date(text: str) -> date:
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build insight reports for every zone over a date range.")
+    parser.add_argument("--start", type=_parse_date, help="First report day, YYYY-MM-DD (default: yesterday)")
+    parser.add_argument("--end", type=_parse_date, help="Last report day, inclusive (default: --start)")
+    parser.add_argument("--zones", nargs="+", choices=ZONE_NAMES, default=list(ZONE_NAMES), metavar="ZONE")
+    parser.add_argument("--output-dir", default=REPORTS_DIR)
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES, help="Data loading / analytics processes")
+    parser.add_argument("--llm-workers", type=int, default=DEFAULT_LLM_WORKERS, help="Concurrent insight generations")
+    parser.add_argument("--lookback-days", type=int, default=LOOKBACK_DAYS)
+    parser.add_argument("--skip-llm", action="store_true", help="Write analytics-only reports without calling the model")
+    parser.add_argument("--force", action="store_true", help="Rebuild reports that are already complete")
+    args = parser.parse_args()
+
+    start_day = args.start or date.today() - timedelta(days=1)
+    end_day = args.end or start_day
+    if end_day < start_day:
+        parser.error("--end is before --start")
+    report_days = [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+    run = run_batch(report_days, args.zones, args.output_dir, args.processes, args.llm_workers, args.lookback_days,
+                    args.skip_llm, args.force)
+    print_run(run)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, RUN_LOG), "a") as f:
+        f.write(json.dumps(run) + "\n")
@@ -0,0 +1,285 @@
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import sensor_handler
+from sensor_handler import ZONE_NAMES
+from tail_reader import EXPORT_COLUMNS
+
+try:
+    import resource # Peak RSS on Unix
+except ImportError:
+    resource = None
+
+# --- Configuration ---
+DEFAULT_CHUNK_ROWS = 100_000 # Rows parsed per chunk; bounds parser memory regardless of file size
+SENSOR_IMPORT_ENV = "MUSHROOM_SENSOR_IMPORT" # api_server imports these exports (os.pathsep-separated) at startup
+RAG_INTERVAL = "6h" # One RAG document per zone per interval (matches rag_ingestion's 4 readings/day)
+COLUMN_ALIASES = {
+    "timestamp": ("timestamp", "date", "datetime", "time"),
+    "temperature": ("temperature", "temp"),
+    "humidity": ("humidity", "rh"),
+    "CO2": ("co2",),
+    "zone": ("zone", "zone_name"),
+}
+# Why normalize_chunk drops a row, checked in this order (each dropped row counts once)
+DROP_REASONS = {
+    "bad_timestamp": "without a valid timestamp",
+    "no_zone": "with no zone (add a Zone column, pass --zone or name the file after the zone)",
+    "unknown_zone": "for zones not in the zone registry",
+    "missing_values": "with a missing temperature, humidity or CO2 value",
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Linux reports KB
+
+
+def zone_from_filename(path: str):
+    """Guesses the zone from an export's file name (e.g. 'babylon_1_2025-01.csv' -> 'Babylon 1')."""
+    name = re.sub(r"[\s_\-]+", " ", os.path.basename(path).lower())
+    for zone_name in sorted(ZONE_NAMES, key=len, reverse=True):
+        if re.search(rf"\b{re.escape(zone_name.lower())}\b", name):
+            return zone_name
+    return None
+
+
+def iter_export_chunks(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    """Yields an export (.csv or .xlsx) as DataFrames of at most chunk_rows rows."""
+    if path.lower().endswith(".csv"):
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+        return
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def normalize_chunk(frame: pd.DataFrame, zone_name: str = None, dropped: dict = None) -> pd.DataFrame:
+    """
+    Maps an export chunk onto the generate_pseudo_sensor_data schema as columns
+    ts (int64 seconds), temperature, humidity, CO2 and zone. Columns are matched by name
+    (see COLUMN_ALIASES); exports without recognizable headers use the controller's
+    positional layout (tail_reader.EXPORT_COLUMNS). Rows without a valid timestamp, a
+    registered zone, or a temperature, humidity and CO2 value are dropped (a missing column
+    drops every row: zeros would skew baselines and alert bands); pass `dropped` (a dict) to
+    have the counts added to it per DROP_REASONS key.
+    """
+    lookup = {str(column).strip().lower(): column for column in frame.columns}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        match = next((lookup[alias] for alias in aliases if alias in lookup), None)
+        if match is not None:
+            columns[field] = frame[match]
+    if "timestamp" not in columns:
+        positional = dict(zip(EXPORT_COLUMNS, frame.columns))
+        columns = {field: frame[positional[source]] for field, source in
+                   (("timestamp", "Date"), ("temperature", "Temperature"), ("humidity", "Humidity"), ("CO2", "CO2"))
+                   if source in positional}
+
+    timestamps = pd.to_datetime(columns["timestamp"], errors="coerce")
+    result = pd.DataFrame({
+        "ts": timestamps.values.astype("datetime64[s]").astype(np.int64),
+        "temperature": pd.to_numeric(columns.get("temperature"), errors="coerce").astype(np.float32),
+        "humidity": pd.to_numeric(columns.get("humidity"), errors="coerce").astype(np.float32),
+        "CO2": pd.to_numeric(columns.get("CO2"), errors="coerce"),
+        "zone": columns["zone"].astype(str).str.strip() if "zone" in columns else zone_name,
+    })
+    has_zone = columns["zone"].notna().values if "zone" in columns else np.full(len(result), zone_name is not None)
+    checks = {
+        "bad_timestamp": timestamps.notna().values,
+        "no_zone": has_zone,
+        "unknown_zone": result["zone"].isin(ZONE_NAMES).values,
+        "missing_values": result[["temperature", "humidity", "CO2"]].notna().all(axis=1).values,
+    }
+    valid = np.ones(len(result), dtype=bool)
+    for reason, passed in checks.items():
+        if dropped is not None:
+            dropped[reason] = dropped.get(reason, 0) + int(np.count_nonzero(valid & ~passed))
+        valid &= passed
+    return result[valid]
+
+
+class ZoneAccumulator:
+    """Per-zone columnar buffers (about 20 bytes per reading) that are deduplicated on (zone, timestamp)."""
+
+    def __init__(self):
+        self.parts = {}
+        self.rows_in = 0
+
+    def add(self, chunk: pd.DataFrame):
+        self.rows_in += len(chunk)
+        for zone_name, group in chunk.groupby("zone", sort=False):
+            self.parts.setdefault(zone_name, []).append(group.drop(columns="zone"))
+
+    def zone_frame(self, zone_name: str) -> pd.DataFrame:
+        """The zone's readings sorted by timestamp, keeping the first occurrence of each timestamp."""
+        frame = pd.concat(self.parts.pop(zone_name), ignore_index=True)
+        frame = frame.sort_values("ts", kind="stable")
+        return frame[~frame["ts"].duplicated(keep="first")]
+
+
+def frame_to_records(frame: pd.DataFrame, zone_name: str) -> list:
+    """Converts a normalized zone frame into generate_pseudo_sensor_data-style records."""
+    timestamps = [text.replace("T", " ") for text in
+                  np.datetime_as_string(frame["ts"].values.astype("datetime64[s]")).tolist()]
+    co2 = frame["CO2"].round().astype(np.int64).tolist() # normalize_chunk dropped rows without CO2
+    return [
+        {"timestamp": timestamp, "temperature": round(temperature, 1), "humidity": round(humidity, 1),
+         "CO2": co2_value, "zone": zone_name}
+        for timestamp, temperature, humidity, co2_value in zip(
+            timestamps, frame["temperature"].tolist(), frame["humidity"].tolist(), co2)
+    ]
+
+
+def rag_sample(frame: pd.DataFrame, interval: str = RAG_INTERVAL) -> pd.DataFrame:
+    """First reading of each interval, so the RAG index stays a manageable size for long backfills."""
+    buckets = frame["ts"] // int(pd.Timedelta(interval).total_seconds())
+    return frame[~buckets.duplicated(keep="first")]
+
+
+def import_exports(paths, zone_name: str = None, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                   replace: bool = True, rag: bool = False, verbose: bool = True) -> dict:
+    """
+    Streams exports chunk by chunk into sensor_handler's history (and optionally the RAG index).
+
+    Each file's zone comes from a zone column, then `zone_name`, then its file name. Returns
+    {"files", "rows_read", "rows_dropped" (per DROP_REASONS key), "rows_loaded", "duplicates",
+    "per_zone", "rag_documents", "seconds", "rows_per_second", "parse_peak_rss_mb",
+    "peak_rss_mb"}. The parse phase is bounded by chunk_rows plus ~20 bytes per reading;
+    the final peak also includes the history itself, which sensor_handler keeps as one dict
+    per reading.
+    """
+    start = time.perf_counter()
+    accumulator = ZoneAccumulator()
+    dropped = dict.fromkeys(DROP_REASONS, 0)
+    for path in paths:
+        file_zone = zone_name or zone_from_filename(path)
+        if verbose:
+            print(f"Importing '{path}'" + (f" as zone '{file_zone}'" if file_zone else "") + "...")
+        for chunk in iter_export_chunks(path, chunk_rows=chunk_rows):
+            accumulator.add(normalize_chunk(chunk, zone_name=file_zone, dropped=dropped))
+    parse_peak_rss_mb = peak_rss_mb()
+
+    collection = None
+    if rag:
+        import rag_ingestion
+        collection = rag_ingestion.get_collection()
+
+    per_zone = {}
+    rag_documents = 0
+    for zone in list(accumulator.parts):
+        frame = accumulator.zone_frame(zone)
+        per_zone[zone] = sensor_handler.load_history(zone, frame_to_records(frame, zone), replace=replace)
+        if collection is not None:
+            rag_documents += rag_ingestion.ingest_readings(collection, frame_to_records(rag_sample(frame), zone))
+        if verbose:
+            print(f"  {zone}: {len(frame):,} unique readings loaded.")
+
+    seconds = time.perf_counter() - start
+    rows_loaded = sum(per_zone.values()) if replace else None
+    rows_read = accumulator.rows_in + sum(dropped.values())
+    return {
+        "files": len(paths),
+        "rows_read": rows_read,
+        "rows_dropped": dropped,
+        "rows_loaded": rows_loaded,
+        "duplicates": accumulator.rows_in - rows_loaded if rows_loaded is not None else None,
+        "per_zone": per_zone,
+        "rag_documents": rag_documents,
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(rows_read / seconds) if seconds else None,
+        "parse_peak_rss_mb": parse_peak_rss_mb,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def write_synthetic_export(path: str, rows: int, duplicate_fraction: float = 0.05):
+    """Writes a multi-zone CSV export (5-minute readings, some duplicated) for benchmarking."""
+    rng = np.random.default_rng(7)
+    per_zone = rows // len(ZONE_NAMES)
+    start = pd.Timestamp("2020-01-01")
+    with open(path, "w") as f:
+        f.write("Zone,Date,Temperature,Humidity,CO2\n")
+        for zone in ZONE_NAMES:
+            low, high = sensor_handler.get_zone_ranges(zone)["temperature"]
+            for offset in range(0, per_zone, DEFAULT_CHUNK_ROWS):
+                count = min(DEFAULT_CHUNK_ROWS, per_zone - offset)
+                index = np.arange(offset, offset + count)
+                duplicates = rng.random(count) < duplicate_fraction
+                index[duplicates] = np.maximum(index[duplicates] - 1, 0)
+                frame = pd.DataFrame({
+                    "Zone": zone,
+                    "Date": (start + pd.to_timedelta(index * 5, unit="min")).strftime("%Y-%m-%d %H:%M:%S"),
+                    "Temperature": rng.uniform(low, high, count).round(1),
+                    "Humidity": rng.uniform(90, 100, count).round(1),
+                    "CO2": rng.integers(440, 520, count),
+                })
+                frame.to_csv(f, header=False, index=False)
+
+
+def print_report(report: dict):
+    print(f"Read {report['rows_read']:,} rows from {report['files']} file(s) in {report['seconds']:.1f}s "
+          f"({report['rows_per_second']:,} rows/s).")
+    for reason, count in report["rows_dropped"].items():
+        if count:
+            print(f"Dropped {count:,} rows {DROP_REASONS[reason]}.")
+    if report["rows_loaded"] is not None:
+        print(f"Loaded {report['rows_loaded']:,} unique readings ({report['duplicates']:,} duplicates dropped).")
+    if report["rag_documents"]:
+        print(f"Indexed {report['rag_documents']:,} RAG documents.")
+    if report["peak_rss_mb"] is not None:
+        print(f"Peak RSS: {report['parse_peak_rss_mb']:.0f} MB while parsing, "
+              f"{report['peak_rss_mb']:.0f} MB after loading into history")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=(
+        "Check historical sensor exports (CSV/XLSX) and report what an import would load. Sensor history lives in "
+        f"the API process, so it is loaded by starting api_server with {SENSOR_IMPORT_ENV}; only --rag writes "
+        "anything (to the ChromaDB index)."))
+    parser.add_argument("paths", nargs="*", help="Export files to import")
+    parser.add_argument("--zone", choices=ZONE_NAMES, help="Zone for exports without a zone column or zone in the file name")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows parsed per chunk")
+    parser.add_argument("--merge", action="store_true", help="Merge into existing history instead of replacing it")
+    parser.add_argument("--rag", action="store_true", help=f"Also index one reading per zone every {RAG_INTERVAL} in ChromaDB")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS", help="Generate a synthetic ROWS-row export and import it")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "synthetic_export.csv")
+            write_synthetic_export(path, args.benchmark)
+            print(f"--- Bulk import benchmark ({args.benchmark:,} rows, {os.path.getsize(path) / 1e6:.0f} MB CSV) ---")
+            print_report(import_exports([path], chunk_rows=args.chunk_rows, rag=args.rag, verbose=False))
+    elif args.paths:
+        print_report(import_exports(args.paths, zone_name=args.zone, chunk_rows=args.chunk_rows,
+                                    replace=not args.merge, rag=args.rag))
+        # History is in-memory and this process exits now: the API loads the exports itself at startup.
+        print(f"\nDry run for sensor history: nothing above was persisted{' except the RAG documents' if args.rag else ''}. "
+              f"To serve these readings, start the API with:\n  "
+              f"{SENSOR_IMPORT_ENV}={os.pathsep.join(args.paths)} uvicorn api_server:app")
+    else:
+        parser.print_help()
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+from metrics import JSON_SERIALIZE_SECONDS
+
+DEFAULT_QUEUE_SIZE = 100 # Events buffered per subscriber before the oldest are dropped
+
+
+class EventHub:
+    """
+    Fan-out of typed server events (alerts, insights, ...) to connected clients.
+
+    Every subscriber (a /ws client or an SSE stream) gets its own bounded asyncio.Queue of
+    pre-serialized messages. publish() is safe to call from worker threads (e.g. insight
+    generation running in asyncio.to_thread); events are serialized once and handed to the
+    event loop with call_soon_threadsafe. A slow subscriber never blocks the publisher:
+    when its queue is full, its oldest event is dropped.
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.loop = None
+        self.published = 0
+        self.dropped = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Must be called once from the server's event loop (e.g. at startup)."""
+        self.loop = loop
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def _enqueue(self, queue: asyncio.Queue, message: str):
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(message)
+
+    def publish(self, event: dict):
+        """Queue an event (a dict with a "type" key) for every subscriber. Thread-safe."""
+        if self.loop is None or not self.subscribers:
+            return
+        with JSON_SERIALIZE_SECONDS.labels("event").time():
+            message = json.dumps(event)
+        self.published += 1
+        for queue in list(self.subscribers):
+            self.loop.call_soon_threadsafe(self._enqueue, queue, message)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+            "queued": sum(queue.qsize() for queue in list(self.subscribers)),
+        }
+
+
+def format_sse(message: str) -> str:
+    """Formats a serialized event as a Server-Sent Events frame (clients read "type" from the JSON)."""
+    return f"data: {message}\n\n"
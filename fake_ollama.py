@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# --- Configuration ---
+DEFAULT_PORT = 11435 # Next to the real Ollama's 11434, so both can run at once
+DEFAULT_TOKENS = 60 # Tokens per generation
+DEFAULT_TOKEN_LATENCY_MS = 20.0 # Per generated token
+DEFAULT_PROMPT_LATENCY_MS = 0.05 # Per prompt character (prompt eval)
+DEFAULT_EMBED_LATENCY_MS = 15.0 # Per embedding request
+DEFAULT_LOAD_SECONDS = 0.0 # Cold model load; 0 = every model is always resident
+DEFAULT_KEEP_ALIVE_SECONDS = 300 # Ollama's default: a model is unloaded this long after its last request
+EMBEDDING_DIMENSIONS = 768 # nomic-embed-text
+SMALL_MODEL_LATENCY_FACTOR = 0.35 # Models with "small" in the name (model_router's small tier) run this much of the token latency
+FILLER_WORDS = ("humidity", "stable", "pins", "fruiting", "mycelium", "airflow", "readings", "zone",
+                "within", "range", "slightly", "trend", "overnight", "misting", "CO2", "levels")
+
+
+class FakeOllamaConfig:
+    def __init__(self, tokens: int = DEFAULT_TOKENS, token_latency_ms: float = DEFAULT_TOKEN_LATENCY_MS,
+                 prompt_latency_ms: float = DEFAULT_PROMPT_LATENCY_MS, embed_latency_ms: float = DEFAULT_EMBED_LATENCY_MS,
+                 load_seconds: float = DEFAULT_LOAD_SECONDS, prefix_cache: bool = False):
+        self.tokens = tokens
+        self.token_latency = token_latency_ms / 1000
+        self.prompt_latency = prompt_latency_ms / 1000
+        self.embed_latency = embed_latency_ms / 1000
+        self.load_seconds = load_seconds
+        self.prefix_cache = prefix_cache # Only the part of a prompt not shared with the model's previous prompt is evaluated
+        self._loaded = {} # model -> monotonic time it is unloaded
+        self._last_prompt = {} # model -> previous prompt (one KV cache slot per model)
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self, model: str, keep_alive=None) -> float:
+        """Sleeps for a cold load if `model` is not resident; returns the seconds spent loading."""
+        keep_alive_seconds = _parse_keep_alive(keep_alive)
+        with self._lock:
+            now = time.monotonic()
+            cold = self.load_seconds > 0 and self._loaded.get(model, 0.0) <= now
+            if cold:
+                # Held under the lock: like Ollama, loads are serialized and waiting requests do not load twice
+                self._last_prompt.pop(model, None)
+                time.sleep(self.load_seconds)
+            self._loaded[model] = time.monotonic() + keep_alive_seconds if keep_alive_seconds >= 0 else float("inf")
+        return self.load_seconds if cold else 0.0
+
+    def uncached_prompt(self, model: str, prompt: str) -> str:
+        """The part of `prompt` that needs evaluating, after the prefix shared with this model's previous prompt."""
+        with self._lock:
+            previous = self._last_prompt.get(model, "")
+            self._last_prompt[model] = prompt
+        if not self.prefix_cache:
+            return prompt
+        shared = 0
+        for a, b in zip(previous, prompt):
+            if a != b:
+                break
+            shared += 1
+        return prompt[shared:]
+
+
+def _parse_keep_alive(keep_alive) -> float:
+    """Seconds from an Ollama keep_alive value ("30m", "1h", 300, -1 = forever); None means the default."""
+    if keep_alive is None or keep_alive == "":
+        return DEFAULT_KEEP_ALIVE_SECONDS
+    if isinstance(keep_alive, (int, float)):
+        return float(keep_alive)
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = str(keep_alive).strip()
+    return float(text[:-1]) * units[text[-1]] if text[-1] in units else float(text)
+
+
+def fake_embedding(text: str) -> list:
+    """Deterministic unit vector for a text, so repeated queries hit the same neighbours."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _filler_text(word_count: int) -> str:
+    return " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(word_count)).capitalize() + "."
+
+
+def fake_response_text(schema, tokens: int) -> str:
+    """Plain text, or for a `format` request a JSON object filling each schema property with text."""
+    if not schema:
+        return _filler_text(tokens)
+    properties = list(schema.get("properties", {})) if isinstance(schema, dict) else []
+    if not properties:
+        return json.dumps({"response": _filler_text(tokens)})
+    words = max(1, tokens // len(properties))
+    return json.dumps({name: _filler_text(words) for name in properties})
+
+
+def _split_tokens(text: str, tokens: int) -> list:
+    """Splits text into `tokens` roughly equal chunks (streamed one per token)."""
+    size = max(1, -(-len(text) // max(1, tokens)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Implements the slice of the Ollama API this project uses: /api/generate, /api/embeddings, /api/tags."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True # Like Ollama (Go sets TCP_NODELAY); otherwise keep-alive responses stall ~40 ms on delayed ACKs
+    config = FakeOllamaConfig()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "mushroom_gemma"}, {"name": "mushroom_gemma_small"}, {"name": "nomic-embed-text"}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json({"error": "invalid JSON"}, status=400)
+            return
+        if self.path == "/api/embeddings":
+            self.config.ensure_loaded(str(request.get("model", "")), request.get("keep_alive"))
+            time.sleep(self.config.embed_latency)
+            self._send_json({"embedding": fake_embedding(str(request.get("prompt", "")))})
+        elif self.path == "/api/generate":
+            self._generate(request)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _generate(self, request: dict):
+        config = self.config
+        start = time.perf_counter()
+        model = str(request.get("model", ""))
+        speed = SMALL_MODEL_LATENCY_FACTOR if "small" in model else 1.0
+        prompt = str(request.get("prompt", ""))
+        load_seconds = config.ensure_loaded(model, request.get("keep_alive"))
+        if not prompt: # Ollama's "load the model" request
+            self._send_json({"model": model, "response": "", "done": True, "done_reason": "load",
+                             "load_duration": int(load_seconds * 1e9)})
+            return
+        tokens = int((request.get("options") or {}).get("num_predict") or config.tokens)
+        tokens = min(tokens, config.tokens) if tokens > 0 else config.tokens
+        text = fake_response_text(request.get("format"), tokens)
+        evaluated = config.uncached_prompt(model, prompt)
+        prompt_eval = len(evaluated) * config.prompt_latency * speed
+        token_latency = config.token_latency * speed
+        time.sleep(prompt_eval)
+        stats = {"model": request.get("model"), "done": True, "prompt_eval_count": len(evaluated) // 4,
+                 "prompt_eval_duration": int(prompt_eval * 1e9), "load_duration": int(load_seconds * 1e9)}
+
+        if not request.get("stream", True):
+            time.sleep(tokens * token_latency)
+            self._send_json({**stats, "response": text, "eval_count": tokens,
+                             "eval_duration": int(tokens * token_latency * 1e9),
+                             "total_duration": int((time.perf_counter() - start) * 1e9)})
+            return
+
+        # Streaming: newline-delimited JSON chunks, one per token, with chunked transfer encoding.
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        eval_start = time.perf_counter()
+        try:
+            pieces = _split_tokens(text, tokens)
+            for piece in pieces:
+                time.sleep(token_latency)
+                self._write_chunk({"model": request.get("model"), "response": piece, "done": False})
+            self._write_chunk({**stats, "response": "", "eval_count": len(pieces),
+                               "eval_duration": int((time.perf_counter() - eval_start) * 1e9),
+                               "total_duration": int((time.perf_counter() - start) * 1e9)})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True # Client stopped reading (e.g. generate_structured's early stop)
+
+    def _write_chunk(self, payload: dict):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that hang up mid-stream (early stops, load test shutdown) are expected here.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def start_fake_ollama(port: int = DEFAULT_PORT, config: FakeOllamaConfig = None, host: str = "127.0.0.1"):
+    """Starts the server on a daemon thread and returns it (call .shutdown() to stop)."""
+    handler = type("ConfiguredFakeOllamaHandler", (FakeOllamaHandler,), {"config": config or FakeOllamaConfig()})
+    server = FakeOllamaServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama API with configurable latency.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--tokens", type=int, default=DEFAULT_TOKENS, help="Tokens generated per request")
+    parser.add_argument("--token-latency-ms", type=float, default=DEFAULT_TOKEN_LATENCY_MS)
+    parser.add_argument("--prompt-latency-ms", type=float, default=DEFAULT_PROMPT_LATENCY_MS, help="Per prompt character")
+    parser.add_argument("--embed-latency-ms", type=float, default=DEFAULT_EMBED_LATENCY_MS)
+    parser.add_argument("--load-seconds", type=float, default=DEFAULT_LOAD_SECONDS, help="Cold load time of a model not kept alive")
+    parser.add_argument("--prefix-cache", action="store_true", help="Skip prompt evaluation of a prefix shared with the previous prompt")
+    args = parser.parse_args()
+    server = start_fake_ollama(args.port, FakeOllamaConfig(args.tokens, args.token_latency_ms, args.prompt_latency_ms,
+                                                           args.embed_latency_ms, args.load_seconds, args.prefix_cache))
+    print(f"Fake Ollama listening on http://127.0.0.1:{args.port} "
+          f"({args.tokens} tokens x {args.token_latency_ms} ms, embeddings {args.embed_latency_ms} ms)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
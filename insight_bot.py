@@ -1,48 +1,65 @@
 import json
+import threading
+import time
 from datetime import datetime 
-from sensor_handler import read_sensor_data, ZONE_NAMES 
-from ai_model import start_conversation as start_ai_conversation, send_message as send_ai_message
+import sensor_handler
+from sensor_handler import read_sensor_data, ZONE_NAMES, ZONE_REGISTRY
+from ai_model import generate_structured
+from analytics import MetricTensorCache, analyze_zones, compute_summary, format_zone_analytics
+from json_stream import repair_json
+from log_utils import get_logger
+from model_router import MODEL_TIERS, record_fallback, record_generation, route
+from tracing import span
+
+logger = get_logger("insight_bot")
 
 LAST_INSIGHT_TIMESTAMP = {} 
 
-def compute_summary(history: list): 
-    temps = [entry["temperature"] for entry in history if "temperature" in entry and entry["temperature"] is not None]
-    hums  = [entry["humidity"] for entry in history if "humidity" in entry and entry["humidity"] is not None]
-    co2s  = [entry["CO2"] for entry in history if "CO2" in entry and entry["CO2"] is not None]
-    
-    summary = {
-        "temperature": {
-            "min": min(temps) if temps else None,
-            "max": max(temps) if temps else None,
-            "avg": round(sum(temps) / len(temps), 1) if temps else None, # Adjusted to 1 decimal
-        },
-        "humidity": {
-            "min": min(hums) if hums else None,
-            "max": max(hums) if hums else None,
-            "avg": round(sum(hums) / len(hums), 1) if hums else None, # Adjusted to 1 decimal
-        },
-        "CO2": {
-            "min": min(co2s) if co2s else None,
-            "max": max(co2s) if co2s else None,
-            "avg": round(sum(co2s) / len(co2s), 0) if co2s else None, # CO2 as whole number
-        }
-    }
-    return summary
+# --- Structured Output Configuration ---
+INSIGHT_KEYS = ("historicalSummary", "currentReading", "insight")
+INSIGHT_SCHEMA = {
+    "type": "object",
+    "properties": {key: {"type": "string"} for key in INSIGHT_KEYS},
+    "required": list(INSIGHT_KEYS),
+}
+INSIGHT_GENERATION_OPTIONS = {"temperature": 0.7, "top_k": 50}
+INSIGHT_RETRY_OPTIONS = {"temperature": 0.2, "top_k": 20} # More conservative sampling on retry
+INSIGHT_MAX_RETRIES = 1
+ANALYTICS_MAX_SAMPLES = 30 * 288 # Up to 30 days of 5-minute readings per zone
+# Packed analytics input kept across requests: each insight only converts readings added since the last one.
+ANALYTICS_TENSOR_CACHE = MetricTensorCache(ANALYTICS_MAX_SAMPLES)
+
+# Counters for insight generation outcomes (see get_insight_metrics)
+INSIGHT_METRICS = {"requests": 0, "parsed": 0, "early_stops": 0, "repaired": 0, "retries": 0, "failures": 0}
+_INSIGHT_METRICS_LOCK = threading.Lock()
+
+def _get_insight_watermark(zone_name: str):
+    # In multi-worker mode the watermark lives in shared memory so every worker agrees on it.
+    if sensor_handler.SHARED_HISTORY is not None:
+        return sensor_handler.SHARED_HISTORY.get_watermark(zone_name)
+    return LAST_INSIGHT_TIMESTAMP.get(zone_name)
+
+def _set_insight_watermark(zone_name: str, timestamp: str):
+    if sensor_handler.SHARED_HISTORY is not None:
+        sensor_handler.SHARED_HISTORY.set_watermark(zone_name, timestamp)
+    else:
+        LAST_INSIGHT_TIMESTAMP[zone_name] = timestamp
 
 def get_insight(zone_name: str):
     global LAST_INSIGHT_TIMESTAMP 
 
-    if zone_name not in ZONE_NAMES:
-        return {"error": f"Invalid zone_name: '{zone_name}'. Must be one of {ZONE_NAMES}"}
+    if zone_name not in ZONE_REGISTRY:
+        return {"error": ZONE_REGISTRY.unknown_zone_message(zone_name)}
 
     try:
-        latest, history = read_sensor_data(zone_name=zone_name)
+        with span("sensor_read"):
+            latest, history = read_sensor_data(zone_name=zone_name)
     except ValueError as e: 
         return {"error": f"Could not read sensor data for zone '{zone_name}': {e}"}
     except Exception as e:
         return {"error": f"Unexpected error reading sensor data for zone '{zone_name}': {e}"}
 
-    last_ts_for_zone = LAST_INSIGHT_TIMESTAMP.get(zone_name)
+    last_ts_for_zone = _get_insight_watermark(zone_name)
     new_history_for_summary = []
 
     if last_ts_for_zone is None:
@@ -52,30 +69,45 @@ def get_insight(zone_name: str):
             last_dt = datetime.strptime(last_ts_for_zone, "%Y-%m-%d %H:%M:%S")
             new_history_for_summary = [entry for entry in history if datetime.strptime(entry["timestamp"], "%Y-%m-%d %H:%M:%S") > last_dt]
         except (ValueError, TypeError) as e: 
-            print(f"Warning: Timestamp comparison error for zone {zone_name} (last_ts: {last_ts_for_zone}): {e}. Using full history.")
+            logger.warning(f"Warning: Timestamp comparison error for zone {zone_name} (last_ts: {last_ts_for_zone}): {e}. Using full history.")
             new_history_for_summary = history
 
     if not new_history_for_summary and history: 
-        print(f"No new sensor data for zone {zone_name} since {last_ts_for_zone}. Summarizing last day's worth of available entries.")
+        logger.info(f"No new sensor data for zone {zone_name} since {last_ts_for_zone}. Summarizing last day's worth of available entries.")
         # Approx last day if 5 min intervals (288 readings)
         new_history_for_summary = history[-288:] 
     elif not new_history_for_summary and not history:
-         print(f"No history available at all for zone {zone_name} to generate summary.")
+         logger.info(f"No history available at all for zone {zone_name} to generate summary.")
          # Return a structure indicating no data, so AI doesn't get empty fields
          summary = {"temperature": {}, "humidity": {}, "CO2": {}} # Empty summary
     else: # This case was missing, should be 'summary = compute_summary(new_history_for_summary)'
-        summary = compute_summary(new_history_for_summary)
+        with span("summary"):
+            summary = compute_summary(new_history_for_summary)
 
 
-    LAST_INSIGHT_TIMESTAMP[zone_name] = latest["timestamp"] 
+    _set_insight_watermark(zone_name, latest["timestamp"])
 
+    # Trends, forecasts, baseline deviations and cross-zone correlations are computed here
+    # (all zones in one batched pass) so the model only has to put them into words.
+    with span("analytics"):
+        analytics_summary = analyze_zones(sensor_handler.get_all_zone_histories(), tensor_cache=ANALYTICS_TENSOR_CACHE)
+        analytics_str = format_zone_analytics(analytics_summary, zone_name)
+
+    prompt = build_insight_prompt(zone_name, summary, latest, analytics_str)
+
+    logger.info(f"\nGenerating insight for zone: {zone_name}")
+    with span("generation"):
+        return generate_validated_insight(zone_name, prompt)
+
+def build_insight_prompt(zone_name: str, summary: dict, latest: dict, analytics_str: str) -> str:
+    """The insight prompt for a zone from its history summary (compute_summary), latest reading and formatted analytics."""
     temp_summary_str = f"Temperature: min {summary['temperature'].get('min','N/A')}°F, max {summary['temperature'].get('max','N/A')}°F, avg {summary['temperature'].get('avg','N/A')}°F"
     hum_summary_str = f"Humidity: min {summary['humidity'].get('min','N/A')}%, max {summary['humidity'].get('max','N/A')}%, avg {summary['humidity'].get('avg','N/A')}%"
     co2_summary_str = f"CO2: min {summary['CO2'].get('min','N/A')} ppm, max {summary['CO2'].get('max','N/A')} ppm, avg {summary['CO2'].get('avg','N/A')} ppm"
     
     current_reading_str = f"Temperature: {latest.get('temperature','N/A')}°F, Humidity: {latest.get('humidity','N/A')}%, CO2: {latest.get('CO2','N/A')} ppm"
 
-    prompt = (
+    return (
         f"You are an AI assistant for a mushroom farm, providing insights for Zone: '{zone_name}'.\n"
         "Based on the following data, produce a JSON object with exactly three keys: "
         "\"historicalSummary\", \"currentReading\", and \"insight\".\n" # Escaped quotes for JSON string
@@ -83,31 +115,73 @@ def get_insight(zone_name: str):
         f"   Historical data summary to use: {temp_summary_str}; {hum_summary_str}; {co2_summary_str}.\n"
         "2. \"currentReading\": Report the latest sensor reading.\n"
         f"   Current reading to use: {current_reading_str}.\n"
-        "3. \"insight\": Provide a brief (max six sentences) analysis comparing historical trends with the current reading for this zone. "
-        "Flag anomalies (e.g., readings outside typical ranges, or significant deviations from average) with EMOJI_WARNING. " # Placeholder for emoji
+        "3. \"insight\": Provide a brief (max six sentences) analysis of this zone using the computed analytics below. "
+        "These numbers are already calculated; quote them rather than recomputing. "
+        "Mention every listed flag with EMOJI_WARNING; if there are none, say conditions look stable. " # Placeholder for emoji
+        f"   Computed analytics:\n{analytics_str}\n"
         "Conclude with one fun fact about mushrooms or mushroom cultivation. "
         "Output only the JSON object without any additional text or explanations."
     ).replace("EMOJI_WARNING", "⚠️") # Replace placeholder with actual emoji
 
-    insight_thread_id = start_ai_conversation() 
-    
-    print(f"\nGenerating insight for zone: {zone_name} (Thread: {insight_thread_id})")
-    
-    response_str = send_ai_message(thread_id=insight_thread_id, user_message=prompt, zone_name=zone_name)
-    
-    try:
-        response_json = json.loads(response_str)
-        if isinstance(response_json, dict) and all(k in response_json for k in ["historicalSummary", "currentReading", "insight"]):
-            return response_json
-        else:
-            print(f"Warning: AI response for zone {zone_name} was valid JSON but not the expected structure. Response: {response_str}")
-            return {"error": "AI response format incorrect.", "raw_response": response_str}
-    except json.JSONDecodeError:
-        print(f"Warning: AI response for zone {zone_name} was not valid JSON. Response: {response_str}")
-        return {"error": "AI response was not valid JSON.", "raw_response": response_str}
-    except Exception as e:
-        print(f"Error processing AI response for zone {zone_name}: {e}. Raw response: {response_str}")
-        return {"error": f"Unexpected error processing AI response: {e}", "raw_response": response_str}
+def _validate_insight(candidate) -> bool:
+    return isinstance(candidate, dict) and all(isinstance(candidate.get(k), str) for k in INSIGHT_KEYS)
+
+def _record_insight_metric(name: str):
+    with _INSIGHT_METRICS_LOCK:
+        INSIGHT_METRICS[name] += 1
+
+def generate_validated_insight(zone_name: str, prompt: str) -> dict:
+    """
+    Generates the insight JSON with schema-constrained output, falling back to a cheap
+    local repair of the raw text and only then to a (costly) regeneration. The first attempt
+    runs on the tier model_router picks (the small model when routing is on); retries always
+    use the large model.
+    """
+    _record_insight_metric("requests")
+    raw_response = ""
+    decision = route("insight", prompt)
+    for attempt in range(INSIGHT_MAX_RETRIES + 1):
+        tier = decision.tier if attempt == 0 else "large"
+        if attempt > 0:
+            _record_insight_metric("retries")
+            if decision.tier != "large" and attempt == 1:
+                record_fallback("insight")
+            logger.info(f"Retrying insight generation for zone {zone_name} on the {tier} model (attempt {attempt + 1}/{INSIGHT_MAX_RETRIES + 1}).")
+        options = INSIGHT_GENERATION_OPTIONS if attempt == 0 else INSIGHT_RETRY_OPTIONS
+        start = time.perf_counter()
+        generation = generate_structured(prompt, INSIGHT_SCHEMA, options=options, model=MODEL_TIERS[tier])
+        raw_response = generation["raw"] or raw_response
+        if generation["error"] and not generation["raw"]:
+            record_generation("insight", tier, time.perf_counter() - start, ok=False)
+            continue
+
+        if generation["early_stop"]:
+            _record_insight_metric("early_stops")
+        if _validate_insight(generation["parsed"]):
+            _record_insight_metric("parsed")
+            record_generation("insight", tier, time.perf_counter() - start)
+            return {k: generation["parsed"][k] for k in INSIGHT_KEYS}
+
+        repaired = repair_json(generation["raw"])
+        if _validate_insight(repaired):
+            _record_insight_metric("repaired")
+            record_generation("insight", tier, time.perf_counter() - start)
+            logger.info(f"Info: Repaired malformed insight JSON for zone {zone_name} locally.")
+            return {k: repaired[k] for k in INSIGHT_KEYS}
+        record_generation("insight", tier, time.perf_counter() - start, ok=False)
+        logger.warning(f"Warning: AI response for zone {zone_name} did not contain a valid insight object. Response: {generation['raw'][:200]}")
+
+    _record_insight_metric("failures")
+    return {"error": "AI response was not a valid insight JSON object.", "raw_response": raw_response}
+
+def get_insight_metrics() -> dict:
+    """Returns insight generation counters plus derived parse/repair/retry/failure rates."""
+    with _INSIGHT_METRICS_LOCK:
+        metrics = dict(INSIGHT_METRICS)
+    total = metrics["requests"]
+    for name in ("parsed", "repaired", "retries", "failures", "early_stops"):
+        metrics[f"{name}_rate"] = round(metrics[name] / total, 4) if total else 0.0
+    return metrics
 
 if __name__ == "__main__":
     print("--- Insight Bot Demonstration (Ollama & RAG - Multi-Zone) ---")
@@ -125,4 +199,7 @@ if __name__ == "__main__":
     else:
         insight_data_2 = get_insight(zone_name=example_zone_2)
         print(f"\nInsight for Zone '{example_zone_2}':")
-        print(json.dumps(insight_data_2, indent=2))
\ No newline at end of file
+        print(json.dumps(insight_data_2, indent=2))
+
+    print("\nInsight generation metrics:")
+    print(json.dumps(get_insight_metrics(), indent=2))
\ No newline at end of file
@@ -0,0 +1,172 @@
+import json
+import re
+
+# Characters some models emit in place of plain ASCII quotes.
+_SMART_QUOTES = {"“": '"', "”": '"', "‘": "'", "’": "'"}
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_CODE_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+
+class IncrementalJSONObjectParser:
+    """
+    Incrementally scans streamed text for the first complete top-level JSON object.
+
+    Chunks are fed as they arrive from a streaming generation. The parser tracks
+    brace depth while respecting string literals and escapes, so it knows the
+    moment the outermost object closes without re-parsing the whole buffer on
+    every chunk. Any text before the first '{' (markdown fences, commentary) is
+    ignored, and anything after the closing '}' is never needed, which lets the
+    caller stop generation as soon as `feed` returns True.
+    """
+
+    def __init__(self):
+        self.buffer = []  # Raw text of the object seen so far (from the first '{')
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.complete = False
+        self.result = None  # Parsed dict once complete and valid
+        self.error = None   # json.JSONDecodeError if the closed object did not parse
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Consume a chunk of streamed text.
+
+        Returns True once the first top-level object has closed (whether or not
+        it parsed cleanly); further chunks are ignored after that point.
+        """
+        if self.complete or not chunk:
+            return self.complete
+
+        for index, char in enumerate(chunk):
+            if not self.started:
+                if char != "{":
+                    continue
+                self.started = True
+                chunk = chunk[index:]
+                break
+        else:
+            if not self.started:
+                return False
+
+        for index, char in enumerate(chunk):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+            if char == '"':
+                self.in_string = True
+            elif char == "{" or char == "[":
+                self.depth += 1
+            elif char == "}" or char == "]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.buffer.append(chunk[:index + 1])
+                    self._finish()
+                    return True
+        self.buffer.append(chunk)
+        return False
+
+    def _finish(self):
+        self.complete = True
+        try:
+            parsed = json.loads(self.text)
+            if isinstance(parsed, dict):
+                self.result = parsed
+            else:
+                self.error = ValueError("Top-level JSON value is not an object.")
+        except json.JSONDecodeError as e:
+            self.error = e
+
+    @property
+    def text(self) -> str:
+        """The raw text of the object captured so far."""
+        return "".join(self.buffer)
+
+
+def repair_json(raw_text: str):
+    """
+    Cheap local repair for almost-JSON model output.
+
+    Tries, in order: parsing as-is, stripping markdown code fences and surrounding
+    commentary, normalizing smart quotes, dropping trailing commas, and finally
+    closing any strings/brackets left open by a truncated generation.
+
+    Returns the parsed dict, or None if the text could not be repaired.
+    """
+    if not raw_text:
+        return None
+
+    candidates = []
+    text = raw_text.strip()
+    candidates.append(text)
+
+    text = _CODE_FENCE_RE.sub("", text).strip()
+    start = text.find("{")
+    if start == -1:
+        return None
+    end = text.rfind("}")
+    sliced = text[start:end + 1] if end > start else text[start:]
+    candidates.append(sliced)
+
+    for smart, plain in _SMART_QUOTES.items():
+        sliced = sliced.replace(smart, plain)
+    sliced = _TRAILING_COMMA_RE.sub(r"\1", sliced)
+    candidates.append(sliced)
+    candidates.append(_close_open_structures(text[start:]))
+
+    for candidate in candidates:
+        try:
+            parsed = json.loads(candidate)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        if isinstance(parsed, dict):
+            return parsed
+    return None
+
+
+def _close_open_structures(text: str) -> str:
+    """Appends the closing quote/brackets a truncated JSON object is missing."""
+    stack = []
+    in_string = False
+    escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    repaired = text
+    if in_string:
+        repaired += '"'
+    repaired = _TRAILING_COMMA_RE.sub(r"\1", repaired.rstrip().rstrip(",") + "".join(reversed(stack)))
+    return repaired
+
+
+if __name__ == "__main__":
+    print("--- Incremental JSON Parser Demonstration ---")
+    streamed_chunks = ['Sure! Here is the JSON:\n```json\n{"historical', 'Summary": "Stable {ish}", ',
+                       '"currentReading": "45.1\\"F", "insight": "All good."}', '\n```\nHope this helps!']
+    parser = IncrementalJSONObjectParser()
+    for i, chunk in enumerate(streamed_chunks):
+        if parser.feed(chunk):
+            print(f"Object closed after chunk {i + 1}/{len(streamed_chunks)}: {parser.result}")
+            break
+
+    print("\n--- Repair Demonstration ---")
+    for broken in ['```json\n{"a": 1, "b": [1, 2,],}\n```', '{"a": "truncated str', "no json here"]:
+        print(f"{broken!r} -> {repair_json(broken)}")
@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+import websockets
+
+from fake_ollama import FakeOllamaConfig, start_fake_ollama, DEFAULT_EMBED_LATENCY_MS, DEFAULT_PROMPT_LATENCY_MS, \
+    DEFAULT_TOKEN_LATENCY_MS, DEFAULT_TOKENS
+from sensor_handler import ZONE_NAMES
+
+# --- Configuration ---
+API_PORT = 8001 # Kept off 8000 / 8765 / 11434 so a load test can run next to the real stack
+SENSOR_FEED_PORT = 8766
+FAKE_OLLAMA_PORT = 11435
+DEFAULT_DURATION_SECONDS = 30
+DEFAULT_SENSOR_INTERVAL_SECONDS = 1.0
+REQUEST_TIMEOUT_SECONDS = 120
+STARTUP_TIMEOUT_SECONDS = 180 # api_server generates sensor history before it accepts requests
+RESULTS_DIR = "load_results"
+REGRESSION_THRESHOLD = 0.20 # --compare flags p95 / throughput changes worse than this fraction
+CHAT_MESSAGES = ( # Alternates between fast-path data lookups and full RAG + LLM questions
+    "What was the max temperature today?",
+    "Should I increase misting to help pins form?",
+    "Average humidity over the last 24 hours?",
+    "Why might the CO2 be creeping up overnight?",
+)
+
+
+class EndpointStats:
+    """Latencies and errors for one scenario (e.g. "chat"). Latencies are seconds."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.errors = {}
+        self.extra = {}
+
+    def record(self, latency: float, error: str = None):
+        if error is None:
+            self.latencies.append(latency)
+        else:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def summary(self, duration: float) -> dict:
+        ok = len(self.latencies)
+        failed = sum(self.errors.values())
+        total = ok + failed
+        summary = {
+            "requests": total,
+            "errors": failed,
+            "error_rate": round(failed / total, 4) if total else 0.0,
+            "throughput_rps": round(ok / duration, 2) if duration else 0.0,
+            "error_kinds": dict(sorted(self.errors.items(), key=lambda item: -item[1])[:10]),
+        }
+        if ok:
+            p50, p95, p99 = np.percentile(self.latencies, [50, 95, 99]) * 1000
+            summary.update(p50_ms=round(p50, 2), p95_ms=round(p95, 2), p99_ms=round(p99, 2),
+                           mean_ms=round(float(np.mean(self.latencies)) * 1000, 2),
+                           max_ms=round(max(self.latencies) * 1000, 2))
+        summary.update(self.extra)
+        return summary
+
+
+def _error_kind(error: Exception) -> str:
+    return type(error).__name__
+
+
+async def _timed_request(client: httpx.AsyncClient, stats: EndpointStats, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        stats.record(time.perf_counter() - start, error=_error_kind(e))
+        return None
+    latency = time.perf_counter() - start
+    if response.status_code >= 400:
+        stats.record(latency, error=f"HTTP {response.status_code}")
+        return None
+    stats.record(latency)
+    return response
+
+
+async def chat_worker(client, stats: EndpointStats, deadline: float, worker_index: int, think: float):
+    thread_id = None
+    zone_name = ZONE_NAMES[worker_index % len(ZONE_NAMES)]
+    for message in itertools.cycle(CHAT_MESSAGES[worker_index % len(CHAT_MESSAGES):] + CHAT_MESSAGES):
+        if time.perf_counter() >= deadline:
+            return
+        payload = {"message": message, "zone_name": zone_name, "thread_id": thread_id}
+        response = await _timed_request(client, stats, "POST", "/chat", json=payload)
+        if response is not None:
+            thread_id = response.json().get("thread_id", thread_id)
+            source = response.json().get("source", "unknown")
+            stats.extra[f"source_{source}"] = stats.extra.get(f"source_{source}", 0) + 1
+        await asyncio.sleep(think)
+
+
+async def history_worker(client, stats: EndpointStats, deadline: float, worker_index: int, think: float):
+    for zone_name in itertools.cycle(ZONE_NAMES[worker_index % len(ZONE_NAMES):] + ZONE_NAMES):
+        if time.perf_counter() >= deadline:
+            return
+        await _timed_request(client, stats, "GET", "/history", params={"zone_name": zone_name})
+        await asyncio.sleep(think)
+
+
+async def insight_worker(client, stats: EndpointStats, deadline: float, worker_index: int, think: float):
+    for zone_name in itertools.cycle(ZONE_NAMES[worker_index % len(ZONE_NAMES):] + ZONE_NAMES):
+        if time.perf_counter() >= deadline:
+            return
+        await _timed_request(client, stats, "GET", "/run_insight", params={"zone_name": zone_name})
+        await asyncio.sleep(think)
+
+
+async def ws_worker(ws_url: str, stats: EndpointStats, deadline: float):
+    """One /ws client: connect latency is the recorded sample; received messages are counted in extra."""
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with websockets.connect(ws_url, open_timeout=REQUEST_TIMEOUT_SECONDS) as websocket:
+                stats.record(time.perf_counter() - start)
+                while time.perf_counter() < deadline:
+                    try:
+                        message = await asyncio.wait_for(websocket.recv(), timeout=max(0.01, deadline - time.perf_counter()))
+                    except asyncio.TimeoutError:
+                        return
+                    payload = json.loads(message)
+                    if isinstance(payload, dict) and payload.get("error"):
+                        stats.extra["error_messages"] = stats.extra.get("error_messages", 0) + 1
+                    else:
+                        stats.extra["messages"] = stats.extra.get("messages", 0) + 1
+        except (OSError, websockets.exceptions.WebSocketException, asyncio.TimeoutError) as e:
+            stats.record(time.perf_counter() - start, error=_error_kind(e))
+            await asyncio.sleep(0.5)
+
+
+async def run_load(base_url: str, duration: float, chat: int, history: int, insight: int, ws: int, think: float) -> dict:
+    """Drives all scenarios concurrently for `duration` seconds and returns per-scenario summaries."""
+    stats = {name: EndpointStats(name) for name, count in
+             (("chat", chat), ("history", history), ("run_insight", insight), ("ws", ws)) if count}
+    limits = httpx.Limits(max_connections=chat + history + insight + 1, max_keepalive_connections=chat + history + insight + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=REQUEST_TIMEOUT_SECONDS, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        tasks = [chat_worker(client, stats["chat"], deadline, i, think) for i in range(chat)]
+        tasks += [history_worker(client, stats["history"], deadline, i, think) for i in range(history)]
+        tasks += [insight_worker(client, stats["run_insight"], deadline, i, think) for i in range(insight)]
+        ws_url = base_url.replace("http://", "ws://") + "/ws"
+        tasks += [ws_worker(ws_url, stats["ws"], deadline) for _ in range(ws)]
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    if "ws" in stats:
+        stats["ws"].extra["messages_per_second"] = round(stats["ws"].extra.get("messages", 0) / elapsed, 2)
+    return {name: endpoint_stats.summary(elapsed) for name, endpoint_stats in stats.items()}
+
+
+def _wait_for_port(port: int, timeout: float, process: subprocess.Popen = None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before listening on port {port}.")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s.")
+
+
+def start_stack(workers: int, sensor_interval: float, ollama_config: FakeOllamaConfig, log_path: str, cwd: str = None,
+                extra_env: dict = None, feed_args: tuple = ()):
+    """
+    Fake Ollama (thread), pseudo sensor feed and api_server (subprocesses). Returns (fake_ollama, processes).
+    With `cwd` the servers run there, so their conversation files and Chroma index stay out of the repo.
+    """
+    fake_ollama = start_fake_ollama(FAKE_OLLAMA_PORT, ollama_config)
+    log_file = open(log_path, "w")
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ,
+               OLLAMA_HOST=f"http://127.0.0.1:{FAKE_OLLAMA_PORT}",
+               MUSHROOM_SENSOR_FEED_URI=f"ws://127.0.0.1:{SENSOR_FEED_PORT}",
+               MUSHROOM_LOG_LEVEL=os.environ.get("MUSHROOM_LOG_LEVEL", "warning"),
+               PYTHONPATH=os.pathsep.join(filter(None, (repo_dir, os.environ.get("PYTHONPATH")))),
+               **(extra_env or {}))
+    feed = subprocess.Popen([sys.executable, os.path.join(repo_dir, "psuedo_sensor_server.py"), "--port", str(SENSOR_FEED_PORT),
+                             "--interval", str(sensor_interval), *feed_args], stdout=subprocess.DEVNULL, stderr=log_file,
+                            env=env, cwd=cwd)
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "api_server:app", "--host", "127.0.0.1", "--port", str(API_PORT),
+                            "--workers", str(workers), "--ws", "wsproto", "--log-level", "warning"],
+                           stdout=log_file, stderr=log_file, env=env, cwd=cwd)
+    processes = [feed, api]
+    try:
+        _wait_for_port(SENSOR_FEED_PORT, 30, feed)
+        _wait_for_port(API_PORT, STARTUP_TIMEOUT_SECONDS, api)
+    except Exception:
+        stop_stack(fake_ollama, processes)
+        raise
+    return fake_ollama, processes
+
+
+def stop_stack(fake_ollama, processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    fake_ollama.shutdown()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare_results(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """Prints p95/throughput/error-rate changes against a baseline results file; returns regression descriptions."""
+    regressions = []
+    print(f"\n--- Compared with {baseline.get('git_commit', '?')} ({baseline.get('timestamp', '?')}) ---")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        line = [f"{name:12s}"]
+        if result.get("p95_ms") and before.get("p95_ms"):
+            change = result["p95_ms"] / before["p95_ms"] - 1
+            line.append(f"p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms ({change:+.0%})")
+            if change > threshold:
+                regressions.append(f"{name} p95 {change:+.0%}")
+        if before.get("throughput_rps"):
+            change = result["throughput_rps"] / before["throughput_rps"] - 1
+            line.append(f"throughput {before['throughput_rps']:.1f} -> {result['throughput_rps']:.1f}/s ({change:+.0%})")
+            if change < -threshold:
+                regressions.append(f"{name} throughput {change:+.0%}")
+        line.append(f"errors {before['error_rate']:.1%} -> {result['error_rate']:.1%}")
+        if result["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{name} error rate {result['error_rate']:.1%}")
+        print("  ".join(line))
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+    return regressions
+
+
+def print_results(results: dict):
+    print(f"{'scenario':12s} {'requests':>9s} {'err%':>6s} {'rps':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for name, result in results.items():
+        print(f"{name:12s} {result['requests']:9d} {result['error_rate'] * 100:6.1f} {result['throughput_rps']:8.2f} "
+              f"{result.get('p50_ms', float('nan')):9.1f} {result.get('p95_ms', float('nan')):9.1f} {result.get('p99_ms', float('nan')):9.1f}")
+        if name == "ws":
+            print(f"{'':12s} {result.get('messages', 0)} messages relayed ({result['messages_per_second']}/s); latency columns are connect times")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test api_server against a fake Ollama and a synthetic sensor feed.")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS, help="Seconds of load per run")
+    parser.add_argument("--chat", type=int, default=4, help="Concurrent /chat clients")
+    parser.add_argument("--history", type=int, default=4, help="Concurrent /history clients")
+    parser.add_argument("--insight", type=int, default=2, help="Concurrent /run_insight clients")
+    parser.add_argument("--ws", type=int, default=4, help="Concurrent /ws clients")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between a client's requests (0 = closed loop)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--sensor-interval", type=float, default=DEFAULT_SENSOR_INTERVAL_SECONDS, help="Seconds between sensor batches")
+    parser.add_argument("--tokens", type=int, default=DEFAULT_TOKENS, help="Fake Ollama tokens per generation")
+    parser.add_argument("--token-latency-ms", type=float, default=DEFAULT_TOKEN_LATENCY_MS)
+    parser.add_argument("--prompt-latency-ms", type=float, default=DEFAULT_PROMPT_LATENCY_MS, help="Per prompt character")
+    parser.add_argument("--embed-latency-ms", type=float, default=DEFAULT_EMBED_LATENCY_MS)
+    parser.add_argument("--base-url", help="Load an already running api_server instead of starting the local stack")
+    parser.add_argument("--output", help=f"Results JSON path (default: {RESULTS_DIR}/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="Compare with an earlier results file; exit 1 on regressions")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    commit = git_commit()
+    stack = None
+    if args.base_url is None:
+        print(f"Starting fake Ollama, sensor feed and api_server ({args.workers} worker(s))...")
+        stack = start_stack(args.workers, args.sensor_interval,
+                            FakeOllamaConfig(args.tokens, args.token_latency_ms, args.prompt_latency_ms, args.embed_latency_ms),
+                            os.path.join(RESULTS_DIR, f"{stamp}_server.log"))
+    try:
+        print(f"Running load for {args.duration:.0f}s: {args.chat} chat, {args.history} history, "
+              f"{args.insight} run_insight, {args.ws} ws client(s)...")
+        results = asyncio.run(run_load(args.base_url or f"http://127.0.0.1:{API_PORT}", args.duration,
+                                       args.chat, args.history, args.insight, args.ws, args.think_ms / 1000))
+    finally:
+        if stack is not None:
+            stop_stack(*stack)
+
+    report = {"timestamp": datetime.now().isoformat(timespec="seconds"), "git_commit": commit, "config": config, "results": results}
+    output = args.output or os.path.join(RESULTS_DIR, f"{stamp}_{commit}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_results(results)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare_results(report, json.load(f)):
+                sys.exit(1)
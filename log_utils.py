@@ -0,0 +1,49 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# --- Configuration ---
+LOG_FORMAT_ENV = "MUSHROOM_LOG_FORMAT" # "text" (default): plain messages, as print() used to produce; "json": one object per line
+LOG_LEVEL_ENV = "MUSHROOM_LOG_LEVEL"   # debug, info (default), warning, error
+ROOT_LOGGER_NAME = "mushroom"
+
+# Standard LogRecord attributes; anything else on a record came from `extra=` and is emitted as a field.
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(log_format: str = None, level: str = None):
+    """(Re)configures the shared handler. Defaults come from MUSHROOM_LOG_FORMAT / MUSHROOM_LOG_LEVEL."""
+    log_format = (log_format or os.environ.get(LOG_FORMAT_ENV, "text")).lower()
+    level = (level or os.environ.get(LOG_LEVEL_ENV, "info")).upper()
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.handlers.clear()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if log_format == "json" else logging.Formatter("%(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+
+
+def get_logger(component: str) -> logging.Logger:
+    """Logger for a module, e.g. get_logger("ai_model"). Configures output on first use."""
+    if not logging.getLogger(ROOT_LOGGER_NAME).handlers:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{component}")
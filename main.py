@@ -1,103 +1,110 @@
+import argparse
 import os
-from openai import OpenAI
-from sensor_handler import read_sensor_data
-
-# Load API Key
-def load_api_key():
-    try:
-        with open("key.txt", "r") as file:
-            key = file.read().strip()
-            if not key:
-                raise ValueError("API key is empty. Please ensure 'key.txt' contains a valid key.")
-            return key
-    except FileNotFoundError:
-        print("❌ ERROR: 'key.txt' not found! Please create it and add your OpenAI API key.")
-        exit(1)
-    except Exception as e:
-        print(f"❌ ERROR: Unable to read 'key.txt': {str(e)}")
-        exit(1)
-
-# Initialize OpenAI client
-api_key = load_api_key()
-client = OpenAI(api_key=api_key)
-
-# OpenAI Assistant ID
-ASSISTANT_ID = "asst_GOHjtf7WMJMji6d5VEjxwuDY"
-
-# Start a new conversation
-def start_conversation():
-    """Creates a new AI conversation thread."""
-    return client.beta.threads.create().id
-
-# Send messages to AI
-def send_message(thread_id, user_message):
-    """Sends a message to OpenAI and returns the response."""
-    try:
-        client.beta.threads.messages.create(
-            thread_id=thread_id, role="user", content=user_message
-        )
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread_id, assistant_id=ASSISTANT_ID
-        )
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        return messages.data[0].content[0].text.value
-    except Exception as e:
-        return f"Error communicating with AI: {str(e)}"
-
-# Create immersive mushroom dialogue
-def generate_mushroom_prompt(sensor_data, history_data):
-    """Formats a mushroom AI prompt using both current and past sensor data."""
-    history_text = "\n".join(
-        [f"- {entry['Date']}: CO₂ {entry['CO2 (ppm)']} ppm, Humidity {entry['RH (%)']}%, Temp {entry['Temperature (F)']}°F"
-         for entry in history_data[:10]]  # Limit to last 10 entries
-    )
-
-    return f"""
-    🍄 *Hello, dear caretaker...* 🍄  
-    I am your ever-growing **mushroom**, deeply rooted in the underground.
-    Through my gills, I have sensed the passing moments… Here’s how I feel now:
-
-    **Current Conditions:**
-    📅 **Time:** {sensor_data['timestamp']}
-    🌿 **Humidity:** {sensor_data['humidity']}
-    🌬️ **CO₂ Levels:** {sensor_data['CO2']}
-    🔥 **Temperature:** {sensor_data['temperature']}
-
-    **I remember my past well…**
-    Here’s how I’ve been doing over time:
-    {history_text}
-
-    Speak to me, tell me your thoughts, and I shall respond with my fungal wisdom.
-    """
-
-def main():
-    """Runs the Mushroom AI conversation system."""
-    print("\n🌱 Welcome to 'Talk to Your Mushrooms' AI 🍄\n")
+import time
 
-    thread_id = start_conversation()
+import ai_model
+from analytics import summarize_recent_window
+from log_utils import LOG_LEVEL_ENV, configure_logging
+from sensor_handler import ZONE_NAMES, read_sensor_data
 
-    # Get sensor data
-    sensor_data, history_data = read_sensor_data()
-    if not sensor_data or not history_data:
-        print("❌ ERROR: No sensor data available. Exiting.")
-        return
+# --- Configuration ---
+TERMINAL_CLIENT = "terminal" # Prefetch client id: a new zone cancels this client's previous warm-up
+GREETING = ("Greet your caretaker as the mushroom growing in this zone. In at most four sentences, tell them how "
+            "you feel about the recent conditions and anything flagged.")
 
-    # Create immersive mushroom dialogue
-    initial_prompt = generate_mushroom_prompt(sensor_data, history_data)
 
-    # Send initial message
-    print("\n🍄 Mushroom says:", send_message(thread_id, initial_prompt))
+def choose_zone(default: str = None) -> str:
+    """Asks for a zone by number or name until a configured one is given."""
+    if default in ZONE_NAMES:
+        return default
+    for index, zone_name in enumerate(ZONE_NAMES, start=1):
+        print(f"  {index}. {zone_name}")
+    while True:
+        choice = input("Choose a zone (number or name): ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(ZONE_NAMES):
+            return ZONE_NAMES[int(choice) - 1]
+        match = next((zone_name for zone_name in ZONE_NAMES if zone_name.lower() == choice.lower()), None)
+        if match:
+            return match
+        print(f"Unknown zone '{choice}'.")
+
+
+def load_zone_summary(zone_name: str) -> str:
+    """Takes a fresh reading and precomputes the zone's recent-window summary used for every message."""
+    latest, history = read_sensor_data(zone_name=zone_name)
+    return summarize_recent_window(zone_name, history)
+
+
+class ZoneSession:
+    """The terminal conversation: the selected zone, its precomputed summary and the conversation thread."""
+
+    def __init__(self, zone_name: str, show_timing: bool = False):
+        self.show_timing = show_timing
+        self.open_zone(zone_name)
+
+    def open_zone(self, zone_name: str):
+        self.zone_name = zone_name
+        self.thread_id = ai_model.start_conversation()
+        # Warms the model, retrieval and the thread while the summary is computed and the user types.
+        ai_model.prefetch_zone(zone_name, client=TERMINAL_CLIENT, thread_id=self.thread_id)
+        self.refresh()
+
+    def refresh(self):
+        start = time.perf_counter()
+        self.zone_summary = load_zone_summary(self.zone_name)
+        print(f"\n📍 Zone {self.zone_name} ({(time.perf_counter() - start) * 1000:.0f} ms to summarize):")
+        print(self.zone_summary)
+
+    def ask(self, message: str) -> dict:
+        """Sends a message and prints the reply as it streams in."""
+        print("\n🍄 Mushroom says: ", end="", flush=True)
+        start = time.perf_counter()
+        first_token = []
+
+        def on_token(token: str):
+            if not first_token:
+                first_token.append(time.perf_counter() - start)
+            print(token, end="", flush=True)
+
+        details = ai_model.send_message_with_details(self.thread_id, message, self.zone_name,
+                                                     zone_summary=self.zone_summary, on_token=on_token)
+        if not first_token: # Errors are returned, not streamed
+            print(details["reply"], end="")
+        print()
+        if self.show_timing and first_token:
+            print(f"   [{details['source']}: first token {first_token[0]:.2f}s, reply {time.perf_counter() - start:.2f}s]")
+        return details
+
+
+def main(zone_name: str = None, greeting: bool = True, show_timing: bool = False):
+    """Runs the Mushroom AI conversation system."""
+    print("\n🌱 Welcome to 'Talk to Your Mushrooms' AI 🍄\n")
+    session = ZoneSession(choose_zone(zone_name), show_timing=show_timing)
+    if greeting:
+        session.ask(GREETING)
 
-    # Chat loop
+    print("\nCommands: /zone [name] switches zone, /refresh re-reads the sensors, exit quits.")
     while True:
-        user_input = input("\n👨‍🌾 Caretaker: ")
+        user_input = input("\n👨‍🌾 Caretaker: ").strip()
         if user_input.lower() in ["exit", "quit"]:
             print("\n🔚 The mushroom retreats into silence... Goodbye! 🍂\n")
             break
+        if not user_input:
+            continue
+        if user_input.startswith("/zone"):
+            session.open_zone(choose_zone(user_input[len("/zone"):].strip() or None))
+            continue
+        if user_input == "/refresh":
+            session.refresh()
+            continue
+        session.ask(user_input)
 
-        # Send user message to AI and get response
-        ai_response = send_message(thread_id, user_input)
-        print("\n🍄 Mushroom says:", ai_response)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Terminal chat with a zone's mushrooms, streamed from the local Ollama model.")
+    parser.add_argument("--zone", choices=ZONE_NAMES, help="Zone to open (asked interactively if omitted)")
+    parser.add_argument("--no-greeting", action="store_true", help="Skip the mushroom's opening message")
+    parser.add_argument("--timing", action="store_true", help="Print time to first token and total reply time")
+    args = parser.parse_args()
+    configure_logging(level=os.environ.get(LOG_LEVEL_ENV, "warning")) # Pipeline info logs would interleave with the streamed reply
+    main(args.zone, greeting=not args.no_greeting, show_timing=args.timing)
@@ -0,0 +1,82 @@
+import os
+import threading
+import tracemalloc
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# --- Configuration ---
+TRACEMALLOC_ENV = "MUSHROOM_TRACEMALLOC" # Frames kept per allocation (e.g. 1 or 5); unset or 0 = tracing off
+DEFAULT_TOP = 10
+# Allocations made by the tracer and the import machinery are not the servers' memory
+_IGNORED = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"), tracemalloc.Filter(False, "<unknown>"))
+
+
+def start_from_env() -> bool:
+    """Starts tracemalloc when MUSHROOM_TRACEMALLOC is set (it roughly doubles allocation cost). Returns whether it is on."""
+    frames = int(os.environ.get(TRACEMALLOC_ENV, "0") or 0)
+    if frames > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return tracemalloc.is_tracing()
+
+
+def rss_mb(pid: int = None) -> float:
+    """Resident set size of a process (this one by default) in MB, or None if it cannot be read."""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / 2**20
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _site(statistic) -> str:
+    frames = statistic.traceback
+    return " <- ".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in frames)
+
+
+class MemoryTracker:
+    """
+    RSS plus, when tracemalloc is on, the largest allocation sites and the sites that grew the
+    most since a baseline snapshot (set with reset_baseline=True, e.g. after warm-up). Snapshots
+    raise RSS themselves, so compare traced sizes rather than RSS while tracing.
+    """
+
+    def __init__(self):
+        self._baseline = None
+        self._lock = threading.Lock()
+
+    @property
+    def has_baseline(self) -> bool:
+        return self._baseline is not None
+
+    def report(self, top: int = DEFAULT_TOP, reset_baseline: bool = False) -> dict:
+        report = {"tracing": tracemalloc.is_tracing()}
+        if not tracemalloc.is_tracing():
+            return {**report, "rss_mb": rss_mb()}
+        current, peak = tracemalloc.get_traced_memory()
+        report.update(traced_mb=round(current / 2**20, 3), traced_peak_mb=round(peak / 2**20, 3),
+                      tracemalloc_overhead_mb=round(tracemalloc.get_tracemalloc_memory() / 2**20, 3))
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        group_by = "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno"
+        report["top"] = [{"site": _site(stat), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                         for stat in snapshot.statistics(group_by)[:top]]
+        with self._lock:
+            if self._baseline is not None:
+                report["growth"] = [
+                    {"site": _site(stat), "size_diff_kb": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff,
+                     "size_kb": round(stat.size / 1024, 1)}
+                    for stat in snapshot.compare_to(self._baseline, group_by)[:top] if stat.size_diff > 0]
+                report["traced_growth_mb"] = round((sum(trace.size for trace in snapshot.traces)
+                                                    - sum(trace.size for trace in self._baseline.traces)) / 2**20, 3)
+            if reset_baseline:
+                self._baseline = snapshot
+        report["rss_mb"] = rss_mb() # After the snapshot: a kept baseline is part of the process from here on
+        return report
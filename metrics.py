@@ -0,0 +1,288 @@
+import threading
+import time
+from bisect import bisect_left
+
+# --- Configuration ---
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8" # Prometheus text exposition format
+
+
+class _Metric:
+    """Shared label handling. Children are keyed by label-value tuples and created on first use."""
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames=(), registry=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+        if not self.labelnames:
+            self.labels() # Unlabeled metrics are exported (as zero) from the start
+
+    def labels(self, *values, **kwargs):
+        key = tuple(str(value) for value in values) or tuple(str(kwargs[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _label_text(self, key, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _default_child(self):
+        return self.labels()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount # A single bytecode-level add under the GIL; exact enough for monitoring
+
+
+class Counter(_Metric):
+    """Monotonic counter. `COUNTER.inc()` without labels, or `COUNTER.labels(x="y").inc()`."""
+    kind = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def render(self) -> list:
+        return [f"{self.name}_total{self._label_text(key)} {_format_number(child.value)}"
+                for key, child in list(self._children.items())]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """Computes the value at scrape time instead (zero cost on the hot path)."""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed lazily at scrape time with set_function()."""
+    kind = "gauge"
+    _new_child = _GaugeChild
+
+    def set(self, value):
+        self._default_child().set(value)
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def dec(self, amount=1):
+        self._default_child().dec(amount)
+
+    def set_function(self, function):
+        self._default_child().set_function(function)
+
+    def get(self):
+        return self._default_child().get()
+
+    def render(self) -> list:
+        return [f"{self.name}{self._label_text(key)} {_format_number(child.get())}"
+                for key, child in list(self._children.items())]
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1) # Last slot: +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        # No lock: like counter increments these are GIL-serialized adds. A rare lost update
+        # under heavy thread contention is an acceptable trade for a lock-free hot path.
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram. Observing is a bisect plus two additions; use
+    `with HISTOGRAM.labels(...).time():` to record a block's wall-clock duration.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default_child().observe(value)
+
+    def time(self):
+        return self._default_child().time()
+
+    def render(self) -> list:
+        lines = []
+        for key, child in list(self._children.items()):
+            counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_label = 'le="' + _format_number(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._label_text(key, bucket_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: _Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# --- Application metrics ---
+# Defined here so every module records into the same registry and /metrics exposes them all.
+EMBEDDING_SECONDS = Histogram("mushroom_embedding_seconds", "Ollama embedding request latency")
+CHROMA_QUERY_SECONDS = Histogram("mushroom_chroma_query_seconds", "ChromaDB query latency")
+OLLAMA_REQUEST_SECONDS = Histogram("mushroom_ollama_request_seconds", "Ollama generation request latency as seen by the client", ("mode",))
+OLLAMA_FIRST_TOKEN_SECONDS = Histogram("mushroom_ollama_first_token_seconds", "Time to the first token of a streamed generation")
+OLLAMA_DURATION_SECONDS = Histogram("mushroom_ollama_duration_seconds", "Durations reported by Ollama itself", ("phase",))
+OLLAMA_TOKENS = Counter("mushroom_ollama_tokens", "Tokens processed by Ollama", ("phase",))
+OLLAMA_ERRORS = Counter("mushroom_ollama_errors", "Failed Ollama requests", ("endpoint",))
+HISTORY_READ_SECONDS = Histogram("mushroom_history_read_seconds", "Sensor history read latency", ("operation",))
+JSON_SERIALIZE_SECONDS = Histogram("mushroom_json_serialize_seconds", "JSON serialization latency", ("payload",))
+PROMPT_TOKENS = Histogram("mushroom_prompt_tokens", "Estimated chat prompt tokens by section", ("section",),
+                          buckets=(32, 64, 128, 256, 512, 768, 1024, 1536, 2048, 4096, 8192))
+CHAT_REPLIES = Counter("mushroom_chat_replies", "Chat replies by answer source", ("source",))
+CACHE_REQUESTS = Counter("mushroom_cache_requests", "Cache lookups by cache and result", ("cache", "result"))
+WS_CLIENTS = Gauge("mushroom_ws_clients", "Connected /ws relay clients")
+WS_MESSAGES = Counter("mushroom_ws_messages", "Messages relayed to /ws clients", ("kind",))
+EVENT_SUBSCRIBERS = Gauge("mushroom_event_subscribers", "Event fan-out subscribers (/ws and SSE)")
+EVENT_QUEUE_DEPTH = Gauge("mushroom_event_queue_depth", "Events queued across all fan-out subscribers")
+EVENTS_DROPPED = Gauge("mushroom_events_dropped", "Events dropped because a subscriber queue was full")
+
+# Ollama reports these in nanoseconds on the final response object.
+_OLLAMA_PHASES = (("total_duration", "total"), ("load_duration", "load"),
+                  ("prompt_eval_duration", "prompt_eval"), ("eval_duration", "eval"))
+
+
+def timed(child):
+    """Decorator recording each call's duration into a histogram child, e.g. @timed(HISTOGRAM.labels("x"))."""
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        wrapper.__name__, wrapper.__doc__, wrapper.__wrapped__ = function.__name__, function.__doc__, function
+        return wrapper
+    return decorator
+
+
+def record_ollama_stats(response_json: dict):
+    """Records Ollama's own timings and token counts from a final (done) response object."""
+    for key, phase in _OLLAMA_PHASES:
+        if response_json.get(key):
+            OLLAMA_DURATION_SECONDS.labels(phase).observe(response_json[key] / 1e9)
+    if response_json.get("prompt_eval_count"):
+        OLLAMA_TOKENS.labels("prompt_eval").inc(response_json["prompt_eval_count"])
+    if response_json.get("eval_count"):
+        OLLAMA_TOKENS.labels("eval").inc(response_json["eval_count"])
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+if __name__ == "__main__":
+    iterations = 1_000_000
+    child = HISTORY_READ_SECONDS.labels("benchmark")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        child.observe(0.003)
+    observe_ns = (time.perf_counter() - start) / iterations * 1e9
+    counter = CACHE_REQUESTS.labels("benchmark", "hit")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        counter.inc()
+    inc_ns = (time.perf_counter() - start) / iterations * 1e9
+    start = time.perf_counter()
+    for _ in range(iterations // 10):
+        with child.time():
+            pass
+    timer_ns = (time.perf_counter() - start) / (iterations // 10) * 1e9
+    print(f"histogram observe: {observe_ns:.0f} ns, counter inc: {inc_ns:.0f} ns, timed block overhead: {timer_ns:.0f} ns")
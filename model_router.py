@@ -0,0 +1,142 @@
+import argparse
+import os
+import re
+import threading
+import time
+
+from metrics import Counter, Histogram
+from prompt_builder import estimate_tokens
+
+# --- Configuration ---
+ROUTING_ENABLED = os.environ.get("MUSHROOM_MODEL_ROUTING", "0") == "1" # Opt-in: needs the small model created in Ollama
+MODEL_TIERS = {
+    "small": os.environ.get("MUSHROOM_SMALL_MODEL", "mushroom_gemma_small"), # gemma3:4b (gemma_mushroom_modelfile_small)
+    "large": os.environ.get("MUSHROOM_LARGE_MODEL", "mushroom_gemma"),       # gemma3:12b
+}
+# Request kinds whose output is tightly constrained (schema, fixed facts) and can start on the small tier.
+SMALL_TIER_KINDS = ("insight", "summary", "phrasing")
+SMALL_MAX_PROMPT_TOKENS = 1200 # Longer prompts go to the large model regardless of kind
+SIMPLE_MAX_WORDS = 25 # Chat messages longer than this are never classified as simple
+ADVICE_PATTERN = re.compile(
+    r"\b(why|how (?:do|can|should|would)|should|recommend|advice|advise|suggest|what (?:should|can|to do)|explain|"
+    r"diagnos\w*|troubleshoot\w*|cause[sd]?|fix|improve|prevent|compare|plan|strategy|contaminat\w*|mold|disease)\b",
+    re.IGNORECASE)
+GREETING_PATTERN = re.compile(r"^\s*(hi|hello|hey|thanks|thank you|ok(ay)?|good (morning|afternoon|evening)|great|cool)\b[\s!.,]*",
+                              re.IGNORECASE)
+FACTUAL_PATTERN = re.compile(r"\b(what(?:'s| is| was| are)|current(?:ly)?|latest|now|level|reading|temperature|humidity|co2)\b",
+                             re.IGNORECASE)
+
+MODEL_ROUTES = Counter("mushroom_model_routes", "Generation routing decisions", ("kind", "tier", "reason"))
+MODEL_FALLBACKS = Counter("mushroom_model_fallbacks", "Small-model outputs that failed validation and were regenerated on the large model", ("kind",))
+MODEL_TIER_SECONDS = Histogram("mushroom_model_tier_seconds", "Generation latency by model tier", ("tier", "kind"))
+
+_stats_lock = threading.Lock()
+_stats = {} # (kind, tier) -> {"requests", "seconds", "failures"}
+_fallbacks = {} # kind -> count
+
+
+class RouteDecision:
+    __slots__ = ("kind", "tier", "model", "reason")
+
+    def __init__(self, kind: str, tier: str, reason: str):
+        self.kind = kind
+        self.tier = tier
+        self.model = MODEL_TIERS[tier]
+        self.reason = reason
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "tier": self.tier, "model": self.model, "reason": self.reason}
+
+
+def classify_message(message: str) -> tuple:
+    """Cheap complexity classifier for chat messages: ("simple"|"complex", reason). No model call."""
+    text = (message or "").strip()
+    words = len(text.split())
+    if ADVICE_PATTERN.search(text):
+        return "complex", "advice"
+    if words > SIMPLE_MAX_WORDS or text.count("?") > 1:
+        return "complex", "long_question"
+    if GREETING_PATTERN.match(text) and words <= 6:
+        return "simple", "greeting"
+    if FACTUAL_PATTERN.search(text):
+        return "simple", "factual"
+    return "complex", "open_ended"
+
+
+def route(kind: str, prompt: str, user_message: str = None) -> RouteDecision:
+    """
+    Picks the model tier for one generation. `kind` is the request type ("chat", "insight",
+    "summary", "phrasing"); chat requests are further split by classify_message.
+    """
+    if not ROUTING_ENABLED:
+        decision = RouteDecision(kind, "large", "routing_disabled")
+    elif estimate_tokens(prompt) > SMALL_MAX_PROMPT_TOKENS:
+        decision = RouteDecision(kind, "large", "long_prompt")
+    elif kind in SMALL_TIER_KINDS:
+        decision = RouteDecision(kind, "small", "kind")
+    elif kind == "chat":
+        complexity, reason = classify_message(user_message if user_message is not None else prompt)
+        decision = RouteDecision(kind, "small" if complexity == "simple" else "large", reason)
+    else:
+        decision = RouteDecision(kind, "large", "default")
+    MODEL_ROUTES.labels(decision.kind, decision.tier, decision.reason).inc()
+    return decision
+
+
+def record_generation(kind: str, tier: str, seconds: float, ok: bool = True):
+    """Per-tier latency and validation failures, for get_routing_stats and /metrics."""
+    MODEL_TIER_SECONDS.labels(tier, kind).observe(seconds)
+    with _stats_lock:
+        entry = _stats.setdefault((kind, tier), {"requests": 0, "seconds": 0.0, "failures": 0})
+        entry["requests"] += 1
+        entry["seconds"] += seconds
+        entry["failures"] += 0 if ok else 1
+
+
+def record_fallback(kind: str):
+    MODEL_FALLBACKS.labels(kind).inc()
+    with _stats_lock:
+        _fallbacks[kind] = _fallbacks.get(kind, 0) + 1
+
+
+def run_with_fallback(decision: RouteDecision, generate, validate):
+    """
+    Calls generate(model) on the routed tier; if a small-tier result fails validate(result), the
+    request is regenerated on the large model. Returns (result, tier that produced it).
+    """
+    start = time.perf_counter()
+    result = generate(decision.model)
+    ok = validate(result)
+    record_generation(decision.kind, decision.tier, time.perf_counter() - start, ok)
+    if ok or decision.tier == "large":
+        return result, decision.tier
+    record_fallback(decision.kind)
+    start = time.perf_counter()
+    result = generate(MODEL_TIERS["large"])
+    record_generation(decision.kind, "large", time.perf_counter() - start, validate(result))
+    return result, "large"
+
+
+def get_routing_stats() -> dict:
+    """Requests, mean latency and validation failure rate per request kind and tier, plus fallbacks."""
+    with _stats_lock:
+        tiers = {f"{kind}/{tier}": {"requests": entry["requests"],
+                                    "mean_seconds": round(entry["seconds"] / entry["requests"], 3),
+                                    "failure_rate": round(entry["failures"] / entry["requests"], 4)}
+                 for (kind, tier), entry in sorted(_stats.items())}
+        return {"enabled": ROUTING_ENABLED, "models": dict(MODEL_TIERS), "tiers": tiers, "fallbacks": dict(_fallbacks)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show how chat messages would be routed between model tiers.")
+    parser.add_argument("messages", nargs="*", help="Chat messages to classify (default: a built-in sample)")
+    args = parser.parse_args()
+    ROUTING_ENABLED = True
+    samples = args.messages or [
+        "hi!", "thanks", "What's the CO2 in Babylon 1 right now?", "current humidity in Tent 2",
+        "Why are my pins aborting in Mine even though humidity looks fine?",
+        "Should I increase fresh air exchange overnight?", "Tell me about oyster mushrooms",
+    ]
+    for message in samples:
+        decision = route("chat", message, message)
+        print(f"{decision.tier:5s} {decision.model:22s} {decision.reason:14s} {message}")
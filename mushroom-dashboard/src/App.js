@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import {
   LineChart,
   Line,
@@ -15,6 +15,19 @@ const WEBSOCKET_URL = "ws://localhost:8000/ws";
 const HISTORY_URL = "http://localhost:8000/history";
 const INSIGHT_URL = "http://localhost:8000/insight";
 const RUN_INSIGHT_URL = "http://localhost:8000/run_insight";
+const ZONES_URL = "http://localhost:8000/zones";
+const EMPTY_INSIGHT = { historicalSummary: "", currentReading: "", insight: "" };
+
+const zoneUrl = (url, zoneName) => `${url}?zone_name=${encodeURIComponent(zoneName)}`;
+
+// Resolves with the JSON body, or rejects with the server's error detail (4xx/5xx bodies are JSON too).
+const fetchJson = (url) =>
+  fetch(url).then((res) =>
+    res.json().then((data) => {
+      if (!res.ok) throw new Error(data.detail || `HTTP ${res.status}`);
+      return data;
+    })
+  );
 
 // Reusable GraphCard component.
 const GraphCard = ({ title, dataKey, data }) => {
@@ -152,12 +165,11 @@ const typeWriter = (fullText, delay, callback) => {
 };
 
 const App = () => {
+  const [zones, setZones] = useState([]);
+  const [selectedZone, setSelectedZone] = useState(null);
+  const selectedZoneRef = useRef(null); // Read by the long-lived WebSocket handler
   const [sensorData, setSensorData] = useState([]);
-  const [insight, setInsight] = useState({
-    historicalSummary: "",
-    currentReading: "",
-    insight: ""
-  });
+  const [insight, setInsight] = useState(EMPTY_INSIGHT);
   const [openGraphs, setOpenGraphs] = useState({
     temperature: false,
     humidity: false,
@@ -165,14 +177,36 @@ const App = () => {
   });
   const [isChatOpen, setIsChatOpen] = useState(false);
   const [isInsightUpdating, setIsInsightUpdating] = useState(false);
+  const [alerts, setAlerts] = useState([]);
 
   useEffect(() => {
-    fetch(HISTORY_URL)
-      .then((res) => res.json())
-      .then((data) => setSensorData(data))
-      .catch((err) => console.error("Error fetching history:", err));
+    fetchJson(ZONES_URL)
+      .then((data) => {
+        const names = data.zones.map((zone) => zone.name);
+        setZones(names);
+        setSelectedZone((current) => current || names[0] || null);
+      })
+      .catch((err) => console.error("Error fetching zones:", err));
   }, []);
 
+  // Everything below the header belongs to the selected zone: reload it when the zone changes.
+  useEffect(() => {
+    selectedZoneRef.current = selectedZone;
+    setSensorData([]);
+    setInsight(EMPTY_INSIGHT);
+    if (!selectedZone) return;
+    fetchJson(zoneUrl(HISTORY_URL, selectedZone))
+      .then((data) => {
+        if (selectedZoneRef.current === selectedZone) setSensorData(data.history || []);
+      })
+      .catch((err) => console.error("Error fetching history:", err));
+    fetchJson(zoneUrl(INSIGHT_URL, selectedZone))
+      .then((data) => {
+        if (selectedZoneRef.current === selectedZone && data.insight) setInsight(data.insight);
+      })
+      .catch((err) => console.error("Error fetching insight:", err));
+  }, [selectedZone]);
+
   useEffect(() => {
     const ws = new WebSocket(WEBSOCKET_URL);
     ws.onopen = () => {
@@ -180,11 +214,26 @@ const App = () => {
     };
     ws.onmessage = (event) => {
       const newData = JSON.parse(event.data);
+      if (newData.type === "alerts") {
+        setAlerts((prevAlerts) => [...newData.alerts, ...prevAlerts].slice(0, 20));
+        return;
+      }
+      if (newData.type === "insight") {
+        // Insights are pushed by the server as soon as they are generated, for every zone; no polling needed.
+        if (newData.zone_name === selectedZoneRef.current && newData.insight) {
+          setInsight(newData.insight);
+        }
+        return;
+      }
+      // The live feed sends one reading per zone each tick.
+      const readings = Array.isArray(newData) ? newData : [newData];
+      const reading = readings.find((r) => r.zone && r.zone === selectedZoneRef.current);
+      if (!reading) return;
       const parsedData = {
-        ...newData,
-        temperature: Number(newData.temperature),
-        humidity: Number(newData.humidity),
-        CO2: Number(newData.CO2)
+        ...reading,
+        temperature: Number(reading.temperature),
+        humidity: Number(reading.humidity),
+        CO2: Number(reading.CO2)
       };
       setSensorData((prevData) => [...prevData, parsedData]);
     };
@@ -205,19 +254,17 @@ const App = () => {
     };
   }, []);
 
-  useEffect(() => {
-    fetch(INSIGHT_URL)
-      .then((res) => res.json())
-      .then((data) => setInsight(data.insight))
-      .catch((err) => console.error("Error fetching insight:", err));
-  }, []);
-
   const updateInsightManual = () => {
+    const zoneName = selectedZone;
+    if (!zoneName) return;
     setIsInsightUpdating(true);
-    fetch(RUN_INSIGHT_URL)
-      .then((res) => res.json())
+    fetchJson(zoneUrl(RUN_INSIGHT_URL, zoneName))
       .then((data) => {
-        const newInsight = data.insight;
+        const newInsight = data.insight || EMPTY_INSIGHT;
+        if (selectedZoneRef.current !== zoneName) {
+          setIsInsightUpdating(false); // The user moved to another zone meanwhile
+          return;
+        }
         Promise.all([
           typeWriter(newInsight.historicalSummary || "", 60, (txt) =>
             setInsight((prev) => ({ ...prev, historicalSummary: txt }))
@@ -234,6 +281,7 @@ const App = () => {
       })
       .catch((err) => {
         console.error("Error updating insight manually:", err);
+        setInsight((prev) => ({ ...prev, insight: `Could not update the insight: ${err.message}` }));
         setIsInsightUpdating(false);
       });
   };
@@ -250,6 +298,17 @@ const App = () => {
     <div className="App">
       <header className="app-header">
         <h1>🍄 Mushroom Environment Monitor</h1>
+        <select
+          className="zone-select"
+          value={selectedZone || ""}
+          onChange={(e) => setSelectedZone(e.target.value)}
+        >
+          {zones.map((zoneName) => (
+            <option key={zoneName} value={zoneName}>
+              {zoneName}
+            </option>
+          ))}
+        </select>
         <button className="chat-toggle-button" onClick={toggleChatPanel}>
           {isChatOpen ? "Hide Chat" : "Open Chat"}
         </button>
@@ -257,7 +316,7 @@ const App = () => {
       <div className={`dashboard ${isChatOpen ? "with-chat" : ""}`}>
         {isChatOpen && (
           <div className="chat-panel">
-            <Chat />
+            <Chat zoneName={selectedZone} />
           </div>
         )}
         <div className="content-panel">
@@ -284,6 +343,17 @@ const App = () => {
           {openGraphs.CO2 && (
             <GraphCard title="CO₂ Levels" dataKey="CO2" data={sensorData} />
           )}
+          {alerts.length > 0 && (
+            <div className="alerts-container">
+              <h2>⚠️ Alerts</h2>
+              {alerts.map((alert, idx) => (
+                <div key={idx} className={`alert-item ${alert.severity}`}>
+                  {alert.timestamp} · {alert.zone} · {alert.metric} {alert.value} (expected ~
+                  {alert.expected})
+                </div>
+              ))}
+            </div>
+          )}
           {/* Insight Section placed below the charts */}
           <div className="insight-container">
             <h2>Insight</h2>
@@ -1,7 +1,7 @@
 import React, { useState } from "react";
 import "./Chat.css";
 
-const Chat = () => {
+const Chat = ({ zoneName }) => {
   const [threadId, setThreadId] = useState(null);
   const [userMessage, setUserMessage] = useState("");
   const [chatHistory, setChatHistory] = useState([]);
@@ -9,7 +9,7 @@ const Chat = () => {
   const [isFullScreen, setIsFullScreen] = useState(false);
 
   const sendChat = async () => {
-    if (!userMessage.trim()) return;
+    if (!userMessage.trim() || !zoneName) return;
     const messageToSend = userMessage; // Preserve the message before clearing
     // Add user message to the history
     setChatHistory((prev) => [...prev, { sender: "user", message: messageToSend }]);
@@ -20,14 +20,14 @@ const Chat = () => {
       const response = await fetch("http://localhost:8000/chat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ thread_id: threadId, message: messageToSend })
+        body: JSON.stringify({ thread_id: threadId, message: messageToSend, zone_name: zoneName })
       });
       const data = await response.json();
       if (!threadId && data.thread_id) {
         setThreadId(data.thread_id);
       }
       // Simulate typing effect for the AI response:
-      const fullResponse = data.reply;
+      const fullResponse = response.ok && data.reply ? data.reply : `Error: ${data.detail || response.status}`;
       let currentResponse = "";
       let index = 0;
       // If there's no previous AI entry, add one.
@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx # Async client; only needed by async callers
+except ImportError:
+    httpx = None
+
+# --- Configuration ---
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "localhost:11434") # Same variable the ollama CLI reads; load_test.py points it at fake_ollama.py
+OLLAMA_BASE_URL = (OLLAMA_HOST if "://" in OLLAMA_HOST else f"http://{OLLAMA_HOST}").rstrip("/")
+POOL_SIZE = int(os.environ.get("MUSHROOM_OLLAMA_POOL_SIZE", "16")) # Keep-alive connections kept per client
+CONNECT_TIMEOUT_SECONDS = 3.05
+READ_TIMEOUTS = { # Default read timeout per endpoint; callers can still pass their own
+    "generate": 60,
+    "embeddings": 10,
+    "tags": 5,
+}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_async_clients = {} # event loop -> httpx.AsyncClient (an AsyncClient is bound to the loop it was used on)
+
+
+def url(endpoint: str) -> str:
+    """Full URL of an Ollama API endpoint, e.g. url("generate")."""
+    return f"{OLLAMA_BASE_URL}/api/{endpoint}"
+
+
+def timeout_for(endpoint: str, read_timeout: float = None) -> tuple:
+    """(connect, read) timeout for requests; connecting fails fast even when generation may take a minute."""
+    return (CONNECT_TIMEOUT_SECONDS, read_timeout if read_timeout is not None else READ_TIMEOUTS.get(endpoint, 60))
+
+
+def get_session() -> requests.Session:
+    """
+    The process-wide keep-alive session. requests.Session pools connections per host through
+    urllib3, whose pool is thread-safe, so every caller (request handlers, to_thread workers,
+    ingestion) shares it. A forked child gets its own session instead of the parent's sockets.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def post(endpoint: str, payload: dict, timeout: float = None, stream: bool = False) -> requests.Response:
+    """POSTs to an Ollama endpoint on the pooled session. `timeout` overrides the endpoint's read timeout."""
+    return get_session().post(url(endpoint), json=payload, timeout=timeout_for(endpoint, timeout), stream=stream)
+
+
+def get_async_client():
+    """The pooled httpx.AsyncClient for the running event loop (requires httpx)."""
+    if httpx is None:
+        raise RuntimeError("httpx is required for async Ollama calls (pip install httpx).")
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            timeout=httpx.Timeout(READ_TIMEOUTS["generate"], connect=CONNECT_TIMEOUT_SECONDS),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def async_post(endpoint: str, payload: dict, timeout: float = None):
+    """Async counterpart of post(); returns an httpx.Response."""
+    read_timeout = timeout_for(endpoint, timeout)[1]
+    return await get_async_client().post(url(endpoint), json=payload,
+                                         timeout=httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT_SECONDS))
+
+
+def embed(text: str, model: str, timeout: float = None) -> list:
+    """One embedding vector from /api/embeddings. Raises requests exceptions or ValueError."""
+    response = post("embeddings", {"model": model, "prompt": text}, timeout=timeout)
+    response.raise_for_status()
+    embedding = response.json().get("embedding")
+    if embedding is None:
+        raise ValueError("Ollama API response does not contain 'embedding' key.")
+    return embedding
+
+
+async def async_embed(text: str, model: str, timeout: float = None) -> list:
+    response = await async_post("embeddings", {"model": model, "prompt": text}, timeout=timeout)
+    response.raise_for_status()
+    embedding = response.json().get("embedding")
+    if embedding is None:
+        raise ValueError("Ollama API response does not contain 'embedding' key.")
+    return embedding
+
+
+async def aclose():
+    """Closes the running loop's async client (e.g. from an application shutdown hook)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def close():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def run_benchmark(calls: int = 500, concurrency: int = 8):
+    """Per-call cost of small embedding requests against a zero-latency fake_ollama.py."""
+    from fake_ollama import FakeOllamaConfig, start_fake_ollama
+
+    global OLLAMA_BASE_URL
+    server = start_fake_ollama(port=0, config=FakeOllamaConfig(embed_latency_ms=0))
+    OLLAMA_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    payload = {"model": "nomic-embed-text", "prompt": "Zone Mine, 45.1F, 97.2% RH, 460 ppm CO2"}
+
+    def per_call_us(function, count=calls):
+        function() # Warm up (and open the pooled connection)
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        return (time.perf_counter() - start) / count * 1e6
+
+    fresh = per_call_us(lambda: requests.post(url("embeddings"), json=payload, timeout=10).json())
+    pooled = per_call_us(lambda: post("embeddings", payload).json())
+
+    async def async_rate():
+        await async_post("embeddings", payload)
+        start = time.perf_counter()
+        for _ in range(calls):
+            (await async_post("embeddings", payload)).json()
+        sequential = (time.perf_counter() - start) / calls * 1e6
+        start = time.perf_counter()
+        for _ in range(calls // concurrency):
+            await asyncio.gather(*(async_post("embeddings", payload) for _ in range(concurrency)))
+        concurrent = (time.perf_counter() - start) / (calls // concurrency * concurrency) * 1e6
+        await aclose()
+        return sequential, concurrent
+
+    async_sequential, async_concurrent = asyncio.run(async_rate())
+    server.shutdown()
+    close()
+    print(f"--- Ollama client overhead: {calls} small embedding calls to a zero-latency fake Ollama ---")
+    print(f"requests.post (new connection each call): {fresh:7.0f} us/call")
+    print(f"pooled keep-alive session:                {pooled:7.0f} us/call ({fresh / pooled:.1f}x)")
+    print(f"pooled async client, sequential:          {async_sequential:7.0f} us/call")
+    print(f"pooled async client, {concurrency} concurrent:         {async_concurrent:7.0f} us/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pooled Ollama HTTP clients.")
+    parser.add_argument("--benchmark", action="store_true", help="Measure per-call overhead for small embedding requests")
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+    if args.benchmark:
+        run_benchmark(args.calls)
+    else:
+        print(f"Ollama at {OLLAMA_BASE_URL}, pool size {POOL_SIZE}, read timeouts {READ_TIMEOUTS}")
@@ -1,7 +1,13 @@
 import requests
 import json
+import ollama_client
+from log_utils import get_logger
+from metrics import EMBEDDING_SECONDS
+from tracing import span
 from chromadb.api.types import EmbeddingFunction, Documents, Embeddings # Ensure these are the correct imports for ChromaDB types
 
+logger = get_logger("ollama_utils")
+
 class OllamaEmbeddingFunction(EmbeddingFunction):
     def __init__(self, model_name: str, api_url: str):
         self.model_name = model_name
@@ -14,16 +20,18 @@ class OllamaEmbeddingFunction(EmbeddingFunction):
         for i, text_input in enumerate(texts):
             try:
                 payload = {"model": self.model_name, "prompt": text_input}
-                response = requests.post(self.api_url, json=payload, timeout=10) # 10s timeout
+                with span("embedding", EMBEDDING_SECONDS):
+                    # Pooled keep-alive session: no new TCP connection per embedding
+                    response = ollama_client.get_session().post(self.api_url, json=payload, timeout=ollama_client.timeout_for("embeddings"))
                 response.raise_for_status()
                 response_json = response.json()
                 if "embedding" in response_json:
                     all_embeddings.append(response_json["embedding"])
                 else:
-                    print(f"Warning: Embedding not found in response for document {i+1}/{len(texts)} ('{text_input[:50]}...'). Raising error.")
+                    logger.warning(f"Warning: Embedding not found in response for document {i+1}/{len(texts)} ('{text_input[:50]}...'). Raising error.")
                     raise ValueError(f"Embedding not found for document: {text_input[:50]}...")
             except requests.exceptions.ConnectionError as e:
-                print(f"CRITICAL: Could not connect to Ollama at {self.api_url} for embeddings. Is Ollama running? Error: {e}")
+                logger.critical(f"CRITICAL: Could not connect to Ollama at {self.api_url} for embeddings. Is Ollama running? Error: {e}")
                 raise
             except requests.exceptions.HTTPError as e:
                 error_message = f"CRITICAL: HTTP error from Ollama (embeddings) for model '{self.model_name}': {e}."
@@ -32,19 +40,19 @@ class OllamaEmbeddingFunction(EmbeddingFunction):
                         error_detail = e.response.json().get('error', 'No additional error detail.')
                         error_message += f" Detail: {error_detail}"
                         if "model not found" in error_detail.lower(): # Specific check for model not found
-                             print(f"CRITICAL: Ollama embedding model '{self.model_name}' not found. Please run 'ollama pull {self.model_name}'.")
+                             logger.critical(f"CRITICAL: Ollama embedding model '{self.model_name}' not found. Please run 'ollama pull {self.model_name}'.")
                     except json.JSONDecodeError:
                         error_message += f" Raw response: {e.response.text}"
-                print(error_message)
+                logger.critical(error_message)
                 raise
             except requests.exceptions.Timeout:
-                print(f"CRITICAL: Timeout connecting to Ollama at {self.api_url} for embeddings.")
+                logger.critical(f"CRITICAL: Timeout connecting to Ollama at {self.api_url} for embeddings.")
                 raise
             except ValueError as e: # Catch custom ValueError
-                print(f"CRITICAL: Error processing Ollama response for text '{text_input[:50]}...': {e}")
+                logger.critical(f"CRITICAL: Error processing Ollama response for text '{text_input[:50]}...': {e}")
                 raise
             except Exception as e:
-                print(f"CRITICAL: An unexpected error occurred during embedding generation for text '{text_input[:50]}...': {e}")
+                logger.critical(f"CRITICAL: An unexpected error occurred during embedding generation for text '{text_input[:50]}...': {e}")
                 raise
         
         if len(all_embeddings) != len(texts):
@@ -0,0 +1,179 @@
+import argparse
+import os
+import threading
+import time
+
+from log_utils import get_logger
+from metrics import Counter, Histogram
+
+logger = get_logger("prefetch")
+
+# --- Configuration ---
+PREFETCH_ENABLED = os.environ.get("MUSHROOM_PREFETCH", "1") == "1"
+MIN_INTERVAL_SECONDS = float(os.environ.get("MUSHROOM_PREFETCH_MIN_INTERVAL", "60")) # Per zone, between completed prefetches
+MAX_CONCURRENT = 2 # Prefetch jobs running at once; further requests are refused rather than queued
+RECENT_JOBS = 20 # Finished jobs kept for get_prefetch_stats
+
+PREFETCH_REQUESTS = Counter("mushroom_prefetch_requests", "Zone prefetch requests by outcome", ("result",))
+PREFETCH_STEP_SECONDS = Histogram("mushroom_prefetch_step_seconds", "Duration of each zone prefetch step", ("step",))
+
+
+class PrefetchJob:
+    """One zone warm-up. Steps check `cancelled` between them; a step already running finishes."""
+
+    def __init__(self, zone_name: str, client: str = None, thread_id: str = None):
+        self.zone_name = zone_name
+        self.client = client
+        self.thread_id = thread_id
+        self.cancelled = threading.Event()
+        self.started = time.time()
+        self.finished = None
+        self.status = "running"
+        self.steps = {} # step name -> seconds, or "error: ..."
+
+    def to_dict(self) -> dict:
+        return {"zone_name": self.zone_name, "client": self.client, "thread_id": self.thread_id, "status": self.status,
+                "started": round(self.started, 3), "seconds": round((self.finished or time.time()) - self.started, 3),
+                "steps": dict(self.steps)}
+
+
+class Prefetcher:
+    """
+    Runs zone warm-up `steps` ([(name, callable(job))], in order) on background threads when a
+    client focuses a zone. A zone is not prefetched again within `min_interval` of its last
+    completed prefetch, at most `max_concurrent` jobs run at once, and a client's new request
+    (or cancel) stops its previous job before the next step.
+    """
+
+    def __init__(self, steps: list, min_interval: float = MIN_INTERVAL_SECONDS, max_concurrent: int = MAX_CONCURRENT,
+                 enabled: bool = PREFETCH_ENABLED):
+        self.steps = steps
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._running = {} # zone_name -> PrefetchJob
+        self._completed_at = {} # zone_name -> time.monotonic() of the last completed prefetch
+        self._recent = []
+        self._counts = {}
+
+    def _count(self, result: str):
+        self._counts[result] = self._counts.get(result, 0) + 1
+        PREFETCH_REQUESTS.labels(result).inc()
+
+    def request(self, zone_name: str, client: str = None, thread_id: str = None) -> dict:
+        """Starts a prefetch for the zone; returns {"status": "started"|"running"|"recent"|"busy"|"disabled", ...}."""
+        with self._lock:
+            if client is not None:
+                self._cancel_locked(lambda job: job.client == client and job.zone_name != zone_name)
+            if not self.enabled:
+                self._count("disabled")
+                return {"status": "disabled"}
+            running = self._running.get(zone_name)
+            if running is not None:
+                self._count("running")
+                return {"status": "running", "job": running.to_dict()}
+            completed_at = self._completed_at.get(zone_name)
+            if completed_at is not None and time.monotonic() - completed_at < self.min_interval:
+                self._count("recent")
+                return {"status": "recent", "retry_after": round(self.min_interval - (time.monotonic() - completed_at), 1)}
+            if len(self._running) >= self.max_concurrent:
+                self._count("busy")
+                return {"status": "busy"}
+            job = self._running[zone_name] = PrefetchJob(zone_name, client, thread_id)
+            self._count("started")
+        threading.Thread(target=self._run, args=(job,), name=f"prefetch-{zone_name}", daemon=True).start()
+        return {"status": "started", "job": job.to_dict()}
+
+    def _run(self, job: PrefetchJob):
+        try:
+            for name, step in self.steps:
+                if job.cancelled.is_set():
+                    break
+                start = time.perf_counter()
+                try:
+                    step(job)
+                    job.steps[name] = round(time.perf_counter() - start, 3)
+                except Exception as e:
+                    job.steps[name] = f"error: {e}"
+                    logger.warning(f"Prefetch step '{name}' failed for zone {job.zone_name}: {e}")
+                PREFETCH_STEP_SECONDS.labels(name).observe(time.perf_counter() - start)
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                job.status = "cancelled" if job.cancelled.is_set() else "completed"
+                self._count(job.status)
+                if self._running.get(job.zone_name) is job:
+                    del self._running[job.zone_name]
+                if job.status == "completed":
+                    self._completed_at[job.zone_name] = time.monotonic()
+                self._recent = (self._recent + [job])[-RECENT_JOBS:]
+            logger.info(f"Prefetch for zone {job.zone_name} {job.status} in {job.finished - job.started:.2f}s: {job.steps}")
+
+    def _cancel_locked(self, matches) -> int:
+        cancelled = 0
+        for job in self._running.values():
+            if matches(job) and not job.cancelled.is_set():
+                job.cancelled.set()
+                cancelled += 1
+        return cancelled
+
+    def cancel(self, client: str = None, zone_name: str = None) -> int:
+        """Cancels running jobs of a client and/or zone (all jobs if neither is given); returns how many."""
+        with self._lock:
+            return self._cancel_locked(lambda job: (client is None or job.client == client)
+                                       and (zone_name is None or job.zone_name == zone_name))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "min_interval_seconds": self.min_interval, "max_concurrent": self.max_concurrent,
+                    "requests": dict(self._counts), "running": [job.to_dict() for job in self._running.values()],
+                    "recent": [job.to_dict() for job in reversed(self._recent)]}
+
+
+def run_benchmark(load_seconds: float = 3.0, zone_name: str = "Mine"):
+    """
+    First chat message latency for a zone with and without a prefetch, against fake_ollama.py
+    with cold model loads and prompt-prefix reuse enabled.
+    """
+    import tempfile
+    from datetime import datetime, timedelta
+    from fake_ollama import FakeOllamaConfig, start_fake_ollama
+
+    port = 11436
+    os.environ["OLLAMA_HOST"] = f"127.0.0.1:{port}"
+    server = start_fake_ollama(port, FakeOllamaConfig(load_seconds=load_seconds, prefix_cache=True))
+    os.chdir(tempfile.mkdtemp(prefix="prefetch_benchmark_")) # Conversation files and the Chroma index stay out of the repo
+    import rag_ingestion
+    from sensor_handler import generate_pseudo_sensor_data
+    now = datetime.now()
+    rag_ingestion.ingest_readings(rag_ingestion.get_collection(reset=True), [
+        generate_pseudo_sensor_data(base_time=now - timedelta(hours=6 * step), zone_name=zone_name) for step in range(28)])
+    import ai_model
+
+    question = f"Why is the CO2 in {zone_name} creeping up in the evenings?" # Not a fast-path lookup
+    print(f"--- First chat message in zone {zone_name}: cold vs prefetched (model load {load_seconds}s) ---")
+    for label, prefetch in (("cold", False), ("prefetched", True)):
+        server.RequestHandlerClass.config._loaded.clear() # Every model unloaded, as after Ollama's keep-alive expires
+        thread_id = ai_model.start_conversation()
+        if prefetch:
+            start = time.perf_counter()
+            ai_model.prefetch_zone(zone_name, client=label, thread_id=thread_id)
+            while ai_model.PREFETCHER.stats()["running"]:
+                time.sleep(0.01)
+            print(f"{'prefetch':12s} {time.perf_counter() - start:6.2f}s in the background: {ai_model.PREFETCHER.stats()['recent'][0]['steps']}")
+        start = time.perf_counter()
+        ai_model.send_message_with_details(thread_id, question, zone_name)
+        print(f"{label:12s} {time.perf_counter() - start:6.2f}s to the first reply")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zone-focus prefetch of model, retrieval and conversation state.")
+    parser.add_argument("--benchmark", action="store_true", help="Compare first-message latency with and without a prefetch")
+    parser.add_argument("--load-seconds", type=float, default=3.0, help="Simulated cold model load")
+    args = parser.parse_args()
+    if args.benchmark:
+        run_benchmark(args.load_seconds)
+    else:
+        parser.print_help()
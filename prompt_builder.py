@@ -0,0 +1,214 @@
+import argparse
+import math
+import os
+import re
+import threading
+
+# --- Configuration ---
+PROMPT_TOKEN_BUDGET = int(os.environ.get("MUSHROOM_PROMPT_TOKEN_BUDGET", "1024")) # Whole chat prompt, before the reply
+CONTEXT_SHARE = 0.4 # Share of what is left after the fixed parts that retrieved documents may use
+SUMMARY_MAX_TOKENS = 200 # Running conversation summary, as included in the prompt
+ZONE_SUMMARY_MAX_TOKENS = 160 # Precomputed recent-window summary of the zone's readings (analytics.summarize_recent_window)
+TURN_MAX_TOKENS = 240 # A single older turn is cut to this before it competes for the history budget
+MAX_CONTEXT_DISTANCE = None # Optional Chroma distance cutoff; documents further away are never included
+DEFAULT_CHARS_PER_TOKEN = 3.6 # Gemma-ish ratio for English mixed with sensor numbers; calibrated at runtime
+CALIBRATION_WEIGHT = 0.1 # Exponential moving average weight of each observed (chars, prompt_eval_count) pair
+
+_chars_per_token = DEFAULT_CHARS_PER_TOKEN
+_calibration_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Token estimate from character count; no tokenizer round-trip on the request path."""
+    return math.ceil(len(text) / _chars_per_token) if text else 0
+
+
+def observe_prompt_tokens(prompt_chars: int, prompt_eval_count: int):
+    """
+    Calibrates estimate_tokens against Ollama's own prompt_eval_count. Ignored for tiny prompts and
+    for counts below the prompt size, which Ollama reports when it reuses a cached prompt prefix.
+    """
+    global _chars_per_token
+    if prompt_chars < 200 or not prompt_eval_count or prompt_eval_count < prompt_chars / 8:
+        return
+    with _calibration_lock:
+        _chars_per_token += CALIBRATION_WEIGHT * (prompt_chars / prompt_eval_count - _chars_per_token)
+
+
+def chars_per_token() -> float:
+    return _chars_per_token
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to about max_tokens at a word boundary, marking the cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, int(max_tokens * _chars_per_token) - 2)
+    cut = text[:limit].rsplit(" ", 1)[0] if " " in text[:limit] else text[:limit]
+    return cut.rstrip() + " …"
+
+
+def _normalized(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def select_context(documents: list, distances: list = None, max_tokens: int = 0) -> tuple:
+    """
+    Deduplicates retrieved documents and keeps the most relevant ones (smallest distance first)
+    that fit max_tokens. Returns (kept documents, number dropped).
+    """
+    distances = distances if distances and len(distances) == len(documents) else [0.0] * len(documents)
+    ranked = sorted(zip(distances, range(len(documents)), documents))
+    kept, seen, used = [], set(), 0
+    for distance, _, document in ranked:
+        key = _normalized(document)
+        if not key or key in seen or (MAX_CONTEXT_DISTANCE is not None and distance > MAX_CONTEXT_DISTANCE):
+            continue
+        seen.add(key)
+        tokens = estimate_tokens(document)
+        if used + tokens > max_tokens:
+            continue # A smaller, less relevant document may still fit
+        kept.append(document)
+        used += tokens
+    return kept, len(documents) - len(kept)
+
+
+def format_turn(entry: dict) -> str:
+    return f"{entry.get('role', 'Unknown').capitalize()}: {entry.get('content', '')}"
+
+
+def select_history(history: list, max_tokens: int) -> tuple:
+    """
+    Newest-first selection of turns that fit max_tokens. The latest exchange is cut to half the
+    budget per turn so it is always included; older turns are cut to TURN_MAX_TOKENS.
+    Returns (formatted turns oldest first, index of the oldest included turn).
+    """
+    lines, used = [], 0
+    start = len(history)
+    for index in range(len(history) - 1, -1, -1):
+        cap = max_tokens // 2 - 1 if index >= len(history) - 2 else TURN_MAX_TOKENS
+        line = truncate_to_tokens(format_turn(history[index]), cap)
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > max_tokens:
+            break
+        lines.append(line)
+        used += tokens
+        start = index
+    return lines[::-1], start
+
+
+def chat_prompt_prefix(zone_name: str) -> str:
+    """The zone-only start of every chat prompt; zone prefetch prefills it so Ollama can reuse it."""
+    return f"You are assisting with Zone: {zone_name}.\n\nRetrieved context from historical data for Zone {zone_name}:\n"
+
+
+class ChatPrompt:
+    """An assembled prompt plus its per-section token estimates and what was left out."""
+
+    def __init__(self, text: str, sections: dict, dropped_documents: int, first_turn: int):
+        self.text = text
+        self.sections = sections
+        self.dropped_documents = dropped_documents
+        self.first_turn = first_turn # Index in the history of the oldest turn included verbatim; earlier ones are left out
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def build_chat_prompt(zone_name: str, user_message: str, history: list, documents: list = (),
+                      distances: list = None, summary: str = "", budget: int = None,
+                      context_note: str = None, zone_summary: str = "") -> ChatPrompt:
+    """
+    Assembles the chat prompt within `budget` tokens: fixed header and question first, then the
+    zone and running summaries, then retrieved context (up to CONTEXT_SHARE of what remains) and
+    finally as many recent turns as fit. `history` holds the earlier turns, not the current message;
+    `context_note` replaces the context section when there are no documents (e.g. retrieval failed).
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    header = chat_prompt_prefix(zone_name)
+    question = f"User: {truncate_to_tokens(user_message, budget // 4)}\nAssistant:"
+    summary_text = truncate_to_tokens(summary, SUMMARY_MAX_TOKENS) if summary else ""
+    zone_text = truncate_to_tokens(zone_summary, ZONE_SUMMARY_MAX_TOKENS) if zone_summary else ""
+    remaining = (budget - estimate_tokens(header) - estimate_tokens(question) - estimate_tokens(summary_text)
+                 - estimate_tokens(zone_text) - 40)
+
+    documents, dropped_documents = select_context(list(documents), distances, max(0, int(remaining * CONTEXT_SHARE)))
+    if documents:
+        context_str = "\n--- Context --- \n".join(documents)
+    elif dropped_documents:
+        context_str = "Retrieved historical data did not fit in the prompt."
+    else:
+        context_str = context_note or "No relevant historical data found for this query in the specified zone."
+    remaining -= estimate_tokens(context_str)
+
+    turns, first_turn = select_history(history, max(0, remaining))
+    parts = [header, f"{context_str}\n\n"]
+    if zone_text:
+        parts.append(f"Recent conditions in Zone {zone_name}:\n{zone_text}\n\n")
+    if summary_text:
+        parts.append(f"Summary of the earlier conversation:\n{summary_text}\n\n")
+    if turns:
+        parts.append("Conversation History (most recent messages):\n" + "\n".join(turns) + "\n")
+    parts.append(question)
+    sections = {"context": estimate_tokens(context_str), "zone_summary": estimate_tokens(zone_text),
+                "summary": estimate_tokens(summary_text),
+                "history": sum(estimate_tokens(turn) for turn in turns), "question": estimate_tokens(question)}
+    return ChatPrompt("".join(parts), sections, dropped_documents, first_turn)
+
+
+def summary_update_prompt(summary: str, turns: list) -> str:
+    """Prompt that folds `turns` (older turns now leaving the verbatim window) into the running summary."""
+    transcript = "\n".join(truncate_to_tokens(format_turn(turn), TURN_MAX_TOKENS) for turn in turns)
+    return (
+        "You maintain a running summary of a conversation between a mushroom farm caretaker and an assistant.\n"
+        f"Current summary:\n{summary or '(none yet)'}\n\n"
+        f"New messages to fold in:\n{transcript}\n\n"
+        f"Write the updated summary in at most {int(SUMMARY_MAX_TOKENS * 0.6)} words. Keep zone names, numbers, "
+        "problems raised and advice given; drop pleasantries. Updated summary:"
+    )
+
+
+def _legacy_prompt_tokens(zone_name: str, user_message: str, history: list, documents: list) -> int:
+    """Tokens of the pre-builder prompt: every document plus the last five raw turns, unbounded."""
+    formatted_history = "".join(f"{format_turn(entry)}\n" for entry in (history + [{"role": "user", "content": user_message}])[-5:])
+    context_str = "\n--- Context --- \n".join(documents)
+    return estimate_tokens(f"You are assisting with Zone: {zone_name}.\n\nRetrieved context from historical data for "
+                           f"Zone {zone_name}:\n{context_str}\n\nConversation History (last few messages):\n"
+                           f"{formatted_history}\nUser: {user_message}\nAssistant:")
+
+
+def run_benchmark(turns: int = 60, reply_words: int = 400):
+    """Prompt size per turn for a conversation with long replies, before and after the builder."""
+    import time
+
+    filler = ("Humidity in the zone held near 96 percent overnight while CO2 rose from 470 to 540 ppm as the "
+              "fans cycled, so pins on the north shelves may need more fresh air exchange. ").split()
+    documents = [f"Sensor reading for Zone 'Mine' at 2025-01-0{day} 06:00:00: Temperature 45.{day}°F, "
+                 f"Humidity 96.{day}%, CO2 48{day} ppm." for day in (1, 2, 2, 3)]
+    history, summary = [], ""
+    print(f"--- Chat prompt size, {reply_words}-word replies, budget {PROMPT_TOKEN_BUDGET} tokens ---")
+    print(f"{'turn':>5} {'legacy':>8} {'builder':>8} {'build us':>9}")
+    for turn in range(1, turns + 1):
+        question = f"Question {turn}: how are the CO2 levels in Mine compared to yesterday?"
+        legacy = _legacy_prompt_tokens("Mine", question, history, documents)
+        start = time.perf_counter()
+        prompt = build_chat_prompt("Mine", question, history, documents, [0.2, 0.3, 0.3, 0.5], summary)
+        build_us = (time.perf_counter() - start) * 1e6
+        if turn in (1, 2, 5, 10, 20, 40, turns):
+            print(f"{turn:5d} {legacy:8d} {prompt.tokens:8d} {build_us:9.0f}")
+        history += [{"role": "user", "content": question},
+                    {"role": "assistant", "content": " ".join(filler[i % len(filler)] for i in range(reply_words))}]
+        summary = truncate_to_tokens(f"{summary} Turn {turn} discussed CO2 in Mine.", SUMMARY_MAX_TOKENS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Token-budgeted chat prompt assembly.")
+    parser.add_argument("--benchmark", action="store_true", help="Compare prompt sizes over a long conversation")
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--reply-words", type=int, default=400, help="Length of each simulated assistant reply")
+    args = parser.parse_args()
+    if args.benchmark:
+        run_benchmark(args.turns, args.reply_words)
+    else:
+        parser.print_help()
@@ -1,11 +1,17 @@
 import asyncio
 import json
-from datetime import datetime
+import os
+import signal
+import time
+from datetime import datetime, timedelta
+import numpy as np
 import websockets
+from anomaly_detector import StreamingAnomalyDetector, DEFAULT_WARMUP
+import memory_debug
 
 # Attempt to import from sensor_handler
 try:
-    from sensor_handler import ZONE_NAMES, generate_pseudo_sensor_data
+    from sensor_handler import ZONE_NAMES, generate_pseudo_sensor_data, get_zone_ranges
     SENSOR_HANDLER_AVAILABLE = True
 except ImportError:
     print("Warning: sensor_handler.py not found or incomplete. Using placeholder data.")
@@ -17,18 +23,40 @@ except ImportError:
             "temperature": 0, "humidity": 0, "CO2": 0, "zone": zone_name or "ErrorZone",
             "error": "Failed to import from sensor_handler.py"
         }
+    def get_zone_ranges(zone_name):
+        return {"temperature": (40.0, 50.0), "humidity": (95.0, 100.0), "CO2": (440, 500)}
     SENSOR_HANDLER_AVAILABLE = False # Explicitly set to False
 
 # Set the WebSocket port (adjust if needed)
 PORT = 8765
+SEND_INTERVAL_SECONDS = 5
+FEED_CLIENTS = set() # Connections served by sensor_data_handler
+
+def create_primed_detector() -> StreamingAnomalyDetector:
+    """
+    Creates an anomaly detector whose per-zone baselines are already warmed up from a short
+    backfill of generated readings, so alerts can fire from the first live batch.
+    """
+    detector = StreamingAnomalyDetector()
+    now = datetime.now()
+    backfill = [
+        generate_pseudo_sensor_data(base_time=now - timedelta(seconds=SEND_INTERVAL_SECONDS * step), zone_name=zone_name)
+        for step in range(DEFAULT_WARMUP * 2, 0, -1) for zone_name in ZONE_NAMES
+    ]
+    detector.prime(backfill)
+    return detector
 
 # Removed local generate_pseudo_sensor_data function as it's now imported
 
 async def sensor_data_handler(websocket, path):
     """
     Continuously send pseudo sensor data for all zones over the WebSocket connection every 5 seconds.
+    Each batch is run through a streaming anomaly detector; any alerts are sent right after
+    the batch as a {"type": "alerts", "alerts": [...]} message.
     """
     print(f"Client connected: {websocket.remote_address}")
+    FEED_CLIENTS.add(websocket)
+    detector = create_primed_detector()
     try:
         while True:
             all_zone_data = []
@@ -50,13 +78,17 @@ async def sensor_data_handler(websocket, path):
 
                 print(f"Sending data for {len(all_zone_data)} zones. (Sample: {all_zone_data[0]['zone']} - {temp_display})")
                 await websocket.send(json.dumps(all_zone_data))
+                alerts = detector.update_many(all_zone_data)
+                if alerts:
+                    print(f"Detected {len(alerts)} anomalous reading(s), sending alerts.")
+                    await websocket.send(json.dumps({"type": "alerts", "alerts": alerts}))
             else:
                 # This case should ideally not be reached if ZONE_NAMES is properly populated (even by fallback)
                 print("Warning: No zone data generated to send. ZONE_NAMES might be empty.") 
                 # Send an empty array to potentially satisfy client expecting JSON array
                 await websocket.send(json.dumps([])) 
                 
-            await asyncio.sleep(5) # Send a batch of readings for all zones every 5 seconds
+            await asyncio.sleep(SEND_INTERVAL_SECONDS) # Send a batch of readings for all zones every 5 seconds
             
     except websockets.exceptions.ConnectionClosedOK:
         print(f"Client {websocket.remote_address} disconnected normally.")
@@ -66,14 +98,206 @@ async def sensor_data_handler(websocket, path):
         # Catching other potential errors during the loop or sending
         print(f"Error in sensor_data_handler for client {websocket.remote_address}: {e}")
     finally:
+        FEED_CLIENTS.discard(websocket)
         # Ensure this print statement is consistent for all disconnections
         print(f"Client {websocket.remote_address} session ended.")
 
-async def main():
+# --- Producer ---
+# With --producer, one shared tick generates every zone's reading as a vectorized batch,
+# serializes it once and broadcasts the same message to all subscribers. Zone count and
+# interval are configurable for stress tests (hundreds of zones at sub-second intervals).
+PRODUCER_CLIENTS = set()
+PRODUCER_REPORT_SECONDS = 5
+ANOMALY_PROBABILITY = 1 / (24 * 12) # Same rate as generate_pseudo_sensor_data
+
+def producer_zone_names(zone_count: int) -> list:
+    """The real zones first, then synthetic 'Zone 7', 'Zone 8', ... up to zone_count."""
+    return list(ZONE_NAMES[:zone_count]) + [f"Zone {i + 1}" for i in range(len(ZONE_NAMES), zone_count)]
+
+class SyntheticZoneBatch:
+    """
+    Vectorized equivalent of calling generate_pseudo_sensor_data for every zone: per-zone ranges
+    are looked up once (synthetic zones cycle through the real zones' ranges), each tick draws
+    all values with NumPy, and the JSON message is assembled from per-zone prefixes with a
+    single timestamp format per tick.
+    """
+
+    def __init__(self, zone_names: list, seed: int = None):
+        self.zone_names = zone_names
+        ranges = [get_zone_ranges(ZONE_NAMES[i % len(ZONE_NAMES)]) for i in range(len(zone_names))]
+        self.temp_low, self.temp_high = (np.array(bounds) for bounds in zip(*(r["temperature"] for r in ranges)))
+        self.hum_low, self.hum_high = (np.array(bounds) for bounds in zip(*(r["humidity"] for r in ranges)))
+        self.co2_low, self.co2_high = (np.array(bounds, dtype=np.int64) for bounds in zip(*(r["CO2"] for r in ranges)))
+        self.rng = np.random.default_rng(seed)
+        self.suffixes = [f', "zone": {json.dumps(zone)}}}' for zone in zone_names]
+
+    def values(self):
+        """Returns (temperature, humidity, CO2) arrays with the same normal/anomalous ranges as the scalar generator."""
+        count = len(self.zone_names)
+        uniform = self.rng.random((3, count))
+        temperature = self.temp_low + uniform[0] * (self.temp_high - self.temp_low)
+        humidity = self.hum_low + uniform[1] * (self.hum_high - self.hum_low)
+        co2 = self.rng.integers(self.co2_low, self.co2_high + 1)
+        anomalous = self.rng.random(count) < ANOMALY_PROBABILITY
+        if anomalous.any():
+            temperature[anomalous] = self.temp_high[anomalous] + 5 + uniform[0][anomalous] * 10
+            hum_low = np.maximum(70.0, self.hum_low[anomalous] - 20)
+            humidity[anomalous] = hum_low + uniform[1][anomalous] * (self.hum_low[anomalous] - 10 - hum_low)
+            co2[anomalous] = self.rng.integers(self.co2_high[anomalous] + 100, self.co2_high[anomalous] + 301)
+        return np.round(temperature, 1), np.round(humidity, 1), co2
+
+    def message(self, base_time: datetime) -> str:
+        """One tick's readings for all zones as a JSON array (same shape as the per-client loop sends)."""
+        temperature, humidity, co2 = self.values()
+        prefix = '{"timestamp": "' + base_time.strftime("%Y-%m-%d %H:%M:%S") + '", "temperature": '
+        return "[" + ", ".join(
+            f'{prefix}{t}, "humidity": {h}, "CO2": {c}{suffix}'
+            for t, h, c, suffix in zip(temperature.tolist(), humidity.tolist(), co2.tolist(), self.suffixes)
+        ) + "]"
+
+async def producer_client_handler(websocket, path):
+    print(f"Producer subscriber connected: {websocket.remote_address}")
+    PRODUCER_CLIENTS.add(websocket)
+    try:
+        await websocket.wait_closed()
+    finally:
+        PRODUCER_CLIENTS.discard(websocket)
+
+async def run_producer(zone_count: int, interval: float, seed: int = None, duration: float = None) -> dict:
+    """
+    Shared tick loop. Ticks are scheduled on absolute times, so generation cost does not add
+    drift; a tick that starts late is counted rather than skipped. Prints achieved readings/s
+    every PRODUCER_REPORT_SECONDS and returns the totals.
+    """
+    batch = SyntheticZoneBatch(producer_zone_names(zone_count), seed=seed)
+    print(f"Producing {zone_count} zones every {interval}s ({zone_count / interval:,.0f} readings/s target).")
+    loop = asyncio.get_running_loop()
+    start = next_tick = loop.time()
+    totals = {"ticks": 0, "readings": 0, "late_ticks": 0, "build_seconds": 0.0}
+    window = {"ticks": 0, "start": start, "build": 0.0}
+    while duration is None or loop.time() - start < duration:
+        delay = next_tick - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -interval:
+            totals["late_ticks"] += 1
+        build_start = time.perf_counter()
+        message = batch.message(datetime.now())
+        build_seconds = time.perf_counter() - build_start
+        websockets.broadcast(PRODUCER_CLIENTS, message)
+        totals["ticks"] += 1
+        totals["readings"] += zone_count
+        totals["build_seconds"] += build_seconds
+        window["ticks"] += 1
+        window["build"] += build_seconds
+        next_tick += interval
+
+        now = loop.time()
+        if now - window["start"] >= PRODUCER_REPORT_SECONDS:
+            elapsed = now - window["start"]
+            print(f"{window['ticks'] * zone_count / elapsed:,.0f} readings/s ({window['ticks'] / elapsed:.1f} ticks/s, "
+                  f"{window['build'] / window['ticks'] * 1000:.2f} ms/tick to generate + serialize, "
+                  f"{len(PRODUCER_CLIENTS)} subscriber(s), {totals['late_ticks']} late tick(s))")
+            window = {"ticks": 0, "start": now, "build": 0.0}
+    elapsed = loop.time() - start
+    totals["seconds"] = round(elapsed, 2)
+    totals["readings_per_second"] = round(totals["readings"] / elapsed) if elapsed else None
+    return totals
+
+# --- Replay ---
+# With --replay, a single task streams a sensor_recorder.py recording to every connected client
+# in lockstep (each frame is delivered to all clients before the next is sent), so every client
+# and every run sees the identical stream. Alerts come from one unprimed detector over that stream.
+REPLAY_CLIENTS = set()
+
+async def replay_client_handler(websocket, path):
+    print(f"Replay client connected: {websocket.remote_address}")
+    REPLAY_CLIENTS.add(websocket)
+    try:
+        await websocket.wait_closed()
+    finally:
+        REPLAY_CLIENTS.discard(websocket)
+
+async def _send_to_replay_clients(message: str):
+    clients = list(REPLAY_CLIENTS)
+    if clients:
+        # Awaiting every send applies backpressure: a slow client slows the replay instead of dropping frames.
+        await asyncio.gather(*(client.send(message) for client in clients), return_exceptions=True)
+
+async def replay_recording(path: str, speed: float = 1.0, wait_for_clients: int = 1) -> dict:
+    """
+    Streams a recording at `speed` times its recorded pace (speed <= 0: as fast as clients accept).
+    Starts once `wait_for_clients` clients are connected. Returns frame/reading counts and rates.
+    """
+    from sensor_recorder import read_recording
+
+    header, frames = read_recording(path)
+    while len(REPLAY_CLIENTS) < wait_for_clients:
+        await asyncio.sleep(0.05)
+    speed_label = f"{speed:g}x" if speed > 0 else "max speed"
+    print(f"Replaying {path} ({header.get('source')}) at {speed_label} to {len(REPLAY_CLIENTS)} client(s)...")
+    detector = StreamingAnomalyDetector()
+    frame_count = reading_count = alert_count = 0
+    start = time.perf_counter()
+    first_offset = None
+    for offset, batch in frames:
+        if first_offset is None:
+            first_offset = offset
+        if speed > 0:
+            delay = start + (offset - first_offset) / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await _send_to_replay_clients(json.dumps(batch))
+        alerts = detector.update_many(batch)
+        if alerts:
+            alert_count += len(alerts)
+            await _send_to_replay_clients(json.dumps({"type": "alerts", "alerts": alerts}))
+        frame_count += 1
+        reading_count += len(batch)
+    elapsed = time.perf_counter() - start
+    stats = {"frames": frame_count, "readings": reading_count, "alerts": alert_count, "seconds": round(elapsed, 2),
+             "readings_per_second": round(reading_count / elapsed) if elapsed else None,
+             "recorded_seconds": (offset - first_offset) if frame_count else 0}
+    print(f"Replayed {frame_count:,} frames ({reading_count:,} readings, {alert_count} alerts) in {elapsed:.1f}s "
+          f"({stats['readings_per_second']:,} readings/s, {stats['recorded_seconds'] / max(elapsed, 1e-9):,.0f}x real time).")
+    return stats
+
+def write_memory_report(path: str, tracker: memory_debug.MemoryTracker):
+    """
+    SIGUSR1 handler: writes RSS, clients, tasks and (MUSHROOM_TRACEMALLOC) top allocation sites to
+    `path`. The first report is the baseline that later reports' growth is measured from.
+    """
+    report = {**tracker.report(reset_baseline=not tracker.has_baseline),
+              "clients": len(FEED_CLIENTS) + len(PRODUCER_CLIENTS) + len(REPLAY_CLIENTS),
+              "asyncio_tasks": len(asyncio.all_tasks())}
+    with open(path + ".tmp", "w") as f:
+        json.dump(report, f)
+    os.replace(path + ".tmp", path) # Readers polling for the file never see a partial report
+
+async def main(port: int = PORT, replay: str = None, speed: float = 1.0, wait_for_clients: int = 1, loop: bool = False,
+               producer: bool = False, zones: int = None, seed: int = None, memory_report: str = None):
+    if memory_report:
+        memory_debug.start_from_env()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, write_memory_report, memory_report,
+                                                      memory_debug.MemoryTracker())
     # Start the WebSocket server
-    server = await websockets.serve(sensor_data_handler, "0.0.0.0", PORT)
-    print(f"Pseudo Sensor WebSocket Server running on ws://0.0.0.0:{PORT}")
-    
+    handler = replay_client_handler if replay else producer_client_handler if producer else sensor_data_handler
+    server = await websockets.serve(handler, "0.0.0.0", port)
+    print(f"Pseudo Sensor WebSocket Server running on ws://0.0.0.0:{port}")
+
+    if producer:
+        await run_producer(zones or len(ZONE_NAMES), SEND_INTERVAL_SECONDS, seed=seed)
+        return
+
+    if replay:
+        while True:
+            await replay_recording(replay, speed=speed, wait_for_clients=wait_for_clients)
+            if not loop:
+                break
+        server.close() # Closes client connections too, so consumers see the end of the stream
+        await server.wait_closed()
+        return
+
     if SENSOR_HANDLER_AVAILABLE:
         print(f"Broadcasting data for zones: {', '.join(ZONE_NAMES)}")
     else:
@@ -84,9 +308,48 @@ async def main():
     await server.wait_closed()
 
 
+def run_benchmark(zone_count: int, ticks: int = 200):
+    """Per-tick cost of the per-connection loop's work (scalar generator + json.dumps) vs the producer batch."""
+    zone_names = producer_zone_names(zone_count)
+    scalar_zones = [ZONE_NAMES[i % len(ZONE_NAMES)] for i in range(zone_count)] # Real names: the scalar generator warns on others
+    start = time.perf_counter()
+    for _ in range(ticks):
+        now = datetime.now()
+        json.dumps([generate_pseudo_sensor_data(base_time=now, zone_name=zone_name) for zone_name in scalar_zones])
+    scalar = (time.perf_counter() - start) / ticks
+    batch = SyntheticZoneBatch(zone_names, seed=0)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        batch.message(datetime.now())
+    vectorized = (time.perf_counter() - start) / ticks
+    print(f"--- {zone_count} zones, {ticks} ticks ---")
+    print(f"per-zone generate + json.dumps: {scalar * 1000:.2f} ms/tick ({zone_count / scalar:,.0f} readings/s per connection)")
+    print(f"vectorized producer batch:      {vectorized * 1000:.2f} ms/tick ({zone_count / vectorized:,.0f} readings/s, shared by all subscribers)")
+
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pseudo sensor WebSocket feed.")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--interval", type=float, default=SEND_INTERVAL_SECONDS, help="Seconds between batches")
+    parser.add_argument("--replay", metavar="RECORDING", help="Stream a sensor_recorder.py recording instead of generating data")
+    parser.add_argument("--speed", default="1", help="Replay speed multiplier, or 'max' (default: 1)")
+    parser.add_argument("--wait-for-clients", type=int, default=1, help="Start the replay once this many clients are connected")
+    parser.add_argument("--loop", action="store_true", help="Restart the replay when it ends")
+    parser.add_argument("--producer", action="store_true", help="One shared, vectorized tick for all subscribers (stress tests)")
+    parser.add_argument("--zones", type=int, help="Producer zone count (synthetic zones are added beyond the real ones)")
+    parser.add_argument("--seed", type=int, help="Producer random seed")
+    parser.add_argument("--benchmark", action="store_true", help="Compare per-zone generation with the vectorized producer batch")
+    parser.add_argument("--memory-report", metavar="PATH", help="Write a memory report to PATH on SIGUSR1 (soak_test.py)")
+    args = parser.parse_args()
+    SEND_INTERVAL_SECONDS = args.interval
+    if args.benchmark:
+        run_benchmark(args.zones or 500)
+        raise SystemExit
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.port, replay=args.replay, speed=0 if args.speed == "max" else float(args.speed),
+                         wait_for_clients=args.wait_for_clients, loop=args.loop,
+                         producer=args.producer, zones=args.zones, seed=args.seed,
+                         memory_report=args.memory_report))
     except KeyboardInterrupt:
         print("\nServer shutting down gracefully...")
     except Exception as e:
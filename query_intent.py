@@ -0,0 +1,255 @@
+import re
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from sensor_handler import ZONE_NAMES, ZONE_REGISTRY, get_zone_history, get_zone_ranges
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# --- Intent Vocabulary ---
+METRIC_PATTERNS = {
+    "CO2": re.compile(r"\b(co2|co₂|carbon dioxide)\b", re.IGNORECASE),
+    "temperature": re.compile(r"\b(temp|temps|temperature|temperatures|hot|cold|warm|warmest|coldest)\b", re.IGNORECASE),
+    "humidity": re.compile(r"\b(humidity|humid|rh|moisture)\b", re.IGNORECASE),
+}
+METRIC_UNITS = {"temperature": "°F", "humidity": "%", "CO2": " ppm"}
+
+AGGREGATION_PATTERNS = [
+    ("max", re.compile(r"\b(max|maximum|highest|peak|warmest|hottest)\b", re.IGNORECASE)),
+    ("min", re.compile(r"\b(min|minimum|lowest|coldest)\b", re.IGNORECASE)),
+    ("avg", re.compile(r"\b(avg|average|mean|typical)\b", re.IGNORECASE)),
+    ("latest", re.compile(r"\b(current|currently|now|latest|right now|at the moment)\b", re.IGNORECASE)),
+]
+
+# Questions asking for advice or explanation need the LLM, even if they mention a metric.
+OPEN_ENDED_PATTERN = re.compile(
+    r"\b(why|should|how (do|can|to|would)|what can|recommend|advice|suggest|improve|fix|explain|cause)\b",
+    re.IGNORECASE,
+)
+ANOMALY_PATTERN = re.compile(r"\b(anomal\w*|alerts?|unusual|spikes?|outliers?|out of range)\b", re.IGNORECASE)
+
+_UNIT_SECONDS = {"minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400, "month": 30 * 86400}
+_RELATIVE_WINDOW_RE = re.compile(r"\b(?:last|past|previous)\s+(\d+)\s+(minute|hour|day|week|month)s?\b", re.IGNORECASE)
+_SINGLE_UNIT_RE = re.compile(r"\b(?:last|past|previous)\s+(minute|hour|day|week|month)\b", re.IGNORECASE)
+_DAYS_AGO_RE = re.compile(r"\b(\d+|a|one|two|three)\s+(day|week)s?\s+ago\b", re.IGNORECASE)
+_SMALL_NUMBERS = {"a": 1, "one": 1, "two": 2, "three": 3}
+
+# Zone names sorted longest-first so "Babylon 1" never shadows a longer name that contains it.
+_ZONE_PATTERNS = [(zone, re.compile(r"\b" + re.escape(zone) + r"\b", re.IGNORECASE))
+                  for zone in sorted(ZONE_NAMES, key=len, reverse=True)]
+
+
+def parse_time_window(message: str, now: datetime = None):
+    """
+    Turns a relative time phrase in the message into a (start, end, label) window.
+
+    Recognizes "today", "yesterday", "this week", "last week", "this month", "last/past N
+    minutes|hours|days|weeks|months", "last hour/day/month", "N days/weeks ago", "last night",
+    "this morning" and "recently"/"lately" (last 24 hours). Returns None when no phrase is found.
+    """
+    now = now or datetime.now()
+    text = message.lower()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    match = _RELATIVE_WINDOW_RE.search(text)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2).lower()
+        return now - timedelta(seconds=amount * _UNIT_SECONDS[unit]), now, f"in the last {amount} {unit}s"
+    match = _DAYS_AGO_RE.search(text)
+    if match:
+        amount = _SMALL_NUMBERS.get(match.group(1).lower()) or int(match.group(1))
+        unit = match.group(2).lower()
+        start = midnight - timedelta(days=amount * (7 if unit == "week" else 1))
+        span_days = 7 if unit == "week" else 1
+        return start, start + timedelta(days=span_days), f"{amount} {unit}{'s' if amount > 1 else ''} ago"
+    if "last night" in text or "overnight" in text:
+        evening = midnight - timedelta(hours=6) if now.hour >= 6 else midnight - timedelta(hours=30)
+        return evening, evening + timedelta(hours=12), "last night"
+    if "this morning" in text:
+        return midnight, min(now, midnight + timedelta(hours=12)), "this morning"
+    if "yesterday" in text:
+        return midnight - timedelta(days=1), midnight, "yesterday"
+    if "today" in text or "so far" in text:
+        return midnight, now, "today"
+    if "last week" in text or "previous week" in text:
+        week_start = midnight - timedelta(days=now.weekday())
+        return week_start - timedelta(days=7), week_start, "last week"
+    if "this week" in text:
+        return midnight - timedelta(days=now.weekday()), now, "this week"
+    if "this month" in text:
+        return midnight.replace(day=1), now, "this month"
+    match = _SINGLE_UNIT_RE.search(text)
+    if match:
+        unit = match.group(1).lower()
+        return now - timedelta(seconds=_UNIT_SECONDS[unit]), now, f"in the last {unit}"
+    if "recent" in text or "lately" in text:
+        return now - timedelta(days=1), now, "in the last 24 hours"
+    return None
+
+
+def parse_data_query(message: str, zone_name: str = None, now: datetime = None):
+    """
+    Classifies a chat message as a deterministic data lookup, if it is one.
+
+    Returns None for anything that needs the LLM (advice, explanations, questions
+    without a metric or without a time window/aggregation). Otherwise returns:
+      {"zone": str, "metrics": [str], "aggregation": "max"|"min"|"avg"|"latest"|"summary",
+       "window": (start, end, label) or None, "anomalies": bool}
+    A zone named in the message overrides the zone_name the request was sent with.
+    """
+    if not message or OPEN_ENDED_PATTERN.search(message):
+        return None
+
+    metrics = [metric for metric, pattern in METRIC_PATTERNS.items() if pattern.search(message)]
+    if not metrics:
+        return None
+
+    zone = zone_name
+    for candidate, pattern in _ZONE_PATTERNS:
+        if pattern.search(message):
+            zone = candidate
+            break
+    if zone not in ZONE_REGISTRY:
+        return None
+
+    aggregation = None
+    for name, pattern in AGGREGATION_PATTERNS:
+        if pattern.search(message):
+            aggregation = name
+            break
+    window = parse_time_window(message, now=now)
+    if aggregation is None and window is None:
+        return None
+
+    return {
+        "zone": zone,
+        "metrics": metrics,
+        "aggregation": aggregation or "summary",
+        "window": None if aggregation == "latest" and window is None else window,
+        "anomalies": bool(ANOMALY_PATTERN.search(message)),
+    }
+
+
+def _slice_window(history: list, window) -> list:
+    """Bisects the (chronologically ordered) history on its timestamp strings."""
+    if window is None:
+        return history
+    start, end, _ = window
+    start_key, end_key = start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+    lo = bisect_left(history, start_key, key=lambda entry: entry["timestamp"])
+    hi = bisect_right(history, end_key, key=lambda entry: entry["timestamp"])
+    return history[lo:hi]
+
+
+def _format_value(metric: str, value) -> str:
+    if metric == "CO2":
+        return f"{int(round(value))}{METRIC_UNITS[metric]}"
+    return f"{value:.1f}{METRIC_UNITS[metric]}"
+
+
+def compute_answer(query: dict) -> dict:
+    """
+    Computes the facts for a parsed data query straight from sensor_handler history.
+
+    Returns {"answer": str, "facts": dict}; "facts" holds the raw numbers so a caller can
+    hand them to a short phrasing prompt without the model having to do any arithmetic.
+    """
+    zone = query["zone"]
+    history = get_zone_history(zone)
+    if query["aggregation"] == "latest" and query["window"] is None:
+        readings = history[-1:]
+    else:
+        readings = _slice_window(history, query["window"])
+    label = query["window"][2] if query["window"] else "in the stored history"
+
+    facts = {"zone": zone, "window": label, "readings": len(readings), "metrics": {}}
+    if not readings:
+        return {"answer": f"There are no stored readings for {zone} {label}.", "facts": facts}
+
+    ranges = get_zone_ranges(zone)
+    sentences = []
+    for metric in query["metrics"]:
+        points = [(entry["timestamp"], entry[metric]) for entry in readings if entry.get(metric) is not None]
+        if not points:
+            continue
+        values = [value for _, value in points]
+        metric_facts = {}
+        if query["aggregation"] == "latest":
+            metric_facts["latest"] = values[-1]
+            sentences.append(f"The latest {metric} reading in {zone} is {_format_value(metric, values[-1])} "
+                             f"(at {points[-1][0]}).")
+        elif query["aggregation"] in ("max", "min"):
+            pick = max if query["aggregation"] == "max" else min
+            index = pick(range(len(values)), key=values.__getitem__)
+            metric_facts[query["aggregation"]] = values[index]
+            word = "highest" if query["aggregation"] == "max" else "lowest"
+            sentences.append(f"The {word} {metric} in {zone} {label} was {_format_value(metric, values[index])} "
+                             f"at {points[index][0]}.")
+        else:
+            average = sum(values) / len(values)
+            metric_facts.update({"min": min(values), "max": max(values), "avg": round(average, 1)})
+            if query["aggregation"] == "avg":
+                sentences.append(f"The average {metric} in {zone} {label} was {_format_value(metric, average)}.")
+            else:
+                sentences.append(f"{metric[0].upper() + metric[1:]} in {zone} {label}: min {_format_value(metric, min(values))}, "
+                                 f"max {_format_value(metric, max(values))}, avg {_format_value(metric, average)}.")
+
+        if query["anomalies"] or query["aggregation"] == "summary":
+            low, high = ranges[metric]
+            outliers = [(timestamp, value) for timestamp, value in points if not low <= value <= high]
+            metric_facts["normal_range"] = [low, high]
+            metric_facts["out_of_range"] = len(outliers)
+            if outliers:
+                worst_ts, worst_value = max(outliers, key=lambda item: abs(item[1] - (low + high) / 2))
+                sentences.append(f"⚠️ {len(outliers)} {metric} reading(s) fell outside the normal range "
+                                 f"({_format_value(metric, low)}–{_format_value(metric, high)}); the largest was "
+                                 f"{_format_value(metric, worst_value)} at {worst_ts}.")
+            elif query["anomalies"]:
+                sentences.append(f"No {metric} readings fell outside the normal range "
+                                 f"({_format_value(metric, low)}–{_format_value(metric, high)}).")
+        facts["metrics"][metric] = metric_facts
+
+    if query["aggregation"] != "latest":
+        sentences.append(f"(Based on {len(readings)} readings.)")
+    return {"answer": " ".join(sentences), "facts": facts}
+
+
+def answer_data_question(message: str, zone_name: str = None, now: datetime = None):
+    """
+    Fast path for plain data lookups. Returns compute_answer's result (plus the parsed
+    "query") when the message is a recognized lookup, or None to fall through to RAG + LLM.
+    """
+    query = parse_data_query(message, zone_name=zone_name, now=now)
+    if query is None:
+        return None
+    try:
+        result = compute_answer(query)
+    except ValueError as e:
+        print(f"Warning: Fast-path lookup failed for zone {query['zone']}: {e}")
+        return None
+    result["query"] = query
+    return result
+
+
+if __name__ == "__main__":
+    import time
+
+    print("--- Query Intent Fast Path Demonstration ---")
+    questions = [
+        ("What were the CO2 levels like yesterday and are there any anomalies?", "Babylon 1"),
+        ("max temperature in Tent 2 this week", "Babylon 1"),
+        ("What's the humidity right now?", "Mine"),
+        ("Any temperature alerts for the Mine recently?", "Mine"),
+        ("Based on that, what should I check or do?", "Babylon 1"),
+        ("How do I generally improve mushroom yield?", "General"),
+    ]
+    get_zone_history(ZONE_NAMES[0])  # Warm the history so timings exclude initialization
+    for question, zone in questions:
+        start = time.perf_counter()
+        result = answer_data_question(question, zone_name=zone)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"\nQ ({zone}): {question}")
+        if result is None:
+            print(f"  -> Not a data lookup, falls through to the LLM ({elapsed_ms:.2f} ms to classify)")
+        else:
+            print(f"  -> {result['answer']} ({elapsed_ms:.2f} ms)")
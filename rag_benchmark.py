@@ -0,0 +1,355 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import chromadb
+import numpy as np
+
+from load_test import git_commit
+from rag_ingestion import EPOCH_KEY, build_reading_document, query_readings, to_epoch
+from sensor_handler import generate_pseudo_sensor_data
+from zone_registry import ZONE_NAMES
+
+# --- Configuration ---
+BENCHMARK_COLLECTION = "rag_benchmark"
+DEFAULT_DAYS = 120
+DEFAULT_INTERVAL_MINUTES = 30
+DEFAULT_DIMENSIONS = 384 # Stand-in embedding size (nomic-embed-text is 768)
+INDEX_END = datetime(2025, 6, 1, 12, 0) # Fixed "now": every run builds and queries the same index
+ADD_BATCH_SIZE = 5000 # Below Chroma's maximum batch size
+N_RESULTS = 6 # Same as ai_model.RAG_CANDIDATES
+REPEATS = 5 # Timed repetitions per query
+RESULTS_DIR = "rag_results"
+CONFIG_FILE = "benchmark_config.json" # Written into --index-dir so a matching index is reused
+LATENCY_REGRESSION = 0.20 # --compare: p95 latency or on-disk size worse than this fraction
+QUALITY_REGRESSION = 0.02 # --compare: recall@k or precision lower by more than this
+
+# Labelled query set: each question's relevant documents are the zone's readings in [from, to)
+# (the whole zone when there is no period). Periods are relative to INDEX_END, a Sunday.
+QUERY_SET = [
+    {"zone": "Babylon 1", "question": "What was the CO2 like in Babylon 1 yesterday?",
+     "from": "2025-05-31 00:00:00", "to": "2025-06-01 00:00:00"},
+    {"zone": "Mine", "question": "Were there humidity problems in Mine last night?",
+     "from": "2025-05-31 18:00:00", "to": "2025-06-01 06:00:00"},
+    {"zone": "Tent 2", "question": "How did the temperature in Tent 2 look last week?",
+     "from": "2025-05-19 00:00:00", "to": "2025-05-26 00:00:00"},
+    {"zone": "Bear Mountain", "question": "Any CO2 spikes in Bear Mountain in the last 3 days?",
+     "from": "2025-05-29 12:00:00", "to": "2025-06-01 12:00:00"},
+    {"zone": "Tent 1", "question": "What happened to humidity in Tent 1 2 days ago?",
+     "from": "2025-05-30 00:00:00", "to": "2025-05-31 00:00:00"},
+    {"zone": "Babylon 2", "question": "How has Babylon 2 been doing this month?",
+     "from": "2025-06-01 00:00:00", "to": "2025-06-01 12:00:00"},
+    {"zone": "Mine", "question": "Summarize the past 2 weeks in Mine",
+     "from": "2025-05-18 12:00:00", "to": "2025-06-01 12:00:00"},
+    {"zone": "Tent 1", "question": "Was Tent 1 too warm this morning?",
+     "from": "2025-06-01 00:00:00", "to": "2025-06-01 12:00:00"},
+    {"zone": "Babylon 1", "question": "CO2 in Babylon 1 over the last month",
+     "from": "2025-05-02 12:00:00", "to": "2025-06-01 12:00:00"},
+    {"zone": "Bear Mountain", "question": "How were conditions in Bear Mountain 3 weeks ago?",
+     "from": "2025-05-11 00:00:00", "to": "2025-05-18 00:00:00"},
+    {"zone": "Mine", "question": "Is the humidity in Mine holding up around 97%?", "from": None, "to": None},
+    {"zone": "Tent 2", "question": "Tell me about temperature 44.5F readings in Tent 2", "from": None, "to": None},
+]
+
+
+# --- Embeddings ---
+class HashingEmbedding:
+    """
+    Deterministic local stand-in for the embedding model: signed feature hashing of words and of
+    numbers rounded to two significant digits, L2-normalized. Texts sharing words and similar
+    values get similar vectors, so nearest-neighbour search behaves like it does on real text.
+    """
+    name = "standin"
+
+    def __init__(self, dimensions: int = DEFAULT_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _features(self, text: str):
+        for token in re.findall(r"[a-z]+|\d+(?:\.\d+)?", text.lower()):
+            if token[0].isdigit():
+                value = float(token)
+                token = f"#{float(f'{value:.2g}'):g}" if value else "#0"
+            yield token
+
+    def __call__(self, texts: list) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class RecordedEmbeddings:
+    """Embeddings replayed from a file written by --record-embeddings (text -> vector)."""
+    name = "recorded"
+
+    def __init__(self, path: str):
+        data = np.load(path, allow_pickle=False)
+        self.vectors = {text: row for row, text in enumerate(data["texts"].tolist())}
+        self.matrix = data["vectors"]
+        self.dimensions = self.matrix.shape[1]
+
+    def __call__(self, texts: list) -> np.ndarray:
+        missing = [text for text in texts if text not in self.vectors]
+        if missing:
+            raise KeyError(f"{len(missing)} texts are not in the recorded embedding set (e.g. {missing[0]!r}); "
+                           "record it again with the same --days/--interval-minutes.")
+        return self.matrix[[self.vectors[text] for text in texts]]
+
+
+class RecordingEmbeddings:
+    """Calls Ollama (pooled, see ollama_client.py) and keeps every vector so save() can write them."""
+    name = "ollama"
+
+    def __init__(self, model: str = "nomic-embed-text"):
+        import ollama_client
+        self._embed = lambda text: ollama_client.embed(text, model)
+        self.recorded = {}
+        self.dimensions = None
+
+    def __call__(self, texts: list) -> np.ndarray:
+        for text in texts:
+            if text not in self.recorded:
+                self.recorded[text] = np.asarray(self._embed(text), dtype=np.float32)
+        vectors = np.stack([self.recorded[text] for text in texts])
+        self.dimensions = vectors.shape[1]
+        return vectors
+
+    def save(self, path: str):
+        texts = list(self.recorded)
+        np.savez_compressed(path, texts=np.array(texts), vectors=np.stack([self.recorded[text] for text in texts]))
+
+
+# --- Index ---
+def generate_documents(days: int, interval_minutes: int, seed: int = 0):
+    """(documents, metadatas, ids) for `days` of seeded readings of every zone, as rag_ingestion writes them."""
+    random.seed(seed)
+    start = INDEX_END - timedelta(days=days)
+    documents, metadatas, ids = [], [], []
+    for step in range(days * 24 * 60 // interval_minutes):
+        base_time = start + timedelta(minutes=step * interval_minutes)
+        for zone_name in ZONE_NAMES:
+            document, metadata, doc_id = build_reading_document(generate_pseudo_sensor_data(base_time=base_time, zone_name=zone_name))
+            documents.append(document), metadatas.append(metadata), ids.append(doc_id)
+    return documents, metadatas, ids
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def build_index(path: str, embedding, config: dict) -> dict:
+    """Builds the collection and returns build statistics (also saved next to the index for reuse)."""
+    start = time.perf_counter()
+    documents, metadatas, ids = generate_documents(config["days"], config["interval_minutes"])
+    generate_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    vectors = embedding(documents)
+    embed_seconds = time.perf_counter() - start
+
+    client = chromadb.PersistentClient(path=path)
+    try:
+        client.delete_collection(BENCHMARK_COLLECTION)
+    except Exception:
+        pass
+    collection_metadata = {"hnsw:space": config["space"], "hnsw:M": config["hnsw_m"], "hnsw:search_ef": config["search_ef"]}
+    collection = client.create_collection(BENCHMARK_COLLECTION, metadata=collection_metadata)
+    start = time.perf_counter()
+    for offset in range(0, len(documents), ADD_BATCH_SIZE):
+        end = offset + ADD_BATCH_SIZE
+        collection.add(documents=documents[offset:end], metadatas=metadatas[offset:end], ids=ids[offset:end],
+                       embeddings=vectors[offset:end])
+    index_seconds = time.perf_counter() - start
+    build = {"documents": len(documents), "generate_seconds": round(generate_seconds, 2),
+             "embed_seconds": round(embed_seconds, 2), "index_seconds": round(index_seconds, 2),
+             "index_docs_per_second": round(len(documents) / index_seconds), "disk_bytes": directory_bytes(path)}
+    with open(os.path.join(path, CONFIG_FILE), "w") as f:
+        json.dump({"config": config, "build": build}, f, indent=2)
+    return build
+
+
+def open_index(path: str, config: dict):
+    """The saved build statistics if `path` holds an index built with the same config, else None."""
+    try:
+        with open(os.path.join(path, CONFIG_FILE)) as f:
+            saved = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return saved["build"] if saved.get("config") == config else None
+
+
+def load_vectors(collection, batch_size: int = ADD_BATCH_SIZE):
+    """All ids, zones, epochs and embeddings of the collection (for exact nearest-neighbour ground truth)."""
+    ids, zones, epochs, vectors = [], [], [], []
+    offset = 0
+    while True:
+        batch = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        ids += batch["ids"]
+        zones += [metadata["zone"] for metadata in batch["metadatas"]]
+        epochs += [metadata[EPOCH_KEY] for metadata in batch["metadatas"]]
+        vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        offset += len(batch["ids"])
+    return np.array(ids), np.array(zones), np.array(epochs, dtype=np.int64), np.vstack(vectors)
+
+
+def _distances(vectors: np.ndarray, query: np.ndarray, space: str) -> np.ndarray:
+    """Exact distances in the collection's hnsw:space (smaller is nearer)."""
+    if space == "cosine":
+        return 1 - (vectors @ query) / (np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1) + 1e-12)
+    if space == "ip":
+        return 1 - vectors @ query
+    return ((vectors - query) ** 2).sum(axis=1)
+
+
+# --- Queries ---
+def run_queries(collection, embedding, space: str, k: int = N_RESULTS, query_set=QUERY_SET) -> dict:
+    """
+    Replays the labelled queries through rag_ingestion.query_readings (the chat retrieval path)
+    and scores each against the exact k nearest neighbours among its relevant documents. A result
+    tied with the k-th exact neighbour counts as found: equally near documents are interchangeable.
+    """
+    ids, zones, epochs, vectors = load_vectors(collection)
+    query_vectors = embedding([entry["question"] for entry in query_set])
+    latencies, rows = [], []
+    for entry, query_vector in zip(query_set, query_vectors):
+        relevant = zones == entry["zone"]
+        if entry["from"]:
+            relevant &= (epochs >= to_epoch(entry["from"])) & (epochs < to_epoch(entry["to"]))
+        relevant_rows = np.flatnonzero(relevant)
+        distances = dict(zip(ids[relevant_rows].tolist(), _distances(vectors[relevant_rows], query_vector, space).tolist()))
+        expected = min(k, len(distances))
+        kth_distance = sorted(distances.values())[expected - 1] + 1e-5 if expected else 0.0
+
+        timings = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            retrieved = query_readings(collection, query_vector.tolist(), entry["zone"], entry["question"], k,
+                                       now=INDEX_END, include=())
+            timings.append(time.perf_counter() - start)
+        latencies += timings
+        returned = retrieved["ids"]
+        window = retrieved["window"]
+        found = sum(1 for doc_id in returned if distances.get(doc_id, np.inf) <= kth_distance)
+        rows.append({
+            "question": entry["question"],
+            "window": window[2] if window else None,
+            "relevant": len(distances),
+            "returned": len(returned),
+            "recall_at_k": round(min(found, expected) / expected, 3) if expected else 1.0,
+            "precision": round(sum(1 for doc_id in returned if doc_id in distances) / len(returned), 3) if returned else 0.0,
+            "median_ms": round(float(np.median(timings)) * 1000, 2),
+        })
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {"k": k, "queries": rows,
+            "latency_ms": {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)},
+            "recall_at_k": round(float(np.mean([row["recall_at_k"] for row in rows])), 4),
+            "precision": round(float(np.mean([row["precision"] for row in rows])), 4)}
+
+
+def print_report(report: dict):
+    build, queries = report["build"], report["queries"]
+    print(f"--- RAG retrieval benchmark: {build['documents']:,} documents, {report['config']['embedding']} embeddings "
+          f"({report['config']['dimensions']}d), hnsw {report['config']['space']} M={report['config']['hnsw_m']} "
+          f"ef={report['config']['search_ef']} ---")
+    print(f"build: embed {build['embed_seconds']:.1f}s, index {build['index_seconds']:.1f}s "
+          f"({build['index_docs_per_second']:,} docs/s), {build['disk_bytes'] / 1e6:.1f} MB on disk")
+    print(f"{'question':55s} {'window':20s} {'relevant':>8s} {'recall':>6s} {'prec':>5s} {'ms':>7s}")
+    for row in queries["queries"]:
+        print(f"{row['question'][:55]:55s} {str(row['window'] or '-')[:20]:20s} {row['relevant']:8,d} "
+              f"{row['recall_at_k']:6.2f} {row['precision']:5.2f} {row['median_ms']:7.2f}")
+    latency = queries["latency_ms"]
+    print(f"recall@{queries['k']} {queries['recall_at_k']:.3f}, precision {queries['precision']:.3f}, "
+          f"latency p50 {latency['p50']:.1f} / p95 {latency['p95']:.1f} / p99 {latency['p99']:.1f} ms")
+
+
+def compare_results(current: dict, baseline: dict) -> list:
+    """Prints changes against a baseline results file; returns regression descriptions."""
+    regressions = []
+    print(f"\n--- Compared with {baseline.get('git_commit', '?')} ({baseline.get('timestamp', '?')}) ---")
+    if baseline.get("config") != current["config"]:
+        print("Note: benchmark configuration differs from the baseline; numbers may not be comparable.")
+    for label, before, after in (("p95 latency", baseline["queries"]["latency_ms"]["p95"], current["queries"]["latency_ms"]["p95"]),
+                                 ("disk size", baseline["build"]["disk_bytes"], current["build"]["disk_bytes"])):
+        change = after / before - 1 if before else 0.0
+        print(f"{label:12s} {before:,} -> {after:,} ({change:+.0%})")
+        if change > LATENCY_REGRESSION:
+            regressions.append(f"{label} {change:+.0%}")
+    for label in ("recall_at_k", "precision"):
+        before, after = baseline["queries"][label], current["queries"][label]
+        print(f"{label:12s} {before:.3f} -> {after:.3f}")
+        if after < before - QUALITY_REGRESSION:
+            regressions.append(f"{label} {after - before:+.3f}")
+    print(f"{'index build':12s} {baseline['build']['index_seconds']:.1f}s -> {current['build']['index_seconds']:.1f}s")
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark and regression check for the RAG path.")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Days of readings per zone to index")
+    parser.add_argument("--interval-minutes", type=int, default=DEFAULT_INTERVAL_MINUTES)
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_DIMENSIONS, help="Stand-in embedding size")
+    parser.add_argument("--embeddings", metavar="NPZ", help="Replay a recorded embedding set instead of the stand-in")
+    parser.add_argument("--record-embeddings", metavar="NPZ", help="Embed with Ollama and record the vectors to this file")
+    parser.add_argument("--space", choices=("cosine", "l2", "ip"), default="cosine", help="hnsw:space of the collection")
+    parser.add_argument("--hnsw-m", type=int, default=16)
+    parser.add_argument("--search-ef", type=int, default=100)
+    parser.add_argument("--k", type=int, default=N_RESULTS, help="Results per query (recall@k)")
+    parser.add_argument("--index-dir", help="Build into (and reuse if the configuration matches) this directory")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild even if --index-dir holds a matching index")
+    parser.add_argument("--output", help=f"Results JSON path (default: {RESULTS_DIR}/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="Compare with an earlier results file; exit 1 on regressions")
+    args = parser.parse_args()
+
+    if args.record_embeddings:
+        embedding = RecordingEmbeddings()
+    elif args.embeddings:
+        embedding = RecordedEmbeddings(args.embeddings)
+    else:
+        embedding = HashingEmbedding(args.dimensions)
+    config = {"days": args.days, "interval_minutes": args.interval_minutes, "embedding": embedding.name,
+              "embedding_source": args.embeddings or args.record_embeddings, "dimensions": embedding.dimensions,
+              "space": args.space, "hnsw_m": args.hnsw_m, "search_ef": args.search_ef}
+
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="rag_benchmark_")
+    build = None if args.rebuild or not args.index_dir else open_index(index_dir, config)
+    if build is None:
+        print(f"Building index in {index_dir}...")
+        build = build_index(index_dir, embedding, config)
+        config["dimensions"] = embedding.dimensions
+    collection = chromadb.PersistentClient(path=index_dir).get_collection(BENCHMARK_COLLECTION)
+    queries = run_queries(collection, embedding, args.space, args.k)
+    if args.record_embeddings:
+        embedding.save(args.record_embeddings)
+        print(f"Recorded {len(embedding.recorded):,} embeddings to {args.record_embeddings}")
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    commit = git_commit()
+    report = {"timestamp": datetime.now().isoformat(timespec="seconds"), "git_commit": commit,
+              "config": config, "build": build, "queries": queries}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"{stamp}_{commit}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Results written to {output}")
+    if not args.index_dir:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare_results(report, json.load(f)):
+                sys.exit(1)
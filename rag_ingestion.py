@@ -1,10 +1,14 @@
+import argparse
 import chromadb
 from chromadb.api.types import EmbeddingFunction, Documents, Embeddings
 from datetime import datetime, timedelta
 import os
 import time
-import requests # For Ollama API calls
+import requests # For Ollama API exceptions
 import json
+import ollama_client # Pooled keep-alive session shared with the API server's callers
+
+from query_intent import parse_time_window
 
 try:
     from sensor_handler import generate_pseudo_sensor_data
@@ -13,11 +17,13 @@ except ImportError:
     exit()
 
 # --- Configuration ---
-ZONE_NAMES = ["Babylon 1", "Babylon 2", "Mine", "Tent 1", "Tent 2", "Bear Mountain"]
+from zone_registry import ZONE_NAMES # Same zones as the rest of the system (zones.json)
 CHROMA_DB_PATH = "chroma_db_data"
 COLLECTION_NAME = "mushroom_zone_data"
 OLLAMA_EMBED_MODEL = 'nomic-embed-text'
-OLLAMA_API_URL = 'http://localhost:11434/api/embeddings'
+OLLAMA_API_URL = ollama_client.url("embeddings")
+EPOCH_KEY = "epoch" # Integer seconds metadata next to the "timestamp" string, so queries can filter on time ranges
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 # --- Custom Ollama Embedding Function ---
 class OllamaEmbeddingFunction(EmbeddingFunction):
@@ -29,10 +35,10 @@ class OllamaEmbeddingFunction(EmbeddingFunction):
     def _test_ollama_connection(self):
         print(f"Testing connection to Ollama and model '{self.model_name}'...")
         try:
-            response = requests.post(
+            response = ollama_client.get_session().post(
                 self.api_url,
                 json={"model": self.model_name, "prompt": "test"},
-                timeout=5 # 5 seconds timeout
+                timeout=ollama_client.timeout_for("embeddings", 5)
             )
             response.raise_for_status() # Raise an exception for HTTP errors
             print("Ollama connection and model access successful.")
@@ -56,9 +62,10 @@ class OllamaEmbeddingFunction(EmbeddingFunction):
         embeddings_list = []
         for i, text_input in enumerate(texts):
             try:
-                response = requests.post(
+                response = ollama_client.get_session().post(
                     self.api_url,
-                    json={"model": self.model_name, "prompt": text_input}
+                    json={"model": self.model_name, "prompt": text_input},
+                    timeout=ollama_client.timeout_for("embeddings")
                 )
                 response.raise_for_status()
                 response_json = response.json()
@@ -75,6 +82,9 @@ class OllamaEmbeddingFunction(EmbeddingFunction):
             except requests.exceptions.ConnectionError as e:
                 print(f"CRITICAL: Could not connect to Ollama at {self.api_url} during embedding generation. Halting. Error: {e}")
                 raise # Re-raise to stop the process if Ollama is down
+            except requests.exceptions.Timeout:
+                print(f"CRITICAL: Timeout waiting for Ollama at {self.api_url} during embedding generation.")
+                raise
             except requests.exceptions.HTTPError as e:
                 error_message = f"CRITICAL: HTTP error from Ollama during embedding: {e}."
                 if e.response is not None:
@@ -93,8 +103,13 @@ class OllamaEmbeddingFunction(EmbeddingFunction):
                 raise
         return embeddings_list
 
-# --- Main Ingestion Logic ---
-def main():
+# --- Ingestion Helpers ---
+def get_collection(reset: bool = False):
+    """
+    Opens (or creates) the sensor-reading collection with Ollama embeddings. With reset=True an
+    existing collection is deleted first, which is needed after changing the embedding function.
+    Returns None if ChromaDB or the embedding function cannot be initialized.
+    """
     print("Initializing ChromaDB...")
     try:
         if not os.path.exists(CHROMA_DB_PATH):
@@ -102,36 +117,158 @@ def main():
         client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
     except Exception as e:
         print(f"Error initializing ChromaDB: {e}")
-        return
+        return None
 
     print(f"Initializing Ollama Embedding Function with model: {OLLAMA_EMBED_MODEL}")
     try:
         ollama_ef = OllamaEmbeddingFunction(model_name=OLLAMA_EMBED_MODEL, api_url=OLLAMA_API_URL)
     except Exception as e: # Should catch issues from _test_ollama_connection if they are severe
         print(f"Could not initialize OllamaEmbeddingFunction: {e}. Aborting.")
-        return
-        
-    # Check if collection exists and delete it to ensure new embedding function is used
-    # This is important if you change the embedding function for an existing collection name
-    try:
-        existing_collections = [col.name for col in client.list_collections()]
-        if COLLECTION_NAME in existing_collections:
-            print(f"Collection '{COLLECTION_NAME}' exists. Deleting it to apply new embedding function...")
-            client.delete_collection(name=COLLECTION_NAME)
-            print(f"Collection '{COLLECTION_NAME}' deleted.")
-    except Exception as e:
-        print(f"Error during pre-check/deletion of existing collection: {e}")
-        # Decide if this is critical enough to stop. For now, we'll try to proceed.
+        return None
+
+    if reset:
+        # Check if collection exists and delete it to ensure new embedding function is used
+        # This is important if you change the embedding function for an existing collection name
+        try:
+            existing_collections = [col.name for col in client.list_collections()]
+            if COLLECTION_NAME in existing_collections:
+                print(f"Collection '{COLLECTION_NAME}' exists. Deleting it to apply new embedding function...")
+                client.delete_collection(name=COLLECTION_NAME)
+                print(f"Collection '{COLLECTION_NAME}' deleted.")
+        except Exception as e:
+            print(f"Error during pre-check/deletion of existing collection: {e}")
+            # Decide if this is critical enough to stop. For now, we'll try to proceed.
 
     print(f"Getting or creating collection: {COLLECTION_NAME}")
     try:
-        collection = client.get_or_create_collection(
+        return client.get_or_create_collection(
             name=COLLECTION_NAME,
             embedding_function=ollama_ef,
             metadata={"hnsw:space": "cosine"} # Example metadata, adjust as needed
         )
     except Exception as e:
         print(f"Error getting or creating collection with Ollama embeddings: {e}")
+        return None
+
+
+def to_epoch(timestamp) -> int:
+    """Seconds since the epoch for a "YYYY-MM-DD HH:MM:SS" string or a datetime (local time, like the readings)."""
+    if isinstance(timestamp, str):
+        timestamp = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    return int(timestamp.timestamp())
+
+
+def build_where(zone_name: str, window=None, now: datetime = None) -> dict:
+    """
+    Chroma metadata filter for one zone, narrowed to [start, end) when `window` is a
+    (start, end, ...) tuple such as query_intent.parse_time_window returns. Each clause costs
+    a filter pass in Chroma, so windows that end at `now` ("last 3 days") get no upper bound.
+    """
+    if window is None:
+        return {"zone": zone_name}
+    start, end = window[0], window[1]
+    clauses = [{"zone": zone_name}, {EPOCH_KEY: {"$gte": to_epoch(start)}}]
+    if end < (now or datetime.now()):
+        clauses.append({EPOCH_KEY: {"$lt": to_epoch(end)}})
+    return {"$and": clauses}
+
+
+def query_readings(collection, query_embedding, zone_name: str, message: str, n_results: int, now: datetime = None,
+                   include=("documents", "distances"), time_filter: bool = True) -> dict:
+    """
+    The retrieval behind a chat message: nearest neighbours of `query_embedding` among the zone's
+    readings, restricted to the period the message names ("yesterday", "past 2 weeks", ...).
+    With time_filter=False (an index without epoch metadata) only the zone is filtered.
+    Returns {"ids", <each included field>: lists for this one query, "window": (start, end, label) or None
+    (None when no period was named or it was not applied)}.
+    """
+    window = parse_time_window(message, now=now) if time_filter else None
+    results = collection.query(query_embeddings=[query_embedding], n_results=n_results,
+                               where=build_where(zone_name, window, now), include=list(include))
+    retrieved = {key: (results.get(key) or [[]])[0] for key in ("ids", *include)}
+    retrieved["window"] = window
+    return retrieved
+
+
+def has_epoch_metadata(collection) -> bool:
+    """
+    Whether the collection's documents carry epoch metadata (an empty collection counts as yes).
+    Samples the oldest document: anything ingested before epochs existed sits at the front, and
+    backfill_epochs updates all of it.
+    """
+    sample = collection.get(limit=1, include=["metadatas"])
+    return not sample["ids"] or EPOCH_KEY in (sample["metadatas"][0] or {})
+
+
+def backfill_epochs(collection, batch_size: int = 1000) -> int:
+    """
+    Adds epoch metadata to documents ingested before it existed (metadata only, no re-embedding).
+    Returns the number of documents updated.
+    """
+    updated = 0
+    offset = 0
+    while True:
+        batch = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return updated
+        ids, metadatas = [], []
+        for doc_id, metadata in zip(batch["ids"], batch["metadatas"]):
+            if metadata and EPOCH_KEY not in metadata and metadata.get("timestamp"):
+                ids.append(doc_id)
+                metadatas.append({**metadata, EPOCH_KEY: to_epoch(metadata["timestamp"])})
+        if ids:
+            collection.update(ids=ids, metadatas=metadatas)
+            updated += len(ids)
+        offset += len(batch["ids"])
+
+
+def build_reading_document(sensor_reading: dict):
+    """Returns (document_text, metadata, id) for one reading in the generate_pseudo_sensor_data format."""
+    zone_name = sensor_reading["zone"]
+    data_timestamp_str = sensor_reading["timestamp"]
+    document_text = (
+        f"Sensor reading for Zone '{zone_name}' at {data_timestamp_str}: "
+        f"Temperature {sensor_reading['temperature']:.1f}°F, "
+        f"Humidity {sensor_reading['humidity']:.1f}%, "
+        f"CO2 {sensor_reading['CO2']} ppm."
+    )
+    metadata = {
+        "zone": zone_name,
+        "timestamp": data_timestamp_str,
+        EPOCH_KEY: to_epoch(data_timestamp_str),
+        "original_temperature": float(sensor_reading['temperature']),
+        "original_humidity": float(sensor_reading['humidity']),
+        "original_co2": int(sensor_reading['CO2'])
+    }
+    safe_zone_name = zone_name.replace(' ', '_')
+    doc_id = f"{safe_zone_name}_{data_timestamp_str.replace(' ', '_').replace(':', '-')}"
+    return document_text, metadata, doc_id
+
+
+def ingest_readings(collection, readings, batch_size: int = 100) -> int:
+    """
+    Embeds and stores readings in batches. IDs are derived from zone and timestamp, so
+    re-ingesting the same readings updates them instead of duplicating them.
+    Returns the number of documents written.
+    """
+    readings = list(readings)
+    written = 0
+    for start in range(0, len(readings), batch_size):
+        batch = [build_reading_document(reading) for reading in readings[start:start + batch_size]]
+        documents, metadatas, ids = (list(column) for column in zip(*batch))
+        try:
+            collection.upsert(documents=documents, metadatas=metadatas, ids=ids)
+            written += len(batch)
+        except Exception as e:
+            print(f"Error adding {len(batch)} documents to ChromaDB: {e}")
+            print("Skipping this batch due to embedding/DB error.")
+    return written
+
+
+# --- Main Ingestion Logic ---
+def main():
+    collection = get_collection(reset=True)
+    if collection is None:
         return
 
     print("Starting data generation and ingestion...")
@@ -139,54 +276,18 @@ def main():
 
     for zone_name in ZONE_NAMES:
         print(f"\nProcessing zone: {zone_name}...")
-        
-        documents = []
-        metadatas = []
-        ids = []
-        
+
         num_days = 7
         readings_per_day = 4 
         current_time = datetime.now() - timedelta(days=num_days) 
+        readings = [
+            generate_pseudo_sensor_data(base_time=current_time + timedelta(days=day, hours=i*6), zone_name=zone_name)
+            for day in range(num_days) for i in range(readings_per_day)
+        ]
 
-        for day in range(num_days):
-            for i in range(readings_per_day):
-                reading_time = current_time + timedelta(days=day, hours=i*6)
-                sensor_reading = generate_pseudo_sensor_data(base_time=reading_time)
-                data_timestamp_str = sensor_reading["timestamp"]
-                
-                document_text = (
-                    f"Sensor reading for Zone '{zone_name}' at {data_timestamp_str}: "
-                    f"Temperature {sensor_reading['temperature']:.1f}°F, "
-                    f"Humidity {sensor_reading['humidity']:.1f}%, "
-                    f"CO2 {sensor_reading['CO2']} ppm."
-                )
-                documents.append(document_text)
-                
-                metadatas.append({
-                    "zone": zone_name,
-                    "timestamp": data_timestamp_str,
-                    "original_temperature": float(sensor_reading['temperature']),
-                    "original_humidity": float(sensor_reading['humidity']),
-                    "original_co2": int(sensor_reading['CO2'])
-                })
-                
-                safe_zone_name = zone_name.replace(' ', '_')
-                ids.append(f"{safe_zone_name}_{data_timestamp_str.replace(' ', '_').replace(':', '-')}")
-
-        if documents:
-            print(f"Adding {len(documents)} documents to ChromaDB for zone '{zone_name}' using Ollama embeddings...")
-            try:
-                collection.add(
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-                print(f"Data ingestion complete for zone: {zone_name}.")
-            except Exception as e:
-                print(f"Error adding documents to ChromaDB for zone '{zone_name}': {e}")
-                print("Skipping this zone due to embedding/DB error.")
-        else:
-            print(f"No documents generated for zone: {zone_name}.")
+        print(f"Adding {len(readings)} documents to ChromaDB for zone '{zone_name}' using Ollama embeddings...")
+        written = ingest_readings(collection, readings)
+        print(f"Data ingestion complete for zone: {zone_name} ({written}/{len(readings)} documents).")
 
     end_time_overall = datetime.now()
     print(f"\nAll data ingestion processes finished in {end_time_overall - start_time_overall}.")
@@ -198,4 +299,13 @@ def main():
         print(f"Error retrieving final collection count: {e}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate sensor readings and ingest them into the RAG collection.")
+    parser.add_argument("--backfill-epochs", action="store_true",
+                        help="Add epoch metadata to an existing collection instead of re-ingesting")
+    args = parser.parse_args()
+    if args.backfill_epochs:
+        collection = get_collection()
+        if collection is not None:
+            print(f"Added epoch metadata to {backfill_epochs(collection)} documents.")
+    else:
+        main()
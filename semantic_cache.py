@@ -0,0 +1,166 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from metrics import CACHE_REQUESTS, Counter
+
+# --- Configuration ---
+SIMILARITY_THRESHOLD = float(os.environ.get("MUSHROOM_SEMANTIC_CACHE_THRESHOLD", "0.92")) # Cosine similarity needed for a hit
+MAX_ENTRIES_PER_ZONE = 256 # Least recently used entries are evicted beyond this
+MAX_AGE_SECONDS = 6 * 3600 # Entries expire even if the watermark never moves
+
+SEMANTIC_CACHE_SAVED_SECONDS = Counter("mushroom_semantic_cache_saved_seconds",
+                                       "Generation time avoided by semantic cache hits")
+_HITS = CACHE_REQUESTS.labels("semantic_chat", "hit")
+_MISSES = CACHE_REQUESTS.labels("semantic_chat", "miss")
+
+
+class _ZoneEntries:
+    """One zone's cached replies: a row-normalized embedding matrix plus per-row entry dicts."""
+
+    def __init__(self, watermark, version: str):
+        self.watermark = watermark
+        self.version = version
+        self.vectors = None # (n, dimensions) float32, unit rows
+        self.entries = []
+
+    def add(self, vector: np.ndarray, entry: dict):
+        self.vectors = vector[None, :] if self.vectors is None else np.vstack([self.vectors, vector])
+        self.entries.append(entry)
+
+    def keep(self, rows: list):
+        self.vectors = self.vectors[rows] if rows else None
+        self.entries = [self.entries[row] for row in rows]
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """
+    Per-zone cache of chat replies keyed by the query embedding. A query hits when the most
+    similar cached query in the same zone is at least `threshold` cosine-similar. Each zone's
+    entries are dropped as soon as a lookup or store sees a different data watermark (new
+    readings or RAG documents) or model/prompt version than the one they were generated under.
+    The conversation history is not part of the key, so ai_model only consults the cache for
+    a thread's opening question: a follow-up's meaning depends on the turns before it.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, max_entries: int = MAX_ENTRIES_PER_ZONE,
+                 max_age_seconds: float = MAX_AGE_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._zones = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def _current(self, zone_name: str, watermark, version: str) -> _ZoneEntries:
+        zone = self._zones.get(zone_name)
+        if zone is None or zone.watermark != watermark or zone.version != version:
+            if zone is not None and zone.entries:
+                self.invalidations += 1
+            zone = self._zones[zone_name] = _ZoneEntries(watermark, version)
+        return zone
+
+    def lookup(self, zone_name: str, embedding, watermark, version: str):
+        """Returns {"reply", "query", "similarity", "cached_at", "generation_seconds"} or None."""
+        vector = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            zone = self._current(zone_name, watermark, version)
+            fresh = [row for row, entry in enumerate(zone.entries) if now - entry["cached_at"] <= self.max_age_seconds]
+            if len(fresh) < len(zone.entries):
+                zone.keep(fresh)
+            if zone.vectors is None or zone.vectors.shape[1] != vector.shape[0]:
+                self.misses += 1
+                _MISSES.inc()
+                return None
+            similarities = zone.vectors @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                _MISSES.inc()
+                return None
+            entry = zone.entries[best]
+            entry["last_used"] = now
+            entry["hits"] += 1
+            self.hits += 1
+            self.saved_seconds += entry["generation_seconds"]
+        _HITS.inc()
+        SEMANTIC_CACHE_SAVED_SECONDS.inc(entry["generation_seconds"])
+        return {"reply": entry["reply"], "query": entry["query"], "similarity": round(similarity, 4),
+                "cached_at": entry["cached_at"], "generation_seconds": entry["generation_seconds"]}
+
+    def store(self, zone_name: str, embedding, watermark, version: str, query: str, reply: str,
+              generation_seconds: float):
+        """Caches a reply generated under `watermark` and `version`."""
+        vector = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            zone = self._current(zone_name, watermark, version)
+            if zone.vectors is not None and zone.vectors.shape[1] != vector.shape[0]:
+                zone.keep([]) # The embedding model changed dimensions; older vectors are incomparable
+            if len(zone.entries) >= self.max_entries:
+                by_use = sorted(range(len(zone.entries)), key=lambda row: zone.entries[row]["last_used"])
+                zone.keep(sorted(by_use[len(zone.entries) - self.max_entries + 1:]))
+            zone.add(vector, {"query": query, "reply": reply, "cached_at": now, "last_used": now, "hits": 0,
+                              "generation_seconds": round(generation_seconds, 3)})
+
+    def invalidate(self, zone_name: str = None):
+        """Drops one zone's entries, or every zone's."""
+        with self._lock:
+            for name in ([zone_name] if zone_name else list(self._zones)):
+                if self._zones.pop(name, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "saved_generation_seconds": round(self.saved_seconds, 3),
+                "invalidations": self.invalidations,
+                "threshold": self.threshold,
+                "entries": {name: len(zone.entries) for name, zone in self._zones.items() if zone.entries},
+            }
+
+
+def run_benchmark(entries: int = MAX_ENTRIES_PER_ZONE, dimensions: int = 768, lookups: int = 2000):
+    """Lookup cost with a full zone: this is what a hit adds on top of the query embedding."""
+    rng = np.random.default_rng(0)
+    cache = SemanticCache()
+    vectors = rng.standard_normal((entries, dimensions))
+    for i, vector in enumerate(vectors):
+        cache.store("Mine", vector, "w", "v", f"question {i}", f"answer {i}", 8.0)
+    queries = vectors[rng.integers(0, entries, lookups)] + rng.standard_normal((lookups, dimensions)) * 0.05
+    start = time.perf_counter()
+    for query in queries:
+        cache.lookup("Mine", query, "w", "v")
+    per_lookup_us = (time.perf_counter() - start) / lookups * 1e6
+    stats = cache.stats()
+    print(f"--- Semantic cache: {entries} entries x {dimensions} dimensions ---")
+    print(f"lookup: {per_lookup_us:.0f} us; {stats['hits']}/{lookups} near-duplicate queries hit "
+          f"(threshold {cache.threshold}), saving {stats['saved_generation_seconds']:.0f}s of 8s generations")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Semantic chat reply cache.")
+    parser.add_argument("--benchmark", action="store_true", help="Time lookups in a full zone")
+    args = parser.parse_args()
+    if args.benchmark:
+        run_benchmark()
+    else:
+        parser.print_help()
@@ -1,19 +1,63 @@
 import random
 from datetime import datetime, timedelta
 import time # For __main__ block sleep
-
-# Define Zone Names
-ZONE_NAMES = ["Babylon 1", "Babylon 2", "Mine", "Tent 1", "Tent 2", "Bear Mountain"]
+from ts_codec import CompressedHistory
+from metrics import HISTORY_READ_SECONDS, timed
+from zone_registry import ZONE_NAMES, ZONE_REGISTRY # Zones and their baselines come from zones.json
 
 # Global dictionary to store pseudo sensor history for each zone
 SENSOR_HISTORY = {}
 
+# --- History Storage ---
+HISTORY_COMPRESSION = True # Seal full blocks of readings into a compact encoding (see ts_codec.py)
+HISTORY_BLOCK_SIZE = 720 # Readings per sealed block; newer readings stay as plain dicts until a block fills
+
+def new_zone_history(readings=()):
+    """
+    Creates the container for one zone's history: a list-like CompressedHistory, or a plain
+    list when HISTORY_COMPRESSION is off. Both support len, indexing, slicing and append.
+    """
+    if HISTORY_COMPRESSION:
+        return CompressedHistory(readings, block_size=HISTORY_BLOCK_SIZE)
+    return list(readings)
+
+# Optional shared_history.SharedHistoryReader. When attached (multi-worker mode), a separate
+# writer process owns ingestion and reads come from shared memory instead of SENSOR_HISTORY.
+SHARED_HISTORY = None
+
+def attach_shared_history(reader):
+    """Serve all history reads from a shared-memory segment owned by a writer process."""
+    global SHARED_HISTORY
+    SHARED_HISTORY = reader
+
+# Callables invoked with each new reading appended by read_sensor_data (e.g. anomaly detection)
+READING_LISTENERS = []
+
+def add_reading_listener(callback):
+    """Registers callback(reading) to be called for every reading read_sensor_data appends."""
+    if callback not in READING_LISTENERS:
+        READING_LISTENERS.append(callback)
+
+def notify_reading_listeners(reading: dict):
+    """Runs every reading listener on a new reading (also used for readings a shared history writer appended)."""
+    for listener in READING_LISTENERS:
+        try:
+            listener(reading)
+        except Exception as e:
+            print(f"Warning: Reading listener {listener} failed for zone '{reading.get('zone')}': {e}")
+
 def get_zone_index(zone_name: str) -> int:
-    # Helper to get a consistent index for zone-based variations
-    if zone_name in ZONE_NAMES:
-        return ZONE_NAMES.index(zone_name)
-    # Fallback for unknown zones, though ideally zone_name should always be valid
-    return -1 
+    # Position of the zone in zones.json (-1 for unknown zones); a dict lookup
+    return ZONE_REGISTRY.index(zone_name)
+
+def get_zone_ranges(zone_name: str) -> dict:
+    """
+    Returns the normal (non-anomalous) operating range for each metric in a zone as
+    {"temperature": (min, max), "humidity": (min, max), "CO2": (min, max)}.
+    Ranges are the zone's configured baselines, precomputed when the registry loads;
+    unknown zones get the configured defaults. The dict is shared, so don't mutate it.
+    """
+    return ZONE_REGISTRY.ranges(zone_name)
 
 def generate_pseudo_sensor_data(base_time=None, zone_name: str = None):
     """
@@ -38,40 +82,17 @@ def generate_pseudo_sensor_data(base_time=None, zone_name: str = None):
     """
     if zone_name is None:
         raise ValueError("zone_name must be provided to generate_pseudo_sensor_data")
-    if zone_name not in ZONE_NAMES:
+    if zone_name not in ZONE_REGISTRY:
         # This helps catch issues if an invalid zone name is passed
         print(f"Warning: '{zone_name}' is not a predefined zone. Using default variations.")
-        zone_idx = -1 # Default to no specific variation or handle as error
-    else:
-        zone_idx = get_zone_index(zone_name)
 
     if base_time is None:
         base_time = datetime.now()
     
-    # Base values - these can be adjusted per zone
-    base_temp_min, base_temp_max = 40.0, 50.0
-    base_humidity_min, base_humidity_max = 95.0, 100.0 # Healthy mushrooms like high humidity
-    base_co2_min, base_co2_max = 440, 500 # Lower CO2 is generally better
-
-    # Apply deterministic zone variations
-    # Example: Zone index shifts the range. 
-    # Using modulo to cycle variations for more than a few zones if needed,
-    # or just simple linear shift based on index.
-    # For 6 zones, (idx - 2.5) gives a spread around 0.
-    # Mine (idx 2) -> -0.5 offset factor
-    # Tent 2 (idx 4) -> +1.5 offset factor
-    offset_factor = (zone_idx - (len(ZONE_NAMES) -1) / 2.0) # e.g. for 6 zones, indices 0-5, (len-1)/2 = 2.5. Results in -2.5 to 2.5
-    
-    temp_offset = offset_factor * 0.8  # Each zone can vary by up to +/- 2F from base if 6 zones (0.8 * 2.5)
-    humidity_offset = offset_factor * -1.0 # Higher index = slightly less humid (max -2.5%)
-    co2_offset = offset_factor * 15 # Higher index = slightly higher CO2 (max +37ppm)
-
-    current_temp_min = base_temp_min + temp_offset
-    current_temp_max = base_temp_max + temp_offset
-    current_humidity_min = max(85.0, base_humidity_min + humidity_offset) # Ensure humidity doesn't go unrealistically low
-    current_humidity_max = min(100.0, base_humidity_max + humidity_offset) # Cap at 100%
-    current_co2_min = max(300, base_co2_min + int(co2_offset))
-    current_co2_max = max(350, base_co2_max + int(co2_offset)) # Ensure CO2 doesn't go too low
+    ranges = get_zone_ranges(zone_name)
+    current_temp_min, current_temp_max = ranges["temperature"]
+    current_humidity_min, current_humidity_max = ranges["humidity"]
+    current_co2_min, current_co2_max = ranges["CO2"]
     
     # Anomaly probability: approx 1 per day for 5-min interval history, 1 per 2 hours for live data (5s interval)
     # For history (5-min interval = 288 readings/day), prob = 1/288
@@ -99,7 +120,8 @@ def generate_pseudo_sensor_data(base_time=None, zone_name: str = None):
 def initialize_history():
     """
     Initializes SENSOR_HISTORY for all defined zones with one week of data.
-    A reading is simulated every 5 minutes from one week ago until now for each zone.
+    A reading is simulated every history_interval_seconds (5 minutes by default, see
+    zones.json) from one week ago until now for each zone.
     """
     global SENSOR_HISTORY
     SENSOR_HISTORY = {} 
@@ -107,11 +129,12 @@ def initialize_history():
     
     print("Initializing sensor history for all zones...")
 
-    for zone_name_iter in ZONE_NAMES: 
+    for zone in ZONE_REGISTRY: 
+        zone_name_iter = zone.name
         print(f"  Initializing history for zone: {zone_name_iter}...")
-        SENSOR_HISTORY[zone_name_iter] = []
+        SENSOR_HISTORY[zone_name_iter] = new_zone_history()
         start_time = now - timedelta(days=7)
-        interval = timedelta(minutes=5) 
+        interval = timedelta(seconds=zone.history_interval_seconds) 
         current_time = start_time
         while current_time <= now:
             data = generate_pseudo_sensor_data(base_time=current_time, zone_name=zone_name_iter)
@@ -120,12 +143,75 @@ def initialize_history():
     print("Sensor history initialization complete.")
 
 
+@timed(HISTORY_READ_SECONDS.labels("get_zone_history"))
+def get_zone_history(zone_name: str) -> list:
+    """
+    Returns the stored history for a zone without generating a new reading.
+    Initializes all zone histories first if needed.
+    
+    Raises:
+        ValueError: if the provided zone_name is not in the zone registry.
+    """
+    if zone_name not in ZONE_REGISTRY:
+        raise ValueError(ZONE_REGISTRY.unknown_zone_message(zone_name))
+    if SHARED_HISTORY is not None:
+        return SHARED_HISTORY.records(zone_name)
+    if not SENSOR_HISTORY.get(zone_name):
+        initialize_history()
+    return SENSOR_HISTORY[zone_name]
+
+
+def load_history(zone_name: str, readings: list, replace: bool = True) -> int:
+    """
+    Loads externally sourced readings (e.g. from bulk_import.py) into a zone's history.
+    Readings must use the generate_pseudo_sensor_data record format. With replace=False they
+    are merged into the existing history, imported readings winning on duplicate timestamps.
+    Other zones keep (or are initialized with) their simulated history.
+
+    Returns the zone's history length after loading.
+    """
+    if zone_name not in ZONE_REGISTRY:
+        raise ValueError(ZONE_REGISTRY.unknown_zone_message(zone_name))
+    if not SENSOR_HISTORY:
+        initialize_history()
+    if replace:
+        readings = list(readings)
+        if all(earlier["timestamp"] < later["timestamp"] for earlier, later in zip(readings, readings[1:])):
+            # Already sorted and unique (bulk_import guarantees this): no re-sort needed.
+            SENSOR_HISTORY[zone_name] = new_zone_history(readings)
+            return len(readings)
+        merged = {reading["timestamp"]: reading for reading in readings}
+    else:
+        merged = {reading["timestamp"]: reading for reading in SENSOR_HISTORY.get(zone_name, [])}
+        merged.update((reading["timestamp"], reading) for reading in readings)
+    # "YYYY-MM-DD HH:MM:SS" strings sort chronologically.
+    SENSOR_HISTORY[zone_name] = new_zone_history(merged[timestamp] for timestamp in sorted(merged))
+    return len(SENSOR_HISTORY[zone_name])
+
+
+def get_latest_timestamp(zone_name: str):
+    """Timestamp of the zone's newest stored reading (None if there is none), without copying its history."""
+    if SHARED_HISTORY is not None:
+        newest = SHARED_HISTORY.records(zone_name, limit=1)
+        return newest[-1]["timestamp"] if newest else None
+    history = get_zone_history(zone_name)
+    return history[-1]["timestamp"] if len(history) else None
+
+
+def get_all_zone_histories() -> dict:
+    """Returns {zone_name: history} for every zone, without generating new readings."""
+    return {zone_name: get_zone_history(zone_name) for zone_name in ZONE_NAMES}
+
+
+@timed(HISTORY_READ_SECONDS.labels("read_sensor_data"))
 def read_sensor_data(zone_name: str):
     """
     Simulate reading sensor data for a specific zone.
     If SENSOR_HISTORY is empty or the zone_name's history is missing/empty, 
     it calls initialize_history() first.
-    Generates a new reading 5 seconds after the last reading for that zone.
+    Generates a new reading sensor_interval_seconds (5 by default) after the last reading for that zone.
+    When a shared history segment is attached, returns a snapshot of it instead (reading
+    listeners then run from the API's shared history watcher, not here).
     
     Parameters:
       zone_name (str): The name of the zone to read data for.
@@ -134,12 +220,20 @@ def read_sensor_data(zone_name: str):
       (latest_sensor_data_for_zone, full_history_for_zone)
     
     Raises:
-        ValueError: if the provided zone_name is not in ZONE_NAMES.
+        ValueError: if the provided zone_name is not in the zone registry.
     """
     global SENSOR_HISTORY
 
-    if zone_name not in ZONE_NAMES:
-        raise ValueError(f"Unknown zone_name: '{zone_name}'. Must be one of {ZONE_NAMES}")
+    zone = ZONE_REGISTRY.get(zone_name)
+    if zone is None:
+        raise ValueError(ZONE_REGISTRY.unknown_zone_message(zone_name))
+
+    if SHARED_HISTORY is not None:
+        # The writer process owns ingestion; workers only take a consistent snapshot.
+        history = SHARED_HISTORY.records(zone_name)
+        if not history:
+            raise ValueError(f"No shared history available yet for zone '{zone_name}'.")
+        return history[-1], history
 
     if not SENSOR_HISTORY or zone_name not in SENSOR_HISTORY or not SENSOR_HISTORY[zone_name]:
         print(f"History not initialized or zone '{zone_name}' missing/empty. Initializing all zone histories...")
@@ -149,14 +243,15 @@ def read_sensor_data(zone_name: str):
         print(f"Warning: History for zone '{zone_name}' remains empty after initialization. Generating a new reading from 'now'.")
         # This indicates an issue, perhaps initialize_history didn't populate this zone.
         # For robustness, create a starting point.
-        last_timestamp_dt = datetime.now() - timedelta(seconds=5) 
+        last_timestamp_dt = datetime.now() - timedelta(seconds=zone.sensor_interval_seconds) 
     else:
         last_reading = SENSOR_HISTORY[zone_name][-1]
         last_timestamp_dt = datetime.strptime(last_reading["timestamp"], "%Y-%m-%d %H:%M:%S")
 
-    new_timestamp_dt = last_timestamp_dt + timedelta(seconds=5) 
+    new_timestamp_dt = last_timestamp_dt + timedelta(seconds=zone.sensor_interval_seconds) 
     new_data = generate_pseudo_sensor_data(base_time=new_timestamp_dt, zone_name=zone_name)
     SENSOR_HISTORY[zone_name].append(new_data)
+    notify_reading_listeners(new_data)
     
     return new_data, SENSOR_HISTORY[zone_name]
 
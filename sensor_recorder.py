@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from sensor_handler import ZONE_NAMES, generate_pseudo_sensor_data
+from ts_codec import (RECORD_KEYS, VALUE_KEYS, decode_column, decode_timestamps, decode_varints, encode_column,
+                      encode_timestamps, encode_varints)
+
+# --- Configuration ---
+RECORDING_FORMAT = "mushroom-sensor-recording"
+RECORDING_VERSION = 1
+SEGMENT_FRAMES = 720 # Frames per segment; a segment is written (and readable) as soon as it fills
+SEGMENT_MAGIC = b"MSR1"
+DEFAULT_INTERVAL_SECONDS = 5 # Generator cadence, matching psuedo_sensor_server
+
+
+class RecordingWriter:
+    """
+    Writes a sensor stream as a sequence of frames (one WebSocket message's batch of readings,
+    plus its capture offset in seconds). The file is a JSON header line followed by columnar
+    segments encoded with ts_codec: delta-of-delta capture offsets and timestamps, varint zone
+    indexes and scaled-integer value deltas: about 6 bytes per reading, against ~100 as JSON.
+    """
+
+    def __init__(self, path: str, zones=ZONE_NAMES, source: str = "", segment_frames: int = SEGMENT_FRAMES):
+        self.path = path
+        self.zones = list(zones)
+        self.zone_index = {zone: i for i, zone in enumerate(self.zones)}
+        self.segment_frames = segment_frames
+        self.frames = 0
+        self.readings = 0
+        self.skipped = 0
+        self._pending = [] # (offset_seconds, [readings]) not yet written
+        self._file = open(path, "wb")
+        header = {"format": RECORDING_FORMAT, "version": RECORDING_VERSION, "zones": self.zones,
+                  "source": source, "created": datetime.now().isoformat(timespec="seconds")}
+        self._file.write(json.dumps(header).encode("utf-8") + b"\n")
+
+    def add_frame(self, offset_seconds: float, readings: list):
+        """Adds one batch. Readings that are not plain generate_pseudo_sensor_data records are skipped."""
+        kept = [reading for reading in readings
+                if isinstance(reading, dict) and len(reading) == len(RECORD_KEYS) and reading.get("zone") in self.zone_index]
+        self.skipped += len(readings) - len(kept)
+        self._pending.append((offset_seconds, kept))
+        self.frames += 1
+        self.readings += len(kept)
+        if len(self._pending) >= self.segment_frames:
+            self._write_segment()
+
+    def _write_segment(self):
+        if not self._pending:
+            return
+        offsets_ms = np.array([round(offset * 1000) for offset, _ in self._pending], dtype=np.int64)
+        readings = [reading for _, batch in self._pending for reading in batch]
+        columns = {
+            "offset_ms": encode_timestamps(offsets_ms),
+            "frame_sizes": encode_varints(np.array([len(batch) for _, batch in self._pending], dtype=np.int64)),
+            "zone": encode_varints(np.array([self.zone_index[reading["zone"]] for reading in readings], dtype=np.int64)),
+            "timestamp": encode_timestamps(np.array([reading["timestamp"] for reading in readings],
+                                                    dtype="datetime64[s]").astype(np.int64)),
+        }
+        codecs = {}
+        for key in VALUE_KEYS:
+            codecs[key], columns[key] = encode_column([reading[key] for reading in readings]) if readings else ("int_delta", b"")
+        descriptor = json.dumps({"frames": len(self._pending), "readings": len(readings), "codecs": codecs,
+                                 "lengths": {name: len(payload) for name, payload in columns.items()}}).encode("utf-8")
+        self._file.write(SEGMENT_MAGIC + struct.pack("<I", len(descriptor)) + descriptor + b"".join(columns.values()))
+        self._file.flush()
+        self._pending = []
+
+    def close(self):
+        self._write_segment()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _format_seconds(seconds: np.ndarray) -> list:
+    return [text.replace("T", " ") for text in np.datetime_as_string(seconds.astype("datetime64[s]")).tolist()]
+
+
+def read_recording(path: str):
+    """Returns (header, frames) where frames yields (offset_seconds, [readings]) in recorded order."""
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+    if header.get("format") != RECORDING_FORMAT:
+        raise ValueError(f"'{path}' is not a sensor recording.")
+    return header, _iter_frames(path, header)
+
+
+def _iter_frames(path: str, header: dict):
+    zones = header["zones"]
+    with open(path, "rb") as f:
+        f.readline()
+        while True:
+            prefix = f.read(len(SEGMENT_MAGIC) + 4)
+            if len(prefix) < len(SEGMENT_MAGIC) + 4:
+                return # End of file (or a segment cut off mid-write by an interrupted recording)
+            if prefix[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                raise ValueError(f"Corrupt segment in '{path}'.")
+            descriptor = json.loads(f.read(struct.unpack("<I", prefix[len(SEGMENT_MAGIC):])[0]))
+            payloads = {}
+            for name, length in descriptor["lengths"].items():
+                payloads[name] = f.read(length)
+                if len(payloads[name]) < length:
+                    return
+            count = descriptor["readings"]
+            offsets = decode_timestamps(payloads["offset_ms"]) / 1000
+            sizes = decode_varints(payloads["frame_sizes"])
+            zone_names = [zones[i] for i in decode_varints(payloads["zone"]).tolist()]
+            timestamps = _format_seconds(decode_timestamps(payloads["timestamp"]))
+            values = [decode_column(descriptor["codecs"][key], payloads[key], count) if count else [] for key in VALUE_KEYS]
+            readings = [{"timestamp": timestamp, "temperature": temperature, "humidity": humidity, "CO2": co2, "zone": zone}
+                        for timestamp, temperature, humidity, co2, zone in zip(timestamps, *values, zone_names)]
+            start = 0
+            for offset, size in zip(offsets.tolist(), sizes.tolist()):
+                yield offset, readings[start:start + size]
+                start += size
+
+
+def record_generated(path: str, hours: float, interval: float = DEFAULT_INTERVAL_SECONDS, seed: int = 0,
+                     start_time: datetime = None) -> RecordingWriter:
+    """Records `hours` of seeded generator output (same seed, same stream) at `interval`-second cadence."""
+    random.seed(seed)
+    start_time = start_time or datetime(2025, 1, 1)
+    frames = int(hours * 3600 / interval)
+    with RecordingWriter(path, source=f"generator seed={seed} interval={interval}s") as writer:
+        for step in range(frames):
+            base_time = start_time + timedelta(seconds=step * interval)
+            writer.add_frame(step * interval, [generate_pseudo_sensor_data(base_time=base_time, zone_name=zone_name)
+                                               for zone_name in ZONE_NAMES])
+    return writer
+
+
+async def record_upstream(path: str, uri: str, duration: float = None) -> RecordingWriter:
+    """Captures a live sensor WebSocket (e.g. ws://localhost:8765) until `duration` seconds or Ctrl+C."""
+    import websockets
+
+    writer = RecordingWriter(path, source=uri)
+    start = time.perf_counter()
+    try:
+        async with websockets.connect(uri) as websocket:
+            while duration is None or time.perf_counter() - start < duration:
+                timeout = None if duration is None else max(0.01, duration - (time.perf_counter() - start))
+                try:
+                    message = await asyncio.wait_for(websocket.recv(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch = json.loads(message)
+                if isinstance(batch, list): # Alert messages are derived data; replay recomputes them
+                    writer.add_frame(time.perf_counter() - start, batch)
+    finally:
+        writer.close()
+    return writer
+
+
+def print_summary(path: str, writer: RecordingWriter = None):
+    header, frames = read_recording(path)
+    frame_count = reading_count = 0
+    last_offset = 0.0
+    for last_offset, readings in frames:
+        frame_count += 1
+        reading_count += len(readings)
+    size = os.path.getsize(path)
+    print(f"{path}: {frame_count:,} frames, {reading_count:,} readings over {timedelta(seconds=round(last_offset))} "
+          f"({header.get('source')}); {size / 1e6:.2f} MB, {size / max(1, reading_count):.1f} bytes/reading")
+    if writer is not None and writer.skipped:
+        print(f"Skipped {writer.skipped:,} readings that were not plain sensor records.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record sensor streams for psuedo_sensor_server.py --replay.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser("generate", help="Record seeded generator output (fast, reproducible)")
+    generate_parser.add_argument("path")
+    generate_parser.add_argument("--hours", type=float, default=24)
+    generate_parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL_SECONDS, help="Seconds between batches")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    record_parser = subparsers.add_parser("record", help="Capture a live sensor WebSocket feed")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--upstream", default="ws://localhost:8765")
+    record_parser.add_argument("--duration", type=float, help="Seconds to record (default: until Ctrl+C)")
+    info_parser = subparsers.add_parser("info", help="Summarize a recording")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        start = time.perf_counter()
+        writer = record_generated(args.path, args.hours, args.interval, args.seed)
+        print(f"Generated {writer.readings:,} readings in {time.perf_counter() - start:.1f}s.")
+        print_summary(args.path, writer)
+    elif args.command == "record":
+        print(f"Recording {args.upstream} to {args.path} (Ctrl+C to stop)...")
+        writer = None
+        try:
+            writer = asyncio.run(record_upstream(args.path, args.upstream, args.duration))
+        except KeyboardInterrupt:
+            pass
+        print_summary(args.path, writer)
+    else:
+        print_summary(args.path)
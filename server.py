@@ -1,27 +1,31 @@
 import asyncio
 import websockets
 import json
-import pandas as pd
+import os
+from tail_reader import SensorFileTailer
 
-EXCEL_FILE_PATH = "/Users/leviwheeling/Documents/talk_to_mushrooms/Comp_min__2025_02_02_09_20_32_MST_1.xlsx"
+EXCEL_FILE_PATH = os.environ.get(
+    "SENSOR_EXPORT_PATH", "/Users/leviwheeling/Documents/talk_to_mushrooms/Comp_min__2025_02_02_09_20_32_MST_1.xlsx")
+UPDATE_INTERVAL_SECONDS = 5
 
-def read_latest_sensor_data():
-    """Reads the latest environmental data from Excel and returns it as a dictionary."""
-    try:
-        # Load Excel file
-        xls = pd.ExcelFile(EXCEL_FILE_PATH)
-        sheet_name = xls.sheet_names[0]  # Read first sheet
-        df = pd.read_excel(xls, sheet_name=sheet_name)
+TAILER = None # Shared by all clients; created on first read
+CLIENTS = set()
+LATEST_MESSAGE = None
 
-        # Rename columns (ensure they match your data structure)
-        df.columns = ["Line#", "Date", "Temperature", "Humidity", "CO2"]
-
-        # Convert Date column to datetime format
-        df["Date"] = pd.to_datetime(df["Date"], errors='coerce')
-        df = df.dropna(subset=["Date"]).sort_values(by="Date", ascending=False)  # Keep only valid timestamps
+def read_latest_sensor_data():
+    """Returns the latest environmental reading from the export as a dictionary.
 
-        # Get latest sensor reading
-        latest = df.iloc[0]
+    The export is read incrementally by a single SensorFileTailer: unchanged files cost one
+    stat() call, and appended rows are the only ones parsed (see tail_reader.py).
+    """
+    global TAILER
+    try:
+        if TAILER is None:
+            TAILER = SensorFileTailer(EXCEL_FILE_PATH)
+        TAILER.poll()
+        latest = TAILER.latest()
+        if latest is None:
+            return None
         return {
             "timestamp": latest["Date"].strftime("%Y-%m-%d %H:%M:%S"),
             "temperature": f"{latest['Temperature']}°F",
@@ -32,25 +36,37 @@ def read_latest_sensor_data():
         print("❌ Error reading sensor data:", e)
         return None
 
+async def broadcast_sensor_data():
+    """One read per tick, serialized once and sent to every connected client."""
+    global LATEST_MESSAGE
+    while True:
+        if CLIENTS:
+            data = await asyncio.to_thread(read_latest_sensor_data)
+            if data:
+                LATEST_MESSAGE = json.dumps(data)
+                print(f"📡 Sending data to {len(CLIENTS)} client(s): {data}")
+                websockets.broadcast(CLIENTS, LATEST_MESSAGE)
+        await asyncio.sleep(UPDATE_INTERVAL_SECONDS)
+
 async def send_sensor_data(websocket):
     try:
         # Access the path via websocket.path if needed.
         print(f"🔗 Client connected: {websocket.path}")
-        while True:
-            data = read_latest_sensor_data()
-            if data:
-                print(f"📡 Sending data: {data}")
-                await websocket.send(json.dumps(data))
-            await asyncio.sleep(5)  # Update every 5 seconds
-    except websockets.exceptions.ConnectionClosedError:
+        CLIENTS.add(websocket)
+        if LATEST_MESSAGE:
+            await websocket.send(LATEST_MESSAGE) # Don't make new clients wait for the next tick
+        await websocket.wait_closed()
         print("⚠️ WebSocket client disconnected.")
     except Exception as e:
         print(f"❌ WebSocket error: {e}")
+    finally:
+        CLIENTS.discard(websocket)
 
 async def main():
     try:
         server = await websockets.serve(send_sensor_data, "0.0.0.0", 8765, ping_interval=10, ping_timeout=20)
         print("✅ WebSocket server started on ws://0.0.0.0:8765")
+        broadcaster = asyncio.create_task(broadcast_sensor_data())
         await server.wait_closed()  # Keep server running
     except Exception as e:
         print(f"❌ WebSocket server failed to start: {e}")
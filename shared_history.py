@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# --- Configuration ---
+DEFAULT_SHM_NAME = "mushroom_sensor_history"
+DEFAULT_CAPACITY = 20000 # Readings kept per zone (7 days @ 5 min + ~22h of 5 s live readings)
+HEADER_BYTES = 65536 # JSON header: zone names and capacity (room for a few thousand zones)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+EPOCH = datetime(1970, 1, 1) # Timestamps are stored as naive (wall-clock) seconds since this
+SHARED_HISTORY_ENV = "MUSHROOM_SHARED_HISTORY" # api_server attaches to this segment when set
+INGEST_INTERVAL_SECONDS = 5
+
+
+def _layout(zone_count: int, capacity: int) -> dict:
+    """Byte offsets of each array inside the shared segment (8-byte aligned)."""
+    offsets = {}
+    position = HEADER_BYTES
+    for name, dtype, shape in (
+        ("seq", np.uint64, (zone_count,)),        # Seqlock counter per zone (odd while writing)
+        ("total", np.uint64, (zone_count,)),      # Readings ever appended per zone
+        ("watermark", np.int64, (zone_count,)),   # Insight watermark (seconds since EPOCH, 0 = none)
+        ("ts", np.int64, (zone_count, capacity)),       # Naive wall-clock seconds since EPOCH
+        ("temperature", np.float32, (zone_count, capacity)),
+        ("humidity", np.float32, (zone_count, capacity)),
+        ("CO2", np.int32, (zone_count, capacity)),
+    ):
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offsets[name] = (position, dtype, shape)
+        position += (nbytes + 7) // 8 * 8
+    offsets["_size"] = position
+    return offsets
+
+
+def _to_seconds(timestamp: str) -> int:
+    return int((datetime.strptime(timestamp, TIMESTAMP_FORMAT) - EPOCH).total_seconds())
+
+
+def _format_seconds(seconds: np.ndarray) -> list:
+    """Vectorized inverse of _to_seconds for a whole column."""
+    return [text.replace("T", " ") for text in np.datetime_as_string(seconds.astype("datetime64[s]")).tolist()]
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    """Attach without registering with the resource tracker, so readers never unlink the writer's segment."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    original_register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = original_register
+
+
+class _SharedHistoryBase:
+    def _map_arrays(self):
+        self.zone_index = {zone: i for i, zone in enumerate(self.zones)}
+        layout = _layout(len(self.zones), self.capacity)
+        self.nbytes = layout.pop("_size")
+        self.arrays = {
+            name: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            for name, (offset, dtype, shape) in layout.items()
+        }
+
+    def _zone(self, zone_name: str) -> int:
+        try:
+            return self.zone_index[zone_name]
+        except KeyError:
+            raise ValueError(f"Unknown zone_name: '{zone_name}'. Must be one of {self.zones}")
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+
+
+class SharedHistoryWriter(_SharedHistoryBase):
+    """
+    Single-writer, per-zone ring buffers of sensor readings in multiprocessing.shared_memory.
+
+    Exactly one process (the ingestion writer) appends; any number of processes attach with
+    SharedHistoryReader. Each zone has a seqlock counter that is odd while a write is in
+    progress, so readers can detect and retry a torn read without any cross-process lock.
+    """
+
+    def __init__(self, zones, capacity: int = DEFAULT_CAPACITY, name: str = DEFAULT_SHM_NAME):
+        self.zones = list(zones)
+        self.capacity = capacity
+        self.name = name
+        size = _layout(len(self.zones), capacity)["_size"]
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            print(f"Removed stale shared history segment '{name}'.")
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = json.dumps({"zones": self.zones, "capacity": capacity}).encode()
+        if len(header) > HEADER_BYTES:
+            raise ValueError(f"Too many zones for the {HEADER_BYTES}-byte shared history header.")
+        self.shm.buf[:len(header)] = header
+        self._map_arrays()
+        for array in self.arrays.values():
+            array.fill(0)
+
+    def append(self, reading: dict):
+        """Append one reading ({"zone", "timestamp", "temperature", "humidity", "CO2"})."""
+        z = self._zone(reading["zone"])
+        arrays = self.arrays
+        slot = int(arrays["total"][z]) % self.capacity
+        arrays["seq"][z] += 1 # Odd: write in progress
+        arrays["ts"][z, slot] = _to_seconds(reading["timestamp"])
+        arrays["temperature"][z, slot] = reading["temperature"]
+        arrays["humidity"][z, slot] = reading["humidity"]
+        arrays["CO2"][z, slot] = reading["CO2"]
+        arrays["total"][z] += 1
+        arrays["seq"][z] += 1 # Even: consistent again
+
+    def extend(self, readings):
+        for reading in readings:
+            self.append(reading)
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+class SharedHistoryReader(_SharedHistoryBase):
+    """Read-only attachment to a SharedHistoryWriter segment; safe to use from any process."""
+
+    def __init__(self, name: str = DEFAULT_SHM_NAME):
+        self.name = name
+        self.shm = _attach_untracked(name)
+        header = bytes(self.shm.buf[:HEADER_BYTES]).rstrip(b"\x00")
+        meta = json.loads(header)
+        self.zones = meta["zones"]
+        self.capacity = meta["capacity"]
+        self._map_arrays()
+
+    def _read(self, z: int, limit: int = None, since: int = None):
+        """Seqlock-consistent (columns, total) for zone index z, optionally only readings after the first `since`."""
+        arrays = self.arrays
+        while True:
+            seq_before = int(arrays["seq"][z])
+            if seq_before % 2:
+                continue # Writer mid-append; retry
+            total = int(arrays["total"][z])
+            count = min(total, self.capacity, limit or self.capacity, total - min(since or 0, total))
+            start = total - count
+            indices = np.arange(start, total) % self.capacity
+            columns = {name: arrays[name][z, indices] for name in ("ts", "temperature", "humidity", "CO2")}
+            if int(arrays["seq"][z]) == seq_before:
+                return columns, total
+
+    def snapshot(self, zone_name: str, limit: int = None) -> dict:
+        """
+        Consistent snapshot of a zone's newest readings as column arrays
+        {"ts", "temperature", "humidity", "CO2"} (oldest first). Retries if the writer
+        touched the zone mid-read.
+        """
+        return self._read(self._zone(zone_name), limit=limit)[0]
+
+    def total(self, zone_name: str) -> int:
+        """Readings ever appended for the zone (keeps counting past capacity)."""
+        return int(self.arrays["total"][self._zone(zone_name)])
+
+    def records_since(self, zone_name: str, seen: int):
+        """
+        (records appended after the first `seen`, new total), for following the writer's
+        appends. A reader that fell more than `capacity` behind gets the newest `capacity`.
+        """
+        columns, total = self._read(self._zone(zone_name), since=seen)
+        return self._to_records(zone_name, columns), total
+
+    def records(self, zone_name: str, limit: int = None) -> list:
+        """
+        Snapshot converted to the generate_pseudo_sensor_data record format. Only the column
+        copy is cheap: building one dict per reading dominates (see README, Multiple API workers).
+        """
+        return self._to_records(zone_name, self.snapshot(zone_name, limit=limit))
+
+    @staticmethod
+    def _to_records(zone_name: str, columns: dict) -> list:
+        timestamps = _format_seconds(columns["ts"])
+        return [
+            {"timestamp": timestamp, "temperature": round(temperature, 1), "humidity": round(humidity, 1),
+             "CO2": co2, "zone": zone_name}
+            for timestamp, temperature, humidity, co2 in zip(
+                timestamps, columns["temperature"].tolist(), columns["humidity"].tolist(), columns["CO2"].tolist())
+        ]
+
+    def get_watermark(self, zone_name: str):
+        """Insight watermark as a timestamp string, or None if no insight has run for the zone."""
+        value = int(self.arrays["watermark"][self._zone(zone_name)])
+        return _format_seconds(np.array([value]))[0] if value else None
+
+    def set_watermark(self, zone_name: str, timestamp: str):
+        """Watermarks are single aligned 8-byte stores, so any worker may update them."""
+        self.arrays["watermark"][self._zone(zone_name)] = _to_seconds(timestamp)
+
+
+async def _ingest_from_upstream(writer: SharedHistoryWriter, uri: str):
+    import websockets
+    async with websockets.connect(uri) as upstream:
+        print(f"Shared history writer ingesting live readings from {uri}")
+        async for message in upstream:
+            batch = json.loads(message)
+            if isinstance(batch, list):
+                writer.extend(reading for reading in batch if reading.get("zone") in writer.zone_index)
+
+
+def run_writer(name: str = DEFAULT_SHM_NAME, capacity: int = DEFAULT_CAPACITY, upstream: str = None):
+    """
+    Owns ingestion for multi-worker deployments: seeds the segment with sensor_handler's
+    initial history, then appends live readings (from the pseudo sensor WebSocket if
+    `upstream` is given, otherwise generated locally every INGEST_INTERVAL_SECONDS).
+    """
+    import sensor_handler
+
+    sensor_handler.initialize_history()
+    writer = SharedHistoryWriter(sensor_handler.ZONE_NAMES, capacity=capacity, name=name)
+    for zone_name in sensor_handler.ZONE_NAMES:
+        writer.extend(sensor_handler.SENSOR_HISTORY[zone_name][-capacity:])
+    print(f"Shared history '{name}' ready: {len(writer.zones)} zones, capacity {capacity}, {writer.nbytes / 1e6:.1f} MB.")
+    print(f"Start API workers with {SHARED_HISTORY_ENV}={name} uvicorn api_server:app --workers N")
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        if upstream:
+            asyncio.run(_ingest_from_upstream(writer, upstream))
+        else:
+            while True:
+                time.sleep(INGEST_INTERVAL_SECONDS)
+                for zone_name in writer.zones:
+                    sensor_handler.read_sensor_data(zone_name)
+                    writer.append(sensor_handler.SENSOR_HISTORY[zone_name][-1])
+                    # The writer's own list only needs the newest reading for the next timestamp.
+                    del sensor_handler.SENSOR_HISTORY[zone_name][:-1]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.unlink()
+        print(f"Shared history '{name}' removed.")
+
+
+def _bench_reader(name: str, zone_name: str, seconds: float, results):
+    reader = SharedHistoryReader(name)
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        json.dumps({"history": reader.records(zone_name)})
+        done += 1
+    results.put(done)
+    reader.close()
+
+
+def run_benchmark(worker_counts=(1, 2, 4), seconds: float = 3.0, capacity: int = 2016):
+    """Measures /history-equivalent snapshot throughput (records + JSON) as reader processes are added."""
+    import multiprocessing
+    from sensor_handler import ZONE_NAMES, generate_pseudo_sensor_data
+    from datetime import timedelta
+
+    name = f"{DEFAULT_SHM_NAME}_bench_{os.getpid()}"
+    writer = SharedHistoryWriter(ZONE_NAMES, capacity=capacity, name=name)
+    start = datetime.now() - timedelta(minutes=5 * capacity)
+    for i in range(capacity):
+        writer.extend(generate_pseudo_sensor_data(base_time=start + timedelta(minutes=5 * i), zone_name=zone)
+                      for zone in ZONE_NAMES)
+    print(f"--- Shared history read scaling ({capacity} readings per /history snapshot, {os.cpu_count()} CPUs) ---")
+    baseline = None
+    try:
+        for workers in worker_counts:
+            results = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=_bench_reader, args=(name, ZONE_NAMES[i % len(ZONE_NAMES)], seconds, results))
+                         for i in range(workers)]
+            for process in processes:
+                process.start()
+            total = sum(results.get() for _ in processes)
+            for process in processes:
+                process.join()
+            rate = total / seconds
+            baseline = baseline or rate
+            print(f"{workers} worker(s): {rate:,.0f} snapshots/s ({rate / baseline:.2f}x)")
+    finally:
+        writer.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared-memory sensor history writer for multi-worker api_server.")
+    parser.add_argument("--name", default=DEFAULT_SHM_NAME, help="Shared memory segment name")
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help="Readings kept per zone")
+    parser.add_argument("--upstream", help="Ingest from a pseudo sensor WebSocket, e.g. ws://localhost:8765")
+    parser.add_argument("--benchmark", action="store_true", help="Run the read-scaling benchmark and exit")
+    args = parser.parse_args()
+    if args.benchmark:
+        run_benchmark()
+    else:
+        run_writer(name=args.name, capacity=args.capacity, upstream=args.upstream)
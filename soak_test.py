@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+import websockets
+
+from fake_ollama import FakeOllamaConfig
+from load_test import API_PORT, CHAT_MESSAGES, REQUEST_TIMEOUT_SECONDS, git_commit, start_stack, stop_stack
+from memory_debug import TRACEMALLOC_ENV, rss_mb
+from sensor_handler import ZONE_NAMES
+
+# --- Configuration ---
+RESULTS_DIR = "soak_results"
+DEFAULT_DAYS = 7
+DEFAULT_SENSOR_INTERVAL_SECONDS = 0.25 # Feed batches during the soak (5 s in production); faster starves traced relays
+# Traffic per simulated day
+HISTORY_POLLS_PER_ZONE = 96 # One dashboard /history refresh every 15 minutes
+CHATS_PER_DAY = 40
+CHAT_THREAD_LENGTH = 8 # Messages before a client starts a new conversation thread
+INSIGHTS_PER_ZONE = 4
+WS_SESSIONS_PER_DAY = 24 # Short dashboard visits: connect, open a zone, read a few batches, leave
+PERSISTENT_WS_CLIENTS = 3 # Dashboards left open for the whole week
+CONCURRENCY = 8
+# Budgets. Zone growth is a server's memory growth after day 1, scaled to a week and divided by
+# the zone count; client cost is the memory of --probe-clients extra /ws connections per client.
+# Memory is the traced Python heap while tracemalloc is on (its snapshots inflate RSS), else RSS.
+BUDGET_ZONE_MB = 8.0
+BUDGET_CLIENT_MB = 1.0
+PROBE_CLIENTS = 20
+TASK_LEAK_TOLERANCE = 10 # asyncio tasks the api may hold above the day-1 count once clients have left
+SETTLE_SECONDS = 1.0 # Pause before sampling so closed connections are cleaned up
+# Browsers do not send keep-alive pings; a client that did would time out during traced, CPU-bound stretches
+WS_OPTIONS = {"open_timeout": REQUEST_TIMEOUT_SECONDS, "ping_interval": None}
+
+
+class Soak:
+    """Drives api_server (and through /ws the sensor feed) with a day of dashboard traffic at a time."""
+
+    def __init__(self, base_url: str, feed_pid: int = None, feed_report: str = None, seed: int = 0):
+        self.base_url = base_url
+        self.ws_url = base_url.replace("http://", "ws://") + "/ws"
+        self.feed_pid = feed_pid
+        self.feed_report = feed_report
+        self.random = random.Random(seed)
+        self.errors = {}
+        self.requests = 0
+        self.thread_id = None
+        self.thread_messages = 0
+        self.dropped_clients = 0 # Clients of hold_clients that were disconnected before being stopped
+
+    def _error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def _request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs):
+        self.requests += 1
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self._error(type(e).__name__)
+            return None
+        if response.status_code >= 400:
+            self._error(f"{url} HTTP {response.status_code}")
+            return None
+        return response
+
+    async def _chat(self, client: httpx.AsyncClient):
+        if self.thread_messages >= CHAT_THREAD_LENGTH:
+            self.thread_id, self.thread_messages = None, 0
+        payload = {"message": self.random.choice(CHAT_MESSAGES), "zone_name": self.random.choice(ZONE_NAMES),
+                   "thread_id": self.thread_id}
+        self.thread_messages += 1
+        response = await self._request(client, "POST", "/chat", json=payload)
+        if response is not None:
+            self.thread_id = response.json().get("thread_id", self.thread_id)
+
+    async def ws_session(self, batches: int = 3):
+        """One dashboard visit: connect, hint a zone, read a few sensor batches, disconnect."""
+        try:
+            async with websockets.connect(self.ws_url, **WS_OPTIONS) as websocket:
+                await websocket.send(json.dumps({"type": "prefetch", "zone_name": self.random.choice(ZONE_NAMES)}))
+                for _ in range(batches):
+                    await asyncio.wait_for(websocket.recv(), timeout=REQUEST_TIMEOUT_SECONDS)
+        except (OSError, websockets.exceptions.WebSocketException, asyncio.TimeoutError) as e:
+            self._error(f"ws {type(e).__name__}")
+
+    async def hold_clients(self, count: int, stop: asyncio.Event):
+        """`count` /ws clients that stay connected and keep reading until `stop` is set."""
+        async def client():
+            try:
+                async with websockets.connect(self.ws_url, **WS_OPTIONS) as websocket:
+                    while not stop.is_set():
+                        try:
+                            await asyncio.wait_for(websocket.recv(), timeout=0.5)
+                        except asyncio.TimeoutError:
+                            pass
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                self._error(f"ws {type(e).__name__}")
+            if not stop.is_set():
+                self.dropped_clients += 1
+        await asyncio.gather(*(client() for _ in range(count)))
+
+    async def run_day(self, client: httpx.AsyncClient, history_polls: int, chats: int, insights: int, ws_sessions: int,
+                      concurrency: int):
+        jobs = [lambda zone_name=zone_name: self._request(client, "GET", "/history", params={"zone_name": zone_name})
+                for zone_name in ZONE_NAMES for _ in range(history_polls)]
+        jobs += [lambda zone_name=zone_name: self._request(client, "GET", "/run_insight", params={"zone_name": zone_name})
+                 for zone_name in ZONE_NAMES for _ in range(insights)]
+        jobs += [self.ws_session for _ in range(ws_sessions)]
+        self.random.shuffle(jobs)
+        jobs = iter(jobs)
+
+        async def chat_client(): # One user's conversations, a message at a time
+            for _ in range(chats):
+                await self._chat(client)
+
+        async def worker():
+            for job in jobs:
+                await job()
+        await asyncio.gather(chat_client(), *(worker() for _ in range(max(1, concurrency - 1))))
+
+    async def sample(self, client: httpx.AsyncClient, baseline: bool = False) -> dict:
+        """Memory reports from both servers; the first call sets their tracemalloc baselines."""
+        await asyncio.sleep(SETTLE_SECONDS)
+        response = await self._request(client, "GET", "/debug/memory", params={"baseline": str(baseline).lower()})
+        sample = {"api": response.json() if response is not None else {}}
+        if self.feed_pid is not None and self.feed_report:
+            sample["feed"] = await self._feed_report()
+        return sample
+
+    async def _feed_report(self) -> dict:
+        if os.path.exists(self.feed_report):
+            os.remove(self.feed_report)
+        os.kill(self.feed_pid, signal.SIGUSR1)
+        for _ in range(100):
+            if os.path.exists(self.feed_report):
+                with open(self.feed_report) as f:
+                    return json.load(f)
+            await asyncio.sleep(0.05)
+        return {"rss_mb": rss_mb(self.feed_pid)}
+
+    async def probe_clients(self, client: httpx.AsyncClient, count: int) -> dict:
+        """RSS of both servers with `count` extra /ws clients connected, and after they leave."""
+        before = await self.sample(client)
+        stop = asyncio.Event()
+        holding = asyncio.create_task(self.hold_clients(count, stop))
+        await asyncio.sleep(SETTLE_SECONDS * 2) # Every client connected and relaying
+        during = await self.sample(client)
+        stop.set()
+        await holding
+        after = await self.sample(client)
+        return {"clients": count, "before": before, "during": during, "after": after}
+
+
+def _rss(sample: dict, server: str) -> float:
+    return (sample.get(server) or {}).get("rss_mb") or 0.0
+
+
+def _memory(sample: dict, server: str) -> float:
+    report = sample.get(server) or {}
+    return report["traced_mb"] if report.get("tracing") else report.get("rss_mb") or 0.0
+
+
+def check_budgets(days: list, probe: dict, persistent_clients: int, budget_zone_mb: float, budget_client_mb: float,
+                  dropped_clients: int = 0, task_tolerance: int = TASK_LEAK_TOLERANCE) -> tuple:
+    """(summary, failures): growth per zone per week and per client, against the budgets, plus leaked clients/tasks."""
+    failures = []
+    if dropped_clients:
+        failures.append(f"{dropped_clients} long-lived /ws client(s) were disconnected; client memory was not measured under load")
+    first, last = days[0], days[-1]
+    measured_days = len(days) - 1
+    zones = len(ZONE_NAMES)
+    summary = {"measured_days": measured_days, "zones": zones}
+    for server in ("api", "feed"):
+        if server not in last:
+            continue
+        summary[f"{server}_rss_growth_mb"] = round(_rss(last, server) - _rss(first, server), 2)
+        measure = "traced" if last[server].get("tracing") else "rss"
+        growth = _memory(last, server) - _memory(first, server)
+        per_zone_week = growth / zones * 7 / max(measured_days, 1)
+        summary[f"{server}_{measure}_growth_mb"] = round(growth, 3)
+        summary[f"{server}_zone_mb_per_week"] = round(per_zone_week, 3)
+        if per_zone_week > budget_zone_mb:
+            failures.append(f"{server}: {per_zone_week:.2f} MB per zone per week ({measure}) > budget {budget_zone_mb} MB")
+        per_client = (_memory(probe["during"], server) - _memory(probe["before"], server)) / probe["clients"]
+        summary[f"{server}_client_mb"] = round(per_client, 3)
+        if per_client > budget_client_mb:
+            failures.append(f"{server}: {per_client:.2f} MB per connected client ({measure}) > budget {budget_client_mb} MB")
+    readings = [sum(day["api"].get("zone_readings", {}).values()) for day in (first, last)]
+    summary["readings_added"] = readings[1] - readings[0]
+    if summary["readings_added"] > 0 and "api" in last:
+        summary["api_bytes_per_reading"] = round((_memory(last, "api") - _memory(first, "api")) * 2**20
+                                                 / summary["readings_added"], 1)
+    summary["conversation_kb"] = last["api"].get("conversation_kb")
+
+    after = probe["after"]["api"]
+    for name in ("ws_clients", "event_subscribers"):
+        if after.get(name, 0) > persistent_clients:
+            failures.append(f"api: {after[name]:.0f} {name} after the probe clients left (expected {persistent_clients})")
+    if "feed" in probe["after"] and probe["after"]["feed"].get("clients", 0) > persistent_clients:
+        failures.append(f"feed: {probe['after']['feed']['clients']} clients after the probe clients left "
+                        f"(expected {persistent_clients})")
+    task_growth = after.get("asyncio_tasks", 0) - first["api"].get("asyncio_tasks", 0)
+    summary["api_task_growth"] = task_growth
+    if task_growth > task_tolerance:
+        failures.append(f"api: {task_growth} more asyncio tasks than after day 1 (tolerance {task_tolerance})")
+    return summary, failures
+
+
+def print_growth_sites(sample: dict, top: int = 10):
+    for server in ("api", "feed"):
+        growth = (sample.get(server) or {}).get("growth")
+        if growth is None:
+            print(f"{server}: no allocation sites (run with --tracemalloc-frames > 0)")
+            continue
+        print(f"--- {server}: top allocation growth since day 1 ---")
+        for site in growth[:top]:
+            print(f"{site['size_diff_kb']:+10.1f} KB {site['count_diff']:+8d} blocks  {site['site']}")
+
+
+async def run_soak(args, base_url: str, feed_pid: int = None, feed_report: str = None) -> dict:
+    soak = Soak(base_url, feed_pid, feed_report, seed=args.seed)
+    days = []
+    limits = httpx.Limits(max_connections=args.concurrency + 1, max_keepalive_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=REQUEST_TIMEOUT_SECONDS, limits=limits) as client:
+        stop = asyncio.Event()
+        persistent = asyncio.create_task(soak.hold_clients(args.ws_clients, stop))
+        start = time.perf_counter()
+        for day in range(1, args.days + 1):
+            day_start = time.perf_counter()
+            await soak.run_day(client, args.history_polls, args.chats, args.insights, args.ws_sessions, args.concurrency)
+            sample = await soak.sample(client, baseline=day == 1)
+            sample.update(day=day, seconds=round(time.perf_counter() - day_start, 1))
+            days.append(sample)
+            api, feed = sample["api"], sample.get("feed", {})
+            print(f"day {day}: {sample['seconds']:6.1f}s  api {_rss(sample, 'api'):7.1f} MB "
+                  f"(traced {api.get('traced_mb', float('nan')):.1f})  feed {_rss(sample, 'feed'):6.1f} MB  "
+                  f"readings {sum(api.get('zone_readings', {}).values()):,}  ws {api.get('ws_clients', 0):.0f}  "
+                  f"tasks {api.get('asyncio_tasks', 0)}  conversations {api.get('conversation_files', 0)} "
+                  f"({api.get('conversation_kb', 0):.0f} KB)")
+        print(f"Probing {args.probe_clients} extra /ws clients...")
+        probe = await soak.probe_clients(client, args.probe_clients)
+        stop.set()
+        await persistent
+        elapsed = time.perf_counter() - start
+    return {"days": days, "probe": probe, "seconds": round(elapsed, 1), "requests": soak.requests, "errors": soak.errors,
+            "dropped_clients": soak.dropped_clients}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak test: a simulated week of dashboard traffic against api_server and "
+                                                 "the sensor feed, failing when memory per zone or per client exceeds its budget.")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Simulated days (day 1 is warm-up and baseline)")
+    parser.add_argument("--history-polls", type=int, default=HISTORY_POLLS_PER_ZONE, help="/history requests per zone per day")
+    parser.add_argument("--chats", type=int, default=CHATS_PER_DAY, help="/chat messages per day")
+    parser.add_argument("--insights", type=int, default=INSIGHTS_PER_ZONE, help="/run_insight requests per zone per day")
+    parser.add_argument("--ws-sessions", type=int, default=WS_SESSIONS_PER_DAY, help="Short /ws visits per day")
+    parser.add_argument("--ws-clients", type=int, default=PERSISTENT_WS_CLIENTS, help="/ws clients connected all week")
+    parser.add_argument("--probe-clients", type=int, default=PROBE_CLIENTS, help="Extra /ws clients for the per-client cost")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Requests in flight")
+    parser.add_argument("--budget-zone-mb", type=float, default=BUDGET_ZONE_MB, help="RSS growth per zone per week")
+    parser.add_argument("--budget-client-mb", type=float, default=BUDGET_CLIENT_MB, help="RSS per connected /ws client")
+    parser.add_argument("--tracemalloc-frames", type=int, default=1,
+                        help="Frames per allocation traced in the servers (0 = off; faster, but no allocation sites)")
+    parser.add_argument("--sensor-interval", type=float, default=DEFAULT_SENSOR_INTERVAL_SECONDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help=f"Results JSON path (default: {RESULTS_DIR}/<timestamp>_<commit>.json)")
+    args = parser.parse_args()
+    if args.days < 2:
+        parser.error("--days must be at least 2: day 1 is the baseline growth is measured from")
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    commit = git_commit()
+    work_dir = tempfile.mkdtemp(prefix="soak_")
+    feed_report = os.path.join(work_dir, "feed_memory.json")
+    print(f"Starting fake Ollama, sensor feed and api_server in {work_dir}...")
+    fake_ollama, processes = start_stack(1, args.sensor_interval, FakeOllamaConfig(tokens=40, token_latency_ms=0.5,
+                                                                                   prompt_latency_ms=0, embed_latency_ms=1),
+                                         os.path.join(RESULTS_DIR, f"{stamp}_server.log"), cwd=work_dir,
+                                         extra_env={TRACEMALLOC_ENV: str(args.tracemalloc_frames)},
+                                         feed_args=("--memory-report", feed_report))
+    try:
+        results = asyncio.run(run_soak(args, f"http://127.0.0.1:{API_PORT}", processes[0].pid, feed_report))
+    finally:
+        stop_stack(fake_ollama, processes)
+
+    summary, failures = check_budgets(results["days"], results["probe"], args.ws_clients, args.budget_zone_mb,
+                                      args.budget_client_mb, results["dropped_clients"])
+    report = {"timestamp": datetime.now().isoformat(timespec="seconds"), "git_commit": commit, "config": config,
+              "summary": summary, "failures": failures, **results}
+    output = args.output or os.path.join(RESULTS_DIR, f"{stamp}_{commit}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n{results['requests']:,} requests in {results['seconds']:.0f}s, errors: {results['errors'] or 'none'}")
+    for key, value in summary.items():
+        print(f"{key:26s} {value}")
+    print(f"Results written to {output}")
+    if failures:
+        print("\nSoak test failed:\n  " + "\n  ".join(failures))
+        print_growth_sites(results["days"][-1])
+        sys.exit(1)
@@ -0,0 +1,458 @@
+import argparse
+import functools
+import glob
+import io
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+import pandas as pd
+
+# --- Configuration ---
+EXPORT_COLUMNS = ["Line#", "Date", "Temperature", "Humidity", "CO2"] # Controller export layout (positional)
+CACHE_SUFFIX = ".cache" # Columnar cache directory created next to the export
+MAX_CACHE_PARTS = 32 # Cache parts are compacted into one file when there are more than this on load
+XLSX_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+XLSX_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+try:
+    import pyarrow # noqa: F401 (pandas' Parquet engine)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    print("Warning: pyarrow not installed; the tail reader will work without its on-disk cache.")
+    PARQUET_AVAILABLE = False
+
+
+def normalize_export_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """Applies the export's positional column names, parses dates and drops rows without a valid timestamp."""
+    frame = frame.iloc[:, :len(EXPORT_COLUMNS)].copy()
+    frame.columns = EXPORT_COLUMNS[:frame.shape[1]]
+    frame["Date"] = pd.to_datetime(frame["Date"], errors="coerce")
+    for column in ("Temperature", "Humidity"):
+        if column in frame:
+            # Keep dtypes stable across chunks (a tail of whole numbers would otherwise parse as int).
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(float)
+    return frame.dropna(subset=["Date"]).reset_index(drop=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _column_index(column_letters: str) -> int:
+    """0-based column of a cell reference's letters ("C" for "C12")."""
+    index = 0
+    for char in column_letters.upper():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+class XlsxSheetTail:
+    """
+    Reads the rows appended to an .xlsx workbook's first sheet since the previous call.
+
+    A workbook is a zip archive that the controller rewrites as a whole, so every change still
+    costs one inflate of the sheet XML (a C-speed pass, ~25 ms for 40k rows). What is kept
+    across polls is the position of the last row read: its offset inside <sheetData> (rows are
+    append-only, so the offset survives the header's <dimension> growing) and its sheet row
+    number. Only the XML after that row is parsed, and shared strings are tailed the same way.
+    Files whose rows cannot be located that way (no r= attributes, prefixed namespaces) fall
+    back to a full parse that skips rows by their sheet row number.
+    """
+
+    def __init__(self, last_row: int = 1, offset: int = None):
+        self.last_row = last_row # Sheet row number of the last row read (row 1 is the header)
+        self.offset = offset # Start of that row, relative to the <sheetData> content
+        self.shared_strings = []
+        self.shared_offset = 0 # End of the last <si> parsed, relative to the first <si>
+        self.sheet_member = None
+        self.epoch = pd.Timestamp("1899-12-30")
+
+    def _locate_sheet(self, archive: zipfile.ZipFile):
+        workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+        properties = workbook.find(f"{{{XLSX_NS}}}workbookPr")
+        if properties is not None and properties.get("date1904") in ("1", "true"):
+            self.epoch = pd.Timestamp("1904-01-01")
+        relation_id = workbook.find(f"{{{XLSX_NS}}}sheets/{{{XLSX_NS}}}sheet").get(f"{{{XLSX_REL_NS}}}id")
+        relations = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        target = next(relation.get("Target") for relation in relations if relation.get("Id") == relation_id)
+        self.sheet_member = target.lstrip("/") if target.startswith("/") else "xl/" + target
+
+    def _read_shared_strings(self, archive: zipfile.ZipFile):
+        try:
+            data = archive.read("xl/sharedStrings.xml")
+        except KeyError:
+            return
+        first = data.find(b"<si")
+        end = data.rfind(b"</sst>")
+        if first == -1 or end == -1:
+            return
+        fragment = data[first + self.shared_offset:end]
+        if fragment.strip():
+            root = ET.fromstring(b'<sst xmlns="' + XLSX_NS.encode() + b'">' + fragment + b"</sst>")
+            self.shared_strings.extend("".join(item.itertext()) for item in root)
+            self.shared_offset = end - first
+
+    def _cell_value(self, cell):
+        kind = cell.get("t", "n")
+        if kind == "inlineStr":
+            return "".join(cell.itertext())
+        value = cell.find(f"{{{XLSX_NS}}}v")
+        if value is None or value.text is None or kind == "e":
+            return None
+        if kind == "s":
+            return self.shared_strings[int(value.text)]
+        if kind == "b":
+            return value.text == "1"
+        if kind in ("str", "d"):
+            return value.text
+        try:
+            return int(value.text)
+        except ValueError:
+            return float(value.text)
+
+    def _to_frame(self, rows: list) -> pd.DataFrame:
+        if not rows:
+            return None
+        frame = pd.DataFrame(rows)
+        # Date is the export's only date-formatted column; workbooks store it as an Excel serial day.
+        serial = pd.to_numeric(frame[1], errors="coerce")
+        if serial.notna().any():
+            dates = (self.epoch + pd.to_timedelta(serial, unit="D")).dt.round("ms")
+            frame[1] = dates.where(serial.notna(), pd.to_datetime(frame[1].where(serial.isna()), errors="coerce"))
+        return frame
+
+    def _convert_rows(self, rows, skip_through: int = 0) -> list:
+        converted = []
+        row_number = 0 if skip_through else self.last_row
+        for row in rows:
+            row_number = int(row.get("r", row_number + 1))
+            if row_number <= skip_through:
+                continue
+            values = [None] * len(EXPORT_COLUMNS)
+            for position, cell in enumerate(row):
+                reference = cell.get("r")
+                column = _column_index(reference.rstrip("0123456789")) if reference else position
+                if column < len(values):
+                    values[column] = self._cell_value(cell)
+            if any(value is not None for value in values):
+                converted.append(values)
+        self.last_row = max(self.last_row, row_number)
+        return converted
+
+    def read(self, path: str) -> pd.DataFrame:
+        """Returns the new data rows (positional columns, as in EXPORT_COLUMNS), or None."""
+        with zipfile.ZipFile(path) as archive:
+            if self.sheet_member is None:
+                self._locate_sheet(archive)
+            self._read_shared_strings(archive)
+            sheet = archive.read(self.sheet_member)
+
+        opening = sheet.find(b"<sheetData")
+        content = sheet.find(b">", opening) + 1
+        end = sheet.rfind(b"</sheetData>")
+        if opening == -1 or end == -1:
+            return None
+        marker = b'<row r="%d"' % self.last_row
+        if self.offset is None or not sheet.startswith(marker, content + self.offset):
+            found = sheet.find(marker, content, end)
+            if found == -1:
+                # Rows without r= attributes or a prefixed namespace: parse it all, skip what was read.
+                self.offset = None
+                row_tag = f"{{{XLSX_NS}}}row"
+                return self._to_frame(self._convert_rows(ET.fromstring(sheet).iter(row_tag), skip_through=self.last_row))
+            self.offset = found - content
+
+        start = sheet.find(b"<row", content + self.offset + len(marker), end)
+        if start == -1:
+            return None
+        fragment = sheet[start:end]
+        rows = self._convert_rows(ET.fromstring(b'<sheetData xmlns="' + XLSX_NS.encode() + b'">' + fragment + b"</sheetData>"))
+        last = fragment.rfind(b"<row ")
+        if last != -1 and sheet.startswith(b'<row r="%d"' % self.last_row, start + last):
+            self.offset = start + last - content
+        return self._to_frame(rows)
+
+
+class SensorFileTailer:
+    """
+    Incremental reader for a growing controller export (.csv or .xlsx).
+
+    poll() costs one os.stat() while the file is unchanged. When mtime/size change, only the
+    appended rows are parsed: CSV exports are read from the last byte offset, and .xlsx
+    workbooks are tailed from the last sheet row read (see XlsxSheetTail). Parsed rows are
+    persisted as Parquet parts in a cache directory, so a restart reloads the columnar cache
+    instead of re-parsing the export. Each part is one in-memory chunk, and the newest two are
+    merged whenever the older is no larger (a binary counter), so a day of polls leaves about
+    log2(rows) parts rather than one per poll. The newest reading is tracked as rows arrive, so
+    latest() never sorts or scans the full history.
+    """
+
+    def __init__(self, path: str, cache_dir: str = None, use_cache: bool = True):
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+        self.cache_dir = cache_dir or path + CACHE_SUFFIX
+        self.use_cache = use_cache and PARQUET_AVAILABLE
+        self.chunks = []
+        self.parts = [] # Cache part paths, one per chunk
+        self.next_part = 0
+        self.latest_row = None
+        self._frame = None
+        self._reset_position()
+        if self.use_cache:
+            self._load_cache()
+
+    def _reset_position(self):
+        self.mtime_ns = None
+        self.size = 0
+        self.offset = 0 # CSV: bytes consumed (header included)
+        self.xlsx = XlsxSheetTail() # XLSX: last sheet row read and where it is
+        self.row_count = 0
+
+    # --- Cache ---
+    def _meta_path(self) -> str:
+        return os.path.join(self.cache_dir, "meta.json")
+
+    def _load_cache(self):
+        try:
+            with open(self._meta_path(), "r") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if meta.get("source") != os.path.abspath(self.path):
+            return
+        parts = sorted(glob.glob(os.path.join(self.cache_dir, "part-*.parquet")))
+        if not parts:
+            return
+        chunks = [pd.read_parquet(part) for part in parts]
+        if sum(len(chunk) for chunk in chunks) != meta.get("row_count") or "last_row" not in meta:
+            print(f"Tail reader cache for '{self.path}' is inconsistent; re-reading the export.")
+            self._clear_cache()
+            return
+        self.mtime_ns, self.size, self.offset = meta["mtime_ns"], meta["size"], meta["offset"]
+        self.xlsx = XlsxSheetTail(meta["last_row"], meta.get("xlsx_offset"))
+        for chunk in chunks:
+            self._add_rows(chunk)
+        self.chunks, self.parts = chunks, parts
+        self.next_part = int(os.path.basename(parts[-1])[len("part-"):-len(".parquet")]) + 1
+        if len(parts) > MAX_CACHE_PARTS:
+            self._merge_tail(len(parts))
+        print(f"Loaded {self.row_count} cached rows for '{self.path}'.")
+
+    def _write_part(self, frame: pd.DataFrame) -> str:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"part-{self.next_part:06d}.parquet")
+        self.next_part += 1
+        frame.to_parquet(path, index=False)
+        return path
+
+    def _save_meta(self):
+        meta = {
+            "source": os.path.abspath(self.path), "mtime_ns": self.mtime_ns, "size": self.size,
+            "offset": self.offset, "last_row": self.xlsx.last_row, "xlsx_offset": self.xlsx.offset,
+            "row_count": self.row_count,
+        }
+        temp_path = self._meta_path() + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self._meta_path())
+
+    def _clear_cache(self):
+        for part in glob.glob(os.path.join(self.cache_dir, "part-*.parquet")):
+            os.remove(part)
+
+    # --- Reading ---
+    def _read_csv_tail(self) -> pd.DataFrame:
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1 # Leave a partially written last line for the next poll
+        if end == 0:
+            return None
+        data = data[:end]
+        if self.offset == 0:
+            data = data[data.find(b"\n") + 1:] # Skip the header row
+        self.offset += end
+        if not data.strip():
+            return None
+        return pd.read_csv(io.BytesIO(data), header=None)
+
+    def _add_rows(self, frame: pd.DataFrame):
+        self.row_count += len(frame)
+        self._frame = None
+        newest = frame.loc[frame["Date"].idxmax()]
+        if self.latest_row is None or newest["Date"] >= self.latest_row["Date"]:
+            self.latest_row = newest
+
+    def _merge_tail(self, count: int):
+        """Replaces the newest `count` chunks (and their cache parts) with one."""
+        merged = pd.concat(self.chunks[-count:], ignore_index=True)
+        self.chunks[-count:] = [merged]
+        if self.use_cache:
+            path = self._write_part(merged) # Written before the old parts go; meta is saved after
+            for part in self.parts[-count:]:
+                os.remove(part)
+            self.parts[-count:] = [path]
+
+    def _append(self, frame: pd.DataFrame):
+        self._add_rows(frame)
+        self.chunks.append(frame)
+        if self.use_cache:
+            self.parts.append(self._write_part(frame))
+        while len(self.chunks) > 1 and len(self.chunks[-2]) <= len(self.chunks[-1]):
+            self._merge_tail(2)
+
+    def poll(self) -> int:
+        """Picks up rows appended since the last poll. Returns the number of new rows."""
+        stat = os.stat(self.path)
+        if (stat.st_mtime_ns, stat.st_size) == (self.mtime_ns, self.size):
+            return 0
+        if stat.st_size < self.size and self.is_csv:
+            # Truncated or replaced: start over. (A rewritten workbook can shrink by compression alone;
+            # XlsxSheetTail falls back to a full parse if its last row is gone.)
+            print(f"'{self.path}' shrank; re-reading it from the start.")
+            self.chunks, self.parts, self.latest_row, self._frame = [], [], None, None
+            self._reset_position()
+            if self.use_cache:
+                self._clear_cache()
+
+        raw = self._read_csv_tail() if self.is_csv else self.xlsx.read(self.path)
+        self.mtime_ns, self.size = stat.st_mtime_ns, stat.st_size
+        new_rows = normalize_export_frame(raw) if raw is not None else None
+        if new_rows is not None and not new_rows.empty:
+            self._append(new_rows)
+        if self.use_cache:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._save_meta()
+        return 0 if new_rows is None else len(new_rows)
+
+    def latest(self):
+        """The row with the newest Date seen so far (a pandas Series), or None."""
+        return self.latest_row
+
+    def to_frame(self) -> pd.DataFrame:
+        """All rows read so far, in file order."""
+        if not self.chunks:
+            return pd.DataFrame(columns=EXPORT_COLUMNS)
+        if self._frame is None:
+            self._frame = self.chunks[0] if len(self.chunks) == 1 else pd.concat(self.chunks, ignore_index=True)
+        return self._frame
+
+
+def _write_csv_export(path: str, rows: int, start_line: int = 0, append: bool = False):
+    start = pd.Timestamp("2025-01-01") + pd.Timedelta(minutes=start_line)
+    frame = pd.DataFrame({
+        "Line#": range(start_line + 1, start_line + rows + 1),
+        "Date": pd.date_range(start, periods=rows, freq="min").strftime("%m/%d/%Y %H:%M:%S"),
+        "Temperature": 65.0, "Humidity": 88.0, "CO2": 900,
+    })
+    frame.to_csv(path, index=False, header=not append, mode="a" if append else "w")
+
+
+def _write_xlsx_export(path: str, rows: int, gap_every: int = 1000):
+    """
+    A minimal controller-style workbook, rewritten whole like the controller does: an inline-string
+    header, Excel-serial dates, and a skipped (blank) sheet row every `gap_every` rows.
+    """
+    first_day = (pd.Timestamp("2025-01-01") - pd.Timestamp("1899-12-30")) / pd.Timedelta(days=1)
+    header = "".join(f'<c r="{chr(65 + i)}1" t="inlineStr"><is><t>{name}</t></is></c>' for i, name in enumerate(EXPORT_COLUMNS))
+    body, r = [f'<row r="1">{header}</row>'], 1
+    for line in range(rows):
+        r += 2 if gap_every and line and line % gap_every == 0 else 1
+        body.append(f'<row r="{r}"><c r="A{r}"><v>{line + 1}</v></c><c r="B{r}"><v>{first_day + line / 1440!r}</v></c>'
+                    f'<c r="C{r}"><v>65</v></c><c r="D{r}"><v>88</v></c><c r="E{r}"><v>900</v></c></row>')
+    package = "http://schemas.openxmlformats.org/package/2006"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", (
+            f'<Types xmlns="{package}/content-types"><Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/></Types>'))
+        archive.writestr("_rels/.rels", (
+            f'<Relationships xmlns="{package}/relationships"><Relationship Id="rId1" Target="xl/workbook.xml" '
+            f'Type="{XLSX_REL_NS}/officeDocument"/></Relationships>'))
+        archive.writestr("xl/workbook.xml", (
+            f'<workbook xmlns="{XLSX_NS}" xmlns:r="{XLSX_REL_NS}"><sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        archive.writestr("xl/_rels/workbook.xml.rels", (
+            f'<Relationships xmlns="{package}/relationships"><Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+            f'Type="{XLSX_REL_NS}/worksheet"/></Relationships>'))
+        archive.writestr("xl/worksheets/sheet1.xml", (
+            f'<worksheet xmlns="{XLSX_NS}"><dimension ref="A1:E{r}"/><sheetData>{"".join(body)}</sheetData></worksheet>'))
+
+
+def _openpyxl_reread(path: str) -> int:
+    """The pre-tailer approach: open the workbook and stream every row."""
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        return sum(1 for row in workbook.worksheets[0].iter_rows(min_row=2, values_only=True) if any(row))
+    finally:
+        workbook.close()
+
+
+def _benchmark_export(path: str, rows: int, ticks: int, append_row, full_read) -> str:
+    start = time.perf_counter()
+    full_read(path)
+    full_read_seconds = time.perf_counter() - start
+
+    tailer = SensorFileTailer(path)
+    start = time.perf_counter()
+    tailer.poll()
+    initial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        tailer.poll()
+    unchanged = (time.perf_counter() - start) / ticks
+
+    appended = 0.0
+    for tick in range(ticks):
+        append_row(tick)
+        start = time.perf_counter()
+        tailer.poll()
+        appended += time.perf_counter() - start
+    appended /= ticks
+
+    start = time.perf_counter()
+    SensorFileTailer(path).poll()
+    restart = time.perf_counter() - start
+    assert tailer.row_count == rows + ticks, tailer.row_count
+    assert len(tailer.parts) <= rows.bit_length() + ticks.bit_length(), len(tailer.parts)
+
+    return (f"{rows:>9,} rows: full re-read {full_read_seconds * 1000:8.1f} ms | tail: initial {initial * 1000:8.1f} ms, "
+            f"unchanged {unchanged * 1e6:6.1f} µs, +1 row {appended * 1000:6.2f} ms, restart from cache {restart * 1000:7.1f} ms, "
+            f"{len(tailer.parts)} parts")
+
+
+def run_benchmark(sizes=(10_000, 100_000, 1_000_000), xlsx_sizes=(2_000, 40_000), ticks: int = 20):
+    """Compares per-tick cost of the old full re-read against the tail reader as the export grows."""
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        print("--- Tail reader benchmark (CSV export; per-tick cost with one appended row) ---")
+        for rows in sizes:
+            path = os.path.join(directory, f"export_{rows}.csv")
+            _write_csv_export(path, rows)
+            print(_benchmark_export(
+                path, rows, ticks,
+                append_row=lambda tick: _write_csv_export(path, 1, start_line=rows + tick, append=True),
+                full_read=lambda p: normalize_export_frame(pd.read_csv(p)).sort_values(by="Date", ascending=False).iloc[0]))
+
+        print("--- XLSX export (rewritten whole each tick; full re-read = openpyxl streaming every row) ---")
+        for rows in xlsx_sizes:
+            path = os.path.join(directory, f"export_{rows}.xlsx")
+            _write_xlsx_export(path, rows)
+            print(_benchmark_export(path, rows, ticks,
+                                    append_row=lambda tick: _write_xlsx_export(path, rows + tick + 1),
+                                    full_read=_openpyxl_reread))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental reader for controller sensor exports.")
+    parser.add_argument("path", nargs="?", help="Export to read (.csv or .xlsx); prints the newest reading")
+    parser.add_argument("--benchmark", action="store_true", help="Run the per-tick cost benchmark and exit")
+    args = parser.parse_args()
+    if args.benchmark:
+        run_benchmark()
+    elif args.path:
+        tailer = SensorFileTailer(args.path)
+        print(f"{tailer.poll()} new rows; latest: {tailer.latest().to_dict() if tailer.latest() is not None else None}")
+    else:
+        parser.print_help()
@@ -0,0 +1,54 @@
+import json
+import os
+from datetime import date
+
+import pytest
+
+import batch_reports
+from batch_reports import is_complete, report_paths, write_report
+from zone_registry import ZONE_NAMES
+
+DAY = date(2025, 1, 1)
+ZONE = ZONE_NAMES[0]
+INPUTS = {"summary": {"temperature": {"min": 60.0, "max": 66.0, "avg": 63.0}},
+          "latest": {"timestamp": "2025-01-01 23:55:00", "temperature": 63.0, "humidity": 92.0, "CO2": 480, "zone": ZONE},
+          "analytics": {"flags": []}}
+
+
+@pytest.mark.parametrize("insight, skip_llm, complete", [
+    ({"historicalSummary": "Stable.", "insight": "Keep misting."}, False, True),
+    ({"error": "Ollama timed out"}, False, False),
+    ({"error": "Ollama timed out"}, True, False),
+    (None, False, False), # Analytics-only reports are upgraded once the model is used
+    (None, True, True),
+])
+def test_is_complete_by_status(tmp_path, insight, skip_llm, complete):
+    write_report(str(tmp_path), DAY, ZONE, INPUTS, insight, llm_seconds=1.0)
+    json_path, markdown_path = report_paths(str(tmp_path), DAY, ZONE)
+    assert os.path.exists(markdown_path)
+    assert is_complete(json_path, skip_llm) is complete
+
+
+def test_missing_or_partial_report_is_not_complete(tmp_path):
+    json_path = report_paths(str(tmp_path), DAY, ZONE)[0]
+    assert not is_complete(json_path)
+    os.makedirs(os.path.dirname(json_path))
+    with open(json_path, "w") as f:
+        f.write('{"status": "do') # Interrupted mid-write (without the atomic rename)
+    assert not is_complete(json_path)
+
+
+def test_rerun_resumes_only_unfinished_reports(tmp_path):
+    output_dir = str(tmp_path)
+    days = [DAY, date(2025, 1, 2)]
+    write_report(output_dir, DAY, ZONE, INPUTS, None)
+    run = batch_reports.run_batch(days, [ZONE], output_dir, processes=1, lookback_days=1, skip_llm=True)
+    assert run["skipped"] == 1 and run["outcomes"]["analytics_only"] == 1
+    with open(report_paths(output_dir, DAY, ZONE)[0]) as f:
+        assert json.load(f)["summary"] == INPUTS["summary"] # The finished report was left alone
+
+    run = batch_reports.run_batch(days, [ZONE], output_dir, processes=1, lookback_days=1, skip_llm=True)
+    assert run["skipped"] == 2 and sum(run["outcomes"].values()) == 0
+
+    run = batch_reports.run_batch(days, [ZONE], output_dir, processes=1, lookback_days=1, skip_llm=True, force=True)
+    assert run["skipped"] == 0 and run["outcomes"]["analytics_only"] == 2
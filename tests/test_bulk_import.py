@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+import bulk_import
+from sensor_handler import ZONE_NAMES
+
+ZONE = ZONE_NAMES[0]
+
+
+def _normalize(rows, columns=("Zone", "Date", "Temperature", "Humidity", "CO2"), zone_name=None):
+    dropped = {}
+    frame = bulk_import.normalize_chunk(pd.DataFrame(rows, columns=list(columns)), zone_name=zone_name, dropped=dropped)
+    return frame, dropped
+
+
+def test_drop_reasons_are_counted_once_each():
+    frame, dropped = _normalize([
+        (ZONE, "2025-01-01 00:00:00", 65, 90, 500),
+        ("Nowhere", "2025-01-01 00:05:00", 65, 90, 500),
+        (None, "2025-01-01 00:10:00", 65, 90, 500),
+        (ZONE, "garbage", 65, 90, 500),
+        (ZONE, "2025-01-01 00:15:00", None, 90, 500),
+        (ZONE, "garbage", None, None, None), # Counted under the first failing check only
+    ])
+    assert len(frame) == 1
+    assert dropped == {"bad_timestamp": 2, "no_zone": 1, "unknown_zone": 1, "missing_values": 1}
+
+
+@pytest.mark.parametrize("co2", [None, "", float("nan")])
+def test_blank_co2_is_dropped_not_zero_filled(co2):
+    frame, dropped = _normalize([(ZONE, "2025-01-01 00:00:00", 65, 90, co2), (ZONE, "2025-01-01 00:05:00", 65, 90, 480)])
+    assert dropped["missing_values"] == 1
+    assert [record["CO2"] for record in bulk_import.frame_to_records(frame, ZONE)] == [480]
+
+
+def test_export_without_co2_column_loads_nothing():
+    frame, dropped = _normalize([("2025-01-01 00:00:00", 65, 90)], columns=("Date", "Temperature", "Humidity"),
+                                zone_name=ZONE)
+    assert frame.empty
+    assert dropped["missing_values"] == 1
+
+
+def test_zone_argument_applies_without_zone_column():
+    frame, dropped = _normalize([("2025-01-01 00:00:00", 65, 90, 500)], columns=("Date", "Temperature", "Humidity", "CO2"))
+    assert frame.empty and dropped["no_zone"] == 1
+    frame, _ = _normalize([("2025-01-01 00:00:00", 65, 90, 500)], columns=("Date", "Temperature", "Humidity", "CO2"),
+                          zone_name=ZONE)
+    assert list(frame["zone"]) == [ZONE]
+
+
+def test_import_dedupes_on_timestamp_and_reports(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text("Zone,Date,Temperature,Humidity,CO2\n"
+                    f"{ZONE},2025-01-01 00:00:00,65,90,500\n"
+                    f"{ZONE},2025-01-01 00:00:00,66,91,510\n"
+                    f"{ZONE},2025-01-01 00:05:00,65,90,\n")
+    report = bulk_import.import_exports([str(path)], verbose=False)
+    assert report["rows_read"] == 3
+    assert report["rows_dropped"]["missing_values"] == 1
+    assert report["rows_loaded"] == 1 and report["duplicates"] == 1
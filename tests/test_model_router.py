@@ -0,0 +1,34 @@
+import pytest
+
+import model_router
+from model_router import classify_message
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Hi there!", ("simple", "greeting")),
+    ("thanks", ("simple", "greeting")),
+    ("What is the humidity in the mine?", ("simple", "factual")),
+    ("current co2", ("simple", "factual")),
+    ("Why is the temperature rising?", ("complex", "advice")),
+    ("Hello, should I mist the Yurt more?", ("complex", "advice")),
+    ("What is the CO2? And the temperature?", ("complex", "long_question")),
+    (" ".join(["reading"] * 30), ("complex", "long_question")),
+    ("Tell me a story about the mushrooms", ("complex", "open_ended")),
+    ("", ("complex", "open_ended")),
+    (None, ("complex", "open_ended")),
+])
+def test_classify_message(message, expected):
+    assert classify_message(message) == expected
+
+
+def test_route_uses_the_classifier_for_chat(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTING_ENABLED", True)
+    assert model_router.route("chat", "prompt text", user_message="What is the humidity?").tier == "small"
+    assert model_router.route("chat", "prompt text", user_message="How should I fix mold?").tier == "large"
+    assert model_router.route("insight", "short prompt").reason == "kind"
+    assert model_router.route("insight", "x " * 10000).reason == "long_prompt"
+
+
+def test_routing_disabled_always_uses_the_large_model(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTING_ENABLED", False)
+    assert model_router.route("chat", "p", user_message="hi").to_dict()["reason"] == "routing_disabled"
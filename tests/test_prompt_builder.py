@@ -0,0 +1,62 @@
+import pytest
+
+import prompt_builder
+from prompt_builder import build_chat_prompt, estimate_tokens, select_context, select_history, truncate_to_tokens
+
+
+@pytest.fixture(autouse=True)
+def default_calibration(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "_chars_per_token", prompt_builder.DEFAULT_CHARS_PER_TOKEN)
+
+
+def _history(turns, words=80):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "humidity " * words}
+            for i in range(turns)]
+
+
+def test_truncate_marks_the_cut_and_fits():
+    text = "spores " * 200
+    cut = truncate_to_tokens(text, 20)
+    assert cut.endswith(" …") and estimate_tokens(cut) <= 20
+    assert truncate_to_tokens("short", 20) == "short"
+
+
+def test_select_context_ranks_dedupes_and_respects_budget():
+    documents = ["far document " * 5, "near document", "NEAR   document", "middle document " * 50]
+    kept, dropped = select_context(documents, [0.9, 0.1, 0.2, 0.5], max_tokens=30)
+    assert kept == ["near document", "far document " * 5] # Too-large middle document skipped, duplicate dropped
+    assert dropped == 2
+
+
+def test_select_history_keeps_newest_turns_within_budget():
+    history = _history(20)
+    lines, first_turn = select_history(history, 200)
+    assert sum(estimate_tokens(line) + 1 for line in lines) <= 200
+    assert lines[-1].startswith("Assistant: turn 19")
+    assert first_turn == 20 - len(lines)
+
+
+def test_latest_exchange_is_always_included_even_if_long():
+    history = _history(2, words=2000)
+    lines, first_turn = select_history(history, 100)
+    assert first_turn == 0 and len(lines) == 2
+
+
+@pytest.mark.parametrize("budget", [512, 1024, 2048])
+def test_prompt_stays_within_budget(budget):
+    prompt = build_chat_prompt("Mine", "What is the humidity now?", _history(60),
+                               documents=[f"reading {i} " + "temperature 55.0 " * 30 for i in range(40)],
+                               distances=[i / 40 for i in range(40)], summary="Earlier: " + "co2 " * 400,
+                               zone_summary="Latest: " + "stable " * 400, budget=budget)
+    assert prompt.tokens <= budget
+    assert prompt.dropped_documents > 0 and prompt.first_turn > 0
+    assert prompt.text.startswith(prompt_builder.chat_prompt_prefix("Mine"))
+    assert prompt.text.endswith("User: What is the humidity now?\nAssistant:")
+    assert prompt.sections["summary"] <= prompt_builder.SUMMARY_MAX_TOKENS
+    assert prompt.sections["zone_summary"] <= prompt_builder.ZONE_SUMMARY_MAX_TOKENS
+
+
+def test_context_note_when_there_are_no_documents():
+    prompt = build_chat_prompt("Mine", "Hi", [], context_note="Error retrieving RAG context.")
+    assert "Error retrieving RAG context." in prompt.text
+    assert prompt.first_turn == 0 and prompt.dropped_documents == 0
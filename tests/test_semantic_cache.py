@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import semantic_cache
+from semantic_cache import SemanticCache
+
+DIMENSIONS = 8
+
+
+def _vector(seed):
+    return np.random.default_rng(seed).standard_normal(DIMENSIONS)
+
+
+@pytest.fixture
+def cache():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("Mine", _vector(1), "w1", "v1", "How humid is it?", "Very.", 4.0)
+    return cache
+
+
+def test_near_duplicate_hits_and_distinct_query_misses(cache):
+    hit = cache.lookup("Mine", _vector(1) + 0.01, "w1", "v1")
+    assert hit["reply"] == "Very." and hit["query"] == "How humid is it?"
+    assert cache.lookup("Mine", _vector(2), "w1", "v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_zones_are_separate(cache):
+    assert cache.lookup("Yurt", _vector(1), "w1", "v1") is None
+
+
+@pytest.mark.parametrize("watermark, version", [("w2", "v1"), ("w1", "v2")])
+def test_new_watermark_or_version_invalidates_the_zone(cache, watermark, version):
+    assert cache.lookup("Mine", _vector(1), watermark, version) is None
+    assert cache.stats()["invalidations"] == 1
+    # The old entries are gone for good, not just hidden under the new key
+    assert cache.lookup("Mine", _vector(1), "w1", "v1") is None
+
+
+def test_explicit_invalidate(cache):
+    cache.store("Yurt", _vector(3), "w1", "v1", "CO2?", "480 ppm.", 2.0)
+    cache.invalidate("Mine")
+    assert cache.lookup("Mine", _vector(1), "w1", "v1") is None
+    assert cache.lookup("Yurt", _vector(3), "w1", "v1") is not None
+    cache.invalidate()
+    assert cache.stats()["entries"] == {}
+
+
+def test_entries_expire_by_age(cache, monkeypatch):
+    cache.max_age_seconds = 60
+    real_time = semantic_cache.time.time
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: real_time() + 61)
+    assert cache.lookup("Mine", _vector(1), "w1", "v1") is None
+    assert cache.stats()["entries"] == {}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(threshold=0.9, max_entries=2)
+    for seed in (1, 2):
+        cache.store("Mine", _vector(seed), "w", "v", f"q{seed}", f"a{seed}", 1.0)
+    assert cache.lookup("Mine", _vector(1), "w", "v") is not None # q1 is now the most recently used
+    cache.store("Mine", _vector(3), "w", "v", "q3", "a3", 1.0)
+    assert cache.lookup("Mine", _vector(2), "w", "v") is None
+    assert cache.lookup("Mine", _vector(1), "w", "v")["reply"] == "a1"
@@ -0,0 +1,90 @@
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import pytest
+
+import ts_codec
+from sensor_handler import generate_pseudo_sensor_data
+from ts_codec import CompressedHistory, SealedBlock
+
+BLOCK_SIZE = 16
+
+
+def _readings(count, zone="Mine"):
+    start = datetime(2025, 1, 1)
+    return [generate_pseudo_sensor_data(base_time=start + timedelta(seconds=5 * i), zone_name=zone)
+            for i in range(count)]
+
+
+def test_round_trip_is_lossless():
+    readings = _readings(5 * BLOCK_SIZE + 3)
+    history = CompressedHistory(readings, block_size=BLOCK_SIZE)
+    assert len(history) == len(readings)
+    assert list(history) == readings
+    assert all(isinstance(block, SealedBlock) for block in history.blocks)
+    assert len(history.tail) == 3
+
+
+def test_unencodable_runs_are_kept_as_plain_lists():
+    readings = _readings(BLOCK_SIZE)
+    readings[3] = dict(readings[3], note="manual") # Extra key: cannot be stored losslessly
+    history = CompressedHistory(readings, block_size=BLOCK_SIZE)
+    assert isinstance(history.blocks[0], list)
+    assert list(history) == readings
+
+
+@pytest.mark.parametrize("index", [0, BLOCK_SIZE - 1, BLOCK_SIZE, 3 * BLOCK_SIZE + 5, -1, -BLOCK_SIZE - 2])
+def test_indexing_matches_list(index):
+    readings = _readings(4 * BLOCK_SIZE + 7)
+    assert CompressedHistory(readings, block_size=BLOCK_SIZE)[index] == readings[index]
+
+
+@pytest.mark.parametrize("window", [
+    slice(None), slice(5, 9), slice(BLOCK_SIZE - 2, BLOCK_SIZE + 2), slice(3, 4 * BLOCK_SIZE + 5),
+    slice(-10, None), slice(-50, -3), slice(None, None, 7), slice(40, 10), slice(1000, 2000),
+])
+def test_slicing_matches_list(window):
+    readings = _readings(4 * BLOCK_SIZE + 7)
+    assert CompressedHistory(readings, block_size=BLOCK_SIZE)[window] == readings[window]
+
+
+def test_bisect_and_scan():
+    readings = _readings(3 * BLOCK_SIZE + 2)
+    history = CompressedHistory(readings, block_size=BLOCK_SIZE)
+    timestamps = [reading["timestamp"] for reading in readings]
+    target = timestamps[BLOCK_SIZE + 4]
+    assert bisect_left(history, target, key=lambda reading: reading["timestamp"]) == BLOCK_SIZE + 4
+    start, end = timestamps[BLOCK_SIZE - 1], timestamps[2 * BLOCK_SIZE + 1]
+    assert list(history.scan(start, end)) == readings[BLOCK_SIZE - 1:2 * BLOCK_SIZE + 2]
+
+
+def test_delitem_keeps_order():
+    readings = _readings(2 * BLOCK_SIZE + 1)
+    history = CompressedHistory(readings, block_size=BLOCK_SIZE)
+    del history[:BLOCK_SIZE // 2]
+    del readings[:BLOCK_SIZE // 2]
+    assert list(history) == readings
+
+
+def test_decoded_block_cache_is_thread_safe(monkeypatch):
+    monkeypatch.setattr(ts_codec, "DECODED_BLOCK_CACHE", 2)
+    readings = _readings(12 * BLOCK_SIZE)
+    history = CompressedHistory(readings, block_size=BLOCK_SIZE)
+    errors = []
+
+    def read(offset):
+        try:
+            for step in range(300):
+                index = ((offset + step) * 7 * BLOCK_SIZE // 3) % len(readings)
+                assert history[index] == readings[index]
+        except Exception as error: # KeyError from a racing eviction, or a wrong record
+            errors.append(error)
+
+    threads = [threading.Thread(target=read, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(history._decoded) <= 2
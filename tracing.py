@@ -0,0 +1,274 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _TallyCounter
+from collections import OrderedDict
+from contextvars import ContextVar
+
+# --- Configuration ---
+PROFILING_ENV = "MUSHROOM_PROFILING" # Per-request profiling is only honoured when this is set to "1"
+PROFILING_ENABLED = os.environ.get(PROFILING_ENV) == "1"
+SAMPLE_INTERVAL_SECONDS = 0.005 # Statistical profiler sampling period
+MAX_STORED_PROFILES = 20 # Most recent profiles kept for GET /profiles/{trace_id}
+PROFILE_TOP_N = 25
+
+# Ollama's own phase timings, reported on the final response object in nanoseconds.
+_OLLAMA_PHASES = (("load_duration", "ollama_load"), ("prompt_eval_duration", "ollama_prompt_eval"),
+                  ("eval_duration", "ollama_eval"))
+
+_CURRENT_TRACE = ContextVar("mushroom_trace", default=None)
+PROFILES = OrderedDict() # trace_id -> profile report
+
+
+class Trace:
+    """
+    Spans recorded for one request. The trace lives in a ContextVar, so it follows the request
+    into awaited coroutines and into asyncio.to_thread workers (which copy the context).
+    """
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = [] # (name, start_offset, duration, depth, thread_id)
+        self.active_threads = {} # thread_id -> open span count (what the sampling profiler looks at)
+        self._lock = threading.Lock()
+
+    def _enter(self, thread_id: int) -> int:
+        with self._lock:
+            depth = self.active_threads.get(thread_id, 0)
+            self.active_threads[thread_id] = depth + 1
+            return depth
+
+    def _exit(self, thread_id: int):
+        with self._lock:
+            remaining = self.active_threads.get(thread_id, 1) - 1
+            if remaining:
+                self.active_threads[thread_id] = remaining
+            else:
+                self.active_threads.pop(thread_id, None)
+
+    def add_span(self, name: str, duration: float, start: float = None, depth: int = None):
+        """
+        Records a finished span. Spans measured elsewhere (e.g. Ollama's own eval_duration) are
+        taken to have just ended, nested under whatever spans are open on this thread.
+        """
+        thread_id = threading.get_ident()
+        offset = (start if start is not None else time.perf_counter() - duration) - self.start
+        with self._lock:
+            if depth is None:
+                depth = self.active_threads.get(thread_id, 0)
+            self.spans.append((name, offset, duration, depth, thread_id))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def totals(self) -> "OrderedDict[str, float]":
+        """Total seconds per span name, in first-seen order."""
+        totals = OrderedDict()
+        with self._lock:
+            spans = list(self.spans)
+        for name, _, duration, _, _ in sorted(spans, key=lambda span: span[1]):
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def summary(self) -> dict:
+        """JSON-friendly breakdown: {"trace_id", "total_ms", "stages": {name: ms}, "spans": [...]}."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span[1])
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "stages": {name: round(seconds * 1000, 2) for name, seconds in self.totals().items()},
+            "spans": [{"name": name, "start_ms": round(offset * 1000, 2), "duration_ms": round(duration * 1000, 2), "depth": depth}
+                      for name, offset, duration, depth, _ in spans],
+        }
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. 'embedding;dur=41.2, chroma_query;dur=3.0, total;dur=52.9'."""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+class _Span:
+    __slots__ = ("name", "histogram", "trace", "start", "depth", "thread_id")
+
+    def __init__(self, name: str, histogram, trace: Trace):
+        self.name = name
+        self.histogram = histogram
+        self.trace = trace
+
+    def __enter__(self):
+        if self.trace is not None:
+            self.thread_id = threading.get_ident()
+            self.depth = self.trace._enter(self.thread_id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        if self.histogram is not None:
+            self.histogram.observe(duration)
+        if self.trace is not None:
+            self.trace.add_span(self.name, duration, start=self.start, depth=self.depth)
+            self.trace._exit(self.thread_id)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, histogram=None):
+    """
+    Times a block as a named stage of the current request's trace. If `histogram` (a metrics
+    Histogram or labelled child) is given, the duration is also observed there. Outside a
+    traced request with no histogram this is a shared no-op.
+    """
+    trace = _CURRENT_TRACE.get()
+    if trace is None and histogram is None:
+        return _NOOP_SPAN
+    return _Span(name, histogram, trace)
+
+
+def current_trace():
+    return _CURRENT_TRACE.get()
+
+
+def add_span(name: str, duration: float):
+    """Adds an externally measured stage to the current trace, if any."""
+    trace = _CURRENT_TRACE.get()
+    if trace is not None:
+        trace.add_span(name, duration)
+
+
+def record_ollama_phases(response_json: dict):
+    """Adds Ollama's self-reported load / prompt_eval / eval durations (nanoseconds) as nested spans."""
+    trace = _CURRENT_TRACE.get()
+    if trace is None:
+        return
+    depth = trace.active_threads.get(threading.get_ident(), 0) + 1
+    for key, name in _OLLAMA_PHASES:
+        if response_json.get(key):
+            trace.add_span(name, response_json[key] / 1e9, depth=depth)
+
+
+def start_trace(name: str):
+    """Starts a trace in the current context. Returns (trace, token) for end_trace()."""
+    trace = Trace(name)
+    return trace, _CURRENT_TRACE.set(trace)
+
+
+def end_trace(token):
+    _CURRENT_TRACE.reset(token)
+
+
+# --- Opt-in profiling ---
+class SamplingProfiler:
+    """
+    Statistical profiler for one trace: a background thread samples the stacks of every thread
+    that currently has an open span in the trace (the event loop and any to_thread workers),
+    so idle threads and unrelated requests don't pollute the profile.
+    """
+
+    def __init__(self, trace: Trace, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.trace = trace
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = _TallyCounter()
+        self.inclusive_counts = _TallyCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{trace.trace_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            with self.trace._lock:
+                thread_ids = [thread_id for thread_id in self.trace.active_threads if thread_id != own_thread]
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                self.samples += 1
+                self.self_counts[_frame_label(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    label = _frame_label(frame)
+                    if label not in seen:
+                        seen.add(label)
+                        self.inclusive_counts[label] += 1
+                    frame = frame.f_back
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        total = self.samples or 1
+        return {
+            "mode": "sample",
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "self": [{"frame": label, "samples": count, "percent": round(100 * count / total, 1)}
+                     for label, count in self.self_counts.most_common(PROFILE_TOP_N)],
+            "inclusive": [{"frame": label, "samples": count, "percent": round(100 * count / total, 1)}
+                          for label, count in self.inclusive_counts.most_common(PROFILE_TOP_N)],
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class DeterministicProfiler:
+    """cProfile for the calling thread only (e.g. /chat, whose work runs on the request's thread)."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+        return self
+
+    def stop(self) -> dict:
+        self.profile.disable()
+        output = io.StringIO()
+        pstats.Stats(self.profile, stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+        return {"mode": "cprofile", "report": output.getvalue()}
+
+
+def start_profiler(trace: Trace, mode: str):
+    """Returns a started profiler for `mode` ("sample" or "cprofile"), or None if profiling is disabled."""
+    if not PROFILING_ENABLED or mode not in ("sample", "cprofile"):
+        return None
+    try:
+        return (DeterministicProfiler() if mode == "cprofile" else SamplingProfiler(trace)).start()
+    except ValueError: # Another cProfile session is already active (only one per process on 3.12+)
+        return None
+
+
+def store_profile(trace: Trace, report: dict):
+    report["trace_id"] = trace.trace_id
+    report["request"] = trace.name
+    PROFILES[trace.trace_id] = report
+    while len(PROFILES) > MAX_STORED_PROFILES:
+        PROFILES.popitem(last=False)
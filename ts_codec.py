@@ -0,0 +1,369 @@
+import argparse
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import CACHE_REQUESTS
+
+# --- Configuration ---
+DEFAULT_BLOCK_SIZE = 720 # Readings per sealed block (1 hour at the live 5 s cadence)
+DECODED_BLOCK_CACHE = 4 # Decoded blocks kept per history for repeated random access (e.g. bisect)
+FLOAT_SCALE = 10 # Readings carry one decimal, so scaled-integer deltas are usually lossless
+RECORD_KEYS = ("timestamp", "temperature", "humidity", "CO2", "zone")
+VALUE_KEYS = ("temperature", "humidity", "CO2")
+_BLOCK_CACHE_HITS = CACHE_REQUESTS.labels("history_block", "hit")
+_BLOCK_CACHE_MISSES = CACHE_REQUESTS.labels("history_block", "miss")
+
+# Column encodings
+CODEC_INT_DELTA = "int_delta"       # Python ints: zigzag varint deltas
+CODEC_SCALED_DELTA = "scaled_delta" # Floats exact at FLOAT_SCALE: zigzag varint deltas of the scaled integers
+CODEC_XOR = "xor"                   # Any other floats: Gorilla-style XOR with the previous value, byte-aligned
+
+
+# --- Integer primitives ---
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values: np.ndarray) -> np.ndarray:
+    return ((values >> np.uint64(1)).astype(np.int64)) ^ -((values & np.uint64(1)).astype(np.int64))
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """LEB128 varints of signed integers (zigzag), encoded without a Python-level loop over values."""
+    unsigned = _zigzag(values)
+    lengths = np.ones(len(unsigned), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += unsigned >= (np.uint64(1) << np.uint64(shift))
+    offsets = np.cumsum(lengths) - lengths
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max(initial=0))):
+        mask = lengths > k
+        payload = (unsigned[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        continuation = (lengths[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[mask] + k] = (payload | continuation).astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if raw.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(starts)), ends - starts + 1)
+    position = np.arange(raw.size) - starts[group]
+    parts = (raw & 0x7F).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    return _unzigzag(np.add.reduceat(parts, starts))
+
+
+# --- Column codecs ---
+def encode_timestamps(seconds: np.ndarray) -> bytes:
+    """Delta-of-delta: a regular cadence encodes as one zero byte per reading."""
+    if len(seconds) < 2:
+        return encode_varints(seconds)
+    deltas = np.diff(seconds)
+    return encode_varints(np.concatenate(([seconds[0], deltas[0]], np.diff(deltas))))
+
+
+def decode_timestamps(data: bytes) -> np.ndarray:
+    values = decode_varints(data)
+    if len(values) < 2:
+        return values
+    deltas = np.cumsum(values[1:])
+    return values[0] + np.concatenate(([0], np.cumsum(deltas)))
+
+
+def encode_xor_floats(values: np.ndarray) -> bytes:
+    """
+    Gorilla-style float compression, byte-aligned so it vectorizes: each value is XORed with
+    the previous one and only the bytes between the first and last non-zero byte are kept.
+    Layout: one control byte per value ((first_byte << 4) | byte_count), then the payloads.
+    """
+    bits = values.astype("<f8").view("<u8")
+    xored = bits ^ np.concatenate(([np.uint64(0)], bits[:-1]))
+    matrix = xored.view(np.uint8).reshape(-1, 8)
+    nonzero = matrix != 0
+    has_bits = nonzero.any(axis=1)
+    low = np.where(has_bits, nonzero.argmax(axis=1), 0)
+    high = np.where(has_bits, 7 - nonzero[:, ::-1].argmax(axis=1), -1)
+    count = high - low + 1
+    columns = np.arange(8)
+    keep = (columns >= low[:, None]) & (columns <= high[:, None])
+    control = ((low << 4) | count).astype(np.uint8)
+    return control.tobytes() + matrix[keep].tobytes()
+
+
+def decode_xor_floats(data: bytes, count: int) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    control = raw[:count].astype(np.int64)
+    low, length = control >> 4, control & 0x0F
+    columns = np.arange(8)
+    keep = (columns >= low[:, None]) & (columns < (low + length)[:, None])
+    matrix = np.zeros((count, 8), dtype=np.uint8)
+    matrix[keep] = raw[count:]
+    xored = matrix.reshape(-1).view("<u8")
+    return np.bitwise_xor.accumulate(xored).view("<f8")
+
+
+def encode_column(values: list):
+    """Picks the most compact lossless codec for a metric column. Returns (codec, payload)."""
+    if all(type(value) is int for value in values):
+        array = np.array(values, dtype=np.int64)
+        return CODEC_INT_DELTA, encode_varints(np.diff(array, prepend=0))
+    array = np.array(values, dtype=np.float64)
+    scaled = np.round(array * FLOAT_SCALE)
+    if np.all(np.abs(scaled) < 2 ** 53) and np.array_equal(scaled / FLOAT_SCALE, array):
+        return CODEC_SCALED_DELTA, encode_varints(np.diff(scaled.astype(np.int64), prepend=0))
+    return CODEC_XOR, encode_xor_floats(array)
+
+
+def decode_column(codec: str, payload: bytes, count: int) -> list:
+    if codec == CODEC_INT_DELTA:
+        return np.cumsum(decode_varints(payload)).tolist()
+    if codec == CODEC_SCALED_DELTA:
+        return (np.cumsum(decode_varints(payload)) / FLOAT_SCALE).tolist()
+    return decode_xor_floats(payload, count).tolist()
+
+
+# --- Blocks ---
+class SealedBlock:
+    """An immutable, compressed run of one zone's readings."""
+    __slots__ = ("count", "zone", "first_timestamp", "last_timestamp", "timestamps", "columns")
+
+    def nbytes(self) -> int:
+        return len(self.timestamps) + sum(len(payload) for _, payload in self.columns.values())
+
+
+def _format_seconds(seconds: np.ndarray) -> list:
+    return [text.replace("T", " ") for text in np.datetime_as_string(seconds.astype("datetime64[s]")).tolist()]
+
+
+def decode_block(block: SealedBlock) -> list:
+    timestamps = _format_seconds(decode_timestamps(block.timestamps))
+    columns = [decode_column(codec, payload, block.count) for codec, payload in
+               (block.columns[key] for key in VALUE_KEYS)]
+    zone = block.zone
+    return [
+        {"timestamp": timestamp, "temperature": temperature, "humidity": humidity, "CO2": co2, "zone": zone}
+        for timestamp, temperature, humidity, co2 in zip(timestamps, *columns)
+    ]
+
+
+def encode_block(records: list):
+    """
+    Compresses a run of readings in the generate_pseudo_sensor_data format. Returns None if
+    the run cannot be stored losslessly (extra keys, mixed zones, unparseable timestamps,
+    non-numeric values); callers keep such runs uncompressed.
+    """
+    if not records:
+        return None
+    zone = records[0].get("zone")
+    try:
+        if any(len(record) != len(RECORD_KEYS) or record["zone"] != zone for record in records):
+            return None
+        seconds = np.array([record["timestamp"] for record in records], dtype="datetime64[s]").astype(np.int64)
+        block = SealedBlock()
+        block.count = len(records)
+        block.zone = zone
+        block.first_timestamp = records[0]["timestamp"]
+        block.last_timestamp = records[-1]["timestamp"]
+        block.timestamps = encode_timestamps(seconds)
+        block.columns = {key: encode_column([record[key] for record in records]) for key in VALUE_KEYS}
+    except (KeyError, TypeError, ValueError):
+        return None
+    # Guards against anything the encoding cannot reproduce exactly (e.g. odd timestamp formatting).
+    return block if decode_block(block) == records else None
+
+
+class CompressedHistory:
+    """
+    List-like history of one zone's readings: recent readings stay in a plain list for cheap
+    appends, and every `block_size` readings are sealed into a SealedBlock (delta-of-delta
+    timestamps, scaled-integer or XOR float deltas, integer deltas for CO2).
+
+    Supports len(), indexing, slicing, iteration, append/extend and bisect, so it can stand in
+    for the list sensor_handler used to keep. Reads decode only the blocks they touch, and
+    recently decoded blocks are cached (under a lock, as API handlers read from threads).
+    Like list slices, slices return new lists of shared dicts: callers must not modify them.
+    """
+
+    def __init__(self, readings=(), block_size: int = DEFAULT_BLOCK_SIZE):
+        self.block_size = block_size
+        self._reset(readings)
+
+    def _reset(self, readings=()):
+        self.blocks = [] # SealedBlock, or a plain list for runs that could not be encoded
+        self.block_starts = []
+        self.sealed_count = 0
+        self.tail = []
+        self._decoded = OrderedDict()
+        self._decoded_lock = threading.Lock()
+        self.extend(readings)
+
+    def append(self, reading: dict):
+        self.tail.append(reading)
+        if len(self.tail) >= self.block_size:
+            self._seal()
+
+    def extend(self, readings):
+        for reading in readings:
+            self.append(reading)
+
+    def _seal(self):
+        block = encode_block(self.tail)
+        self.blocks.append(block if block is not None else self.tail)
+        self.block_starts.append(self.sealed_count)
+        self.sealed_count += len(self.tail)
+        self.tail = []
+
+    def _block_records(self, block_index: int) -> list:
+        block = self.blocks[block_index]
+        if isinstance(block, list):
+            return block
+        with self._decoded_lock: # move_to_end/popitem race otherwise (KeyError on an evicted block)
+            records = self._decoded.get(block_index)
+            if records is None:
+                _BLOCK_CACHE_MISSES.inc()
+                records = decode_block(block)
+                self._decoded[block_index] = records
+                if len(self._decoded) > DECODED_BLOCK_CACHE:
+                    self._decoded.popitem(last=False)
+            else:
+                _BLOCK_CACHE_HITS.inc()
+                self._decoded.move_to_end(block_index)
+        return records
+
+    def __len__(self) -> int:
+        return self.sealed_count + len(self.tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self._range(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        if index >= self.sealed_count:
+            return self.tail[index - self.sealed_count]
+        block_index = bisect_right(self.block_starts, index) - 1
+        return self._block_records(block_index)[index - self.block_starts[block_index]]
+
+    def _range(self, start: int, stop: int) -> list:
+        result = []
+        if start < self.sealed_count:
+            first_block = bisect_right(self.block_starts, start) - 1
+            for block_index in range(first_block, len(self.blocks)):
+                block_start = self.block_starts[block_index]
+                if block_start >= stop:
+                    break
+                records = self._block_records(block_index)
+                result.extend(records[max(start - block_start, 0):stop - block_start])
+        if stop > self.sealed_count:
+            result.extend(self.tail[max(start - self.sealed_count, 0):stop - self.sealed_count])
+        return result
+
+    def __iter__(self):
+        for block_index in range(len(self.blocks)):
+            yield from self._block_records(block_index)
+        yield from list(self.tail)
+
+    def __delitem__(self, index):
+        records = list(self)
+        del records[index]
+        self._reset(records)
+
+    def scan(self, start_timestamp: str = None, end_timestamp: str = None):
+        """Yields readings with start <= timestamp <= end, skipping (not decoding) blocks outside the range."""
+        for block_index, block in enumerate(self.blocks):
+            first = block.first_timestamp if isinstance(block, SealedBlock) else block[0]["timestamp"]
+            last = block.last_timestamp if isinstance(block, SealedBlock) else block[-1]["timestamp"]
+            if (end_timestamp is not None and first > end_timestamp) or (start_timestamp is not None and last < start_timestamp):
+                continue
+            for reading in self._block_records(block_index):
+                if (start_timestamp is None or reading["timestamp"] >= start_timestamp) and \
+                        (end_timestamp is None or reading["timestamp"] <= end_timestamp):
+                    yield reading
+        for reading in list(self.tail):
+            if (start_timestamp is None or reading["timestamp"] >= start_timestamp) and \
+                    (end_timestamp is None or reading["timestamp"] <= end_timestamp):
+                yield reading
+
+    def stats(self) -> dict:
+        sealed = [block for block in self.blocks if isinstance(block, SealedBlock)]
+        encoded_bytes = sum(block.nbytes() for block in sealed)
+        encoded_readings = sum(block.count for block in sealed)
+        return {
+            "readings": len(self),
+            "sealed_blocks": len(sealed),
+            "uncompressed_blocks": len(self.blocks) - len(sealed),
+            "tail_readings": len(self.tail),
+            "encoded_bytes": encoded_bytes,
+            "bytes_per_sealed_reading": round(encoded_bytes / encoded_readings, 2) if encoded_readings else None,
+        }
+
+    def __repr__(self) -> str:
+        return f"CompressedHistory({len(self)} readings, {len(self.blocks)} sealed blocks)"
+
+
+def _deep_size(reading: dict) -> int:
+    return sys.getsizeof(reading) + sum(sys.getsizeof(value) for value in reading.values() if value is not reading["zone"])
+
+
+def run_benchmark(readings_per_zone: int = 30 * 17280 // 10):
+    """Bytes per sample, append cost and scan throughput for list vs CompressedHistory."""
+    from datetime import datetime, timedelta
+    from sensor_handler import generate_pseudo_sensor_data
+
+    start = datetime(2025, 1, 1)
+    readings = [generate_pseudo_sensor_data(base_time=start + timedelta(seconds=5 * i), zone_name="Mine")
+                for i in range(readings_per_zone)]
+    print(f"--- Time-series codec benchmark ({readings_per_zone:,} live readings, one zone) ---")
+    dict_bytes = sum(_deep_size(reading) for reading in readings) + sys.getsizeof(readings)
+    print(f"list of dicts: {dict_bytes / len(readings):7.1f} bytes/sample")
+
+    begin = time.perf_counter()
+    history = CompressedHistory()
+    for reading in readings:
+        history.append(reading)
+    append_seconds = time.perf_counter() - begin
+    stats = history.stats()
+    tail_bytes = sum(_deep_size(reading) for reading in history.tail)
+    total = stats["encoded_bytes"] + tail_bytes
+    print(f"compressed:    {total / len(history):7.1f} bytes/sample overall, "
+          f"{stats['bytes_per_sealed_reading']} bytes/sample in sealed blocks "
+          f"({dict_bytes / total:.0f}x smaller)")
+    print(f"append (incl. sealing): {append_seconds / len(readings) * 1e6:.2f} µs/reading")
+
+    assert list(history) == readings, "round trip mismatch"
+    history._decoded.clear()
+    begin = time.perf_counter()
+    count = sum(1 for _ in history)
+    scan_seconds = time.perf_counter() - begin
+    print(f"full scan (cold decode): {count / scan_seconds:,.0f} readings/s")
+
+    window_start, window_end = readings[len(readings) // 2]["timestamp"], readings[len(readings) // 2 + 720]["timestamp"]
+    history._decoded.clear()
+    begin = time.perf_counter()
+    in_window = sum(1 for _ in history.scan(window_start, window_end))
+    range_seconds = time.perf_counter() - begin
+    print(f"1h range scan: {in_window} readings in {range_seconds * 1000:.2f} ms (only overlapping blocks decoded)")
+
+    begin = time.perf_counter()
+    history[-288:]
+    print(f"history[-288:]: {(time.perf_counter() - begin) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compressed time-series encoding for sensor history.")
+    parser.add_argument("--readings", type=int, default=30 * 17280 // 10, help="Readings to generate for the benchmark")
+    args = parser.parse_args()
+    run_benchmark(args.readings)
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# --- Configuration ---
+ZONES_CONFIG_ENV = "MUSHROOM_ZONES_CONFIG" # Path to a zones JSON file; defaults to zones.json next to this module
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zones.json")
+METRIC_KEYS = ("temperature", "humidity", "CO2")
+BUILTIN_DEFAULTS = {
+    "site": "Main",
+    "sensor_interval_seconds": 5,     # Live reading cadence
+    "history_interval_seconds": 300,  # Cadence of the simulated backfill history
+    "baselines": {"temperature": [40.0, 50.0], "humidity": [95.0, 100.0], "CO2": [440, 500]},
+}
+MAX_NAMES_IN_ERRORS = 10 # Unknown-zone errors list at most this many valid names
+
+
+class Zone:
+    """One zone's metadata, with its normal operating ranges precomputed as (min, max) tuples."""
+    __slots__ = ("name", "index", "site", "sensor_interval_seconds", "history_interval_seconds", "ranges", "metadata")
+
+    def __init__(self, name: str, index: int, site: str, sensor_interval_seconds: float,
+                 history_interval_seconds: float, ranges: dict, metadata: dict = None):
+        self.name = name
+        self.index = index
+        self.site = site
+        self.sensor_interval_seconds = sensor_interval_seconds
+        self.history_interval_seconds = history_interval_seconds
+        self.ranges = ranges
+        self.metadata = metadata or {}
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "site": self.site, "sensor_interval_seconds": self.sensor_interval_seconds,
+                "history_interval_seconds": self.history_interval_seconds,
+                "baselines": {key: list(bounds) for key, bounds in self.ranges.items()}, **self.metadata}
+
+
+def _parse_ranges(baselines: dict, defaults: dict, zone_name: str) -> dict:
+    ranges = {}
+    for key in METRIC_KEYS:
+        low, high = baselines.get(key, defaults[key])
+        if low > high:
+            raise ValueError(f"Zone '{zone_name}': {key} baseline minimum {low} is above maximum {high}.")
+        cast = int if key == "CO2" else float
+        ranges[key] = (cast(low), cast(high))
+    return ranges
+
+
+class ZoneRegistry:
+    """
+    The set of zones the system knows about, loaded once from configuration. Membership,
+    index and range lookups are dict lookups; per-zone parameters are computed at load time,
+    and per-metric bound arrays are available for vectorized generators.
+    """
+
+    def __init__(self, zones: list, defaults: dict = None):
+        self.zones = zones
+        self.defaults = defaults or BUILTIN_DEFAULTS
+        self.names = [zone.name for zone in zones]
+        self._by_name = {zone.name: zone for zone in zones}
+        self._default_ranges = _parse_ranges({}, self.defaults["baselines"], "<default>")
+        self._bounds = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ZoneRegistry":
+        """Builds a registry from {"defaults": {...}, "zones": [{"name": ..., optional overrides}, ...]}."""
+        defaults = {**BUILTIN_DEFAULTS, **config.get("defaults", {})}
+        defaults["baselines"] = {**BUILTIN_DEFAULTS["baselines"], **defaults.get("baselines", {})}
+        zones = []
+        seen = set()
+        for index, entry in enumerate(config.get("zones", [])):
+            name = entry.get("name") if isinstance(entry, dict) else entry
+            if not name:
+                raise ValueError(f"Zone entry {index} has no name.")
+            if name in seen:
+                raise ValueError(f"Zone '{name}' is defined more than once.")
+            seen.add(name)
+            entry = entry if isinstance(entry, dict) else {"name": name}
+            metadata = {key: value for key, value in entry.items() if key not in
+                        ("name", "site", "sensor_interval_seconds", "history_interval_seconds", "baselines")}
+            zones.append(Zone(
+                name=name, index=index,
+                site=entry.get("site", defaults["site"]),
+                sensor_interval_seconds=entry.get("sensor_interval_seconds", defaults["sensor_interval_seconds"]),
+                history_interval_seconds=entry.get("history_interval_seconds", defaults["history_interval_seconds"]),
+                ranges=_parse_ranges(entry.get("baselines", {}), defaults["baselines"], name),
+                metadata=metadata,
+            ))
+        if not zones:
+            raise ValueError("Zone configuration defines no zones.")
+        return cls(zones, defaults)
+
+    @classmethod
+    def load(cls, path: str = None) -> "ZoneRegistry":
+        path = path or os.environ.get(ZONES_CONFIG_ENV) or DEFAULT_CONFIG_PATH
+        with open(path) as f:
+            return cls.from_config(json.load(f))
+
+    @classmethod
+    def synthetic(cls, count: int, sites: int = 10) -> "ZoneRegistry":
+        """`count` generated zones spread over `sites` sites, with varied baselines (for benchmarks)."""
+        rng = np.random.default_rng(0)
+        offsets = rng.uniform(-3, 3, count).round(1)
+        return cls.from_config({"zones": [
+            {"name": f"Site {i % sites + 1} Room {i // sites + 1}", "site": f"Site {i % sites + 1}",
+             "baselines": {"temperature": [40.0 + offset, 50.0 + offset], "CO2": [440 + int(offset * 10), 500 + int(offset * 10)]}}
+            for i, offset in enumerate(offsets.tolist())
+        ]})
+
+    def __contains__(self, zone_name) -> bool:
+        return zone_name in self._by_name
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    def __iter__(self):
+        return iter(self.zones)
+
+    def get(self, zone_name: str):
+        """The Zone, or None if unknown."""
+        return self._by_name.get(zone_name)
+
+    def require(self, zone_name: str) -> Zone:
+        """The Zone; raises ValueError (with a bounded list of valid names) if unknown."""
+        zone = self._by_name.get(zone_name)
+        if zone is None:
+            raise ValueError(self.unknown_zone_message(zone_name))
+        return zone
+
+    def index(self, zone_name: str) -> int:
+        """Position of the zone in the configuration, or -1 if unknown."""
+        zone = self._by_name.get(zone_name)
+        return zone.index if zone is not None else -1
+
+    def ranges(self, zone_name: str) -> dict:
+        """Precomputed {"temperature": (min, max), ...}; the configured defaults for unknown zones. Do not mutate."""
+        zone = self._by_name.get(zone_name)
+        return zone.ranges if zone is not None else self._default_ranges
+
+    def bounds(self, metric: str):
+        """(low, high) NumPy arrays of a metric's range, in zone order (cached)."""
+        if metric not in self._bounds:
+            dtype = np.int64 if metric == "CO2" else np.float64
+            self._bounds[metric] = tuple(np.array(column, dtype=dtype)
+                                         for column in zip(*(zone.ranges[metric] for zone in self.zones)))
+        return self._bounds[metric]
+
+    def sites(self) -> dict:
+        """{site: [zone names]} in configuration order."""
+        sites = {}
+        for zone in self.zones:
+            sites.setdefault(zone.site, []).append(zone.name)
+        return sites
+
+    def unknown_zone_message(self, zone_name) -> str:
+        names = self.names[:MAX_NAMES_IN_ERRORS]
+        more = f" (and {len(self.names) - len(names)} more)" if len(self.names) > len(names) else ""
+        return f"Unknown zone_name: '{zone_name}'. Must be one of {names}{more}."
+
+
+ZONE_REGISTRY = ZoneRegistry.load()
+ZONE_NAMES = ZONE_REGISTRY.names
+
+
+def _legacy_ranges(zone_names: list, zone_name: str) -> dict:
+    """The per-call computation sensor_handler used before the registry (list.index + offsets), for the benchmark."""
+    zone_idx = zone_names.index(zone_name) if zone_name in zone_names else -1
+    offset_factor = zone_idx - (len(zone_names) - 1) / 2.0
+    return {
+        "temperature": (40.0 + offset_factor * 0.8, 50.0 + offset_factor * 0.8),
+        "humidity": (max(85.0, 95.0 - offset_factor), min(100.0, 100.0 - offset_factor)),
+        "CO2": (max(300, 440 + int(offset_factor * 15)), max(350, 500 + int(offset_factor * 15))),
+    }
+
+
+def run_benchmark(zone_count: int = 1000, lookups: int = 200_000):
+    config = {"zones": [zone.to_dict() for zone in ZoneRegistry.synthetic(zone_count)]}
+    start = time.perf_counter()
+    registry = ZoneRegistry.from_config(json.loads(json.dumps(config)))
+    load_ms = (time.perf_counter() - start) * 1000
+    names = list(registry.names)
+    sample = [names[i] for i in np.random.default_rng(1).integers(0, zone_count, lookups).tolist()]
+
+    def per_lookup_ns(function):
+        start = time.perf_counter()
+        for name in sample:
+            function(name)
+        return (time.perf_counter() - start) / lookups * 1e9
+
+    print(f"--- Zone registry, {zone_count:,} zones over {len(registry.sites())} sites (config parsed in {load_ms:.1f} ms) ---")
+    for label, legacy, current in (
+        ("validate", lambda name: name in names, lambda name: name in registry),
+        ("index", names.index, registry.index),
+        ("ranges", lambda name: _legacy_ranges(names, name), registry.ranges),
+    ):
+        before, after = per_lookup_ns(legacy), per_lookup_ns(current)
+        print(f"{label:9s} list: {before:9,.0f} ns   registry: {after:6,.0f} ns   ({before / after:,.0f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zone registry (zones.json) inspection and benchmark.")
+    parser.add_argument("--benchmark", type=int, metavar="ZONES", help="Benchmark lookups with this many synthetic zones")
+    args = parser.parse_args()
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+    else:
+        for site, zone_names in ZONE_REGISTRY.sites().items():
+            print(f"{site}: {', '.join(zone_names)}")